@@ -61,6 +61,26 @@ KH_MARKDOWN_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 KH_CHUNKS_OUTPUT_DIR = KH_APP_DATA_DIR / "chunks_cache_dir"
 KH_CHUNKS_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
+# number of worker processes used to parse large PDF files page-range by page-range,
+# 0 or 1 parses them in the main process
+KH_PDF_LOADER_WORKERS = config("KH_PDF_LOADER_WORKERS", default=0, cast=int)
+
+# figure captioning with the vision language model (KH_VLM_ENDPOINT): number of
+# concurrent requests, retries, persistent caption cache and maximum image size
+KH_VLM_CAPTION_CONCURRENCY = config("KH_VLM_CAPTION_CONCURRENCY", default=4, cast=int)
+KH_VLM_CAPTION_RETRIES = config("KH_VLM_CAPTION_RETRIES", default=2, cast=int)
+KH_VLM_CAPTION_CACHE_DIR = KH_APP_DATA_DIR / "caption_cache_dir"
+KH_VLM_CAPTION_MAX_IMAGE_SIZE = config(
+    "KH_VLM_CAPTION_MAX_IMAGE_SIZE", default=1024, cast=int
+)
+
+# cache of the documents extracted by the file loaders, so that re-indexing a file
+# (e.g. with other chunk settings) does not parse it again
+KH_READER_CACHE_DIR = KH_APP_DATA_DIR / "reader_cache_dir"
+KH_READER_CACHE_MAX_SIZE_MB = config(
+    "KH_READER_CACHE_MAX_SIZE_MB", default=2048, cast=int
+)
+
 # zip output directory
 KH_ZIP_OUTPUT_DIR = KH_APP_DATA_DIR / "zip_cache_dir"
 KH_ZIP_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
@@ -88,12 +108,63 @@ if KH_LANG not in SUPPORTED_LANGUAGE_MAP:
 KH_MODE = config("KH_MODE", default="dev")
 KH_SSO_ENABLED = config("KH_SSO_ENABLED", default=False, cast=bool)
 KH_FEATURE_CHAT_SUGGESTION = config("KH_FEATURE_CHAT_SUGGESTION", default=False, cast=bool)
+# the chat answer is re-rendered at most every KH_CHAT_STREAM_INTERVAL_MS
+# milliseconds, or once KH_CHAT_STREAM_MAX_TOKENS chunks are pending
+KH_CHAT_STREAM_INTERVAL_MS = config("KH_CHAT_STREAM_INTERVAL_MS", default=80, cast=int)
+KH_CHAT_STREAM_MAX_TOKENS = config("KH_CHAT_STREAM_MAX_TOKENS", default=64, cast=int)
+# projection of the citation visualization: umap, pca or random (the fastest)
+KH_CITATION_VIZ_METHOD = config("KH_CITATION_VIZ_METHOD", default="umap")
+# models loaded in the background at startup, the others are loaded on first use,
+# e.g. "embeddings:default,rerankings:default,llms:openai"
+KH_MODEL_WARMUP = config("KH_MODEL_WARMUP", default="")
+# latency spans of the pipeline stages: finished traces appended as OTLP JSON lines
+# to KH_TRACING_EXPORT_PATH, p50/p95 per stage served as Prometheus text on
+# http://<host>:KH_TRACING_METRICS_PORT/metrics (disabled if empty or 0)
+KH_TRACING_EXPORT_PATH = config("KH_TRACING_EXPORT_PATH", default="")
+KH_TRACING_METRICS_PORT = config("KH_TRACING_METRICS_PORT", default=0, cast=int)
+# price in USD of one million input and output tokens of the models, to compute the
+# cost of the chats (Resources > Usage); a key also matches the model names
+# starting with it, e.g. {"gpt-4o-mini": {"input": 0.15, "output": 0.6}}
+KH_LLM_PRICING = {}
+# opt-in cache of the LLM responses of the pipelines: pipeline class name -> time
+# to live of its responses in seconds, e.g. {"SuggestConvNamePipeline": 86400,
+# "RewriteQuestionPipeline": 86400, "LLMTrulensScoring": 3600}
+KH_LLM_CACHE_PIPELINES = {}
+KH_LLM_CACHE_PATH = str(KH_APP_DATA_DIR / "llm_cache.db")
+KH_LLM_CACHE_MAX_ENTRIES = config("KH_LLM_CACHE_MAX_ENTRIES", default=10000, cast=int)
+# limits of the chat model requests by model name (or prefix, "*" for the other
+# models), the waiting requests are served by priority (interactive > auxiliary >
+# batch), e.g. {"gpt-4o-mini": {"max_concurrency": 8, "requests_per_minute": 500,
+# "tokens_per_minute": 200000}}; the models without limits are not queued
+KH_LLM_SCHEDULER_LIMITS = {}
+KH_LLM_SCHEDULER_MAX_RETRIES = config(
+    "KH_LLM_SCHEDULER_MAX_RETRIES", default=2, cast=int
+)
 KH_FEATURE_USER_MANAGEMENT = config("KH_FEATURE_USER_MANAGEMENT", default=True, cast=bool)
 KH_USER_CAN_SEE_PUBLIC = None
 KH_FEATURE_USER_MANAGEMENT_ADMIN = config("KH_FEATURE_USER_MANAGEMENT_ADMIN", default="admin")
 KH_FEATURE_USER_MANAGEMENT_PASSWORD = config("KH_FEATURE_USER_MANAGEMENT_PASSWORD", default="admin")
 KH_ENABLE_ALEMBIC = False
 KH_DATABASE = f"sqlite:///{KH_USER_DATA_DIR / 'sql.db'}"
+# connection pool of the database engine, seconds to wait for a connection or a
+# lock, and size (bytes) of the memory-mapped I/O of SQLite
+KH_DATABASE_POOL_SIZE = config("KH_DATABASE_POOL_SIZE", default=10, cast=int)
+KH_DATABASE_MAX_OVERFLOW = config("KH_DATABASE_MAX_OVERFLOW", default=20, cast=int)
+KH_DATABASE_BUSY_TIMEOUT = config("KH_DATABASE_BUSY_TIMEOUT", default=30, cast=int)
+KH_SQLITE_MMAP_SIZE = config("KH_SQLITE_MMAP_SIZE", default=256 * 1024**2, cast=int)
+# number of conversation turns loaded at once in the chat
+KH_CHAT_HISTORY_PAGE_SIZE = config("KH_CHAT_HISTORY_PAGE_SIZE", default=50, cast=int)
+# number of rows of a page of the file and group lists, and seconds during which
+# the total number of files is reused
+KH_FILE_LIST_PAGE_SIZE = config("KH_FILE_LIST_PAGE_SIZE", default=50, cast=int)
+KH_FILE_LIST_COUNT_TTL = config("KH_FILE_LIST_COUNT_TTL", default=30, cast=int)
+# server-side store of the retrieval panels and plots of the chat sessions:
+# "memory" (per process) or "sqlite" (shared by the worker processes)
+KH_SESSION_STORE = config("KH_SESSION_STORE", default="memory")
+KH_SESSION_STORE_MAX_ITEMS = config(
+    "KH_SESSION_STORE_MAX_ITEMS", default=1000, cast=int
+)
+KH_SESSION_STORE_PATH = str(KH_USER_DATA_DIR / "session_store.db")
 KH_FILESTORAGE_PATH = str(KH_USER_DATA_DIR / "files")
 KH_WEB_SEARCH_BACKEND = (
     "kotaemon.indices.retrievers.tavily_web_search.WebSearch"
@@ -1,15 +1,13 @@
 import logging
 import re
-from functools import partial
 from typing import Optional
 
-import tiktoken
-
 from kotaemon.agents.base import BaseAgent, BaseLLM
 from kotaemon.agents.io import AgentAction, AgentFinish, AgentOutput, AgentType
 from kotaemon.agents.tools import BaseTool
 from kotaemon.base import Document, Param
 from kotaemon.indices.splitters import TokenSplitter
+from kotaemon.indices.splitters.tiktoken_splitter import get_token_func
 from kotaemon.llms import PromptTemplate
 
 FINAL_ANSWER_ACTION = "Final Answer:"
@@ -155,10 +153,8 @@ class ReactAgent(BaseAgent):
                 chunk_size=self.max_context_length,
                 chunk_overlap=0,
                 separator=" ",
-                tokenizer=partial(
-                    tiktoken.encoding_for_model("gpt-3.5-turbo").encode,
-                    allowed_special=set(),
-                    disallowed_special="all",
+                tokenizer=get_token_func(
+                    "gpt-3.5-turbo", allowed_special=set(), disallowed_special="all"
                 ),
             )
         )
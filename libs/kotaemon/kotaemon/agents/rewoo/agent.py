@@ -1,11 +1,8 @@
 import logging
 import re
 from concurrent.futures import ThreadPoolExecutor
-from functools import partial
 from typing import Any
 
-import tiktoken
-
 from kotaemon.agents.base import BaseAgent
 from kotaemon.agents.io import AgentOutput, AgentType, BaseScratchPad
 from kotaemon.agents.tools import BaseTool
@@ -13,6 +10,7 @@ from kotaemon.agents.utils import get_plugin_response_content
 from kotaemon.base import Document, Node, Param
 from kotaemon.indices.qa.citation import CitationPipeline
 from kotaemon.indices.splitters import TokenSplitter
+from kotaemon.indices.splitters.tiktoken_splitter import get_token_func
 from kotaemon.llms import BaseLLM, PromptTemplate
 
 from .planner import Planner
@@ -250,10 +248,8 @@ class RewooAgent(BaseAgent):
                 chunk_size=self.max_context_length,
                 chunk_overlap=0,
                 separator=" ",
-                tokenizer=partial(
-                    tiktoken.encoding_for_model("gpt-3.5-turbo").encode,
-                    allowed_special=set(),
-                    disallowed_special="all",
+                tokenizer=get_token_func(
+                    "gpt-3.5-turbo", allowed_special=set(), disallowed_special="all"
                 ),
             )
         )
@@ -7,6 +7,7 @@ from .schema import (
     ExtractorOutput,
     HumanMessage,
     LLMInterface,
+    RetrievedChunk,
     RetrievedDocument,
     StructuredOutputLLMInterface,
     SystemMessage,
@@ -21,6 +22,7 @@ __all__ = [
     "AIMessage",
     "HumanMessage",
     "RetrievedDocument",
+    "RetrievedChunk",
     "LLMInterface",
     "StructuredOutputLLMInterface",
     "ExtractorOutput",
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, Any, Literal, Optional, TypeVar
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Any, Literal, Mapping, Optional, TypeVar
 
 from langchain.schema.messages import AIMessage as LCAIMessage
 from langchain.schema.messages import HumanMessage as LCHumanMessage
@@ -132,6 +133,54 @@ class RetrievedDocument(Document):
     retrieval_metadata: dict = Field(default={})
 
 
+class RetrievedChunk:
+    """Lightweight record of a retrieved chunk
+
+    Retrieval pipelines keep their candidates (often `top_k` times a multiplier)
+    as this record while merging, sorting and cutting them, instead of building a
+    full `RetrievedDocument` for each. The document returned by the document store
+    is referenced, not copied: `metadata` is a read-only view over its metadata.
+    Only the chunks that are finally returned are converted with
+    `to_retrieved_document`.
+
+    Attributes:
+        id (str): id of the chunk
+        text (str): text of the chunk
+        score (float): retrieval score, -1.0 when the score is unknown (e.g.
+            full-text search)
+        file_id (str | None): id of the file containing the chunk
+        page_label (Any): page of the chunk in its file
+    """
+
+    __slots__ = ("id", "text", "score", "file_id", "page_label", "_source")
+
+    def __init__(self, source: Document, score: float = 0.0):
+        self.id: str = source.doc_id
+        self.text: str = source.text
+        self.score = score
+        self.file_id: Optional[str] = source.metadata.get("file_id")
+        self.page_label: Any = source.metadata.get("page_label")
+        self._source = source
+
+    @property
+    def source(self) -> Document:
+        """The document of the chunk, as returned by the document store"""
+        return self._source
+
+    @property
+    def metadata(self) -> Mapping[str, Any]:
+        return MappingProxyType(self._source.metadata)
+
+    def to_retrieved_document(self) -> RetrievedDocument:
+        return RetrievedDocument(**self._source.to_dict(), score=self.score)
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(id={self.id!r}, score={self.score}, "
+            f"file_id={self.file_id!r}, page_label={self.page_label!r})"
+        )
+
+
 class LLMInterface(AIMessage):
     candidates: list[str] = Field(default_factory=list)
     completion_tokens: int = -1
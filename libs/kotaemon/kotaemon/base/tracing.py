@@ -0,0 +1,400 @@
+"""Latency spans of the stages of the pipelines
+
+A span times a stage (query embedding, vector query, reranking, generation...).
+The current span is kept in a context variable, so that the spans opened by the
+components called inside a stage become its children, whatever the depth of the
+calls. The streams keep their span across their steps with `trace_stream`, the
+threads started inside a stage with `contextvars.copy_context().run`.
+
+The tracer keeps the latest durations of each stage for their p50/p95 summaries,
+and exports the finished traces:
+    - `KH_TRACING_EXPORT_PATH`: JSON lines file, one OTLP `ExportTraceServiceRequest`
+      per trace, as written by the OpenTelemetry file exporters
+    - `KH_TRACING_METRICS_PORT`: Prometheus text endpoint (`/metrics`) started by
+      `start_metrics_server`, with the summary of each stage
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Generator, Iterator, Optional, TypeVar
+
+from theflow.settings import settings as flowsettings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# number of durations kept per stage for the quantiles
+WINDOW_SIZE = 1024
+# number of traces whose spans are buffered until their root span ends
+MAX_PENDING_TRACES = 256
+QUANTILES = (0.5, 0.95)
+
+
+class Span:
+    """A timed stage of a trace"""
+
+    __slots__ = (
+        "name",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "start_ns",
+        "end_ns",
+        "attributes",
+        "error",
+        "_tracer",
+    )
+
+    def __init__(
+        self,
+        tracer: "Tracer",
+        name: str,
+        parent: Optional["Span"] = None,
+        start_ns: Optional[int] = None,
+        attributes: Optional[dict] = None,
+    ):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.start_ns = start_ns if start_ns is not None else time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes or {}
+        self.error: Optional[str] = None
+        self._tracer = tracer
+
+    @property
+    def duration(self) -> float:
+        """Duration in seconds, up to now if the span is not ended"""
+        end_ns = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end_ns - self.start_ns) / 1e9
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def mark(self, name: str, **attributes) -> "Span":
+        """Record a child span from the start of this span to now, e.g. the time to
+        the first token of a generation"""
+        child = Span(
+            self._tracer,
+            name,
+            parent=self,
+            start_ns=self.start_ns,
+            attributes=attributes,
+        )
+        child.end()
+        return child
+
+    def end(self, error: Optional[BaseException] = None):
+        """End the span, only the first call counts"""
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        self._tracer.record(self)
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [
+                {"key": key, "value": _otlp_value(value)}
+                for key, value in self.attributes.items()
+            ],
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.error:
+            span["status"] = {"code": 2, "message": self.error}
+        return span
+
+
+def _otlp_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class StageStats:
+    """Durations of the latest spans of a stage, and the totals of all of them"""
+
+    def __init__(self, window_size: int = WINDOW_SIZE):
+        self.durations: deque[float] = deque(maxlen=window_size)
+        self.count = 0
+        self.sum = 0.0
+
+    def add(self, duration: float):
+        self.durations.append(duration)
+        self.count += 1
+        self.sum += duration
+
+    def quantile(self, q: float) -> float:
+        if not self.durations:
+            return 0.0
+        values = sorted(self.durations)
+        return values[min(int(q * len(values)), len(values) - 1)]
+
+
+class Tracer:
+    """Record the spans: summaries per stage and export of the traces
+
+    Args:
+        export_path: JSON lines file receiving the finished traces in the OTLP JSON
+            format, nothing is exported if empty
+        service_name: the `service.name` of the exported traces
+    """
+
+    def __init__(self, export_path: str = "", service_name: str = "kotaemon"):
+        self.export_path = export_path
+        self.service_name = service_name
+        self._current: ContextVar[Optional[Span]] = ContextVar(
+            "kotaemon_current_span", default=None
+        )
+        self._stats: dict[str, StageStats] = defaultdict(StageStats)
+        self._pending: OrderedDict[str, list[Span]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def current_span(self) -> Optional[Span]:
+        return self._current.get()
+
+    def start_span(
+        self,
+        name: str,
+        parent: Optional[Span] = None,
+        start_ns: Optional[int] = None,
+        **attributes,
+    ) -> Span:
+        """Start a span, child of `parent` (default to the current span), without
+        making it the current span. It must be ended with `Span.end`."""
+        return Span(
+            self,
+            name,
+            parent=parent or self._current.get(),
+            start_ns=start_ns,
+            attributes=attributes,
+        )
+
+    @contextmanager
+    def use_span(self, span: Span) -> Iterator[Span]:
+        """Make an open span the current span in the enclosed block, without
+        ending it"""
+        previous = self._current.get()
+        token = self._current.set(span)
+        try:
+            yield span
+        finally:
+            try:
+                self._current.reset(token)
+            except ValueError:
+                # the block was resumed in another context (step of a stream)
+                self._current.set(previous)
+
+    @contextmanager
+    def span(
+        self, name: str, parent: Optional[Span] = None, **attributes
+    ) -> Iterator[Span]:
+        """Time the enclosed block as the current span"""
+        span = self.start_span(name, parent=parent, **attributes)
+        try:
+            with self.use_span(span):
+                yield span
+        except BaseException as e:
+            span.end(error=e)
+            raise
+        finally:
+            span.end()
+
+    def stream_with_span(
+        self, stream: Generator[T, Any, Any], span: Span
+    ) -> Generator[T, None, Any]:
+        """Make an open span the current span during each step of a stream,
+        without ending it
+
+        The steps of a stream may run in different contexts (e.g. gradio runs each
+        of them in a worker thread), the span is made current for each step so that
+        the spans opened by the stream are its children.
+        """
+        try:
+            while True:
+                token = self._current.set(span)
+                try:
+                    item = next(stream)
+                except StopIteration as e:
+                    return e.value
+                finally:
+                    self._current.reset(token)
+                yield item
+        except GeneratorExit:
+            stream.close()
+            raise
+
+    def trace_stream(
+        self, stream: Generator[T, Any, Any], name: str, **attributes
+    ) -> Generator[T, None, Any]:
+        """Time a stream as a span, current during each of its steps (see
+        `stream_with_span`)"""
+        span = self.start_span(name, **attributes)
+        try:
+            return (yield from self.stream_with_span(stream, span))
+        except GeneratorExit:
+            raise
+        except BaseException as e:
+            span.end(error=e)
+            raise
+        finally:
+            span.end()
+
+    def record(self, span: Span):
+        """Add an ended span to the summaries, and export its trace if it is the
+        root span"""
+        with self._lock:
+            self._stats[span.name].add(span.duration)
+            if not self.export_path:
+                return
+            spans = self._pending.setdefault(span.trace_id, [])
+            spans.append(span)
+            if span.parent_id is not None:
+                while len(self._pending) > MAX_PENDING_TRACES:
+                    self._pending.popitem(last=False)
+                return
+            del self._pending[span.trace_id]
+
+        self.export(spans)
+
+    def export(self, spans: list[Span]):
+        """Append the spans of a trace to the export file"""
+        request = {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            {
+                                "key": "service.name",
+                                "value": {"stringValue": self.service_name},
+                            }
+                        ]
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": __name__},
+                            "spans": [span.to_otlp() for span in spans],
+                        }
+                    ],
+                }
+            ]
+        }
+        line = json.dumps(request, ensure_ascii=False)
+        try:
+            with self._lock, open(self.export_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except OSError as e:
+            logger.warning(f"Failed to export the trace: {e}")
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        """The count, total and p50/p95 durations (seconds) of each stage"""
+        with self._lock:
+            return {
+                name: {
+                    "count": stats.count,
+                    "sum": stats.sum,
+                    **{f"p{int(q * 100)}": stats.quantile(q) for q in QUANTILES},
+                }
+                for name, stats in sorted(self._stats.items())
+            }
+
+    def prometheus_text(self) -> str:
+        """The summaries of the stages in the Prometheus text format"""
+        metric = "kotaemon_stage_duration_seconds"
+        lines = [
+            f"# HELP {metric} Duration of the pipeline stages",
+            f"# TYPE {metric} summary",
+        ]
+        with self._lock:
+            for name, stats in sorted(self._stats.items()):
+                for q in QUANTILES:
+                    lines.append(
+                        f'{metric}{{stage="{name}",quantile="{q}"}} '
+                        f"{stats.quantile(q):.6f}"
+                    )
+                lines.append(f'{metric}_sum{{stage="{name}"}} {stats.sum:.6f}')
+                lines.append(f'{metric}_count{{stage="{name}"}} {stats.count}')
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        """Forget the summaries and the pending traces"""
+        with self._lock:
+            self._stats.clear()
+            self._pending.clear()
+
+
+tracer = Tracer(export_path=getattr(flowsettings, "KH_TRACING_EXPORT_PATH", ""))
+current_span = tracer.current_span
+start_span = tracer.start_span
+use_span = tracer.use_span
+span = tracer.span
+stream_with_span = tracer.stream_with_span
+trace_stream = tracer.trace_stream
+
+
+def start_metrics_server(
+    port: Optional[int] = None, host: str = "0.0.0.0", tracer: Tracer = tracer
+) -> Optional[ThreadingHTTPServer]:
+    """Serve the Prometheus text of the stages on `/metrics` in a background thread
+
+    Args:
+        port: the port, default to the `KH_TRACING_METRICS_PORT` setting, nothing
+            is started if it is not set or if it is not available
+        host: the interface to listen on
+        tracer: the tracer whose stages are served
+    """
+    port = (
+        port
+        if port is not None
+        else getattr(flowsettings, "KH_TRACING_METRICS_PORT", 0)
+    )
+    if not port:
+        return None
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = tracer.prometheus_text().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug(format, *args)
+
+    try:
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+    except OSError as e:
+        # e.g. the port is used by another worker of the app
+        logger.warning(f"Cannot serve the stage metrics on port {port}: {e}")
+        return None
+    thread = threading.Thread(
+        target=server.serve_forever, name="tracing-metrics", daemon=True
+    )
+    thread.start()
+    logger.info(f"Serving the stage metrics on port {server.server_address[1]}")
+    return server
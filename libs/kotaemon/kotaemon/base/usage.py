@@ -0,0 +1,299 @@
+"""Token and cost accounting of the model calls
+
+The chat models and the embedding models record the tokens of each of their calls
+with `record_usage`: the usage reported by the API when there is one (including
+the streams, with `stream_options={"include_usage": True}`), else an estimate
+with a local tokenizer. The records go to the collectors active in the current
+context (`collect_usage`, `collect_stream`), so that an app can aggregate them per
+chat turn, conversation, user or model. Each record holds the stage of the
+pipeline it was made in (the current span of `kotaemon.base.tracing`, e.g.
+"retrieval.llm_scoring" or "answer.citation"), to find the auxiliary calls that
+dominate the spend.
+
+The cost of a call is computed from the `KH_LLM_PRICING` setting: the price in
+USD of one million input and output tokens of each model, e.g.
+    {"gpt-4o-mini": {"input": 0.15, "output": 0.6}}
+a model name also matches the longest key it starts with (e.g. "gpt-4o" for
+"gpt-4o-2024-08-06"). The calls of the models without price cost 0.
+"""
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Generator, Iterator, Optional, TypeVar
+
+from theflow.settings import settings as flowsettings
+
+from . import tracing
+
+T = TypeVar("T")
+
+# number of tokens added to the estimate for each message (role and separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+class Usage:
+    """Tokens and cost of a model call
+
+    Args:
+        kind: "chat" or "embedding"
+        model: the name of the model
+        prompt_tokens: the number of input tokens
+        completion_tokens: the number of generated tokens
+        cost: the cost in USD
+        estimated: whether the tokens are estimated with a local tokenizer
+        stage: the pipeline stage of the call (name of the current span)
+    """
+
+    __slots__ = (
+        "kind",
+        "model",
+        "prompt_tokens",
+        "completion_tokens",
+        "cost",
+        "estimated",
+        "stage",
+    )
+
+    def __init__(
+        self,
+        kind: str,
+        model: str,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+        cost: float = 0.0,
+        estimated: bool = False,
+        stage: str = "",
+    ):
+        self.kind = kind
+        self.model = model
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.cost = cost
+        self.estimated = estimated
+        self.stage = stage
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def to_dict(self) -> dict:
+        return {key: getattr(self, key) for key in self.__slots__}
+
+
+class UsageCollector:
+    """The usage records of the model calls made while it is active"""
+
+    def __init__(self):
+        self.records: list[Usage] = []
+        self._lock = threading.Lock()
+
+    def add(self, usage: Usage):
+        with self._lock:
+            self.records.append(usage)
+
+    def totals(self) -> dict[str, Any]:
+        """The number of calls, tokens and cost of all the records"""
+        return self.group_by().get((), _empty_totals())
+
+    def group_by(self, *keys: str) -> dict[tuple, dict[str, Any]]:
+        """The totals of the records by the values of some of their attributes,
+        e.g. `group_by("stage", "model")`"""
+        groups: dict[tuple, dict[str, Any]] = defaultdict(_empty_totals)
+        with self._lock:
+            records = list(self.records)
+        for usage in records:
+            totals = groups[tuple(getattr(usage, key) for key in keys)]
+            totals["calls"] += 1
+            totals["prompt_tokens"] += usage.prompt_tokens
+            totals["completion_tokens"] += usage.completion_tokens
+            totals["total_tokens"] += usage.total_tokens
+            totals["cost"] += usage.cost
+            totals["estimated"] = totals["estimated"] or usage.estimated
+        return dict(groups)
+
+
+def _empty_totals() -> dict[str, Any]:
+    return {
+        "calls": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "total_tokens": 0,
+        "cost": 0.0,
+        "estimated": False,
+    }
+
+
+_collectors: ContextVar[tuple[UsageCollector, ...]] = ContextVar(
+    "kotaemon_usage_collectors", default=()
+)
+
+
+@contextmanager
+def collect_usage(
+    collector: Optional[UsageCollector] = None,
+) -> Iterator[UsageCollector]:
+    """Collect the usage of the model calls made in the enclosed block, the
+    enclosing collectors still receive them"""
+    collector = collector or UsageCollector()
+    token = _collectors.set(_collectors.get() + (collector,))
+    try:
+        yield collector
+    finally:
+        _collectors.reset(token)
+
+
+def collect_stream(
+    stream: Generator[T, Any, Any], collector: UsageCollector
+) -> Generator[T, None, Any]:
+    """Collect the usage of the model calls made by a stream, whose steps may run
+    in different contexts (see `tracing.Tracer.stream_with_span`)"""
+    try:
+        while True:
+            with collect_usage(collector):
+                try:
+                    item = next(stream)
+                except StopIteration as e:
+                    return e.value
+            yield item
+    except GeneratorExit:
+        stream.close()
+        raise
+
+
+def get_price(model: str, pricing: Optional[dict] = None) -> Optional[dict]:
+    """Get the price of a model: exact name, else the longest matching prefix"""
+    if pricing is None:
+        pricing = getattr(flowsettings, "KH_LLM_PRICING", {})
+    if not pricing or not model:
+        return None
+    if model in pricing:
+        return pricing[model]
+    prefixes = [name for name in pricing if model.startswith(name)]
+    return pricing[max(prefixes, key=len)] if prefixes else None
+
+
+def compute_cost(
+    model: str,
+    prompt_tokens: int,
+    completion_tokens: int = 0,
+    pricing: Optional[dict] = None,
+) -> float:
+    """The cost in USD of a call, 0 if the model has no price"""
+    price = get_price(model, pricing)
+    if not price:
+        return 0.0
+    return (
+        prompt_tokens * price.get("input", 0.0)
+        + completion_tokens * price.get("output", 0.0)
+    ) / 1e6
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of tokens of a text with the cl100k tokenizer"""
+    if not text:
+        return 0
+    from kotaemon.indices.splitters.tiktoken_splitter import get_encoding
+
+    return len(get_encoding("gpt-4").encode(text, disallowed_special=()))
+
+
+def estimate_message_tokens(messages: Any) -> int:
+    """Estimate the number of tokens of the input of a chat model: a text, a
+    message or a list of messages (kotaemon, langchain or OpenAI format). The
+    images are not counted."""
+    if isinstance(messages, str):
+        return estimate_tokens(messages)
+    if not isinstance(messages, (list, tuple)):
+        messages = [messages]
+
+    count = 0
+    for message in messages:
+        content = (
+            message.get("content")
+            if isinstance(message, dict)
+            else getattr(message, "content", message)
+        )
+        if isinstance(content, list):
+            content = " ".join(
+                part.get("text", "") if isinstance(part, dict) else str(part)
+                for part in content
+            )
+        count += estimate_tokens(str(content or "")) + MESSAGE_OVERHEAD_TOKENS
+    return count
+
+
+def record_usage(
+    kind: str,
+    model: str,
+    prompt_tokens: int,
+    completion_tokens: int = 0,
+    estimated: bool = False,
+) -> Optional[Usage]:
+    """Record the usage of a model call to the active collectors
+
+    Returns:
+        the usage record, None if no collector is active
+    """
+    collectors = _collectors.get()
+    if not collectors:
+        return None
+
+    span = tracing.current_span()
+    usage = Usage(
+        kind=kind,
+        model=model or "",
+        prompt_tokens=max(prompt_tokens or 0, 0),
+        completion_tokens=max(completion_tokens or 0, 0),
+        estimated=estimated,
+        stage=span.name if span else "",
+    )
+    usage.cost = compute_cost(usage.model, usage.prompt_tokens, usage.completion_tokens)
+    for collector in collectors:
+        collector.add(usage)
+    return usage
+
+
+def record_chat_usage(
+    model: str,
+    messages: Any,
+    output: str,
+    prompt_tokens: Optional[int] = None,
+    completion_tokens: Optional[int] = None,
+) -> Optional[Usage]:
+    """Record the usage of a chat model call: the tokens reported by the API, else
+    (unknown or 0 input tokens) the tokens of the messages and of the output
+    estimated with a local tokenizer"""
+    if not is_collecting():
+        return None
+    if prompt_tokens:
+        return record_usage("chat", model, prompt_tokens, completion_tokens or 0)
+    return record_usage(
+        "chat",
+        model,
+        estimate_message_tokens(messages),
+        estimate_tokens(output),
+        estimated=True,
+    )
+
+
+def record_embedding_usage(
+    model: str, texts: list[str], prompt_tokens: Optional[int] = None
+) -> Optional[Usage]:
+    """Record the usage of an embedding model call, estimated if the API does not
+    report it"""
+    if not is_collecting():
+        return None
+    if prompt_tokens:
+        return record_usage("embedding", model, prompt_tokens)
+    return record_usage(
+        "embedding",
+        model,
+        sum(estimate_tokens(text) for text in texts),
+        estimated=True,
+    )
+
+
+def is_collecting() -> bool:
+    """Whether a collector is active, to skip the estimates otherwise"""
+    return bool(_collectors.get())
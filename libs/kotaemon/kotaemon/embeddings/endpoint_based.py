@@ -1,6 +1,7 @@
 import requests
 
 from kotaemon.base import Document, DocumentWithEmbedding
+from kotaemon.base.usage import record_embedding_usage
 
 from .base import BaseEmbeddings
 
@@ -34,6 +35,11 @@ class EndpointEmbeddings(BaseEmbeddings):
             response = requests.post(
                 self.endpoint_url, json={"input": str(item)}
             ).json()
+            record_embedding_usage(
+                response.get("model") or self.endpoint_url,
+                [str(item)],
+                prompt_tokens=response["usage"]["prompt_tokens"],
+            )
             outputs.append(
                 DocumentWithEmbedding(
                     text=str(item),
@@ -3,7 +3,6 @@ from typing import Optional
 
 import numpy as np
 import openai
-import tiktoken
 from tenacity import (
     retry,
     retry_if_not_exception_type,
@@ -13,6 +12,7 @@ from tenacity import (
 from theflow.utils.modules import import_dotted_string
 
 from kotaemon.base import Param
+from kotaemon.base.usage import record_embedding_usage
 
 from .base import BaseEmbeddings, Document, DocumentWithEmbedding
 
@@ -27,6 +27,8 @@ def split_text_by_chunk_size(text: str, chunk_size: int) -> list[list[int]]:
     Returns:
         list of chunks (as tokens)
     """
+    import tiktoken
+
     encoding = tiktoken.get_encoding("cl100k_base")
     tokens = iter(encoding.encode(text))
     result = []
@@ -84,6 +86,14 @@ class BaseOpenAIEmbeddings(BaseEmbeddings):
         """Get the openai response"""
         raise NotImplementedError
 
+    def record_usage(self, resp: dict, texts: list[str]):
+        """Record the usage of a call (see `kotaemon.base.usage`)"""
+        record_embedding_usage(
+            resp.get("model", ""),
+            texts,
+            prompt_tokens=(resp.get("usage") or {}).get("prompt_tokens"),
+        )
+
     def invoke(
         self, text: str | list[str] | Document | list[Document], *args, **kwargs
     ) -> list[DocumentWithEmbedding]:
@@ -102,6 +112,7 @@ class BaseOpenAIEmbeddings(BaseEmbeddings):
                 input_.append(text.text)
 
         resp = self.openai_response(client, input=input_, **kwargs).dict()
+        self.record_usage(resp, [doc.text for doc in input_doc])
         output_ = list(sorted(resp["data"], key=lambda x: x["index"]))
 
         output = []
@@ -132,6 +143,7 @@ class BaseOpenAIEmbeddings(BaseEmbeddings):
         resp = await self.openai_response(
             client, input=[_.text if _.text else " " for _ in input_], **kwargs
         ).dict()
+        self.record_usage(resp, [doc.text for doc in input_])
         output_ = sorted(resp["data"], key=lambda x: x["index"])
         return [
             DocumentWithEmbedding(embedding=o["embedding"], content=i)
@@ -18,8 +18,10 @@ from kotaemon.loaders import (
     MathpixPDFReader,
     MhtmlReader,
     OCRReader,
-    PandasExcelReader,
     PDFThumbnailReader,
+    ReaderCache,
+    ShardedPDFReader,
+    SpreadsheetReader,
     TxtReader,
     UnstructuredReader,
     WebReader,
@@ -38,9 +40,31 @@ adobe_reader.vlm_endpoint = (
     azure_reader.vlm_endpoint
 ) = docling_reader.vlm_endpoint = getattr(flowsettings, "KH_VLM_ENDPOINT", "")
 
+pdf_loader_workers = int(getattr(flowsettings, "KH_PDF_LOADER_WORKERS", 0))
+pdf_reader = (
+    ShardedPDFReader(
+        reader_class="kotaemon.loaders.PDFThumbnailReader",
+        num_workers=pdf_loader_workers,
+    )
+    if pdf_loader_workers > 1
+    else PDFThumbnailReader()
+)
+
+reader_cache_dir = getattr(flowsettings, "KH_READER_CACHE_DIR", None)
+reader_cache = (
+    ReaderCache(
+        reader_cache_dir,
+        max_size=int(getattr(flowsettings, "KH_READER_CACHE_MAX_SIZE_MB", 2048))
+        * 1024**2,
+    )
+    if reader_cache_dir
+    else None
+)
+
 
 KH_DEFAULT_FILE_EXTRACTORS: dict[str, BaseReader] = {
-    ".xlsx": PandasExcelReader(),
+    ".xlsx": SpreadsheetReader(),
+    ".csv": SpreadsheetReader(),
     ".docx": unstructured,
     ".pptx": unstructured,
     ".xls": unstructured,
@@ -52,7 +76,7 @@ KH_DEFAULT_FILE_EXTRACTORS: dict[str, BaseReader] = {
     ".jpg": unstructured,
     ".tiff": unstructured,
     ".tif": unstructured,
-    ".pdf": PDFThumbnailReader(),
+    ".pdf": pdf_reader,
     ".txt": TxtReader(),
     ".md": TxtReader(),
 }
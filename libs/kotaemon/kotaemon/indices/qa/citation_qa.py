@@ -1,5 +1,7 @@
+import logging
 import threading
 from collections import defaultdict
+from contextvars import copy_context
 from typing import Generator
 
 import numpy as np
@@ -13,8 +15,11 @@ from kotaemon.base import (
     HumanMessage,
     Node,
     SystemMessage,
+    tracing,
 )
 from kotaemon.llms import ChatLLM, PromptTemplate
+from kotaemon.llms.cache import cached_llm
+from kotaemon.llms.scheduler import Priority, priority
 
 from .citation import CitationPipeline
 from .format_context import (
@@ -22,7 +27,7 @@ from .format_context import (
     EVIDENCE_MODE_TABLE,
     EVIDENCE_MODE_TEXT,
 )
-from .utils import find_text
+from .utils import SpanMatcher, find_text
 
 try:
     from ktem.llms.manager import llms
@@ -31,6 +36,8 @@ try:
 except ImportError:
     raise ImportError("Please install `ktem` to use this component")
 
+logger = logging.getLogger(__name__)
+
 MAX_IMAGES = 10
 CITATION_TIMEOUT = 5.0
 CONTEXT_RELEVANT_WARNING_SCORE = config(
@@ -99,10 +106,14 @@ class AnswerWithContextPipeline(BaseComponent):
     vlm_endpoint: str = getattr(flowsettings, "KH_VLM_ENDPOINT", "")
     use_multimodal: bool = getattr(flowsettings, "KH_REASONINGS_USE_MULTIMODAL", True)
     citation_pipeline: CitationPipeline = Node(
-        default_callback=lambda _: CitationPipeline(llm=llms.get_default())
+        default_callback=lambda _: CitationPipeline(
+            llm=cached_llm(llms.get_default(), "CitationPipeline")
+        )
     )
     create_mindmap_pipeline: CreateMindmapPipeline = Node(
-        default_callback=lambda _: CreateMindmapPipeline(llm=llms.get_default())
+        default_callback=lambda _: CreateMindmapPipeline(
+            llm=cached_llm(llms.get_default(), "CreateMindmapPipeline")
+        )
     )
 
     qa_template: str = DEFAULT_QA_TEXT_PROMPT
@@ -196,7 +207,7 @@ class AnswerWithContextPipeline(BaseComponent):
         **kwargs,
     ) -> Generator[Document, None, Document]:
         history = kwargs.get("history", [])
-        print(f"Got {len(images)} images")
+        logger.debug(f"Got {len(images)} images")
         # check if evidence exists, use QA prompt
         if evidence:
             prompt, evidence = self.get_prompt(question, evidence, evidence_mode)
@@ -209,11 +220,15 @@ class AnswerWithContextPipeline(BaseComponent):
 
         def citation_call():
             nonlocal citation
-            citation = self.citation_pipeline(context=evidence, question=question)
+            with tracing.span("answer.citation"), priority(Priority.AUXILIARY):
+                citation = self.citation_pipeline(context=evidence, question=question)
 
         def mindmap_call():
             nonlocal mindmap
-            mindmap = self.create_mindmap_pipeline(context=evidence, question=question)
+            with tracing.span("answer.mindmap"), priority(Priority.AUXILIARY):
+                mindmap = self.create_mindmap_pipeline(
+                    context=evidence, question=question
+                )
 
         citation_thread = None
         mindmap_thread = None
@@ -221,11 +236,15 @@ class AnswerWithContextPipeline(BaseComponent):
         # execute function call in thread
         if evidence:
             if self.enable_citation:
-                citation_thread = threading.Thread(target=citation_call)
+                citation_thread = threading.Thread(
+                    target=copy_context().run, args=(citation_call,)
+                )
                 citation_thread.start()
 
             if self.enable_mindmap:
-                mindmap_thread = threading.Thread(target=mindmap_call)
+                mindmap_thread = threading.Thread(
+                    target=copy_context().run, args=(mindmap_call,)
+                )
                 mindmap_thread.start()
 
         output = ""
@@ -259,17 +278,34 @@ class AnswerWithContextPipeline(BaseComponent):
             # append main prompt
             messages.append(HumanMessage(content=prompt))
 
+        generation = tracing.start_span("answer.generation")
+        first_token = True
+        llm_stream = None
         try:
             # try streaming first
-            print("Trying LLM streaming")
-            for out_msg in self.llm.stream(messages):
+            logger.debug("Trying LLM streaming")
+            llm_stream = tracing.stream_with_span(self.llm.stream(messages), generation)
+            for out_msg in llm_stream:
+                if first_token:
+                    generation.mark("answer.first_token")
+                    first_token = False
                 output += out_msg.text
                 logprobs += out_msg.logprobs
                 yield Document(channel="chat", content=out_msg.text)
         except NotImplementedError:
-            print("Streaming is not supported, falling back to normal processing")
-            output = self.llm(messages).text
+            logger.debug(
+                "Streaming is not supported, falling back to normal processing"
+            )
+            with tracing.use_span(generation):
+                output = self.llm(messages).text
+            generation.mark("answer.first_token")
             yield Document(channel="chat", content=output)
+        finally:
+            # close the model stream explicitly (e.g. when the answer is cut or
+            # the consumer stops), so that its scheduler slot is released now
+            if llm_stream is not None:
+                llm_stream.close()
+            generation.end()
 
         if logprobs:
             qa_score = np.exp(np.average(logprobs))
@@ -301,10 +337,12 @@ class AnswerWithContextPipeline(BaseComponent):
             return spans
 
         evidences = answer.metadata["citation"].evidences
+        # index each document once for all the evidences
+        matchers = [SpanMatcher.from_context(doc.text) for doc in docs]
         for quote in evidences:
             matched_excerpts = []
-            for doc in docs:
-                matches = find_text(quote, doc.text)
+            for doc, matcher in zip(docs, matchers):
+                matches = find_text(quote, doc.text, matcher=matcher)
 
                 for start, end in matches:
                     if "|" not in doc.text[start:end]:
@@ -324,7 +362,8 @@ class AnswerWithContextPipeline(BaseComponent):
         with_citation, without_citation = [], []
         has_llm_score = any("llm_trulens_score" in doc.metadata for doc in docs)
 
-        spans = self.match_evidence_with_context(answer, docs)
+        with tracing.span("answer.citation_matching", n_docs=len(docs)):
+            spans = self.match_evidence_with_context(answer, docs)
         id2docs = {doc.doc_id: doc for doc in docs}
         not_detected = set(id2docs.keys()) - set(spans.keys())
 
@@ -376,7 +415,7 @@ class AnswerWithContextPipeline(BaseComponent):
                 )
             )
 
-        print("Got {} cited docs".format(len(with_citation)))
+        logger.debug(f"Got {len(with_citation)} cited docs")
 
         sorted_not_detected_items_with_scores = [
             (id_, id2docs[id_].metadata.get("llm_trulens_score", 0.0))
@@ -1,17 +1,27 @@
+import logging
 import re
 import threading
 from collections import defaultdict
-from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
 from typing import Generator
 
 import numpy as np
 
-from kotaemon.base import AIMessage, Document, HumanMessage, SystemMessage
+from kotaemon.base import AIMessage, Document, HumanMessage, SystemMessage, tracing
 from kotaemon.llms import PromptTemplate
+from kotaemon.llms.scheduler import Priority, priority
 
 from .citation_qa import CITATION_TIMEOUT, MAX_IMAGES, AnswerWithContextPipeline
 from .format_context import EVIDENCE_MODE_FIGURE
-from .utils import find_start_end_phrase
+from .utils import (
+    InlineCitationParser,
+    InlineEvidence,
+    SpanMatcher,
+    find_start_end_phrase,
+)
+
+logger = logging.getLogger(__name__)
 
 DEFAULT_QA_CITATION_PROMPT = """
 Use the following pieces of context to answer the question at the end.
@@ -69,18 +79,6 @@ ANSWER:
 
 START_ANSWER = "FINAL ANSWER"
 START_CITATION = "CITATION LIST"
-CITATION_PATTERN = r"citation【(\d+)】"
-START_ANSWER_PATTERN = "start_phrase:"
-END_ANSWER_PATTERN = "end_phrase:"
-
-
-@dataclass
-class InlineEvidence:
-    """List of evidences to support the answer."""
-
-    start_phrase: str | None = None
-    end_phrase: str | None = None
-    idx: int | None = None
 
 
 class AnswerWithInlineCitation(AnswerWithContextPipeline):
@@ -101,53 +99,34 @@ class AnswerWithInlineCitation(AnswerWithContextPipeline):
         return prompt, evidence
 
     def answer_to_citations(self, answer) -> list[InlineEvidence]:
-        citations: list[InlineEvidence] = []
-        lines = answer.split("\n")
-
-        current_evidence = None
-
-        for line in lines:
-            # check citation idx using regex
-            match = re.match(CITATION_PATTERN, line.lower())
-
-            if match:
-                try:
-                    parsed_citation_idx = int(match.group(1))
-                except ValueError:
-                    parsed_citation_idx = None
-
-                # conclude the current evidence if exists
-                if current_evidence:
-                    citations.append(current_evidence)
-                    current_evidence = None
-
-                current_evidence = InlineEvidence(idx=parsed_citation_idx)
-            else:
-                for keyword in [START_ANSWER_PATTERN, END_ANSWER_PATTERN]:
-                    if line.lower().startswith(keyword):
-                        matched_phrase = line[len(keyword) :].strip()
-                        if not current_evidence:
-                            current_evidence = InlineEvidence(idx=None)
-
-                        if keyword == START_ANSWER_PATTERN:
-                            current_evidence.start_phrase = matched_phrase
-                        else:
-                            current_evidence.end_phrase = matched_phrase
-
-                        break
-
-            if (
-                current_evidence
-                and current_evidence.end_phrase
-                and current_evidence.start_phrase
-            ):
-                citations.append(current_evidence)
-                current_evidence = None
-
-        if current_evidence:
-            citations.append(current_evidence)
-
-        return citations
+        parser = InlineCitationParser()
+        return parser.feed(answer) + parser.close()
+
+    def match_phrases(
+        self, evidence: InlineEvidence, docs, matchers: dict
+    ) -> dict[str, tuple]:
+        """Match the phrases of an evidence with each document
+
+        Args:
+            evidence: the evidence
+            docs: the documents
+            matchers: the `SpanMatcher` of the documents by id, the missing ones
+                are added
+
+        Returns:
+            the (match, match length) of `find_start_end_phrase` by document id
+        """
+        matches = {}
+        for doc in docs:
+            if doc.doc_id not in matchers:
+                matchers[doc.doc_id] = SpanMatcher.from_context(doc.text)
+            matches[doc.doc_id] = find_start_end_phrase(
+                evidence.start_phrase,
+                evidence.end_phrase,
+                doc.text,
+                matcher=matchers[doc.doc_id],
+            )
+        return matches
 
     def replace_citation_with_link(self, answer: str):
         # Define the regex pattern to match 【number】
@@ -199,7 +178,7 @@ class AnswerWithInlineCitation(AnswerWithContextPipeline):
         **kwargs,
     ) -> Generator[Document, None, Document]:
         history = kwargs.get("history", [])
-        print(f"Got {len(images)} images")
+        logger.debug(f"Got {len(images)} images")
         # check if evidence exists, use QA prompt
         if evidence:
             prompt, evidence = self.get_prompt(question, evidence, evidence_mode)
@@ -214,14 +193,19 @@ class AnswerWithInlineCitation(AnswerWithContextPipeline):
 
         def mindmap_call():
             nonlocal mindmap
-            mindmap = self.create_mindmap_pipeline(context=evidence, question=question)
+            with tracing.span("answer.mindmap"), priority(Priority.AUXILIARY):
+                mindmap = self.create_mindmap_pipeline(
+                    context=evidence, question=question
+                )
 
         mindmap_thread = None
 
         # execute function call in thread
         if evidence:
             if self.enable_mindmap:
-                mindmap_thread = threading.Thread(target=mindmap_call)
+                mindmap_thread = threading.Thread(
+                    target=copy_context().run, args=(mindmap_call,)
+                )
                 mindmap_thread.start()
 
         messages = []
@@ -254,10 +238,36 @@ class AnswerWithInlineCitation(AnswerWithContextPipeline):
 
         final_answer = ""
 
+        # parse the citations while streaming, and match their phrases with the
+        # retrieved documents (if given) in the background
+        docs = kwargs.get("docs") or []
+        citation_parser = InlineCitationParser()
+        citations: list[InlineEvidence] = []
+        phrase_matches: list = []
+        matchers: dict = {}
+        match_executor = (
+            ThreadPoolExecutor(max_workers=1) if evidence and docs else None
+        )
+
+        def add_citations(completed: list[InlineEvidence]):
+            for item in completed:
+                citations.append(item)
+                if match_executor:
+                    phrase_matches.append(
+                        match_executor.submit(self.match_phrases, item, docs, matchers)
+                    )
+
+        generation = tracing.start_span("answer.generation")
+        first_token = True
+        llm_stream = None
         try:
             # try streaming first
-            print("Trying LLM streaming")
-            for out_msg in self.llm.stream(messages):
+            logger.debug("Trying LLM streaming")
+            llm_stream = tracing.stream_with_span(self.llm.stream(messages), generation)
+            for out_msg in llm_stream:
+                if first_token:
+                    generation.mark("answer.first_token")
+                    first_token = False
                 if evidence:
                     if START_ANSWER in output:
                         if not final_answer:
@@ -284,17 +294,43 @@ class AnswerWithInlineCitation(AnswerWithContextPipeline):
 
                 output += out_msg.text
                 logprobs += out_msg.logprobs
+                add_citations(citation_parser.feed(out_msg.text))
         except NotImplementedError:
-            print("Streaming is not supported, falling back to normal processing")
-            output = self.llm(messages).text
+            logger.debug(
+                "Streaming is not supported, falling back to normal processing"
+            )
+            with tracing.use_span(generation):
+                output = self.llm(messages).text
+            generation.mark("answer.first_token")
             yield Document(channel="chat", content=output)
 
+            citation_parser = InlineCitationParser()
+            citations.clear()
+            phrase_matches.clear()
+            add_citations(citation_parser.feed(output))
+        finally:
+            # the stream is left at the citation list, free its model slot
+            if llm_stream is not None:
+                llm_stream.close()
+            generation.end()
+
         if logprobs:
             qa_score = np.exp(np.average(logprobs))
         else:
             qa_score = None
 
-        citation = self.answer_to_citations(output)
+        add_citations(citation_parser.close())
+        citation = citations
+
+        # the phrases matched during the streaming, by citation index
+        citation_matches = {}
+        for e_id, future in enumerate(phrase_matches):
+            try:
+                citation_matches[e_id] = future.result()
+            except Exception as e:
+                logger.warning(f"Failed to match the citation phrases: {e}")
+        if match_executor:
+            match_executor.shutdown()
 
         if mindmap_thread:
             mindmap_thread.join(timeout=CITATION_TIMEOUT)
@@ -306,6 +342,7 @@ class AnswerWithInlineCitation(AnswerWithContextPipeline):
                 "citation_viz": self.enable_citation_viz,
                 "mindmap": mindmap,
                 "citation": citation,
+                "citation_matches": citation_matches,
                 "qa_score": qa_score,
             },
         )
@@ -327,9 +364,12 @@ class AnswerWithInlineCitation(AnswerWithContextPipeline):
             return spans
 
         evidences = answer.metadata["citation"]
+        # the phrases already matched while streaming the answer
+        citation_matches = answer.metadata.get("citation_matches") or {}
+        # index each document once for all the evidences
+        matchers: dict = {}
 
         for e_id, evidence in enumerate(evidences):
-            start_phrase, end_phrase = evidence.start_phrase, evidence.end_phrase
             evidence_idx = evidence.idx
 
             if evidence_idx is None:
@@ -339,10 +379,12 @@ class AnswerWithInlineCitation(AnswerWithContextPipeline):
             best_match_length = 0
             best_match_doc_idx = None
 
+            doc_matches = citation_matches.get(e_id, {})
+            if any(doc.doc_id not in doc_matches for doc in docs):
+                doc_matches = self.match_phrases(evidence, docs, matchers)
+
             for doc in docs:
-                match, match_length = find_start_end_phrase(
-                    start_phrase, end_phrase, doc.text
-                )
+                match, match_length = doc_matches[doc.doc_id]
                 if best_match is None or (
                     match is not None and match_length > best_match_length
                 ):
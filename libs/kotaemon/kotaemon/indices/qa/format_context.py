@@ -1,10 +1,15 @@
 import html
-from functools import partial
-
-import tiktoken
+import logging
 
 from kotaemon.base import BaseComponent, Document, RetrievedDocument
+from kotaemon.base.tracing import span
 from kotaemon.indices.splitters import TokenSplitter
+from kotaemon.indices.splitters.tiktoken_splitter import (
+    get_token_count,
+    get_token_func,
+)
+
+logger = logging.getLogger(__name__)
 
 EVIDENCE_MODE_TEXT = 0
 EVIDENCE_MODE_TABLE = 1
@@ -17,6 +22,10 @@ class PrepareEvidencePipeline(BaseComponent):
 
     This step usually happens after `DocumentRetrievalPipeline`.
 
+    The evidence is only tokenized to be trimmed when it may not fit in
+    `max_context_length`: its size is first estimated from the number of tokens of
+    the chunks recorded at indexing time (see `set_token_count`).
+
     Args:
         trim_func: a callback function or a BaseComponent, that splits a large
             chunk of text into smaller ones. The first one will be retained.
@@ -25,26 +34,29 @@ class PrepareEvidencePipeline(BaseComponent):
     max_context_length: int = 32000
     trim_func: TokenSplitter | None = None
 
+    def get_trim_func(self):
+        if self.trim_func:
+            return self.trim_func
+        return TokenSplitter(
+            chunk_size=self.max_context_length,
+            chunk_overlap=0,
+            separator=" ",
+            tokenizer=get_token_func(
+                "gpt-3.5-turbo", allowed_special=set(), disallowed_special="all"
+            ),
+        )
+
     def run(self, docs: list[RetrievedDocument]) -> Document:
+        with span("answer.evidence", n_docs=len(docs)):
+            return self.prepare_evidence(docs)
+
+    def prepare_evidence(self, docs: list[RetrievedDocument]) -> Document:
         evidence = ""
         images = []
         table_found = 0
         evidence_modes = []
-
-        evidence_trim_func = (
-            self.trim_func
-            if self.trim_func
-            else TokenSplitter(
-                chunk_size=self.max_context_length,
-                chunk_overlap=0,
-                separator=" ",
-                tokenizer=partial(
-                    tiktoken.encoding_for_model("gpt-3.5-turbo").encode,
-                    allowed_special=set(),
-                    disallowed_special="all",
-                ),
-            )
-        )
+        # number of tokens and bytes of the evidence from counted chunks
+        counted_tokens = counted_bytes = 0
 
         for _, retrieved_item in enumerate(docs):
             retrieved_content = ""
@@ -85,12 +97,17 @@ class PrepareEvidencePipeline(BaseComponent):
                 )
                 images.append(retrieved_content)
             else:
+                n_tokens = None
                 if "window" in retrieved_item.metadata:
                     retrieved_content = retrieved_item.metadata["window"]
                 else:
                     retrieved_content = retrieved_item.text
+                    n_tokens = get_token_count(retrieved_item)
                 retrieved_content = retrieved_content.replace("\n", " ")
                 if retrieved_content not in evidence:
+                    if n_tokens is not None:
+                        counted_tokens += n_tokens
+                        counted_bytes += len(retrieved_content.encode())
                     evidence += (
                         f"<br><b>Content from {source}: </b> "
                         + retrieved_content
@@ -104,11 +121,13 @@ class PrepareEvidencePipeline(BaseComponent):
         elif EVIDENCE_MODE_TABLE in evidence_modes:
             evidence_mode = EVIDENCE_MODE_TABLE
 
-        # trim context by trim_len
-        print("len (original)", len(evidence))
-        if evidence:
-            texts = evidence_trim_func([Document(text=evidence)])
+        # trim context by trim_len, the number of bytes of the rest of the evidence
+        # is an upper bound of its number of tokens (tokens are at least 1 byte)
+        logger.debug(f"Evidence length (original): {len(evidence)}")
+        estimated_tokens = counted_tokens + len(evidence.encode()) - counted_bytes
+        if evidence and estimated_tokens > self.max_context_length * 0.9:
+            texts = self.get_trim_func()([Document(text=evidence)])
             evidence = texts[0].text
-            print("len (trimmed)", len(evidence))
+            logger.debug(f"Evidence length (trimmed): {len(evidence)}")
 
         return Document(content=(evidence_mode, evidence, images))
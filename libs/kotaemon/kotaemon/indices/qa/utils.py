@@ -1,27 +1,169 @@
-from difflib import SequenceMatcher
+import re
+from dataclasses import dataclass
+from typing import Optional
 
+# the lines of the citation list of the inline citation answers
+CITATION_PATTERN = r"citation【(\d+)】"
+START_ANSWER_PATTERN = "start_phrase:"
+END_ANSWER_PATTERN = "end_phrase:"
 
-def find_text(search_span, context, min_length=5):
-    search_span, context = search_span.lower(), context.lower()
+# largest n-gram indexed by `SpanMatcher`, longer n-grams make fewer candidates
+MAX_NGRAM = 12
+
+
+class SpanMatcher:
+    """Index of the character n-grams of a text, to find the blocks of a sentence
+    that also appear in the text
+
+    It gives the same blocks as `difflib.SequenceMatcher(None, sentence, text,
+    autojunk=False)` for the blocks longer than a minimum length, without comparing
+    the sentence with the whole text: every block of at least `min_size`
+    characters contains one of the n-grams of the sentence sampled every
+    `min_size - n + 1` characters, so the blocks are found by looking up these
+    n-grams in the index and extending the hits. The index of each n-gram size is
+    built once, and reused for all the sentences searched in the text.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self._indices: dict[int, dict[str, list[int]]] = {}
+
+    @classmethod
+    def from_context(cls, context: str) -> "SpanMatcher":
+        """Index a context as searched by `find_text` and `find_start_end_phrase`"""
+        return cls(context.lower().replace("\n", " "))
+
+    def _index(self, n: int) -> dict[str, list[int]]:
+        index = self._indices.get(n)
+        if index is None:
+            index = {}
+            text = self.text
+            for pos in range(len(text) - n + 1):
+                index.setdefault(text[pos : pos + n], []).append(pos)
+            self._indices[n] = index
+        return index
+
+    def maximal_matches(self, sentence: str, min_size: int) -> list[tuple]:
+        """Find the maximal common blocks of at least `min_size` characters
+
+        Returns:
+            the (start in sentence, start in text, size) of each block
+        """
+        if min_size < 1 or len(sentence) < min_size or len(self.text) < min_size:
+            return []
+
+        n = min(min_size, MAX_NGRAM)
+        step = min_size - n + 1
+        index = self._index(n)
+        text = self.text
+
+        matches = []
+        # end of the last block found on each diagonal, the hits are visited in
+        # the order of the sentence so a hit inside this block is skipped
+        block_ends: dict[int, int] = {}
+        for i in range(0, len(sentence) - n + 1, step):
+            for j in index.get(sentence[i : i + n], ()):
+                if block_ends.get(j - i, -1) >= i + n:
+                    continue
+                # extend the hit on its diagonal
+                start = 0
+                while (
+                    i - start > 0
+                    and j - start > 0
+                    and sentence[i - start - 1] == text[j - start - 1]
+                ):
+                    start += 1
+                end = n
+                while (
+                    i + end < len(sentence)
+                    and j + end < len(text)
+                    and sentence[i + end] == text[j + end]
+                ):
+                    end += 1
+                block_ends[j - i] = i + end
+                if start + end >= min_size:
+                    matches.append((i - start, j - start, start + end))
+
+        return matches
+
+    @staticmethod
+    def _longest(matches: list[tuple], alo: int, ahi: int, blo: int, bhi: int):
+        """Longest block inside the ranges, the earliest in the sentence then in
+        the text in case of tie, as `SequenceMatcher.find_longest_match`"""
+        best_i, best_j, best_size = alo, blo, 0
+        for i, j, size in matches:
+            start = max(alo - i, blo - j, 0)
+            end = min(ahi - i, bhi - j, size)
+            if end - start > best_size or (
+                end - start == best_size
+                and best_size > 0
+                and (i + start, j + start) < (best_i, best_j)
+            ):
+                best_i, best_j, best_size = i + start, j + start, end - start
+        return best_i, best_j, best_size
+
+    def longest_match(self, sentence: str, min_size: int) -> Optional[tuple]:
+        """Find the longest common block if it has at least `min_size` characters
+
+        Returns:
+            the (start in sentence, start in text, size) of the block or None
+        """
+        matches = self.maximal_matches(sentence, min_size)
+        if not matches:
+            return None
+        return self._longest(matches, 0, len(sentence), 0, len(self.text))
+
+    def matching_blocks(self, sentence: str, min_size: int) -> list[tuple]:
+        """Find the blocks of at least `min_size` characters that
+        `SequenceMatcher.get_matching_blocks` would return
+
+        Returns:
+            the (start in sentence, start in text, size) of each block, sorted
+        """
+        matches = self.maximal_matches(sentence, min_size)
+        blocks = []
+        queue = [(0, len(sentence), 0, len(self.text))]
+        while queue:
+            alo, ahi, blo, bhi = queue.pop()
+            i, j, size = self._longest(matches, alo, ahi, blo, bhi)
+            # the blocks inside the remaining ranges are not longer than this one
+            if size < min_size:
+                continue
+            blocks.append((i, j, size))
+            if alo < i and blo < j:
+                queue.append((alo, i, blo, j))
+            if i + size < ahi and j + size < bhi:
+                queue.append((i + size, ahi, j + size, bhi))
+        return sorted(blocks)
+
+
+def find_text(search_span, context, min_length=5, matcher=None):
+    """Find the span of the context matching the search span
+
+    Args:
+        search_span: the text to search, its lines are searched separately
+        context: the text to search in
+        min_length: the minimum length of the matched blocks
+        matcher: the `SpanMatcher.from_context` of the context, to reuse the same
+            index when searching several spans in the same context
+    """
+    search_span = search_span.lower()
+    matcher = matcher or SpanMatcher.from_context(context)
 
     sentence_list = search_span.split("\n")
-    context = context.replace("\n", " ")
 
     matches_span = []
     # don't search for small text
     if len(search_span) > min_length:
         for sentence in sentence_list:
-            match_results = SequenceMatcher(
-                None,
-                sentence,
-                context,
-                autojunk=False,
-            ).get_matching_blocks()
-
-            matched_blocks = []
-            for _, start, length in match_results:
-                if length > max(len(sentence) * 0.25, min_length):
-                    matched_blocks.append((start, start + length))
+            # only the blocks longer than the threshold are used
+            threshold = max(len(sentence) * 0.25, min_length)
+            matched_blocks = [
+                (start, start + length)
+                for _, start, length in matcher.matching_blocks(
+                    sentence, int(threshold) + 1
+                )
+            ]
 
             if matched_blocks:
                 start_index = min(start for start, _ in matched_blocks)
@@ -42,12 +184,15 @@ def find_text(search_span, context, min_length=5):
 
 
 def find_start_end_phrase(
-    start_phrase, end_phrase, context, min_length=5, max_excerpt_length=300
+    start_phrase,
+    end_phrase,
+    context,
+    min_length=5,
+    max_excerpt_length=300,
+    matcher=None,
 ):
     start_phrase, end_phrase = start_phrase.lower(), end_phrase.lower()
-    context = context.lower()
-
-    context = context.replace("\n", " ")
+    matcher = matcher or SpanMatcher.from_context(context)
 
     matches = []
     matched_length = 0
@@ -55,12 +200,11 @@ def find_start_end_phrase(
         if sentence is None:
             continue
 
-        match = SequenceMatcher(
-            None, sentence, context, autojunk=False
-        ).find_longest_match()
-        if match.size > max(len(sentence) * 0.35, min_length):
-            matches.append((match.b, match.b + match.size))
-            matched_length += match.size
+        threshold = max(len(sentence) * 0.35, min_length)
+        match = matcher.longest_match(sentence, int(threshold) + 1)
+        if match is not None and match[2] > threshold:
+            matches.append((match[1], match[1] + match[2]))
+            matched_length += match[2]
 
     # check if second match is before the first match
     if len(matches) == 2 and matches[1][0] < matches[0][0]:
@@ -95,3 +239,80 @@ def strip_think_tag(text):
     if "</think>" in text:
         text = text.split("</think>")[1]
     return text
+
+
+@dataclass
+class InlineEvidence:
+    """List of evidences to support the answer."""
+
+    start_phrase: str | None = None
+    end_phrase: str | None = None
+    idx: int | None = None
+
+
+class InlineCitationParser:
+    """Parse the citation list of an answer while it is streamed
+
+    The output of the LLM is fed as it arrives, and each citation is returned as
+    soon as its block is complete (both phrases are found, or the next citation
+    starts). Feeding the whole output then closing the parser gives the same
+    citations as parsing the complete answer.
+    """
+
+    def __init__(self):
+        self._line = ""
+        self._current: InlineEvidence | None = None
+
+    def feed(self, text: str) -> list[InlineEvidence]:
+        """Feed a chunk of the output, return the citations completed by it"""
+        *lines, self._line = (self._line + text).split("\n")
+        citations: list[InlineEvidence] = []
+        for line in lines:
+            citations.extend(self._parse_line(line))
+        return citations
+
+    def close(self) -> list[InlineEvidence]:
+        """End of the output, return the remaining citations"""
+        citations = self._parse_line(self._line)
+        self._line = ""
+        if self._current:
+            citations.append(self._current)
+            self._current = None
+        return citations
+
+    def _parse_line(self, line: str) -> list[InlineEvidence]:
+        citations = []
+
+        # check citation idx using regex
+        match = re.match(CITATION_PATTERN, line.lower())
+
+        if match:
+            try:
+                parsed_citation_idx = int(match.group(1))
+            except ValueError:
+                parsed_citation_idx = None
+
+            # conclude the current evidence if exists
+            if self._current:
+                citations.append(self._current)
+
+            self._current = InlineEvidence(idx=parsed_citation_idx)
+        else:
+            for keyword in [START_ANSWER_PATTERN, END_ANSWER_PATTERN]:
+                if line.lower().startswith(keyword):
+                    matched_phrase = line[len(keyword) :].strip()
+                    if not self._current:
+                        self._current = InlineEvidence(idx=None)
+
+                    if keyword == START_ANSWER_PATTERN:
+                        self._current.start_phrase = matched_phrase
+                    else:
+                        self._current.end_phrase = matched_phrase
+
+                    break
+
+        if self._current and self._current.end_phrase and self._current.start_phrase:
+            citations.append(self._current)
+            self._current = None
+
+        return citations
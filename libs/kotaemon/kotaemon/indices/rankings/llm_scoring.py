@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
 
 import numpy as np
 from langchain.output_parsers.boolean import BooleanOutputParser
@@ -27,7 +28,10 @@ class LLMScoring(LLMReranking):
                     _prompt = self.prompt_template.populate(
                         question=query, context=doc.get_content()
                     )
-                    futures.append(executor.submit(lambda: self.llm(_prompt)))
+                    # the calls are traced and accounted in the caller's context
+                    futures.append(
+                        executor.submit(copy_context().run, self.llm, _prompt)
+                    )
 
                 results = [future.result() for future in futures]
         else:
@@ -1,17 +1,19 @@
 from __future__ import annotations
 
+import logging
 import re
 from concurrent.futures import ThreadPoolExecutor
-from functools import partial
-
-import tiktoken
+from contextvars import copy_context
 
 from kotaemon.base import Document, HumanMessage, SystemMessage
 from kotaemon.indices.splitters import TokenSplitter
+from kotaemon.indices.splitters.tiktoken_splitter import get_token_func
 from kotaemon.llms import BaseLLM, PromptTemplate
 
 from .llm import LLMReranking
 
+logger = logging.getLogger(__name__)
+
 SYSTEM_PROMPT_TEMPLATE = PromptTemplate(
     """You are a RELEVANCE grader; providing the relevance of the given CONTEXT to the given QUESTION.
         Respond only as a number from 0 to 10 where 0 is the least relevant and 10 is the most relevant.
@@ -103,10 +105,8 @@ class LLMTrulensScoring(LLMReranking):
         chunk_size=MAX_CONTEXT_LEN,
         chunk_overlap=0,
         separator=" ",
-        tokenizer=partial(
-            tiktoken.encoding_for_model("gpt-3.5-turbo").encode,
-            allowed_special=set(),
-            disallowed_special="all",
+        tokenizer=get_token_func(
+            "gpt-3.5-turbo", allowed_special=set(), disallowed_special="all"
         ),
     )
 
@@ -142,10 +142,13 @@ class LLMTrulensScoring(LLMReranking):
                         )
                     )
 
-                    def llm_call():
+                    def llm_call(messages):
                         return self.llm(messages).text
 
-                    futures.append(executor.submit(llm_call))
+                    # the calls are traced and accounted in the caller's context
+                    futures.append(
+                        executor.submit(copy_context().run, llm_call, messages)
+                    )
 
                 results = [future.result() for future in futures]
         else:
@@ -174,9 +177,9 @@ class LLMTrulensScoring(LLMReranking):
             doc.metadata["llm_trulens_score"] = score
             filtered_docs.append(doc)
 
-        print(
-            "LLM rerank scores",
-            [doc.metadata["llm_trulens_score"] for doc in filtered_docs],
+        logger.debug(
+            "LLM rerank scores "
+            f"{[doc.metadata['llm_trulens_score'] for doc in filtered_docs]}"
         )
 
         return filtered_docs
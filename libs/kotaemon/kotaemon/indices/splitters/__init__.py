@@ -1,10 +1,13 @@
-from ..base import DocTransformer, LlamaIndexDocTransformerMixin
-
-
-class BaseSplitter(DocTransformer):
-    """Represent base splitter class"""
-
-    ...
+from ..base import LlamaIndexDocTransformerMixin
+from .base import BaseSplitter
+from .tiktoken_splitter import TiktokenSplitter
+
+__all__ = [
+    "BaseSplitter",
+    "TokenSplitter",
+    "SentenceWindowSplitter",
+    "TiktokenSplitter",
+]
 
 
 class TokenSplitter(LlamaIndexDocTransformerMixin, BaseSplitter):
@@ -1,19 +1,24 @@
 from __future__ import annotations
 
+import logging
 import threading
 import uuid
+from contextvars import copy_context
 from pathlib import Path
 from typing import Optional, Sequence, cast
 
 from theflow.settings import settings as flowsettings
 
-from kotaemon.base import BaseComponent, Document, RetrievedDocument
+from kotaemon.base import BaseComponent, Document, RetrievedChunk, RetrievedDocument
+from kotaemon.base.tracing import span
 from kotaemon.embeddings import BaseEmbeddings
 from kotaemon.storages import BaseDocumentStore, BaseVectorStore
 
 from .base import BaseIndexing, BaseRetrieval
 from .rankings import BaseReranking, LLMReranking
 
+logger = logging.getLogger(__name__)
+
 VECTOR_STORE_FNAME = "vectorstore"
 DOC_STORE_FNAME = "docstore"
 
@@ -78,15 +83,15 @@ class VectorIndexing(BaseIndexing):
 
     def add_to_docstore(self, docs: list[Document]):
         if self.doc_store:
-            print("Adding documents to doc store")
+            logger.debug("Adding documents to doc store")
             self.doc_store.add(docs)
 
     def add_to_vectorstore(self, docs: list[Document]):
         # in case we want to skip embedding
         if self.vector_store:
-            print(f"Getting embeddings for {len(docs)} nodes")
+            logger.debug(f"Getting embeddings for {len(docs)} nodes")
             embeddings = self.embedding(docs)
-            print("Adding embeddings to vector store")
+            logger.debug("Adding embeddings to vector store")
             self.vector_store.add(
                 embeddings=embeddings,
                 ids=[t.doc_id for t in docs],
@@ -124,9 +129,7 @@ class VectorRetrieval(BaseRetrieval):
     first_round_top_k_mult: int = 10
     retrieval_mode: str = "hybrid"  # vector, text, hybrid
 
-    def _filter_docs(
-        self, documents: list[RetrievedDocument], top_k: int | None = None
-    ):
+    def _filter_docs(self, documents: list, top_k: int | None = None) -> list:
         if top_k:
             documents = documents[:top_k]
         return documents
@@ -160,33 +163,36 @@ class VectorRetrieval(BaseRetrieval):
                 "retrieve the documents"
             )
 
-        result: list[RetrievedDocument] = []
+        chunks: list[RetrievedChunk] = []
         # TODO: should declare scope directly in the run params
         scope = kwargs.pop("scope", None)
         emb: list[float]
 
         if self.retrieval_mode == "vector":
-            emb = self.embedding(text)[0].embedding
-            _, scores, ids = self.vector_store.query(
-                embedding=emb, top_k=top_k_first_round, doc_ids=scope, **kwargs
-            )
-            docs = self.doc_store.get(ids)
-            result = [
-                RetrievedDocument(**doc.to_dict(), score=score)
-                for doc, score in zip(docs, scores)
+            with span("retrieval.embedding"):
+                emb = self.embedding(text)[0].embedding
+            with span("retrieval.vector_query", top_k=top_k_first_round):
+                _, scores, ids = self.vector_store.query(
+                    embedding=emb, top_k=top_k_first_round, doc_ids=scope, **kwargs
+                )
+                docs = self.doc_store.get(ids)
+            chunks = [
+                RetrievedChunk(doc, score=score) for doc, score in zip(docs, scores)
             ]
         elif self.retrieval_mode == "text":
             query = text.text if isinstance(text, Document) else text
             docs = []
             if scope:
-                docs = self.doc_store.query(
-                    query, top_k=top_k_first_round, doc_ids=scope
-                )
-            result = [RetrievedDocument(**doc.to_dict(), score=-1.0) for doc in docs]
+                with span("retrieval.fulltext_query", top_k=top_k_first_round):
+                    docs = self.doc_store.query(
+                        query, top_k=top_k_first_round, doc_ids=scope
+                    )
+            chunks = [RetrievedChunk(doc, score=-1.0) for doc in docs]
         elif self.retrieval_mode == "hybrid":
             # similarity search section
-            emb = self.embedding(text)[0].embedding
-            vs_docs: list[RetrievedDocument] = []
+            with span("retrieval.embedding"):
+                emb = self.embedding(text)[0].embedding
+            vs_docs: list[Document] = []
             vs_ids: list[str] = []
             vs_scores: list[float] = []
 
@@ -196,14 +202,15 @@ class VectorRetrieval(BaseRetrieval):
                 nonlocal vs_ids
 
                 assert self.doc_store is not None
-                _, vs_scores, vs_ids = self.vector_store.query(
-                    embedding=emb, top_k=top_k_first_round, doc_ids=scope, **kwargs
-                )
-                if vs_ids:
-                    vs_docs = self.doc_store.get(vs_ids)
+                with span("retrieval.vector_query", top_k=top_k_first_round):
+                    _, vs_scores, vs_ids = self.vector_store.query(
+                        embedding=emb, top_k=top_k_first_round, doc_ids=scope, **kwargs
+                    )
+                    if vs_ids:
+                        vs_docs = self.doc_store.get(vs_ids)
 
             # full-text search section
-            ds_docs: list[RetrievedDocument] = []
+            ds_docs: list[Document] = []
 
             def query_docstore():
                 nonlocal ds_docs
@@ -211,12 +218,18 @@ class VectorRetrieval(BaseRetrieval):
                 assert self.doc_store is not None
                 query = text.text if isinstance(text, Document) else text
                 if scope:
-                    ds_docs = self.doc_store.query(
-                        query, top_k=top_k_first_round, doc_ids=scope
-                    )
-
-            vs_query_thread = threading.Thread(target=query_vectorstore)
-            ds_query_thread = threading.Thread(target=query_docstore)
+                    with span("retrieval.fulltext_query", top_k=top_k_first_round):
+                        ds_docs = self.doc_store.query(
+                            query, top_k=top_k_first_round, doc_ids=scope
+                        )
+
+            # the queries run in the context of the caller, to be traced in its span
+            vs_query_thread = threading.Thread(
+                target=copy_context().run, args=(query_vectorstore,)
+            )
+            ds_query_thread = threading.Thread(
+                target=copy_context().run, args=(query_docstore,)
+            )
 
             vs_query_thread.start()
             ds_query_thread.start()
@@ -224,28 +237,44 @@ class VectorRetrieval(BaseRetrieval):
             vs_query_thread.join()
             ds_query_thread.join()
 
-            result = [
-                RetrievedDocument(**doc.to_dict(), score=-1.0)
+            # the chunks found by both searches are kept with their vector score
+            vs_id_set = set(vs_ids)
+            chunks = [
+                RetrievedChunk(doc, score=-1.0)
                 for doc in ds_docs
-                if doc not in vs_ids
+                if doc.doc_id not in vs_id_set
             ]
-            result += [
-                RetrievedDocument(**doc.to_dict(), score=score)
+            chunks += [
+                RetrievedChunk(doc, score=score)
                 for doc, score in zip(vs_docs, vs_scores)
             ]
-            print(f"Got {len(vs_docs)} from vectorstore")
-            print(f"Got {len(ds_docs)} from docstore")
+            logger.debug(f"Got {len(vs_docs)} from vectorstore")
+            logger.debug(f"Got {len(ds_docs)} from docstore")
 
         # use additional reranker to re-order the document list
         if self.rerankers and text:
+            # rerankers work on (and may modify) full documents, only the candidates
+            # that reach them are converted
+            if isinstance(self.rerankers[0], LLMReranking):
+                chunks = self._filter_docs(chunks, top_k=top_k)
+            result = [chunk.to_retrieved_document() for chunk in chunks]
             for reranker in self.rerankers:
                 # if reranker is LLMReranking, limit the document with top_k items only
                 if isinstance(reranker, LLMReranking):
                     result = self._filter_docs(result, top_k=top_k)
-                result = reranker.run(documents=result, query=text)
+                    stage = "retrieval.llm_scoring"
+                else:
+                    stage = "retrieval.reranking"
+                with span(stage, reranker=reranker.__class__.__name__):
+                    result = reranker.run(documents=result, query=text)
+        else:
+            result = [
+                chunk.to_retrieved_document()
+                for chunk in self._filter_docs(chunks, top_k=top_k)
+            ]
 
         result = self._filter_docs(result, top_k=top_k)
-        print(f"Got raw {len(result)} retrieved documents")
+        logger.debug(f"Got raw {len(result)} retrieved documents")
 
         # add page thumbnails to the result if exists
         thumbnail_doc_ids: set[str] = set()
@@ -272,13 +301,10 @@ class VectorRetrieval(BaseRetrieval):
                 non_thumbnail_docs.append(doc)
 
         linked_thumbnail_docs = self.doc_store.get(list(thumbnail_doc_ids))
-        print(
-            "thumbnail docs",
-            len(linked_thumbnail_docs),
-            "non-thumbnail docs",
-            len(non_thumbnail_docs),
-            "raw-thumbnail docs",
-            len(raw_thumbnail_docs),
+        logger.debug(
+            f"thumbnail docs {len(linked_thumbnail_docs)}, "
+            f"non-thumbnail docs {len(non_thumbnail_docs)}, "
+            f"raw-thumbnail docs {len(raw_thumbnail_docs)}"
         )
         additional_docs = []
 
@@ -2,6 +2,7 @@ from kotaemon.base.schema import AIMessage, BaseMessage, HumanMessage, SystemMes
 
 from .base import BaseLLM
 from .branching import GatedBranchingPipeline, SimpleBranchingPipeline
+from .cache import CachedChatLLM
 from .chats import (
     AzureChatOpenAI,
     ChatLLM,
@@ -25,6 +26,7 @@ __all__ = [
     "BaseLLM",
     # chat-specific components
     "ChatLLM",
+    "CachedChatLLM",
     "EndpointChatLLM",
     "BaseMessage",
     "HumanMessage",
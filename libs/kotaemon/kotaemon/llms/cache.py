@@ -0,0 +1,333 @@
+"""Exact-match cache of the chat model responses
+
+The auxiliary calls of the pipelines (conversation name, follow-up questions,
+question rewriting and decomposition, citations, mindmap, LLM scoring of the
+retrieved chunks) are often repeated with the same input: regenerated answers,
+repeated questions, re-ranking of the same chunks. `CachedChatLLM` wraps a chat
+model and stores its responses in a SQLite file, keyed by the model spec (its
+params, without the secrets), the normalized messages and the call params, so
+that the repeated calls are answered without calling the model.
+
+The cache is opt-in per pipeline with the `KH_LLM_CACHE_PIPELINES` setting, the
+time to live in seconds of the responses of each pipeline class, e.g.
+    {"SuggestConvNamePipeline": 86400, "LLMTrulensScoring": 3600}
+`cached_llm` wraps the model of a pipeline only if its class is listed. The
+cache is stored at `KH_LLM_CACHE_PATH` and holds at most
+`KH_LLM_CACHE_MAX_ENTRIES` responses, the least recently used are evicted.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from typing import Any, AsyncGenerator, Iterator, Optional
+
+from theflow.settings import settings as flowsettings
+
+from kotaemon.base import BaseComponent, BaseMessage, LLMInterface, tracing
+
+from .base import BaseLLM
+from .chats.base import ChatLLM
+
+logger = logging.getLogger(__name__)
+
+# the params of the models which do not change their responses
+IGNORED_PARAMS = {"timeout", "max_retries", "stream_usage", "organization"}
+# the suffixes of the params holding secrets, never stored in the keys
+SECRET_SUFFIXES = ("api_key", "_token", "_token_provider", "password", "secret")
+
+
+class LLMResponseCache:
+    """Responses of the chat models in a SQLite file, as JSON
+
+    The cache is shared by the processes using the same file. The expired and the
+    least recently used responses above `max_entries` are evicted every
+    `evict_every` writes.
+    """
+
+    def __init__(self, path: str, max_entries: int = 10000, evict_every: int = 100):
+        self.path = path
+        self.max_entries = max_entries
+        self.evict_every = evict_every
+        self._local = threading.local()
+        self._writes = 0
+        self._lock = threading.Lock()
+
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache "
+            "(key TEXT PRIMARY KEY, value TEXT, expires REAL, accessed REAL)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_llm_cache_accessed ON llm_cache (accessed)"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[dict]:
+        """Get a response, None if it is missing or expired"""
+        conn = self._conn()
+        now = time.time()
+        row = conn.execute(
+            "SELECT value FROM llm_cache WHERE key = ? AND expires > ?", (key, now)
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE llm_cache SET accessed = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def set(self, key: str, value: dict, ttl: float):
+        """Store a response for `ttl` seconds"""
+        now = time.time()
+        self._conn().execute(
+            "INSERT OR REPLACE INTO llm_cache (key, value, expires, accessed) "
+            "VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value), now + ttl, now),
+        )
+        with self._lock:
+            self._writes += 1
+            evict = self._writes % self.evict_every == 0
+        if evict:
+            self.evict()
+
+    def evict(self):
+        """Delete the expired responses and the least recently used ones above
+        `max_entries`"""
+        conn = self._conn()
+        conn.execute("DELETE FROM llm_cache WHERE expires <= ?", (time.time(),))
+        conn.execute(
+            "DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache "
+            "ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def clear(self):
+        self._conn().execute("DELETE FROM llm_cache")
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+
+@lru_cache
+def get_llm_cache(path: Optional[str] = None) -> LLMResponseCache:
+    """Get the response cache of the app, as configured by the settings"""
+    return LLMResponseCache(
+        path=path or getattr(flowsettings, "KH_LLM_CACHE_PATH", "llm_cache.db"),
+        max_entries=getattr(flowsettings, "KH_LLM_CACHE_MAX_ENTRIES", 10000),
+    )
+
+
+def _json_default(value: Any) -> Any:
+    """Serialize the params which are not JSON: the pydantic models by their
+    schema (e.g. the tools), the other objects by their type"""
+    if isinstance(value, type) and hasattr(value, "schema"):
+        return {"model": value.__qualname__, "schema": value.schema()}
+    if isinstance(value, BaseComponent):
+        return model_spec(value)
+    if hasattr(value, "dict"):
+        return value.dict()
+    return f"{type(value).__module__}.{type(value).__qualname__}"
+
+
+def _strip_params(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {
+            key: _strip_params(item)
+            for key, item in value.items()
+            if not (
+                isinstance(key, str)
+                and (key in IGNORED_PARAMS or key.endswith(SECRET_SUFFIXES))
+            )
+        }
+    if isinstance(value, (list, tuple)):
+        return [_strip_params(item) for item in value]
+    return value
+
+
+def model_spec(llm: BaseComponent) -> dict:
+    """The class and the params of a model, without the secrets"""
+    try:
+        spec = llm.dump()
+    except Exception:
+        spec = {"function": repr(llm)}
+    spec.pop("configs", None)
+    return _strip_params(spec)
+
+
+def normalize_messages(messages: Any) -> list[tuple[str, Any]]:
+    """The (role, content) of the input messages of a chat model, with the text
+    stripped: a text is the same input as a single human message"""
+    if not isinstance(messages, (list, tuple)):
+        messages = [messages]
+
+    normalized = []
+    for message in messages:
+        if isinstance(message, str):
+            role, content = "human", message
+        elif isinstance(message, dict):
+            role, content = message.get("role", ""), message.get("content")
+        elif isinstance(message, BaseMessage):
+            role, content = message.type, message.content
+        else:
+            role, content = type(message).__name__, getattr(message, "content", "")
+        if role == "user":
+            role = "human"
+        if isinstance(content, str):
+            content = content.strip()
+        normalized.append((role, content))
+    return normalized
+
+
+def cache_key(llm: BaseComponent, messages: Any, **kwargs) -> str:
+    """The key of a call: hash of the model spec, the normalized messages and the
+    call params"""
+    payload = json.dumps(
+        {
+            "model": model_spec(llm),
+            "messages": normalize_messages(messages),
+            "params": _strip_params(kwargs),
+        },
+        sort_keys=True,
+        default=_json_default,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class CachedChatLLM(ChatLLM):
+    """Chat model answering the repeated calls of another chat model from the
+    response cache
+
+    Only the plain responses are stored (not the structured outputs), with their
+    content, candidates, tool calls, logprobs and tokens. The responses from the
+    cache record no token usage since they cost nothing. The streams are
+    replayed as a single chunk.
+
+    Args:
+        llm: the chat model
+        ttl: time to live of the stored responses, in seconds
+        cache_path: path of the SQLite file, default to `KH_LLM_CACHE_PATH`
+    """
+
+    llm: BaseLLM
+    ttl: float = 86400
+    cache_path: str = ""
+
+    @property
+    def cache(self) -> LLMResponseCache:
+        return get_llm_cache(self.cache_path or None)
+
+    def _get(self, key: str) -> Optional[dict]:
+        try:
+            value = self.cache.get(key)
+        except sqlite3.Error as e:
+            logger.warning(f"Cannot read the LLM response cache: {e}")
+            return None
+        span = tracing.current_span()
+        if span is not None:
+            span.set_attribute("llm_cache", "hit" if value is not None else "miss")
+        return value
+
+    def _set(self, key: str, value: dict):
+        try:
+            self.cache.set(key, value, self.ttl)
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.warning(f"Cannot store the LLM response: {e}")
+
+    @staticmethod
+    def _dump(output: LLMInterface) -> Optional[dict]:
+        if type(output) is not LLMInterface:
+            return None
+        return {
+            "content": output.content,
+            "candidates": output.candidates,
+            "additional_kwargs": output.additional_kwargs,
+            "logprobs": output.logprobs,
+            "prompt_tokens": output.prompt_tokens,
+            "completion_tokens": output.completion_tokens,
+            "total_tokens": output.total_tokens,
+        }
+
+    def invoke(self, messages: Any, **kwargs) -> LLMInterface:
+        llm = self.get_from_path("llm")
+        key = cache_key(llm, messages, **kwargs)
+        value = self._get(key)
+        if value is not None:
+            logger.debug(f"LLM response from the cache: {key}")
+            return LLMInterface(**value)
+
+        output = llm.invoke(messages, **kwargs)
+        value = self._dump(output)
+        if value is not None:
+            self._set(key, value)
+        return output
+
+    async def ainvoke(self, messages: Any, **kwargs) -> LLMInterface:
+        llm = self.get_from_path("llm")
+        key = cache_key(llm, messages, **kwargs)
+        value = self._get(key)
+        if value is not None:
+            return LLMInterface(**value)
+
+        output = await llm.ainvoke(messages, **kwargs)
+        value = self._dump(output)
+        if value is not None:
+            self._set(key, value)
+        return output
+
+    def stream(self, messages: Any, **kwargs) -> Iterator[LLMInterface]:
+        llm = self.get_from_path("llm")
+        key = cache_key(llm, messages, **kwargs)
+        value = self._get(key)
+        if value is not None:
+            yield LLMInterface(content=value["content"], logprobs=value["logprobs"])
+            return
+
+        content: list[str] = []
+        logprobs: list[float] = []
+        for chunk in llm.stream(messages, **kwargs):
+            content.append(chunk.text)
+            logprobs.extend(chunk.logprobs)
+            yield chunk
+
+        # only the complete streams are stored
+        self._set(
+            key,
+            {
+                "content": "".join(content),
+                "candidates": [],
+                "additional_kwargs": {},
+                "logprobs": logprobs,
+            },
+        )
+
+    def astream(self, *args, **kwargs) -> AsyncGenerator[LLMInterface, None]:
+        return self.get_from_path("llm").astream(*args, **kwargs)
+
+
+def cached_llm(llm: Optional[BaseLLM], pipeline: Any) -> Optional[BaseLLM]:
+    """Wrap the chat model of a pipeline with the response cache, if the cache is
+    enabled for the pipeline class in `KH_LLM_CACHE_PIPELINES`
+
+    Args:
+        llm: the chat model
+        pipeline: the pipeline (or its class name) making the calls
+
+    Returns:
+        the cached model, else the model itself
+    """
+    name = pipeline if isinstance(pipeline, str) else type(pipeline).__name__
+    ttl = getattr(flowsettings, "KH_LLM_CACHE_PIPELINES", {}).get(name)
+    if not ttl or llm is None or isinstance(llm, CachedChatLLM):
+        return llm
+    return CachedChatLLM(llm=llm, ttl=ttl)
@@ -8,7 +8,9 @@ from kotaemon.base import (
     Param,
     SystemMessage,
 )
+from kotaemon.base.usage import record_chat_usage
 
+from ..scheduler import get_scheduler
 from .base import ChatLLM
 
 
@@ -56,7 +58,15 @@ class EndpointChatLLM(ChatLLM):
             "messages": [{"content": m.text, "role": decide_role(m)} for m in input_]
         }
 
-        response = requests.post(self.endpoint_url, json=request_json).json()
+        def post() -> dict:
+            response = requests.post(self.endpoint_url, json=request_json)
+            # the rate limited requests are retried by the scheduler
+            response.raise_for_status()
+            return response.json()
+
+        response = get_scheduler().call(
+            self.endpoint_url, post, request_json["messages"]
+        )
 
         content = ""
         candidates = []
@@ -68,13 +78,21 @@ class EndpointChatLLM(ChatLLM):
             ]
             content = candidates[0]
 
-        return LLMInterface(
+        output = LLMInterface(
             content=content,
             candidates=candidates,
             completion_tokens=response["usage"]["completion_tokens"],
             total_tokens=response["usage"]["total_tokens"],
             prompt_tokens=response["usage"]["prompt_tokens"],
         )
+        record_chat_usage(
+            response.get("model") or self.endpoint_url,
+            request_json["messages"],
+            output.content,
+            prompt_tokens=output.prompt_tokens,
+            completion_tokens=output.completion_tokens,
+        )
+        return output
 
     def invoke(
         self, messages: str | BaseMessage | list[BaseMessage], **kwargs
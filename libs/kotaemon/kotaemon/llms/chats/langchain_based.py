@@ -4,7 +4,9 @@ import logging
 from typing import AsyncGenerator, Iterator
 
 from kotaemon.base import BaseMessage, HumanMessage, LLMInterface, Param
+from kotaemon.base.usage import record_chat_usage
 
+from ..scheduler import get_scheduler
 from .base import ChatLLM
 
 logger = logging.getLogger(__name__)
@@ -48,6 +50,30 @@ class LCChatMixin:
 
         return input_
 
+    def _get_model_name(self) -> str:
+        for key in ("model", "model_name", "azure_deployment", "deployment_name"):
+            if self._kwargs.get(key):
+                return str(self._kwargs[key])
+        return self._lc_class.__name__
+
+    def record_usage(self, messages, output: str, usage: dict | None = None):
+        """Record the usage of a call (see `kotaemon.base.usage`), from the
+        `usage_metadata` of langchain when the provider reports it"""
+        record_chat_usage(
+            self._get_model_name(),
+            messages,
+            output,
+            prompt_tokens=usage["input_tokens"] if usage else None,
+            completion_tokens=usage["output_tokens"] if usage else None,
+        )
+
+    @staticmethod
+    def _add_usage(usage: dict, chunk):
+        """Add the usage of a streamed chunk, the usage of the chunks adds up"""
+        for key, value in (getattr(chunk, "usage_metadata", None) or {}).items():
+            if key in usage:
+                usage[key] += value
+
     def prepare_response(self, pred):
         all_text = [each.text for each in pred.generations[0]]
         all_messages = [each.message for each in pred.generations[0]]
@@ -90,9 +116,10 @@ class LCChatMixin:
                 "tools_pydantic",
             )
             lc_tool_call = self._obj.bind_tools(tools)
-            pred = lc_tool_call.invoke(
+            pred = get_scheduler().call(
+                self._get_model_name(),
+                lambda: lc_tool_call.invoke(input_, **self._get_tool_call_kwargs()),
                 input_,
-                **self._get_tool_call_kwargs(),
             )
             if pred.tool_calls:
                 tool_calls = pred.tool_calls
@@ -104,29 +131,78 @@ class LCChatMixin:
                 additional_kwargs={"tool_calls": tool_calls},
             )
         else:
-            pred = self._obj.generate(messages=[input_], **kwargs)
+            pred = get_scheduler().call(
+                self._get_model_name(),
+                lambda: self._obj.generate(messages=[input_], **kwargs),
+                input_,
+            )
             output = self.prepare_response(pred)
 
+        self.record_usage(
+            input_,
+            output.content,
+            {
+                "input_tokens": output.prompt_tokens,
+                "output_tokens": output.completion_tokens,
+            },
+        )
         return output
 
     async def ainvoke(
         self, messages: str | BaseMessage | list[BaseMessage], **kwargs
     ) -> LLMInterface:
         input_ = self.prepare_message(messages)
-        pred = await self._obj.agenerate(messages=[input_], **kwargs)
-        return self.prepare_response(pred)
+        pred = await get_scheduler().acall(
+            self._get_model_name(),
+            lambda: self._obj.agenerate(messages=[input_], **kwargs),
+            input_,
+        )
+        output = self.prepare_response(pred)
+        self.record_usage(
+            input_,
+            output.content,
+            {
+                "input_tokens": output.prompt_tokens,
+                "output_tokens": output.completion_tokens,
+            },
+        )
+        return output
 
     def stream(
         self, messages: str | BaseMessage | list[BaseMessage], **kwargs
     ) -> Iterator[LLMInterface]:
-        for response in self._obj.stream(input=messages, **kwargs):
-            yield LLMInterface(content=response.content)
+        output: list[str] = []
+        usage: dict = {"input_tokens": 0, "output_tokens": 0}
+        try:
+            for response in get_scheduler().stream(
+                self._get_model_name(),
+                lambda: self._obj.stream(input=messages, **kwargs),
+                messages,
+            ):
+                self._add_usage(usage, response)
+                output.append(str(response.content))
+                yield LLMInterface(content=response.content)
+        finally:
+            if output:
+                self.record_usage(messages, "".join(output), usage)
 
     async def astream(
         self, messages: str | BaseMessage | list[BaseMessage], **kwargs
     ) -> AsyncGenerator[LLMInterface, None]:
-        async for response in self._obj.astream(input=messages, **kwargs):
-            yield LLMInterface(content=response.content)
+        output: list[str] = []
+        usage: dict = {"input_tokens": 0, "output_tokens": 0}
+        try:
+            async for response in get_scheduler().astream(
+                self._get_model_name(),
+                lambda: self._obj.astream(input=messages, **kwargs),
+                messages,
+            ):
+                self._add_usage(usage, response)
+                output.append(str(response.content))
+                yield LLMInterface(content=response.content)
+        finally:
+            if output:
+                self.record_usage(messages, "".join(output), usage)
 
     def to_langchain_format(self):
         return self._obj
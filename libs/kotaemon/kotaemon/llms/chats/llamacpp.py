@@ -1,7 +1,9 @@
 from typing import TYPE_CHECKING, Iterator, Optional, cast
 
 from kotaemon.base import BaseMessage, HumanMessage, LLMInterface, Param
+from kotaemon.base.usage import record_chat_usage
 
+from ..scheduler import get_scheduler
 from .base import ChatLLM
 
 if TYPE_CHECKING:
@@ -118,16 +120,24 @@ class LlamaCppChat(ChatLLM):
 
         return output_
 
+    def _get_model_name(self) -> str:
+        return self.model_path or f"{self.repo_id}/{self.filename}"
+
     def invoke(
         self, messages: str | BaseMessage | list[BaseMessage], **kwargs
     ) -> LLMInterface:
 
-        pred: "CCCR" = self.client_object.create_chat_completion(
-            messages=self.prepare_message(messages),
-            stream=False,
+        input_messages = self.prepare_message(messages)
+        pred: "CCCR" = get_scheduler().call(
+            self._get_model_name(),
+            lambda: self.client_object.create_chat_completion(
+                messages=input_messages,
+                stream=False,
+            ),
+            input_messages,
         )
 
-        return LLMInterface(
+        output = LLMInterface(
             content=pred["choices"][0]["message"]["content"] if pred["choices"] else "",
             candidates=[
                 c["message"]["content"]
@@ -138,19 +148,40 @@ class LlamaCppChat(ChatLLM):
             total_tokens=pred["usage"]["total_tokens"],
             prompt_tokens=pred["usage"]["prompt_tokens"],
         )
+        record_chat_usage(
+            pred.get("model", ""),
+            input_messages,
+            output.content,
+            prompt_tokens=output.prompt_tokens,
+            completion_tokens=output.completion_tokens,
+        )
+        return output
 
     def stream(
         self, messages: str | BaseMessage | list[BaseMessage], **kwargs
     ) -> Iterator[LLMInterface]:
-        pred = self.client_object.create_chat_completion(
-            messages=self.prepare_message(messages),
-            stream=True,
+        input_messages = self.prepare_message(messages)
+        pred = get_scheduler().stream(
+            self._get_model_name(),
+            lambda: self.client_object.create_chat_completion(
+                messages=input_messages,
+                stream=True,
+            ),
+            input_messages,
         )
-        for chunk in pred:
-            if not chunk["choices"]:
-                continue
-
-            if "content" not in chunk["choices"][0]["delta"]:
-                continue
-
-            yield LLMInterface(content=chunk["choices"][0]["delta"]["content"])
+        model, output = "", []
+        try:
+            for chunk in pred:
+                model = chunk.get("model") or model
+                if not chunk["choices"]:
+                    continue
+
+                if "content" not in chunk["choices"][0]["delta"]:
+                    continue
+
+                output.append(chunk["choices"][0]["delta"]["content"])
+                yield LLMInterface(content=chunk["choices"][0]["delta"]["content"])
+        finally:
+            # llama.cpp does not report the usage of the streams
+            if model:
+                record_chat_usage(model, input_messages, "".join(output))
@@ -11,7 +11,9 @@ from kotaemon.base import (
     Param,
     StructuredOutputLLMInterface,
 )
+from kotaemon.base.usage import is_collecting, record_chat_usage
 
+from ..scheduler import get_scheduler, get_status_code
 from .base import ChatLLM
 
 if TYPE_CHECKING:
@@ -19,6 +21,19 @@ if TYPE_CHECKING:
         ChatCompletionMessageParam,
     )
 
+# the servers which rejected the `stream_options` of a stream: (class, endpoint,
+# model), their streams are sent without it and their usage is estimated
+_NO_STREAM_OPTIONS: set[tuple] = set()
+
+
+def _rejects_stream_options(error: BaseException) -> bool:
+    """Whether a request failed because the server does not support
+    `stream_options` (e.g. Azure with an older api_version)"""
+    message = str(error)
+    return get_status_code(error) == 400 and (
+        "stream_options" in message or "include_usage" in message
+    )
+
 
 class BaseChatOpenAI(ChatLLM):
     """Base interface for OpenAI chat model, using the openai library
@@ -129,12 +144,23 @@ class BaseChatOpenAI(ChatLLM):
         ),
     )
 
+    stream_usage: bool = Param(
+        True,
+        help=(
+            "Request the token usage at the end of the streams (`stream_options`) "
+            "when it is accounted. The streams rejected by the server because of "
+            "it are sent again without it, the usage is then estimated"
+        ),
+    )
+
     @Param.auto(depends_on=["max_retries"])
     def max_retries_(self):
         if self.max_retries is None:
             from openai._constants import DEFAULT_MAX_RETRIES
 
-            return DEFAULT_MAX_RETRIES
+            # the scheduler retries the failed requests, once for all the requests
+            # to the model
+            return 0 if get_scheduler().max_retries else DEFAULT_MAX_RETRIES
         return self.max_retries
 
     def prepare_message(
@@ -208,15 +234,92 @@ class BaseChatOpenAI(ChatLLM):
         """Get the openai response"""
         raise NotImplementedError
 
+    def _get_model_name(self) -> str:
+        return getattr(self, "model", None) or getattr(self, "azure_deployment", "")
+
+    def record_usage(self, resp: dict, input_messages: list, output: LLMInterface):
+        """Record the usage of a call (see `kotaemon.base.usage`)"""
+        record_chat_usage(
+            resp.get("model", ""),
+            input_messages,
+            output.content,
+            prompt_tokens=output.prompt_tokens,
+            completion_tokens=output.completion_tokens,
+        )
+
+    def _server_key(self) -> tuple:
+        return (
+            type(self).__name__,
+            getattr(self, "base_url", None) or getattr(self, "azure_endpoint", None),
+            getattr(self, "api_version", None),
+            self._get_model_name(),
+        )
+
+    def stream_kwargs(self, **kwargs) -> dict:
+        """The arguments of a streamed call, requesting its usage if accounted"""
+        if (
+            self.stream_usage
+            and is_collecting()
+            and "stream_options" not in kwargs
+            and self._server_key() not in _NO_STREAM_OPTIONS
+        ):
+            kwargs["stream_options"] = {"include_usage": True}
+        return kwargs
+
+    def _drop_stream_options(self, error: Exception, stream_kwargs: dict) -> bool:
+        """Remove the `stream_options` rejected by the server from the arguments
+        of a stream, return whether the stream should be sent again"""
+        if "stream_options" not in stream_kwargs or not _rejects_stream_options(error):
+            return False
+        _NO_STREAM_OPTIONS.add(self._server_key())
+        stream_kwargs.pop("stream_options")
+        return True
+
+    def stream_response(self, client, input_messages: list, stream_kwargs: dict):
+        """Start a stream, without `stream_options` if the server rejects it"""
+        try:
+            return self.openai_response(
+                client, messages=input_messages, stream=True, **stream_kwargs
+            )
+        except Exception as e:
+            if not self._drop_stream_options(e, stream_kwargs):
+                raise
+        return self.openai_response(
+            client, messages=input_messages, stream=True, **stream_kwargs
+        )
+
+    async def astream_response(self, client, input_messages: list, stream_kwargs: dict):
+        """Same as `stream_response`, for the async client"""
+        try:
+            return await self.aopenai_response(
+                client, messages=input_messages, stream=True, **stream_kwargs
+            )
+        except Exception as e:
+            if not self._drop_stream_options(e, stream_kwargs):
+                raise
+        return await self.aopenai_response(
+            client, messages=input_messages, stream=True, **stream_kwargs
+        )
+
     def invoke(
         self, messages: str | BaseMessage | list[BaseMessage], *args, **kwargs
     ) -> LLMInterface:
         client = self.prepare_client(async_version=False)
         input_messages = self.prepare_message(messages)
-        resp = self.openai_response(
-            client, messages=input_messages, stream=False, **kwargs
-        ).dict()
-        return self.prepare_output(resp)
+        resp = (
+            get_scheduler()
+            .call(
+                self._get_model_name(),
+                lambda: self.openai_response(
+                    client, messages=input_messages, stream=False, **kwargs
+                ),
+                input_messages,
+            )
+            .dict()
+        )
+        output = self.prepare_output(resp)
+        self.record_usage(resp, input_messages, output)
+        return output
 
     async def ainvoke(
         self, messages: str | BaseMessage | list[BaseMessage], *args, **kwargs
@@ -224,55 +327,97 @@ class BaseChatOpenAI(ChatLLM):
         client = self.prepare_client(async_version=True)
         input_messages = self.prepare_message(messages)
         resp = (
-            await self.aopenai_response(
-                client, messages=input_messages, stream=False, **kwargs
+            await get_scheduler().acall(
+                self._get_model_name(),
+                lambda: self.aopenai_response(
+                    client, messages=input_messages, stream=False, **kwargs
+                ),
+                input_messages,
             )
         ).dict()
 
-        return self.prepare_output(resp)
+        output = self.prepare_output(resp)
+        self.record_usage(resp, input_messages, output)
+        return output
 
     def stream(
         self, messages: str | BaseMessage | list[BaseMessage], *args, **kwargs
     ) -> Iterator[LLMInterface]:
         client = self.prepare_client(async_version=False)
         input_messages = self.prepare_message(messages)
-        resp = self.openai_response(
-            client, messages=input_messages, stream=True, **kwargs
+        stream_kwargs = self.stream_kwargs(**kwargs)
+        resp = get_scheduler().stream(
+            self._get_model_name(),
+            lambda: self.stream_response(client, input_messages, stream_kwargs),
+            input_messages,
         )
 
-        for c in resp:
-            chunk = c.dict()
-            if not chunk["choices"]:
-                continue
-            if chunk["choices"][0]["delta"]["content"] is not None:
-                if chunk["choices"][0].get("logprobs") is None:
-                    logprobs = []
-                else:
-                    logprobs = [
-                        logprob["logprob"]
-                        for logprob in chunk["choices"][0]["logprobs"].get(
-                            "content", []
-                        )
-                    ]
-
-                yield LLMInterface(
-                    content=chunk["choices"][0]["delta"]["content"], logprobs=logprobs
-                )
+        model, usage, output = "", None, []
+        try:
+            for c in resp:
+                chunk = c.dict()
+                model = chunk.get("model") or model
+                # the usage comes in a last chunk without choices
+                usage = chunk.get("usage") or usage
+                if not chunk["choices"]:
+                    continue
+                if chunk["choices"][0]["delta"]["content"] is not None:
+                    if chunk["choices"][0].get("logprobs") is None:
+                        logprobs = []
+                    else:
+                        logprobs = [
+                            logprob["logprob"]
+                            for logprob in chunk["choices"][0]["logprobs"].get(
+                                "content", []
+                            )
+                        ]
+
+                    output.append(chunk["choices"][0]["delta"]["content"])
+                    yield LLMInterface(
+                        content=chunk["choices"][0]["delta"]["content"],
+                        logprobs=logprobs,
+                    )
+        finally:
+            if model:
+                self.record_stream_usage(model, usage, input_messages, "".join(output))
 
     async def astream(
         self, messages: str | BaseMessage | list[BaseMessage], *args, **kwargs
     ) -> AsyncGenerator[LLMInterface, None]:
         client = self.prepare_client(async_version=True)
         input_messages = self.prepare_message(messages)
-        resp = self.openai_response(
-            client, messages=input_messages, stream=True, **kwargs
+        stream_kwargs = self.stream_kwargs(**kwargs)
+        resp = get_scheduler().astream(
+            self._get_model_name(),
+            lambda: self.astream_response(client, input_messages, stream_kwargs),
+            input_messages,
         )
 
-        async for chunk in resp:
-            if not chunk.choices:
-                continue
-            if chunk.choices[0].delta.content is not None:
-                yield LLMInterface(content=chunk.choices[0].delta.content)
+        model, usage, output = "", None, []
+        try:
+            async for chunk in resp:
+                model = chunk.model or model
+                usage = chunk.usage.dict() if chunk.usage else usage
+                if not chunk.choices:
+                    continue
+                if chunk.choices[0].delta.content is not None:
+                    output.append(chunk.choices[0].delta.content)
+                    yield LLMInterface(content=chunk.choices[0].delta.content)
+        finally:
+            if model:
+                self.record_stream_usage(model, usage, input_messages, "".join(output))
+
+    def record_stream_usage(
+        self, model: str, usage: Optional[dict], input_messages: list, output: str
+    ):
+        """Record the usage of a stream, reported in its last chunk or estimated"""
+        record_chat_usage(
+            model,
+            input_messages,
+            output,
+            prompt_tokens=usage["prompt_tokens"] if usage else None,
+            completion_tokens=usage["completion_tokens"] if usage else None,
+        )
 
 
 class ChatOpenAI(BaseChatOpenAI):
@@ -404,6 +549,7 @@ class StructuredOutputChatOpenAI(ChatOpenAI):
 
         # doesn't do streaming
         params.pop("stream")
+        params.pop("stream_options", None)
 
         return params
 
@@ -0,0 +1,470 @@
+"""Central scheduler of the chat model calls
+
+The chat answers, the LLM scoring of the retrieved chunks, the citation and
+mindmap threads and the indexing pipelines call the same providers at the same
+time. The chat models send their requests through the scheduler, which for each
+model:
+    - limits the number of concurrent requests and the requests and tokens per
+      minute (token buckets), the requests waiting for a slot are served by
+      priority: interactive (an user waits for the answer) > auxiliary
+      (scoring, citations, suggestions...) > batch (indexing)
+    - retries the rate limited (429) and overloaded requests after the
+      `Retry-After` delay of the response, else with an exponential backoff,
+      and holds the other requests to the model meanwhile
+    - records the time spent waiting as a span of `kotaemon.base.tracing`
+      ("llm.queue.<priority>"), hence in the stage summaries and the Prometheus
+      metrics
+
+The priority of the calls is kept in a context variable: `priority` for a
+block, `stream_with_priority` for a stream whose steps may run in different
+contexts, the threads started with `contextvars.copy_context().run` inherit it.
+The calls without priority are interactive.
+
+The limits are set with the `KH_LLM_SCHEDULER_LIMITS` setting, by model name:
+    {"gpt-4o-mini": {"max_concurrency": 8, "requests_per_minute": 500,
+                     "tokens_per_minute": 200000},
+     "*": {"max_concurrency": 4}}
+a model name also matches the longest key it starts with, "*" applies to the
+other models. The calls of the models without limits are sent directly. The
+number of retries is set with `KH_LLM_SCHEDULER_MAX_RETRIES`.
+"""
+import asyncio
+import heapq
+import inspect
+import itertools
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from email.utils import parsedate_to_datetime
+from enum import IntEnum
+from functools import lru_cache
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Generator,
+    Iterable,
+    Iterator,
+    Optional,
+    TypeVar,
+)
+
+from theflow.settings import settings as flowsettings
+
+from kotaemon.base import tracing
+from kotaemon.base.usage import estimate_message_tokens
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# the HTTP status of the responses whose requests are retried
+RETRY_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+# the backoff in seconds of the first retry when there is no Retry-After, doubled
+# at each retry and capped
+BASE_BACKOFF = 1.0
+MAX_BACKOFF = 60.0
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    AUXILIARY = 1
+    BATCH = 2
+
+
+_priority: ContextVar[Priority] = ContextVar(
+    "kotaemon_llm_priority", default=Priority.INTERACTIVE
+)
+
+
+def _as_priority(value: "Priority | str") -> Priority:
+    return value if isinstance(value, Priority) else Priority[value.upper()]
+
+
+def current_priority() -> Priority:
+    return _priority.get()
+
+
+@contextmanager
+def priority(value: "Priority | str") -> Iterator[Priority]:
+    """Set the priority of the chat model calls made in the enclosed block"""
+    token = _priority.set(_as_priority(value))
+    try:
+        yield _priority.get()
+    finally:
+        _priority.reset(token)
+
+
+def stream_with_priority(
+    stream: Generator[T, Any, Any], value: "Priority | str"
+) -> Generator[T, None, Any]:
+    """Set the priority of the calls made by a stream, whose steps may run in
+    different contexts (see `kotaemon.base.usage.collect_stream`)"""
+    try:
+        while True:
+            with priority(value):
+                try:
+                    item = next(stream)
+                except StopIteration as e:
+                    return e.value
+            yield item
+    except GeneratorExit:
+        stream.close()
+        raise
+
+
+class TokenBucket:
+    """Rate limit of `per_minute` units, with bursts of up to a minute of units"""
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60
+        self.capacity = per_minute
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """The seconds until `amount` units are available"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return max((amount - self.tokens) / self.rate, 0.0)
+
+    def take(self, amount: float, now: float):
+        self._refill(now)
+        self.tokens -= min(amount, self.capacity)
+
+
+class ModelQueue:
+    """The requests to a model: at most `max_concurrency` at the same time (0 for
+    no limit) within the requests and tokens per minute, the waiting requests are
+    served by priority then by arrival"""
+
+    def __init__(
+        self,
+        max_concurrency: int = 0,
+        requests_per_minute: float = 0,
+        tokens_per_minute: float = 0,
+    ):
+        self.max_concurrency = max_concurrency
+        self.requests = (
+            TokenBucket(requests_per_minute) if requests_per_minute else None
+        )
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.active = 0
+        self.paused_until = 0.0
+        self._waiting: list[tuple[int, int]] = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+
+    def _delay(self, entry: tuple[int, int], tokens: int) -> Optional[float]:
+        """The seconds until the request can be sent, None if it must wait for
+        another request (higher in the queue, or a free slot)"""
+        if self._waiting[0] != entry:
+            return None
+        if self.max_concurrency and self.active >= self.max_concurrency:
+            return None
+        now = time.monotonic()
+        delay = self.paused_until - now
+        if self.requests:
+            delay = max(delay, self.requests.wait_time(1, now))
+        if self.tokens:
+            delay = max(delay, self.tokens.wait_time(tokens, now))
+        return max(delay, 0.0)
+
+    def acquire(self, priority: Priority = Priority.INTERACTIVE, tokens: int = 0):
+        """Wait for the turn of a request of `tokens` estimated input tokens"""
+        with self._cond:
+            entry = (int(priority), next(self._counter))
+            heapq.heappush(self._waiting, entry)
+            try:
+                while (delay := self._delay(entry, tokens)) != 0:
+                    self._cond.wait(delay)
+            except BaseException:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+                raise
+
+            heapq.heappop(self._waiting)
+            self.active += 1
+            now = time.monotonic()
+            if self.requests:
+                self.requests.take(1, now)
+            if self.tokens:
+                self.tokens.take(tokens, now)
+            self._cond.notify_all()
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify_all()
+
+    def pause(self, seconds: float):
+        """Hold the requests for `seconds`, e.g. after a rate limited response"""
+        with self._cond:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+
+    def stats(self) -> dict[str, int]:
+        with self._cond:
+            return {"active": self.active, "waiting": len(self._waiting)}
+
+
+def _release_acquired(waiting: "asyncio.Future[Optional[ModelQueue]]"):
+    """Release the slot acquired for a cancelled request"""
+    if waiting.cancelled() or waiting.exception() is not None:
+        return
+    queue = waiting.result()
+    if queue is not None:
+        queue.release()
+
+
+def get_status_code(error: BaseException) -> Optional[int]:
+    """The HTTP status of the response of a failed request, if any"""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def get_retry_after(error: BaseException) -> Optional[float]:
+    """The `Retry-After` (or `retry-after-ms`) delay in seconds of the response of
+    a failed request, if any"""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return parsedate_to_datetime(value).timestamp() - time.time()
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether a failed request may succeed later: rate limited, overloaded or
+    connection errors"""
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    if get_status_code(error) in RETRY_STATUS_CODES:
+        return True
+    # e.g. openai.APIConnectionError, which has no status
+    return any(cls.__name__ == "APIConnectionError" for cls in type(error).__mro__)
+
+
+class LLMScheduler:
+    """Queue the chat model requests by model (see the module docstring)
+
+    Args:
+        limits: the limits of the models, by model name or prefix and "*"
+        max_retries: the number of retries of the failed requests
+    """
+
+    def __init__(self, limits: Optional[dict] = None, max_retries: int = 2):
+        self.limits = limits or {}
+        self.max_retries = max_retries
+        self._queues: dict[str, Optional[ModelQueue]] = {}
+        self._lock = threading.Lock()
+
+    def get_limits(self, model: str) -> Optional[dict]:
+        """The limits of a model: exact name, else the longest matching prefix,
+        else "*" """
+        if model in self.limits:
+            return self.limits[model]
+        prefixes = [name for name in self.limits if name and model.startswith(name)]
+        if prefixes:
+            return self.limits[max(prefixes, key=len)]
+        return self.limits.get("*")
+
+    def get_queue(self, model: str) -> Optional[ModelQueue]:
+        """The queue of a model, None if the model has no limits"""
+        with self._lock:
+            if model not in self._queues:
+                limits = self.get_limits(model)
+                self._queues[model] = ModelQueue(**limits) if limits else None
+            return self._queues[model]
+
+    def _backoff(self, error: BaseException, attempt: int) -> float:
+        delay = get_retry_after(error)
+        if delay is None:
+            delay = BASE_BACKOFF * 2**attempt * (1 + random.random() / 2)
+        return min(max(delay, 0.0), MAX_BACKOFF)
+
+    def _should_retry(
+        self, model: str, error: BaseException, attempt: int
+    ) -> Optional[float]:
+        """The delay before retrying a failed request, None to raise the error"""
+        if attempt >= self.max_retries or not is_retryable(error):
+            return None
+        delay = self._backoff(error, attempt)
+        logger.warning(
+            f"Request to {model} failed ({error.__class__.__name__}), "
+            f"retry {attempt + 1}/{self.max_retries} in {delay:.1f}s"
+        )
+        queue = self.get_queue(model)
+        if queue is not None:
+            # the other requests to the model wait too
+            queue.pause(delay)
+        return delay
+
+    def _acquire(self, model: str, messages: Any = None) -> Optional[ModelQueue]:
+        """Wait for the turn of a request to a model, the caller releases the
+        returned queue (None if the model has no limits)"""
+        queue = self.get_queue(model)
+        if queue is None:
+            return None
+
+        priority_ = current_priority()
+        tokens = estimate_message_tokens(messages) if queue.tokens else 0
+        current = tracing.current_span()
+        with tracing.span(f"llm.queue.{priority_.name.lower()}", model=model) as span:
+            queue.acquire(priority_, tokens)
+        if current is not None:
+            current.set_attribute("llm.queue_time", span.duration)
+        return queue
+
+    async def _aacquire(self, model: str, messages: Any = None) -> Optional[ModelQueue]:
+        """Same as `_acquire`, without blocking the event loop. If the waiting
+        task is cancelled, the slot is released as soon as it is acquired."""
+        waiting = asyncio.ensure_future(
+            asyncio.to_thread(self._acquire, model, messages)
+        )
+        try:
+            return await asyncio.shield(waiting)
+        except asyncio.CancelledError:
+            waiting.add_done_callback(_release_acquired)
+            raise
+
+    @contextmanager
+    def slot(self, model: str, messages: Any = None) -> Iterator[None]:
+        """Wait for the turn of a request to a model and hold its slot in the
+        enclosed block
+
+        Args:
+            model: the name of the model
+            messages: the input of the request, to estimate its tokens
+        """
+        queue = self._acquire(model, messages)
+        try:
+            yield
+        finally:
+            if queue is not None:
+                queue.release()
+
+    def call(self, model: str, fn: Callable[[], T], messages: Any = None) -> T:
+        """Send a request `fn` when its turn comes, retrying it on failure"""
+        for attempt in itertools.count():
+            with self.slot(model, messages):
+                try:
+                    return fn()
+                except Exception as e:
+                    delay = self._should_retry(model, e, attempt)
+                    if delay is None:
+                        raise
+            if self.get_queue(model) is None:
+                time.sleep(delay)
+        raise AssertionError("unreachable")
+
+    def stream(
+        self, model: str, fn: Callable[[], Iterable[T]], messages: Any = None
+    ) -> Iterator[T]:
+        """Send a streamed request `fn` when its turn comes and hold its slot
+        until the end of the stream. The request is retried if it fails before
+        its first chunk."""
+        for attempt in itertools.count():
+            with self.slot(model, messages):
+                try:
+                    chunks = iter(fn())
+                    first = next(chunks)
+                except StopIteration:
+                    return
+                except Exception as e:
+                    delay = self._should_retry(model, e, attempt)
+                    if delay is None:
+                        raise
+                else:
+                    yield first
+                    yield from chunks
+                    return
+            if self.get_queue(model) is None:
+                time.sleep(delay)
+
+    async def acall(
+        self, model: str, fn: Callable[[], Awaitable[T]], messages: Any = None
+    ) -> T:
+        """Same as `call`, for the async requests"""
+        for attempt in itertools.count():
+            queue = await self._aacquire(model, messages)
+            try:
+                return await fn()
+            except Exception as e:
+                delay = self._should_retry(model, e, attempt)
+                if delay is None:
+                    raise
+            finally:
+                if queue is not None:
+                    queue.release()
+            if queue is None:
+                await asyncio.sleep(delay)
+        raise AssertionError("unreachable")
+
+    async def astream(
+        self,
+        model: str,
+        fn: Callable[[], Awaitable[AsyncIterator[T]]],
+        messages: Any = None,
+    ) -> AsyncIterator[T]:
+        """Same as `stream`, for the async requests"""
+        for attempt in itertools.count():
+            queue = await self._aacquire(model, messages)
+            try:
+                try:
+                    chunks = fn()
+                    if inspect.isawaitable(chunks):
+                        chunks = await chunks
+                    chunks = chunks.__aiter__()
+                    first = await chunks.__anext__()
+                except StopAsyncIteration:
+                    return
+                except Exception as e:
+                    delay = self._should_retry(model, e, attempt)
+                    if delay is None:
+                        raise
+                else:
+                    yield first
+                    async for chunk in chunks:
+                        yield chunk
+                    return
+            finally:
+                if queue is not None:
+                    queue.release()
+            if queue is None:
+                await asyncio.sleep(delay)
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        """The number of active and waiting requests of each limited model"""
+        with self._lock:
+            queues = {name: q for name, q in self._queues.items() if q is not None}
+        return {name: queue.stats() for name, queue in sorted(queues.items())}
+
+
+@lru_cache
+def get_scheduler() -> LLMScheduler:
+    """Get the scheduler of the app, as configured by the settings"""
+    return LLMScheduler(
+        limits=getattr(flowsettings, "KH_LLM_SCHEDULER_LIMITS", {}),
+        max_retries=getattr(flowsettings, "KH_LLM_SCHEDULER_MAX_RETRIES", 2),
+    )
@@ -1,6 +1,7 @@
 from .adobe_loader import AdobeReader
 from .azureai_document_intelligence_loader import AzureAIDocumentIntelligenceLoader
 from .base import AutoReader, BaseReader
+from .cache import ReaderCache
 from .composite_loader import DirectoryReader
 from .docling_loader import DoclingReader
 from .docx_loader import DocxReader
@@ -9,6 +10,8 @@ from .html_loader import HtmlReader, MhtmlReader
 from .mathpix_loader import MathpixPDFReader
 from .ocr_loader import ImageReader, OCRReader
 from .pdf_loader import PDFThumbnailReader
+from .sharded_pdf_loader import ShardedPDFReader
+from .spreadsheet_loader import SpreadsheetReader
 from .txt_loader import TxtReader
 from .unstructured_loader import UnstructuredReader
 from .web_loader import WebReader
@@ -19,6 +22,7 @@ __all__ = [
     "BaseReader",
     "PandasExcelReader",
     "ExcelReader",
+    "SpreadsheetReader",
     "MathpixPDFReader",
     "ImageReader",
     "OCRReader",
@@ -30,6 +34,8 @@ __all__ = [
     "AdobeReader",
     "TxtReader",
     "PDFThumbnailReader",
+    "ReaderCache",
+    "ShardedPDFReader",
     "WebReader",
     "DoclingReader",
 ]
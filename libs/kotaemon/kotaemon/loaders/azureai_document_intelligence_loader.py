@@ -9,7 +9,7 @@ from PIL import Image
 from kotaemon.base import Document, Param
 
 from .base import BaseReader
-from .utils.adobe import generate_single_figure_caption
+from .utils.adobe import generate_figure_captions
 
 
 def crop_image(file_path: Path, bbox: list[float], page_number: int = 0) -> Image.Image:
@@ -145,6 +145,7 @@ class AzureAIDocumentIntelligenceLoader(BaseReader):
 
         # extract the figures
         figures = []
+        figure_metadatas: list[dict] = []
         for figure_desc in result.get("figures", []):
             if not self.vlm_endpoint:
                 continue
@@ -172,11 +173,6 @@ class AzureAIDocumentIntelligenceLoader(BaseReader):
             img_base64 = base64.b64encode(img_bytes.getvalue()).decode("utf-8")
             img_base64 = f"data:image/png;base64,{img_base64}"
 
-            # caption the image
-            caption = generate_single_figure_caption(
-                figure=img_base64, vlm_endpoint=self.vlm_endpoint
-            )
-
             # store the image into document
             figure_metadata = {
                 "image_origin": img_base64,
@@ -185,13 +181,22 @@ class AzureAIDocumentIntelligenceLoader(BaseReader):
             }
             figure_metadata.update(metadata)
 
+            figure_metadatas.append(figure_metadata)
+            removed_spans += figure_desc["spans"]
+
+        # caption the images concurrently
+        captions = generate_figure_captions(
+            self.vlm_endpoint,
+            [figure_metadata["image_origin"] for figure_metadata in figure_metadatas],
+            len(figure_metadatas),
+        )
+        for figure_metadata, caption in zip(figure_metadatas, captions):
             figures.append(
                 Document(
                     text=caption,
                     metadata=figure_metadata,
                 )
             )
-            removed_spans += figure_desc["spans"]
 
         # extract the tables
         tables = []
@@ -1,5 +1,5 @@
 from pathlib import Path
-from typing import TYPE_CHECKING, Any, List, Type, Union
+from typing import TYPE_CHECKING, Any, Iterator, List, Type, Union
 
 from kotaemon.base import BaseComponent, Document
 
@@ -8,9 +8,20 @@ if TYPE_CHECKING:
 
 
 class BaseReader(BaseComponent):
-    """The base class for all readers"""
+    """The base class for all readers
 
-    ...
+    Readers implement `load_data`, which returns all the documents of a file at
+    once. Readers that can produce documents incrementally (page by page, row
+    window by row window...) should also implement `lazy_load_data` so that
+    callers can process large files with bounded memory.
+    """
+
+    def lazy_load_data(self, *args, **kwargs) -> Iterator[Document]:
+        """Yield the documents of a file one by one
+
+        The default implementation falls back to `load_data`.
+        """
+        yield from self.load_data(*args, **kwargs)
 
 
 class AutoReader(BaseReader):
@@ -0,0 +1,175 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import pickle
+import tempfile
+import threading
+import uuid
+from pathlib import Path
+from typing import Any, Iterable, Iterator, Optional
+
+from kotaemon.base import Document
+
+logger = logging.getLogger(__name__)
+
+
+def file_sha256(file_path: str | Path, block_size: int = 1 << 20) -> str:
+    """Compute the sha256 of a file without loading it in memory"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while block := f.read(block_size):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def reader_fingerprint(reader: Any) -> str:
+    """Describe the class and the parameters of a reader as a stable string
+
+    kotaemon readers are described by their exported config. For other readers
+    (e.g. llama-index readers), the JSON-serializable public and private attributes
+    are used, other values (clients, models...) are ignored.
+    """
+    cls = f"{reader.__class__.__module__}.{reader.__class__.__qualname__}"
+    if hasattr(reader, "dump"):
+        params = reader.dump()
+    else:
+        params = {}
+        for key, value in sorted(vars(reader).items()):
+            try:
+                params[key] = json.loads(json.dumps(value))
+            except (TypeError, ValueError):
+                continue
+    return f"{cls}:{json.dumps(params, sort_keys=True, default=str)}"
+
+
+class ReaderCache:
+    """Persistent cache of the documents produced by a reader for a file
+
+    The entries are keyed by (sha256 of the file, reader class, reader params), so
+    that re-indexing a file (e.g. with another chunk size or embedding model) does
+    not call the (slow or paid) reader again, while changing the reader or its
+    settings invalidates the entry.
+
+    Each entry is a gzip stream of pickled documents that is written and read one
+    document at a time, so caching does not defeat lazy loading. The least recently
+    used entries are evicted once the cache directory grows over `max_size` bytes.
+
+    Args:
+        cache_dir: directory of the cache
+        max_size: maximum size of the cache directory in bytes
+    """
+
+    suffix = ".docs.gz"
+
+    def __init__(self, cache_dir: str | Path, max_size: int = 2 * 1024**3):
+        self.cache_dir = Path(cache_dir)
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def key(self, file_path: str | Path, reader: Any) -> str:
+        fingerprint = reader_fingerprint(reader)
+        return hashlib.sha256(
+            f"{file_sha256(file_path)}\x00{fingerprint}".encode()
+        ).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}{self.suffix}"
+
+    def get(self, key: str) -> Optional[Iterator[Document]]:
+        """Iterate over the cached documents, None if the entry does not exist"""
+        path = self._path(key)
+        try:
+            f = gzip.open(path, "rb")
+        except FileNotFoundError:
+            return None
+
+        # mark the entry as recently used
+        path.touch()
+        return self._iter_entry(f)
+
+    def _iter_entry(self, f) -> Iterator[Document]:
+        with f:
+            while True:
+                try:
+                    doc = pickle.load(f)
+                except EOFError:
+                    return
+                # give every cache hit its own document ids, the same file may be
+                # indexed several times
+                doc.id_ = str(uuid.uuid4())
+                yield doc
+
+    def put(self, key: str, docs: Iterable[Document]) -> Iterator[Document]:
+        """Cache the documents while passing them through
+
+        The entry is only committed once `docs` is exhausted, an interrupted
+        loading leaves the cache untouched.
+        """
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as raw, gzip.GzipFile(
+                fileobj=raw, mode="wb", compresslevel=6
+            ) as f:
+                for doc in docs:
+                    pickle.dump(doc, f, protocol=pickle.HIGHEST_PROTOCOL)
+                    yield doc
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        self.evict()
+
+    def load(
+        self, reader: Any, file_path: str | Path, extra_info: Optional[dict] = None
+    ) -> Iterator[Document]:
+        """Load the documents of `file_path` with `reader`, from the cache if
+        possible. Lazy loading is used when the reader supports it."""
+        extra_info = extra_info or {}
+        key = self.key(file_path, reader)
+
+        cached = self.get(key)
+        if cached is not None:
+            logger.info(f"Loading {file_path} from the reader cache")
+            for doc in cached:
+                # the extra info (file id...) is specific to this indexing run
+                doc.metadata.update(extra_info)
+                yield doc
+            return
+
+        try:
+            docs = reader.lazy_load_data(file_path, extra_info=extra_info)
+        except NotImplementedError:
+            # llama-index readers raise when they do not support lazy loading
+            docs = reader.load_data(file_path, extra_info=extra_info)
+        yield from self.put(key, docs)
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits `max_size`"""
+        with self._lock:
+            entries = []
+            total_size = 0
+            for path in self.cache_dir.glob(f"*/*{self.suffix}"):
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total_size += stat.st_size
+
+            entries.sort()
+            for _, size, path in entries:
+                if total_size <= self.max_size:
+                    break
+                path.unlink(missing_ok=True)
+                total_size -= size
+
+    def clear(self):
+        """Remove all the entries"""
+        for path in self.cache_dir.glob(f"*/*{self.suffix}"):
+            path.unlink(missing_ok=True)
@@ -8,7 +8,7 @@ from kotaemon.base import Document, Param
 
 from .azureai_document_intelligence_loader import crop_image
 from .base import BaseReader
-from .utils.adobe import generate_single_figure_caption, make_markdown_table
+from .utils.adobe import generate_figure_captions, make_markdown_table
 
 
 class DoclingReader(BaseReader):
@@ -70,7 +70,7 @@ class DoclingReader(BaseReader):
 
         # extract the figures
         figures = []
-        gen_caption_count = 0
+        figure_items: list[tuple[list[str], dict]] = []
         for figure_obj in result_dict.get("pictures", []):
             if not self.vlm_endpoint:
                 continue
@@ -118,18 +118,6 @@ class DoclingReader(BaseReader):
             img_base64 = base64.b64encode(img_bytes.getvalue()).decode("utf-8")
             img_base64 = f"data:image/png;base64,{img_base64}"
 
-            # generate the generative caption
-            if gen_caption_count >= self.max_figure_to_caption:
-                gen_caption = ""
-            else:
-                gen_caption_count += 1
-                gen_caption = generate_single_figure_caption(
-                    figure=img_base64, vlm_endpoint=self.vlm_endpoint
-                )
-
-            # join the extractive and generative captions
-            caption = "\n".join(extractive_captions + [gen_caption])
-
             # store the image into document
             figure_metadata = {
                 "image_origin": img_base64,
@@ -140,6 +128,19 @@ class DoclingReader(BaseReader):
             }
             figure_metadata.update(metadata)
 
+            figure_items.append((extractive_captions, figure_metadata))
+
+        # generate the generative captions concurrently
+        gen_captions = generate_figure_captions(
+            self.vlm_endpoint,
+            [figure_metadata["image_origin"] for _, figure_metadata in figure_items],
+            self.max_figure_to_caption,
+        )
+        for (extractive_captions, figure_metadata), gen_caption in zip(
+            figure_items, gen_captions
+        ):
+            # join the extractive and generative captions
+            caption = "\n".join(extractive_captions + [gen_caption])
             figures.append(
                 Document(
                     text=caption,
@@ -4,7 +4,7 @@ Pandas parser for .xlsx files.
 
 """
 from pathlib import Path
-from typing import Any, List, Optional, Union
+from typing import Any, Iterator, List, Optional, Union
 
 from llama_index.core.readers.base import BaseReader
 
@@ -60,8 +60,29 @@ class PandasExcelReader(BaseReader):
             List[Document]: A list of`Document objects containing the
                 values from the specified column in the Excel file.
         """
-        import itertools
+        texts = [
+            doc.text
+            for doc in self.lazy_load_data(
+                file,
+                include_sheetname=include_sheetname,
+                sheet_name=sheet_name,
+                extra_info=extra_info,
+                **kwargs,
+            )
+        ]
+        return [Document(text=self._row_joiner.join(texts), metadata=extra_info or {})]
 
+    def lazy_load_data(
+        self,
+        file: Path,
+        include_sheetname: bool = False,
+        sheet_name: Optional[Union[str, int, list]] = None,
+        extra_info: Optional[dict] = None,
+        **kwargs,
+    ) -> Iterator[Document]:
+        """Same as `load_data` but read the workbook one sheet at a time and yield
+        a Document per sheet, so that only one sheet is held in memory. Joined with
+        the row joiner, their texts are the text of the document of `load_data`."""
         try:
             import pandas as pd
         except ImportError:
@@ -74,34 +95,22 @@ class PandasExcelReader(BaseReader):
                 [sheet_name] if not isinstance(sheet_name, list) else sheet_name
             )
 
-        dfs = pd.read_excel(file, sheet_name=sheet_name, **self._pandas_config)
-        sheet_names = dfs.keys()
-        df_sheets = []
-
-        for key in sheet_names:
-            sheet = []
-            if include_sheetname:
-                sheet.append([key])
-            dfs[key] = dfs[key].dropna(axis=0, how="all")
-            dfs[key] = dfs[key].dropna(axis=0, how="all")
-            dfs[key].fillna("", inplace=True)
-            sheet.extend(dfs[key].values.astype(str).tolist())
-            df_sheets.append(sheet)
-
-        text_list = list(
-            itertools.chain.from_iterable(df_sheets)
-        )  # flatten list of lists
-
-        output = [
-            Document(
-                text=self._row_joiner.join(
-                    self._col_joiner.join(sublist) for sublist in text_list
-                ),
-                metadata=extra_info or {},
-            )
-        ]
+        with pd.ExcelFile(file) as xls:
+            for key in sheet_name if sheet_name is not None else xls.sheet_names:
+                df = xls.parse(key, **self._pandas_config)
+                df = df.dropna(axis=0, how="all")
+                df.fillna("", inplace=True)
 
-        return output
+                rows = df.values.astype(str).tolist()
+                if include_sheetname:
+                    rows.insert(0, [key])
+                if rows:
+                    yield Document(
+                        text=self._row_joiner.join(
+                            self._col_joiner.join(row) for row in rows
+                        ),
+                        metadata=extra_info or {},
+                    )
 
 
 class ExcelReader(BaseReader):
@@ -153,7 +162,25 @@ class ExcelReader(BaseReader):
             List[Document]: A list of`Document objects containing the
                 values from the specified column in the Excel file.
         """
+        return list(
+            self.lazy_load_data(
+                file,
+                include_sheetname=include_sheetname,
+                sheet_name=sheet_name,
+                extra_info=extra_info,
+                **kwargs,
+            )
+        )
 
+    def lazy_load_data(
+        self,
+        file: Path,
+        include_sheetname: bool = True,
+        sheet_name: Optional[Union[str, int, list]] = None,
+        extra_info: Optional[dict] = None,
+        **kwargs,
+    ) -> Iterator[Document]:
+        """Same as `load_data` but read the workbook one sheet at a time"""
         try:
             import pandas as pd
         except ImportError:
@@ -170,23 +197,19 @@ class ExcelReader(BaseReader):
         file = Path(file)
         extra_info = extra_info or {}
 
-        dfs = pd.read_excel(file, sheet_name=sheet_name, **self._pandas_config)
-        sheet_names = dfs.keys()
-        output = []
-
-        for idx, key in enumerate(sheet_names):
-            dfs[key] = dfs[key].dropna(axis=0, how="all")
-            dfs[key] = dfs[key].dropna(axis=0, how="all")
-            dfs[key] = dfs[key].astype("object")
-            dfs[key].fillna("", inplace=True)
-
-            rows = dfs[key].values.astype(str).tolist()
-            content = self._row_joiner.join(
-                self._col_joiner.join(row).strip() for row in rows
-            ).strip()
-            if include_sheetname:
-                content = f"(Sheet {key} of file {file.name})\n{content}"
-            metadata = {"page_label": idx + 1, "sheet_name": key, **extra_info}
-            output.append(Document(text=content, metadata=metadata))
-
-        return output
+        with pd.ExcelFile(file) as xls:
+            sheet_names = sheet_name if sheet_name is not None else xls.sheet_names
+            for idx, key in enumerate(sheet_names):
+                df = xls.parse(key, **self._pandas_config)
+                df = df.dropna(axis=0, how="all")
+                df = df.astype("object")
+                df.fillna("", inplace=True)
+
+                rows = df.values.astype(str).tolist()
+                content = self._row_joiner.join(
+                    self._col_joiner.join(row).strip() for row in rows
+                ).strip()
+                if include_sheetname:
+                    content = f"(Sheet {key} of file {file.name})\n{content}"
+                metadata = {"page_label": idx + 1, "sheet_name": key, **extra_info}
+                yield Document(text=content, metadata=metadata)
@@ -1,6 +1,6 @@
 import email
 from pathlib import Path
-from typing import Optional
+from typing import Iterator, Optional
 
 from llama_index.core.readers.base import BaseReader
 from theflow.settings import settings as flowsettings
@@ -45,6 +45,12 @@ class HtmlReader(BaseReader):
         Returns:
             list[Document]: list of documents extracted from the HTML file
         """
+        return list(self.lazy_load_data(file_path, extra_info=extra_info, **kwargs))
+
+    def lazy_load_data(
+        self, file_path: Path | str, extra_info: Optional[dict] = None, **kwargs
+    ) -> Iterator[Document]:
+        """Yield the pages of the HTML file one by one"""
         import html2text
 
         file_path = Path(file_path).resolve()
@@ -63,15 +69,11 @@ class HtmlReader(BaseReader):
         extra_info = extra_info or {}
 
         # create Document from non-table text
-        documents = [
-            Document(
+        for page_id, page in enumerate(pages):
+            yield Document(
                 text=page.strip(),
                 metadata={"page_label": page_id + 1, **extra_info},
             )
-            for page_id, page in enumerate(pages)
-        ]
-
-        return documents
 
 
 class MhtmlReader(BaseReader):
@@ -1,7 +1,8 @@
 import base64
+import logging
 from io import BytesIO
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional
 
 from decouple import config
 from fsspec import AbstractFileSystem
@@ -10,6 +11,8 @@ from PIL import Image
 
 from kotaemon.base import Document
 
+logger = logging.getLogger(__name__)
+
 PDF_LOADER_DPI = config("PDF_LOADER_DPI", default=40, cast=int)
 
 
@@ -25,8 +28,6 @@ def get_page_thumbnails(
     Returns:
         list[Image.Image]: list of page thumbnails
     """
-
-    img: Image.Image
     suffix = file_path.suffix.lower()
     assert suffix == ".pdf", "This function only supports PDF files."
     try:
@@ -38,14 +39,28 @@ def get_page_thumbnails(
 
     output_imgs = []
     for page_number in pages:
-        page = doc.load_page(page_number)
-        pm = page.get_pixmap(dpi=dpi)
-        img = Image.frombytes("RGB", [pm.width, pm.height], pm.samples)
-        output_imgs.append(convert_image_to_base64(img))
+        output_imgs.append(get_page_thumbnail(doc, page_number, dpi=dpi))
 
     return output_imgs
 
 
+def get_page_thumbnail(doc, page_number: int, dpi: int = PDF_LOADER_DPI) -> str:
+    """Render a page of an opened PyMuPDF document into a base64 image
+
+    Args:
+        doc (fitz.Document): the opened PDF document
+        page_number (int): the index of the page to render
+
+    Returns:
+        str: the base64 data URL of the page thumbnail
+    """
+    img: Image.Image
+    page = doc.load_page(page_number)
+    pm = page.get_pixmap(dpi=dpi)
+    img = Image.frombytes("RGB", [pm.width, pm.height], pm.samples)
+    return convert_image_to_base64(img)
+
+
 def convert_image_to_base64(img: Image.Image) -> str:
     # convert the image into base64
     img_bytes = BytesIO()
@@ -72,46 +87,64 @@ class PDFThumbnailReader(PDFReader):
         fs: Optional[AbstractFileSystem] = None,
     ) -> List[Document]:
         """Parse file."""
-        documents = super().load_data(file, extra_info, fs)
-
-        page_numbers_str = []
-        filtered_docs = []
-        is_int_page_number: dict[str, bool] = {}
-
-        for doc in documents:
-            if "page_label" in doc.metadata:
-                page_num_str = doc.metadata["page_label"]
-                page_numbers_str.append(page_num_str)
-                try:
-                    _ = int(page_num_str)
-                    is_int_page_number[page_num_str] = True
-                    filtered_docs.append(doc)
-                except ValueError:
-                    is_int_page_number[page_num_str] = False
-                    continue
-
-        documents = filtered_docs
-        page_numbers = list(range(len(page_numbers_str)))
-
-        print("Page numbers:", len(page_numbers))
-        page_thumbnails = get_page_thumbnails(file, page_numbers)
-
-        documents.extend(
-            [
-                Document(
-                    text="Page thumbnail",
-                    metadata={
-                        "image_origin": page_thumbnail,
-                        "type": "thumbnail",
-                        "page_label": page_number,
-                        **(extra_info if extra_info is not None else {}),
-                    },
-                )
-                for (page_thumbnail, page_number) in zip(
-                    page_thumbnails, page_numbers_str
-                )
-                if is_int_page_number[page_number]
-            ]
-        )
-
-        return documents
+        documents = list(self.lazy_load_data(file, extra_info, fs))
+
+        # keep the page texts first, followed by the page thumbnails
+        return [doc for doc in documents if doc.metadata.get("type") != "thumbnail"] + [
+            doc for doc in documents if doc.metadata.get("type") == "thumbnail"
+        ]
+
+    def lazy_load_data(
+        self,
+        file: Path,
+        extra_info: Optional[Dict] = None,
+        fs: Optional[AbstractFileSystem] = None,
+    ) -> Iterator[Document]:
+        """Parse file page by page.
+
+        For each page with an integer page label, yield the page thumbnail followed
+        by the page text. Only one page is held in memory at a time.
+        """
+        try:
+            import fitz
+            import pypdf
+        except ImportError:
+            raise ImportError(
+                "Please install PyMuPDF and pypdf: 'pip install PyMuPDF pypdf'"
+            )
+
+        file = Path(file)
+        extra_info = extra_info or {}
+
+        with (fs.open(str(file), "rb") if fs else open(file, "rb")) as fp:
+            pdf = pypdf.PdfReader(fp)
+            with fitz.open(file) as thumbnail_source:
+                num_pages = len(pdf.pages)
+                logger.debug(f"Page numbers: {num_pages}")
+
+                for page_idx in range(num_pages):
+                    page_label = pdf.page_labels[page_idx]
+                    try:
+                        _ = int(page_label)
+                    except ValueError:
+                        continue
+
+                    yield Document(
+                        text="Page thumbnail",
+                        metadata={
+                            "image_origin": get_page_thumbnail(
+                                thumbnail_source, page_idx
+                            ),
+                            "type": "thumbnail",
+                            "page_label": page_label,
+                            **extra_info,
+                        },
+                    )
+                    yield Document(
+                        text=pdf.pages[page_idx].extract_text(),
+                        metadata={
+                            "page_label": page_label,
+                            "file_name": file.name,
+                            **extra_info,
+                        },
+                    )
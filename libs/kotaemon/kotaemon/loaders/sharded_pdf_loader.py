@@ -0,0 +1,219 @@
+import json
+import multiprocessing
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+from theflow.utils.modules import import_dotted_string
+
+from kotaemon.base import Document, Param
+
+from .base import BaseReader
+
+# process pools are shared by all the readers and reused across files, so that the
+# (spawn) start-up cost of the workers is only paid once
+_pools: dict[int, ProcessPoolExecutor] = {}
+_pools_lock = threading.Lock()
+
+# readers instantiated inside a worker process, keyed by their specification
+_worker_readers: dict[tuple[str, str], object] = {}
+
+
+def get_process_pool(num_workers: int) -> ProcessPoolExecutor:
+    """Get the shared process pool with `num_workers` workers"""
+    with _pools_lock:
+        if num_workers not in _pools:
+            _pools[num_workers] = ProcessPoolExecutor(
+                max_workers=num_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pools[num_workers]
+
+
+def _load_shard(
+    reader_class: str,
+    reader_kwargs: dict,
+    shard_path: str,
+    extra_info: dict,
+) -> list[Document]:
+    """Run the reader on a shard, executed inside a worker process"""
+    key = (reader_class, json.dumps(reader_kwargs, sort_keys=True, default=str))
+    if key not in _worker_readers:
+        _worker_readers[key] = import_dotted_string(reader_class, safe=False)(
+            **reader_kwargs
+        )
+    reader = _worker_readers[key]
+    try:
+        return list(reader.lazy_load_data(Path(shard_path), extra_info=extra_info))
+    except NotImplementedError:
+        return list(reader.load_data(Path(shard_path), extra_info=extra_info))
+
+
+def page_ranges(num_pages: int, num_shards: int, min_pages: int) -> list[range]:
+    """Split `num_pages` pages into at most `num_shards` contiguous ranges having
+    at least `min_pages` pages each (except when the document is shorter)"""
+    num_shards = max(1, min(num_shards, num_pages // max(min_pages, 1)))
+    size, extra = divmod(num_pages, num_shards)
+    ranges, start = [], 0
+    for idx in range(num_shards):
+        end = start + size + (1 if idx < extra else 0)
+        ranges.append(range(start, end))
+        start = end
+    return ranges
+
+
+class ShardedPDFReader(BaseReader):
+    """Parse a PDF in parallel by splitting it into page ranges
+
+    Each page range is written to a temporary PDF file and parsed by the configured
+    reader in a pool of worker processes. The documents of all the shards are then
+    merged back in page order, with their `page_label` mapped back to the labels of
+    the original file.
+
+    The wrapped reader is instantiated once per worker process from `reader_class`
+    and `reader_kwargs`, and the process pool is shared across files.
+
+    Example:
+        ```python
+        reader = ShardedPDFReader(
+            reader_class="kotaemon.loaders.PDFThumbnailReader", num_workers=4
+        )
+        documents = reader.load_data("path/to/large.pdf")
+        ```
+    """
+
+    reader_class: str = Param(
+        "kotaemon.loaders.PDFThumbnailReader",
+        help="Dotted path of the reader class used to parse each shard",
+    )
+    reader_kwargs: dict = Param(
+        default_callback=lambda _: {},
+        help="Keyword arguments to instantiate the reader class",
+    )
+    num_workers: int = Param(4, help="Number of worker processes")
+    min_pages_per_shard: int = Param(
+        8,
+        help="Minimum number of pages of a shard. PDFs shorter than twice this "
+        "value are parsed in the current process.",
+    )
+
+    def run(
+        self, file_path: str | Path, extra_info: Optional[dict] = None, **kwargs
+    ) -> List[Document]:
+        return self.load_data(file_path, extra_info=extra_info, **kwargs)
+
+    def load_data(
+        self, file_path: str | Path, extra_info: Optional[dict] = None, **kwargs
+    ) -> List[Document]:
+        return list(self.lazy_load_data(file_path, extra_info=extra_info, **kwargs))
+
+    def lazy_load_data(
+        self, file_path: str | Path, extra_info: Optional[dict] = None, **kwargs
+    ) -> Iterator[Document]:
+        """Yield the documents shard by shard, in page order"""
+        from pypdf import PdfReader, PdfWriter
+
+        file_path = Path(file_path)
+        extra_info = extra_info or {}
+
+        pdf = PdfReader(file_path)
+        num_pages = len(pdf.pages)
+        page_labels = list(pdf.page_labels)
+        ranges = page_ranges(num_pages, self.num_workers, self.min_pages_per_shard)
+
+        if len(ranges) == 1 or self.num_workers <= 1:
+            yield from _load_shard(
+                self.reader_class, self.reader_kwargs, str(file_path), extra_info
+            )
+            return
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            shard_paths = []
+            for idx, page_range in enumerate(ranges):
+                writer = PdfWriter()
+                for page_idx in page_range:
+                    writer.add_page(pdf.pages[page_idx])
+                shard_path = Path(tmp_dir) / f"{idx:05d}_{file_path.name}"
+                with shard_path.open("wb") as f:
+                    writer.write(f)
+                shard_paths.append(shard_path)
+
+            # at most `num_workers` shards are parsed or held at the same time
+            pool: Executor = get_process_pool(self.num_workers)
+            shards = iter(zip(ranges, shard_paths))
+            in_flight: deque[tuple[range, Path, Future]] = deque()
+
+            def submit_next():
+                for page_range, shard_path in shards:
+                    future = pool.submit(
+                        _load_shard,
+                        self.reader_class,
+                        self.reader_kwargs,
+                        str(shard_path),
+                        extra_info,
+                    )
+                    in_flight.append((page_range, shard_path, future))
+                    return
+
+            try:
+                for _ in range(self.num_workers):
+                    submit_next()
+                while in_flight:
+                    page_range, shard_path, future = in_flight.popleft()
+                    docs = future.result()
+                    submit_next()
+                    for doc in docs:
+                        restored = self._restore_metadata(
+                            doc, page_range, page_labels, shard_path, file_path
+                        )
+                        if restored is not None:
+                            yield restored
+            finally:
+                # the shard files are removed with the directory: cancel the pending
+                # shards and wait for the running ones
+                for _, _, future in in_flight:
+                    future.cancel()
+                wait([future for _, _, future in in_flight])
+
+    @staticmethod
+    def _restore_metadata(
+        doc: Document,
+        page_range: range,
+        page_labels: list[str],
+        shard_path: Path,
+        file_path: Path,
+    ) -> Optional[Document]:
+        """Map the shard page label and path back to the original file
+
+        The shards number their pages from 1, so the pages whose original label is
+        not an integer (e.g. roman numerals) are dropped, as when the file is not
+        sharded.
+        """
+        page_label = doc.metadata.get("page_label")
+        try:
+            page_idx = page_range.start + int(page_label) - 1  # type: ignore
+        except (TypeError, ValueError):
+            page_idx = -1
+        if page_idx in page_range:
+            original_label = page_labels[page_idx]
+            try:
+                int(original_label)
+            except ValueError:
+                return None
+            # keep the type of the label produced by the reader (str or int)
+            doc.metadata["page_label"] = (
+                type(page_label)(original_label)
+                if isinstance(page_label, int) and original_label.isdigit()
+                else original_label
+            )
+
+        for key, value in doc.metadata.items():
+            if value == str(shard_path):
+                doc.metadata[key] = str(file_path)
+            elif value == shard_path.name:
+                doc.metadata[key] = file_path.name
+
+        return doc
@@ -0,0 +1,146 @@
+import csv
+from pathlib import Path
+from typing import Any, Iterable, Iterator, Optional
+
+from kotaemon.base import Document
+
+from .base import BaseReader
+
+
+def _cell_to_str(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+
+class SpreadsheetReader(BaseReader):
+    """Stream a spreadsheet (.xlsx, .xlsm, .csv, .tsv) as windows of rows
+
+    The workbook is read row by row, with openpyxl in read-only mode or with a csv
+    iterator, so that the memory used does not depend on the size of the file. Each
+    sheet is cut into documents of at most `rows_per_document` rows (and roughly
+    `max_chars_per_document` characters), each starting with the header row of the
+    sheet so that it can be understood on its own.
+
+    The metadata of each document contains the sheet name and the range of rows
+    (1-based, as displayed by spreadsheet applications) that it covers.
+
+    Args:
+        rows_per_document: maximum number of data rows in a document
+        max_chars_per_document: a document is closed early once its text exceeds
+            this number of characters
+        include_sheetname: prefix each document with the sheet and file name
+        row_joiner: string used to join the rows
+        col_joiner: string used to join the cells of a row
+    """
+
+    rows_per_document: int = 50
+    max_chars_per_document: int = 4000
+    include_sheetname: bool = True
+    row_joiner: str = "\n"
+    col_joiner: str = " | "
+
+    def run(
+        self, file_path: str | Path, extra_info: Optional[dict] = None, **kwargs
+    ) -> list[Document]:
+        return self.load_data(Path(file_path), extra_info=extra_info, **kwargs)
+
+    def load_data(
+        self, file_path: Path, extra_info: Optional[dict] = None, **kwargs
+    ) -> list[Document]:
+        return list(self.lazy_load_data(file_path, extra_info=extra_info, **kwargs))
+
+    def lazy_load_data(
+        self, file_path: Path, extra_info: Optional[dict] = None, **kwargs
+    ) -> Iterator[Document]:
+        file_path = Path(file_path)
+        extra_info = extra_info or {}
+
+        for sheet_idx, (sheet_name, rows) in enumerate(self._iter_sheets(file_path)):
+            for text, row_start, row_end in self._iter_windows(rows):
+                if self.include_sheetname:
+                    text = f"(Sheet {sheet_name} of file {file_path.name})\n{text}"
+                yield Document(
+                    text=text,
+                    metadata={
+                        "page_label": sheet_idx + 1,
+                        "sheet_name": sheet_name,
+                        "row_start": row_start,
+                        "row_end": row_end,
+                        **extra_info,
+                    },
+                )
+
+    def _iter_sheets(
+        self, file_path: Path
+    ) -> Iterator[tuple[str, Iterable[tuple[int, list[str]]]]]:
+        """Yield (sheet name, iterator of (row number, cells)) for each sheet"""
+        if file_path.suffix.lower() in (".csv", ".tsv"):
+            with open(file_path, newline="", encoding="utf-8-sig") as f:
+                delimiter = "\t" if file_path.suffix.lower() == ".tsv" else ","
+                rows = csv.reader(f, delimiter=delimiter)
+                yield file_path.stem, (
+                    (idx, [cell.strip() for cell in row])
+                    for idx, row in enumerate(rows, start=1)
+                )
+            return
+
+        try:
+            from openpyxl import load_workbook
+        except ImportError:
+            raise ImportError(
+                "install openpyxl using `pip install openpyxl` to use this loader"
+            )
+
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            for sheet in workbook.worksheets:
+                yield sheet.title, (
+                    (idx, [_cell_to_str(value) for value in row])
+                    for idx, row in enumerate(sheet.iter_rows(values_only=True), 1)
+                )
+        finally:
+            workbook.close()
+
+    def _iter_windows(
+        self, rows: Iterable[tuple[int, list[str]]]
+    ) -> Iterator[tuple[str, int, int]]:
+        """Group the non-empty rows of a sheet into windows, the first non-empty
+        row being the header repeated at the top of every window"""
+        header, header_row = "", 0
+        window: list[str] = []
+        window_chars = 0
+        row_start = row_end = 0
+
+        for row_idx, cells in rows:
+            # read-only sheets pad rows to the sheet width, drop the empty tail
+            while cells and not cells[-1]:
+                cells.pop()
+            if not cells:
+                continue
+
+            line = self.col_joiner.join(cells)
+            if not header_row:
+                header, header_row = line, row_idx
+                continue
+
+            if not window:
+                row_start = row_idx
+            window.append(line)
+            window_chars += len(line) + len(self.row_joiner)
+            row_end = row_idx
+
+            if (
+                len(window) >= self.rows_per_document
+                or window_chars >= self.max_chars_per_document
+            ):
+                yield self.row_joiner.join([header, *window]), row_start, row_end
+                window, window_chars = [], 0
+
+        if window:
+            yield self.row_joiner.join([header, *window]), row_start, row_end
+        elif header_row and not row_end:
+            # a sheet with a single row, keep it as content
+            yield header, header_row, header_row
@@ -1,5 +1,5 @@
 from pathlib import Path
-from typing import Optional
+from typing import Iterator, Optional
 
 from kotaemon.base import Document
 
@@ -7,6 +7,15 @@ from .base import BaseReader
 
 
 class TxtReader(BaseReader):
+    """Read a plain text file
+
+    Args:
+        block_size: when loading lazily, the approximate number of characters of
+            each yielded document. The file is cut at paragraph (or line) breaks.
+    """
+
+    block_size: int = 1_000_000
+
     def run(
         self, file_path: str | Path, extra_info: Optional[dict] = None, **kwargs
     ) -> list[Document]:
@@ -20,3 +29,27 @@ class TxtReader(BaseReader):
 
         metadata = extra_info or {}
         return [Document(text=text, metadata=metadata)]
+
+    def lazy_load_data(
+        self, file_path: Path, extra_info: Optional[dict] = None, **kwargs
+    ) -> Iterator[Document]:
+        metadata = extra_info or {}
+        buffer = ""
+        n_docs = 0
+        with open(file_path, "r", encoding="utf-8") as f:
+            while block := f.read(self.block_size):
+                buffer += block
+
+                # cut after the last paragraph break, or at least a line break, so
+                # that no paragraph is split across two documents
+                cut = buffer.rfind("\n\n")
+                cut = cut + 2 if cut != -1 else buffer.rfind("\n") + 1
+                if cut <= 0:
+                    continue
+
+                yield Document(text=buffer[:cut], metadata=dict(metadata))
+                n_docs += 1
+                buffer = buffer[cut:]
+
+        if buffer or not n_docs:
+            yield Document(text=buffer, metadata=dict(metadata))
@@ -6,14 +6,13 @@ import logging
 import os
 import tempfile
 import zipfile
-from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import List, Union
 
 import pandas as pd
 from decouple import config
 
-from kotaemon.loaders.utils.gpt4v import generate_gpt4v
+from kotaemon.loaders.utils.captioning import get_figure_captioner
 
 
 def request_adobe_service(file_path: str, output_path: str = "") -> str:
@@ -203,22 +202,8 @@ def parse_figure_paths(file_paths: List[Path]) -> Union[bytes, str]:
 
 
 def generate_single_figure_caption(vlm_endpoint: str, figure: str) -> str:
-    output = ""
-
     """Summarize a single figure using GPT-4V"""
-    if figure:
-        try:
-            output = generate_gpt4v(
-                endpoint=vlm_endpoint,
-                prompt="Provide a short 2 sentence summary of this image?",
-                images=figure,
-            )
-            if "sorry" in output.lower():
-                output = ""
-        except Exception as e:
-            print(f"Error generating caption: {e}")
-
-    return output
+    return get_figure_captioner().caption(vlm_endpoint, figure)
 
 
 def generate_figure_captions(
@@ -235,16 +220,6 @@ def generate_figure_captions(
         results (List[str]): list of all figure captions and empty strings for
         ignored figures.
     """
-    to_gen_figures = figures[:max_figures_to_process]
-    other_figures = figures[max_figures_to_process:]
-
-    with ThreadPoolExecutor() as executor:
-        futures = [
-            executor.submit(
-                lambda: generate_single_figure_caption(vlm_endpoint, figure)
-            )
-            for figure in to_gen_figures
-        ]
-
-    results = [future.result() for future in futures]
-    return results + [""] * len(other_figures)
+    return get_figure_captioner().caption_many(
+        vlm_endpoint, figures, max_figures_to_process
+    )
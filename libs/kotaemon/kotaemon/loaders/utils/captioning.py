@@ -0,0 +1,248 @@
+import base64
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from io import BytesIO
+from pathlib import Path
+from typing import Optional
+
+from kotaemon.loaders.utils.gpt4v import generate_gpt4v
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CAPTION_PROMPT = "Provide a short 2 sentence summary of this image?"
+
+
+def downscale_image(figure: str, max_size: int) -> str:
+    """Downscale a base64 data-url image so that its longest side is at most
+    `max_size` pixels. The image is returned unchanged if it is already smaller
+    or cannot be decoded."""
+    from PIL import Image
+
+    header, _, data = figure.partition(",")
+    if not data:
+        return figure
+
+    try:
+        img = Image.open(BytesIO(base64.b64decode(data)))
+        if max(img.size) <= max_size:
+            return figure
+        img.thumbnail((max_size, max_size))
+        if img.mode not in ("RGB", "RGBA", "L", "LA"):
+            img = img.convert("RGBA")
+        buffer = BytesIO()
+        img.save(buffer, format="PNG", optimize=True)
+    except Exception as e:
+        logger.warning(f"Cannot downscale figure: {e}")
+        return figure
+
+    return "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+
+class FigureCaptioner:
+    """Caption figures with a vision language model
+
+    - at most `max_workers` requests are sent to the VLM at the same time, the
+      thread pool is shared by all the documents being ingested
+    - failed requests are retried up to `max_retries` times with exponential
+      backoff
+    - captions are cached by the hash of the VLM endpoint, the prompt and the
+      (optionally downscaled) image, in memory (the `max_memory_entries` most
+      recently used) and in `cache_dir` if provided, so that duplicated figures
+      (logos, recurring charts...) are only captioned once
+    - images larger than `max_image_size` pixels are downscaled before upload
+
+    Args:
+        max_workers: maximum number of concurrent VLM requests
+        max_retries: number of retries of a failed request
+        retry_backoff: delay (seconds) before the first retry, doubled each retry
+        cache_dir: directory of the persistent caption cache, None to disable
+        max_image_size: maximum length (pixels) of the longest side of the image,
+            None to send the original image
+        prompt: the captioning prompt
+        max_memory_entries: maximum number of captions cached in memory
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 4,
+        max_retries: int = 2,
+        retry_backoff: float = 1.0,
+        cache_dir: Optional[str | Path] = None,
+        max_image_size: Optional[int] = 1024,
+        prompt: str = DEFAULT_CAPTION_PROMPT,
+        max_memory_entries: int = 1024,
+    ):
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.max_image_size = max_image_size
+        self.prompt = prompt
+        self.max_memory_entries = max_memory_entries
+
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.RLock()
+        self._memory_cache: OrderedDict[str, str] = OrderedDict()
+        self._pending: dict[str, Future] = {}
+
+        if self.cache_dir:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="vlm-caption"
+                )
+            return self._executor
+
+    def cache_key(self, figure: str, vlm_endpoint: str = "") -> str:
+        """The key of a caption: the endpoint (hence the model) of the VLM, the
+        prompt and the figure"""
+        return hashlib.sha256(
+            f"{vlm_endpoint}\x00{self.prompt}\x00{figure}".encode()
+        ).hexdigest()
+
+    def _cache_path(self, key: str) -> Path:
+        assert self.cache_dir is not None
+        return self.cache_dir / key[:2] / f"{key}.txt"
+
+    def _remember(self, key: str, caption: str):
+        """Keep a caption in memory, forget the least recently used ones"""
+        with self._lock:
+            self._memory_cache[key] = caption
+            self._memory_cache.move_to_end(key)
+            while len(self._memory_cache) > self.max_memory_entries:
+                self._memory_cache.popitem(last=False)
+
+    def _get_cached(self, key: str) -> Optional[str]:
+        if key in self._memory_cache:
+            self._memory_cache.move_to_end(key)
+            return self._memory_cache[key]
+        if self.cache_dir:
+            path = self._cache_path(key)
+            if path.exists():
+                caption = path.read_text(encoding="utf-8")
+                self._remember(key, caption)
+                return caption
+        return None
+
+    def _set_cached(self, key: str, caption: str):
+        self._remember(key, caption)
+        if self.cache_dir:
+            path = self._cache_path(key)
+            path.parent.mkdir(exist_ok=True)
+            # write to a temporary file first so that readers never see a
+            # partially written caption
+            fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(caption)
+            os.replace(tmp_path, path)
+
+    def _request(self, vlm_endpoint: str, figure: str) -> str:
+        for attempt in range(self.max_retries + 1):
+            try:
+                output = generate_gpt4v(
+                    endpoint=vlm_endpoint,
+                    prompt=self.prompt,
+                    images=figure,
+                    raise_error=True,
+                )
+                if "sorry" in output.lower():
+                    output = ""
+                return output
+            except Exception as e:
+                if attempt >= self.max_retries:
+                    logger.error(f"Error generating caption: {e}")
+                    raise
+                delay = self.retry_backoff * 2**attempt
+                logger.warning(f"Error generating caption: {e}, retry in {delay}s")
+                time.sleep(delay)
+        return ""
+
+    def _caption(self, vlm_endpoint: str, figure: str, key: str) -> str:
+        try:
+            caption = self._request(vlm_endpoint, figure)
+        except Exception:
+            # failures are not cached so that they are retried on the next ingestion
+            return ""
+        else:
+            self._set_cached(key, caption)
+            return caption
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def submit(self, vlm_endpoint: str, figure: str) -> Future:
+        """Schedule the captioning of a base64 data-url figure"""
+        if not figure or not vlm_endpoint:
+            future: Future = Future()
+            future.set_result("")
+            return future
+
+        if self.max_image_size:
+            figure = downscale_image(figure, self.max_image_size)
+
+        key = self.cache_key(figure, vlm_endpoint)
+        with self._lock:
+            cached = self._get_cached(key)
+            if cached is not None:
+                future = Future()
+                future.set_result(cached)
+                return future
+
+            # the same figure is already being captioned, share the request
+            if key in self._pending:
+                return self._pending[key]
+
+            future = self.executor.submit(self._caption, vlm_endpoint, figure, key)
+            self._pending[key] = future
+            return future
+
+    def caption(self, vlm_endpoint: str, figure: str) -> str:
+        """Caption a single base64 data-url figure"""
+        return self.submit(vlm_endpoint, figure).result()
+
+    def caption_many(
+        self, vlm_endpoint: str, figures: list[str], max_figures: Optional[int] = None
+    ) -> list[str]:
+        """Caption several figures concurrently, the figures after the first
+        `max_figures` get an empty caption"""
+        if max_figures is None:
+            max_figures = len(figures)
+        futures = [
+            self.submit(vlm_endpoint, figure) for figure in figures[:max_figures]
+        ]
+        captions = [future.result() for future in futures]
+        return captions + [""] * len(figures[max_figures:])
+
+
+_default_captioner: Optional[FigureCaptioner] = None
+_default_captioner_lock = threading.Lock()
+
+
+def get_figure_captioner() -> FigureCaptioner:
+    """Get the captioner shared by all the readers, configured from the
+    `KH_VLM_CAPTION_*` settings"""
+    global _default_captioner
+
+    with _default_captioner_lock:
+        if _default_captioner is None:
+            from theflow.settings import settings as flowsettings
+
+            _default_captioner = FigureCaptioner(
+                max_workers=getattr(flowsettings, "KH_VLM_CAPTION_CONCURRENCY", 4),
+                max_retries=getattr(flowsettings, "KH_VLM_CAPTION_RETRIES", 2),
+                cache_dir=getattr(flowsettings, "KH_VLM_CAPTION_CACHE_DIR", None),
+                max_image_size=getattr(
+                    flowsettings, "KH_VLM_CAPTION_MAX_IMAGE_SIZE", 1024
+                ),
+            )
+        return _default_captioner
@@ -14,6 +14,7 @@ def generate_gpt4v(
     prompt: str,
     max_tokens: int = 512,
     max_images: int = 10,
+    raise_error: bool = False,
 ) -> str:
     # OpenAI API Key
     api_key = config("AZURE_OPENAI_API_KEY", default="")
@@ -50,6 +51,8 @@ def generate_gpt4v(
     try:
         response.raise_for_status()
     except Exception as e:
+        if raise_error:
+            raise
         logger.exception(f"Error generating gpt4v: {response.text}; error {e}")
         return ""
 
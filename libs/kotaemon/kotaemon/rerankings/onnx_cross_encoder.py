@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+import os
+from typing import TYPE_CHECKING, Optional
+
+from kotaemon.base import Document, Param
+
+from .base import BaseReranking
+
+if TYPE_CHECKING:
+    from onnxruntime import InferenceSession
+    from tokenizers import Tokenizer
+
+
+def length_bucketed_batches(
+    lengths: list[int], batch_size: int, max_batch_tokens: int
+) -> list[list[int]]:
+    """Group item indices into batches of similar length
+
+    Items are sorted by length so that each batch only pads to the length of its
+    longest member. A batch is closed once it reaches `batch_size` items or once
+    its padded size (`len(batch) * longest`) would exceed `max_batch_tokens`.
+
+    Args:
+        lengths: the token length of each item
+        batch_size: maximum number of items per batch
+        max_batch_tokens: maximum number of padded tokens per batch
+
+    Returns:
+        list of batches, each batch being a list of indices into `lengths`
+    """
+    order = sorted(range(len(lengths)), key=lambda idx: lengths[idx])
+
+    batches: list[list[int]] = []
+    current: list[int] = []
+    for idx in order:
+        # items are sorted ascending, so the new item is the longest of the batch
+        padded_size = (len(current) + 1) * lengths[idx]
+        if current and (len(current) >= batch_size or padded_size > max_batch_tokens):
+            batches.append(current)
+            current = []
+        current.append(idx)
+
+    if current:
+        batches.append(current)
+
+    return batches
+
+
+class ONNXCrossEncoderReranking(BaseReranking):
+    """Run a cross-encoder reranking model locally on CPU with ONNX Runtime.
+
+    The model is downloaded from the HuggingFace Hub and must provide an exported
+    ONNX graph together with a `tokenizer.json` file, e.g. the `Xenova/*` exports
+    of the ms-marco cross-encoders.
+
+    Query-document pairs are truncated to `max_length` tokens, sorted by length
+    and scored in batches so that padding stays minimal.
+    """
+
+    model_name: str = Param(
+        "Xenova/ms-marco-MiniLM-L-6-v2",
+        help=(
+            "HuggingFace Hub repository of the cross-encoder. The repository must "
+            "contain `tokenizer.json` and an ONNX export of the model."
+        ),
+        required=True,
+    )
+    model_file: str = Param(
+        "onnx/model.onnx",
+        help="Path of the ONNX file inside the model repository",
+    )
+    cache_dir: Optional[str] = Param(
+        None, help="Directory to store the downloaded model files"
+    )
+    max_length: int = Param(
+        512,
+        help="Maximum number of tokens of a query-document pair. Longer pairs are "
+        "truncated (document side first).",
+    )
+    batch_size: int = Param(32, help="Maximum number of pairs per batch")
+    max_batch_tokens: int = Param(
+        8192,
+        help="Maximum number of (padded) tokens per batch. Bounds the memory used "
+        "by a single forward pass.",
+    )
+    num_threads: Optional[int] = Param(
+        None,
+        help=(
+            "Number of intra-op threads used by ONNX Runtime. "
+            "If 0, use all available CPUs. "
+            "If None, use default onnxruntime threading."
+        ),
+    )
+
+    @Param.auto(depends_on=["model_name", "cache_dir", "max_length"])
+    def tokenizer_(self) -> "Tokenizer":
+        try:
+            from huggingface_hub import hf_hub_download
+            from tokenizers import Tokenizer
+        except ImportError:
+            raise ImportError(
+                "Please install tokenizers and huggingface_hub: "
+                "`pip install tokenizers huggingface_hub`"
+            )
+
+        tokenizer = Tokenizer.from_file(
+            hf_hub_download(self.model_name, "tokenizer.json", cache_dir=self.cache_dir)
+        )
+        tokenizer.no_padding()
+        tokenizer.enable_truncation(max_length=self.max_length, strategy="only_second")
+        return tokenizer
+
+    @Param.auto(depends_on=["model_name", "model_file", "cache_dir", "num_threads"])
+    def session_(self) -> "InferenceSession":
+        try:
+            import onnxruntime as ort
+            from huggingface_hub import hf_hub_download
+        except ImportError:
+            raise ImportError(
+                "Please install onnxruntime: `pip install onnxruntime huggingface_hub`"
+            )
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.num_threads is not None:
+            options.intra_op_num_threads = self.num_threads or (os.cpu_count() or 1)
+            options.inter_op_num_threads = 1
+
+        return ort.InferenceSession(
+            hf_hub_download(self.model_name, self.model_file, cache_dir=self.cache_dir),
+            sess_options=options,
+            providers=["CPUExecutionProvider"],
+        )
+
+    def score(self, query: str, texts: list[str]) -> list[float]:
+        """Compute the relevance score (0 to 1) of each text against the query"""
+        import numpy as np
+
+        if not texts:
+            return []
+
+        encodings = self.tokenizer_.encode_batch([(query, text) for text in texts])
+        input_names = {inp.name for inp in self.session_.get_inputs()}
+
+        scores = np.zeros(len(texts), dtype=np.float32)
+        for batch in length_bucketed_batches(
+            [len(enc.ids) for enc in encodings],
+            batch_size=self.batch_size,
+            max_batch_tokens=self.max_batch_tokens,
+        ):
+            seq_len = max(len(encodings[idx].ids) for idx in batch)
+            input_ids = np.zeros((len(batch), seq_len), dtype=np.int64)
+            attention_mask = np.zeros((len(batch), seq_len), dtype=np.int64)
+            token_type_ids = np.zeros((len(batch), seq_len), dtype=np.int64)
+            for row, idx in enumerate(batch):
+                enc = encodings[idx]
+                input_ids[row, : len(enc.ids)] = enc.ids
+                attention_mask[row, : len(enc.ids)] = enc.attention_mask
+                token_type_ids[row, : len(enc.ids)] = enc.type_ids
+
+            inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+            if "token_type_ids" in input_names:
+                inputs["token_type_ids"] = token_type_ids
+
+            logits = self.session_.run(None, inputs)[0]
+            if logits.ndim == 2 and logits.shape[1] > 1:
+                # 2-class head, take the probability of the relevant class
+                exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+                batch_scores = exp[:, 1] / exp.sum(axis=1)
+            else:
+                batch_scores = 1.0 / (1.0 + np.exp(-logits.reshape(-1)))
+            scores[batch] = batch_scores
+
+        return scores.tolist()
+
+    def run(self, documents: list[Document], query: str) -> list[Document]:
+        """Score documents with the local cross-encoder and re-order them
+        by their relevance score"""
+        if not documents:
+            return []
+
+        scores = self.score(query, [doc.content for doc in documents])
+        for doc, score in zip(documents, scores):
+            doc.metadata["reranking_score"] = score
+
+        return sorted(
+            documents, key=lambda x: x.metadata["reranking_score"], reverse=True
+        )
@@ -0,0 +1,249 @@
+import functools
+import math
+import re
+import threading
+from array import array
+from collections import Counter
+from pathlib import Path
+from typing import Iterable, Optional, Union
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> list[str]:
+    """Split text into lower-cased word tokens"""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def _synchronized(func):
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return func(self, *args, **kwargs)
+
+    return wrapper
+
+
+class BM25Index:
+    """In-process inverted index with Okapi BM25 scoring
+
+    Every document is assigned an internal integer number. Posting lists store
+    these numbers and the term frequencies in compact `array("I")` buffers so
+    that they can be appended to in place and scored with numpy without copying.
+    Deleted documents are tombstoned and the posting lists are compacted once
+    the ratio of deleted documents becomes too high.
+
+    The index is safe to query while documents are being added from another
+    thread.
+
+    Args:
+        k1: term frequency saturation parameter
+        b: document length normalization parameter
+        compact_ratio: compact the posting lists when the ratio of deleted
+            documents exceeds this value
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, compact_ratio: float = 0.25):
+        self.k1 = k1
+        self.b = b
+        self.compact_ratio = compact_ratio
+        self._lock = threading.RLock()
+        self.clear()
+
+    @_synchronized
+    def clear(self):
+        """Remove all documents from the index"""
+        self._postings: dict[str, tuple[array, array]] = {}
+        self._doc_ids: list[Optional[str]] = []
+        self._doc_nums: dict[str, int] = {}
+        self._doc_lens = array("I")
+        self._alive = bytearray()
+        self._total_len = 0
+
+    def __len__(self) -> int:
+        return len(self._doc_nums)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._doc_nums
+
+    @_synchronized
+    def add(self, doc_id: str, text: str):
+        """Index a document, replacing the previous version if `doc_id` exists"""
+        if doc_id in self._doc_nums:
+            self.delete([doc_id])
+
+        doc_num = len(self._doc_ids)
+        tokens = tokenize(text)
+        for term, freq in Counter(tokens).items():
+            posting = self._postings.get(term)
+            if posting is None:
+                posting = self._postings[term] = (array("I"), array("I"))
+            posting[0].append(doc_num)
+            posting[1].append(freq)
+
+        self._doc_ids.append(doc_id)
+        self._doc_nums[doc_id] = doc_num
+        self._doc_lens.append(len(tokens))
+        self._alive.append(1)
+        self._total_len += len(tokens)
+
+    @_synchronized
+    def delete(self, doc_ids: Iterable[str]):
+        """Remove documents from the index, unknown ids are ignored"""
+        for doc_id in doc_ids:
+            doc_num = self._doc_nums.pop(doc_id, None)
+            if doc_num is None:
+                continue
+            self._alive[doc_num] = 0
+            self._doc_ids[doc_num] = None
+            self._total_len -= self._doc_lens[doc_num]
+
+        num_deleted = len(self._doc_ids) - len(self._doc_nums)
+        if num_deleted and num_deleted > self.compact_ratio * len(self._doc_ids):
+            self.compact()
+
+    @_synchronized
+    def compact(self):
+        """Drop the deleted documents from the posting lists and renumber"""
+        if len(self._doc_nums) == len(self._doc_ids):
+            return
+
+        alive = np.frombuffer(self._alive, dtype=np.uint8).astype(bool)
+        new_nums = np.cumsum(alive, dtype=np.int64) - 1
+
+        postings = {}
+        for term, (doc_nums, freqs) in self._postings.items():
+            nums = np.frombuffer(doc_nums, dtype=np.uint32)
+            keep = alive[nums]
+            if not keep.any():
+                continue
+            postings[term] = (
+                array("I", new_nums[nums[keep]].astype(np.uint32).tobytes()),
+                array("I", np.frombuffer(freqs, dtype=np.uint32)[keep].tobytes()),
+            )
+
+        doc_lens = np.frombuffer(self._doc_lens, dtype=np.uint32)[alive]
+        self._postings = postings
+        self._doc_ids = [doc_id for doc_id in self._doc_ids if doc_id is not None]
+        self._doc_nums = {doc_id: idx for idx, doc_id in enumerate(self._doc_ids)}
+        self._doc_lens = array("I", doc_lens.tobytes())
+        self._alive = bytearray(b"\x01" * len(self._doc_ids))
+
+    @_synchronized
+    def query(
+        self, query: str, top_k: int = 10, doc_ids: Optional[list] = None
+    ) -> list[tuple[str, float]]:
+        """Search the index
+
+        Args:
+            query: the search query
+            top_k: number of results to return
+            doc_ids: if provided, only search among these documents
+
+        Returns:
+            list of (doc_id, score) sorted by descending score
+        """
+        num_docs = len(self._doc_nums)
+        terms = set(tokenize(query))
+        if not num_docs or not terms or top_k <= 0:
+            return []
+
+        alive = np.frombuffer(self._alive, dtype=np.uint8).astype(bool)
+        if doc_ids is not None:
+            scope = np.zeros(len(self._doc_ids), dtype=bool)
+            scope_nums = [
+                self._doc_nums[doc_id] for doc_id in doc_ids if doc_id in self._doc_nums
+            ]
+            if not scope_nums:
+                return []
+            scope[scope_nums] = True
+        else:
+            scope = alive
+
+        doc_lens = np.frombuffer(self._doc_lens, dtype=np.uint32)
+        avg_len = self._total_len / num_docs or 1.0
+        scores = np.zeros(len(self._doc_ids), dtype=np.float32)
+
+        for term in terms:
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            nums = np.frombuffer(posting[0], dtype=np.uint32)
+            freqs = np.frombuffer(posting[1], dtype=np.uint32)
+
+            # document frequency is computed over all live documents so that the
+            # scores do not depend on the search scope
+            live = alive[nums]
+            df = int(live.sum())
+            if not df:
+                continue
+            idf = math.log(1.0 + (num_docs - df + 0.5) / (df + 0.5))
+
+            in_scope = scope[nums]
+            nums, freqs = nums[in_scope], freqs[in_scope].astype(np.float32)
+            norm = self.k1 * (1.0 - self.b + self.b * doc_lens[nums] / avg_len)
+            scores[nums] += idf * freqs * (self.k1 + 1.0) / (freqs + norm)
+
+        candidates = np.flatnonzero(scores)
+        if not len(candidates):
+            return []
+        if len(candidates) > top_k:
+            top = np.argpartition(-scores[candidates], top_k - 1)[:top_k]
+            candidates = candidates[top]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+
+        return [(self._doc_ids[num], float(scores[num])) for num in candidates]
+
+    @_synchronized
+    def save(self, path: Union[str, Path]):
+        """Save the index to a binary `.npz` file"""
+        self.compact()
+        terms = list(self._postings.keys())
+        doc_ids = "\x00".join(self._doc_ids)  # type: ignore[arg-type]
+        lengths = np.array([len(self._postings[t][0]) for t in terms], dtype=np.int64)
+        doc_nums, freqs = array("I"), array("I")
+        for term in terms:
+            doc_nums.extend(self._postings[term][0])
+            freqs.extend(self._postings[term][1])
+
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                params=np.array([self.k1, self.b], dtype=np.float64),
+                terms=np.frombuffer("\n".join(terms).encode("utf-8"), dtype=np.uint8),
+                doc_ids=np.frombuffer(doc_ids.encode("utf-8"), dtype=np.uint8),
+                lengths=lengths,
+                doc_nums=np.frombuffer(doc_nums, dtype=np.uint32),
+                freqs=np.frombuffer(freqs, dtype=np.uint32),
+                doc_lens=np.frombuffer(self._doc_lens, dtype=np.uint32),
+            )
+
+    @_synchronized
+    def load(self, path: Union[str, Path]):
+        """Load the index from a file created by `save`"""
+        with np.load(path) as data:
+            self.k1, self.b = (float(x) for x in data["params"])
+            terms_raw = data["terms"].tobytes().decode("utf-8")
+            doc_ids_raw = data["doc_ids"].tobytes().decode("utf-8")
+            lengths = data["lengths"]
+            doc_nums = data["doc_nums"].astype(np.uint32)
+            freqs = data["freqs"].astype(np.uint32)
+            doc_lens = data["doc_lens"].astype(np.uint32)
+
+        self.clear()
+        terms = terms_raw.split("\n") if terms_raw else []
+        self._doc_ids = doc_ids_raw.split("\x00") if len(doc_lens) else []
+        self._doc_nums = {doc_id: idx for idx, doc_id in enumerate(self._doc_ids)}
+        self._doc_lens = array("I", doc_lens.tobytes())
+        self._alive = bytearray(b"\x01" * len(self._doc_ids))
+        self._total_len = int(doc_lens.sum())
+
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        for idx, term in enumerate(terms):
+            start, end = offsets[idx], offsets[idx + 1]
+            self._postings[term] = (
+                array("I", doc_nums[start:end].tobytes()),
+                array("I", freqs[start:end].tobytes()),
+            )
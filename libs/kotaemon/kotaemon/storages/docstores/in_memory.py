@@ -5,13 +5,19 @@ from typing import List, Optional, Union
 from kotaemon.base import Document
 
 from .base import BaseDocumentStore
+from .bm25 import BM25Index
 
 
 class InMemoryDocumentStore(BaseDocumentStore):
-    """Simple memory document store that store document in a dictionary"""
+    """Simple memory document store that store document in a dictionary
+
+    Full-text search is served by an in-process BM25 index that is updated
+    whenever documents are added or deleted.
+    """
 
     def __init__(self):
         self._store = {}
+        self._fts_index = BM25Index()
 
     def add(
         self,
@@ -40,6 +46,7 @@ class InMemoryDocumentStore(BaseDocumentStore):
             if doc_id in self._store and not exist_ok:
                 raise ValueError(f"Document with id {doc_id} already exist")
             self._store[doc_id] = doc
+            self._fts_index.add(doc_id, doc.text)
 
     def get(self, ids: Union[List[str], str]) -> List[Document]:
         """Get document by id"""
@@ -63,12 +70,19 @@ class InMemoryDocumentStore(BaseDocumentStore):
 
         for doc_id in ids:
             del self._store[doc_id]
+        self._fts_index.delete(ids)
+
+    @staticmethod
+    def _fts_index_path(path: Union[str, Path]) -> Path:
+        """Path of the full-text index saved next to the document store file"""
+        return Path(path).with_suffix(".bm25.npz")
 
     def save(self, path: Union[str, Path]):
         """Save document to path"""
         store = {key: value.to_dict() for key, value in self._store.items()}
         with open(path, "w") as f:
             json.dump(store, f)
+        self._fts_index.save(self._fts_index_path(path))
 
     def load(self, path: Union[str, Path]):
         """Load document store from path"""
@@ -81,11 +95,31 @@ class InMemoryDocumentStore(BaseDocumentStore):
         # Also, for portability, use SQLAlchemy for document store.
         self._store = {key: Document.from_dict(value) for key, value in store.items()}
 
+        fts_index_path = self._fts_index_path(path)
+        if fts_index_path.is_file():
+            self._fts_index.load(fts_index_path)
+        if len(self._fts_index) != len(self._store) or any(
+            doc_id not in self._fts_index for doc_id in self._store
+        ):
+            # missing or stale full-text index, rebuild it from the documents
+            self._fts_index.clear()
+            for doc_id, doc in self._store.items():
+                self._fts_index.add(doc_id, doc.text)
+
     def query(
         self, query: str, top_k: int = 10, doc_ids: Optional[list] = None
     ) -> List[Document]:
-        """Perform full-text search on document store"""
-        return []
+        """Perform full-text search (BM25) on document store
+
+        Args:
+            query: the search query
+            top_k: number of documents to return
+            doc_ids: if provided, only search among these documents
+        """
+        return [
+            self._store[doc_id]
+            for doc_id, _ in self._fts_index.query(query, top_k=top_k, doc_ids=doc_ids)
+        ]
 
     def __persist_flow__(self):
         return {}
@@ -93,3 +127,4 @@ class InMemoryDocumentStore(BaseDocumentStore):
     def drop(self):
         """Drop the document store"""
         self._store = {}
+        self._fts_index.clear()
@@ -58,6 +58,7 @@ class SimpleFileDocumentStore(InMemoryDocumentStore):
         """Drop the document store"""
         super().drop()
         self._save_path.unlink(missing_ok=True)
+        self._fts_index_path(self._save_path).unlink(missing_ok=True)
 
     def __persist_flow__(self):
         from theflow.utils.modules import serialize
@@ -71,6 +71,18 @@ class BaseVectorStore(ABC):
         """Drop the vector store"""
         ...
 
+    def get_embeddings(self, ids: list[str]) -> dict[str, list[float]]:
+        """Get the stored vector embeddings by id
+
+        Args:
+            ids: List of ids of the embeddings
+
+        Returns:
+            the embeddings found, by id. Empty if the vector store does not support
+            getting the embeddings back
+        """
+        return {}
+
 
 class LlamaIndexVectorStore(BaseVectorStore):
     """Mixin for LlamaIndex based vectorstores"""
@@ -1,12 +1,28 @@
-from typing import Any, Dict, List, Optional, Type, cast
-
-from llama_index.vector_stores.chroma import ChromaVectorStore as LIChromaVectorStore
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, cast
 
 from .base import LlamaIndexVectorStore
 
+if TYPE_CHECKING:
+    from llama_index.vector_stores.chroma import (
+        ChromaVectorStore as LIChromaVectorStore,
+    )
+
 
 class ChromaVectorStore(LlamaIndexVectorStore):
-    _li_class: Type[LIChromaVectorStore] = LIChromaVectorStore
+    _li_class = None
+
+    def _get_li_class(self):
+        try:
+            from llama_index.vector_stores.chroma import (
+                ChromaVectorStore as LIChromaVectorStore,
+            )
+        except ImportError:
+            raise ImportError(
+                "Please install missing package: "
+                "'pip install llama-index-vector-stores-chroma'"
+            )
+
+        return LIChromaVectorStore
 
     def __init__(
         self,
@@ -55,7 +71,7 @@ class ChromaVectorStore(LlamaIndexVectorStore):
             flat_metadata=flat_metadata,
             **kwargs,
         )
-        self._client = cast(LIChromaVectorStore, self._client)
+        self._client = cast("LIChromaVectorStore", self._client)
 
     def delete(self, ids: List[str], **kwargs):
         """Delete vector embeddings from vector stores
@@ -66,6 +82,17 @@ class ChromaVectorStore(LlamaIndexVectorStore):
         """
         self._client.client.delete(ids=ids)
 
+    def get_embeddings(self, ids: List[str]) -> Dict[str, List[float]]:
+        if not ids:
+            return {}
+        result = self._client.client.get(ids=ids, include=["embeddings"])
+        if result.get("embeddings") is None:
+            return {}
+        return {
+            id_: list(embedding)
+            for id_, embedding in zip(result["ids"], result["embeddings"])
+        }
+
     def drop(self):
         """Delete entire collection from vector stores"""
         self._client.client._client.delete_collection(self._client.client.name)
@@ -53,6 +53,10 @@ class InMemoryVectorStore(LlamaIndexVectorStore):
         """
         self._client = self._client.from_persist_path(persist_path=load_path, fs=fs)
 
+    def get_embeddings(self, ids: list[str]) -> dict[str, list[float]]:
+        embedding_dict = self._client.data.embedding_dict
+        return {id_: embedding_dict[id_] for id_ in ids if id_ in embedding_dict}
+
     def drop(self):
         """Clear the old data"""
         self._data = SimpleVectorStoreData()
@@ -1,34 +1,62 @@
-from typing import Any, List, Type, cast
-
-from llama_index.core.vector_stores.types import MetadataFilters
-from llama_index.vector_stores.lancedb import LanceDBVectorStore as LILanceDBVectorStore
-from llama_index.vector_stores.lancedb import base as base_lancedb
+from typing import TYPE_CHECKING, Any, List, cast
 
 from .base import LlamaIndexVectorStore
 
-# custom monkey patch for LanceDB
-original_to_lance_filter = base_lancedb._to_lance_filter
+if TYPE_CHECKING:
+    from llama_index.core.vector_stores.types import MetadataFilters
+    from llama_index.vector_stores.lancedb import (
+        LanceDBVectorStore as LILanceDBVectorStore,
+    )
+
+_patched = False
+
 
+def _patch_lancedb():
+    """Custom monkey patch for LanceDB, applied when the store is first used"""
+    global _patched
+    if _patched:
+        return
 
-def custom_to_lance_filter(
-    standard_filters: MetadataFilters, metadata_keys: list
-) -> Any:
-    for filter in standard_filters.filters:
-        if isinstance(filter.value, list):
-            # quote string values if filter are list of strings
-            if filter.value and isinstance(filter.value[0], str):
-                filter.value = [f"'{v}'" for v in filter.value]
+    from llama_index.vector_stores.lancedb import (
+        LanceDBVectorStore as LILanceDBVectorStore,
+    )
+    from llama_index.vector_stores.lancedb import base as base_lancedb
 
-    return original_to_lance_filter(standard_filters, metadata_keys)
+    original_to_lance_filter = base_lancedb._to_lance_filter
 
+    def custom_to_lance_filter(
+        standard_filters: "MetadataFilters", metadata_keys: list
+    ) -> Any:
+        for filter in standard_filters.filters:
+            if isinstance(filter.value, list):
+                # quote string values if filter are list of strings
+                if filter.value and isinstance(filter.value[0], str):
+                    filter.value = [f"'{v}'" for v in filter.value]
 
-# skip table existence check
-LILanceDBVectorStore._table_exists = lambda _: False
-base_lancedb._to_lance_filter = custom_to_lance_filter
+        return original_to_lance_filter(standard_filters, metadata_keys)
+
+    # skip table existence check
+    LILanceDBVectorStore._table_exists = lambda _: False
+    base_lancedb._to_lance_filter = custom_to_lance_filter
+    _patched = True
 
 
 class LanceDBVectorStore(LlamaIndexVectorStore):
-    _li_class: Type[LILanceDBVectorStore] = LILanceDBVectorStore
+    _li_class = None
+
+    def _get_li_class(self):
+        try:
+            from llama_index.vector_stores.lancedb import (
+                LanceDBVectorStore as LILanceDBVectorStore,
+            )
+        except ImportError:
+            raise ImportError(
+                "Please install missing package: "
+                "'pip install llama-index-vector-stores-lancedb'"
+            )
+
+        _patch_lancedb()
+        return LILanceDBVectorStore
 
     def __init__(
         self,
@@ -61,7 +89,7 @@ class LanceDBVectorStore(LlamaIndexVectorStore):
             table=table,
             **kwargs,
         )
-        self._client = cast(LILanceDBVectorStore, self._client)
+        self._client = cast("LILanceDBVectorStore", self._client)
         self._client._metadata_keys = ["file_id"]
 
     def delete(self, ids: List[str], **kwargs):
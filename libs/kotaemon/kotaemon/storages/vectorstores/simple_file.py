@@ -58,6 +58,10 @@ class SimpleFileVectorStore(LlamaIndexVectorStore):
         self._client.persist(str(self._save_path), self._fs)
         return r
 
+    def get_embeddings(self, ids: list[str]) -> dict[str, list[float]]:
+        embedding_dict = self._client.data.embedding_dict
+        return {id_: embedding_dict[id_] for id_ in ids if id_ in embedding_dict}
+
     def drop(self):
         self._data = SimpleVectorStoreData()
         self._save_path.unlink(missing_ok=True)
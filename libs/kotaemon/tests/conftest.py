@@ -79,6 +79,15 @@ def if_voyageai_not_installed():
         return False
 
 
+def if_ktem_not_installed():
+    try:
+        import ktem  # noqa: F401
+    except ImportError:
+        return True
+    else:
+        return False
+
+
 skip_when_haystack_not_installed = pytest.mark.skipif(
     if_haystack_not_installed(), reason="Haystack is not installed"
 )
@@ -110,3 +119,7 @@ skip_llama_cpp_not_installed = pytest.mark.skipif(
 skip_when_voyageai_not_installed = pytest.mark.skipif(
     if_voyageai_not_installed(), reason="voyageai is not installed"
 )
+
+skip_when_ktem_not_installed = pytest.mark.skipif(
+    if_ktem_not_installed(), reason="ktem is not installed"
+)
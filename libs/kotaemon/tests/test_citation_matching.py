@@ -0,0 +1,149 @@
+import random
+from difflib import SequenceMatcher
+
+from kotaemon.base import Document, LLMInterface
+from kotaemon.indices.qa.utils import (
+    InlineCitationParser,
+    InlineEvidence,
+    SpanMatcher,
+    find_start_end_phrase,
+    find_text,
+)
+from kotaemon.llms import ChatLLM
+
+from .conftest import skip_when_ktem_not_installed
+
+CONTEXT = (
+    "The City Hall and Raffles Place MRT stations are paired cross-platform "
+    "interchanges on the North–South line (NSL) and East–West line (EWL) of the "
+    "Singapore Mass Rapid Transit (MRT) system.\nThe stations were first announced "
+    "in 1982. Constructing the tunnels between the City Hall and Raffles Place "
+    "stations required the draining of the Singapore River."
+)
+
+WORDS = "the of a retrieval model index answer and to in is chunk vector\nquery"
+
+
+def random_text(rng, num_words):
+    return " ".join(rng.choice(WORDS.split(" ")) for _ in range(num_words))
+
+
+def test_find_text():
+    spans = find_text("the stations were first announced in 1982", CONTEXT)
+    assert len(spans) == 1
+    start, end = spans[0]
+    assert CONTEXT[start:end] == "The stations were first announced in 1982"
+
+    assert find_text("a pink cockatoo in arid areas", CONTEXT) == []
+
+
+def test_find_start_end_phrase():
+    match, length = find_start_end_phrase(
+        "The City Hall and Raffles Place", "first announced in 1982", CONTEXT
+    )
+    assert match is not None
+    assert CONTEXT[match[0] : match[1]].startswith("The City Hall")
+    assert CONTEXT[match[0] : match[1]].endswith("first announced in 1982")
+    assert length == len("The City Hall and Raffles Place") + len(
+        "first announced in 1982"
+    )
+
+
+def test_span_matcher_same_blocks_as_difflib():
+    rng = random.Random(0)
+    for _ in range(500):
+        text = random_text(rng, rng.randint(5, 200))
+        if rng.random() < 0.7:
+            start = rng.randrange(len(text))
+            sentence = text[start : start + rng.randint(3, 80)]
+            sentence += " " + random_text(rng, rng.randint(0, 5))
+        else:
+            sentence = random_text(rng, rng.randint(1, 10))
+        min_size = rng.randint(6, 20)
+
+        sequence_matcher = SequenceMatcher(None, sentence, text, autojunk=False)
+        expected = [
+            tuple(block)
+            for block in sequence_matcher.get_matching_blocks()
+            if block.size >= min_size
+        ]
+        longest = sequence_matcher.find_longest_match(0, len(sentence), 0, len(text))
+
+        matcher = SpanMatcher(text)
+        assert matcher.matching_blocks(sentence, min_size) == expected
+        if longest.size >= min_size:
+            assert matcher.longest_match(sentence, min_size) == tuple(longest)
+        else:
+            assert matcher.longest_match(sentence, min_size) in (None, tuple(longest))
+
+
+INLINE_ANSWER = (
+    "CITATION LIST\n\n"
+    "CITATION【1】\n\n"
+    "START_PHRASE: The City Hall and Raffles Place MRT stations\n"
+    "END_PHRASE: Singapore Mass Rapid Transit (MRT) system.\n\n"
+    "CITATION【2】\n\n"
+    "START_PHRASE: The stations were first announced in 1982.\n"
+    "END_PHRASE: draining of the Singapore River.\n\n"
+    "FINAL ANSWER\n"
+    "The stations are interchanges【1】, announced in 1982【2】."
+)
+
+
+class StreamingChatLLM(ChatLLM):
+    chunk_size: int = 7
+
+    def stream(self, messages, **kwargs):
+        for i in range(0, len(INLINE_ANSWER), self.chunk_size):
+            yield LLMInterface(content=INLINE_ANSWER[i : i + self.chunk_size])
+
+
+def test_inline_citation_parser_streaming():
+    expected = [
+        InlineEvidence(
+            start_phrase="The City Hall and Raffles Place MRT stations",
+            end_phrase="Singapore Mass Rapid Transit (MRT) system.",
+            idx=1,
+        ),
+        InlineEvidence(
+            start_phrase="The stations were first announced in 1982.",
+            end_phrase="draining of the Singapore River.",
+            idx=2,
+        ),
+    ]
+
+    for chunk_size in [1, 3, 16, len(INLINE_ANSWER)]:
+        parser = InlineCitationParser()
+        citations = []
+        for i in range(0, len(INLINE_ANSWER), chunk_size):
+            citations += parser.feed(INLINE_ANSWER[i : i + chunk_size])
+        assert citations + parser.close() == expected
+
+    # the citations are complete before the final answer is streamed
+    parser = InlineCitationParser()
+    head = INLINE_ANSWER[: INLINE_ANSWER.index("FINAL ANSWER")]
+    assert parser.feed(head) == expected
+
+
+@skip_when_ktem_not_installed
+def test_inline_citation_spans_matched_while_streaming():
+    from kotaemon.indices.qa.citation_qa_inline import AnswerWithInlineCitation
+
+    docs = [
+        Document(text="The pink cockatoo is a medium-sized cockatoo.", id_="a"),
+        Document(text=CONTEXT, id_="b"),
+    ]
+    pipeline = AnswerWithInlineCitation(llm=StreamingChatLLM())
+    output = pipeline.stream(question="q", evidence=CONTEXT, docs=docs)
+    try:
+        while True:
+            next(output)
+    except StopIteration as e:
+        answer = e.value
+
+    assert set(answer.metadata["citation_matches"]) == {0, 1}
+    spans = pipeline.match_evidence_with_context(answer, docs)
+
+    answer.metadata["citation_matches"] = {}
+    assert spans == pipeline.match_evidence_with_context(answer, docs[::-1])
+    assert [span["idx"] for span in spans["b"]] == [1, 2]
@@ -322,6 +322,38 @@ def test_simplefile_document_store_base_interfaces(tmp_path):
     os.remove(tmp_path / "default.json")
 
 
+def test_inmemory_document_store_query(tmp_path):
+    store = SimpleFileDocumentStore(path=tmp_path)
+    docs = [
+        Document(text="The quick brown fox jumps over the lazy dog", id_="fox"),
+        Document(text="A lazy afternoon in the park", id_="park"),
+        Document(text="A fox is quick, every fox is quick", id_="foxes"),
+        Document(text="Nothing relevant here", id_="other"),
+    ]
+    store.add(docs)
+
+    matched = store.query("quick fox", top_k=10)
+    assert [doc.doc_id for doc in matched] == ["foxes", "fox"]
+
+    matched = store.query("lazy", top_k=1)
+    assert len(matched) == 1, "Should respect top_k"
+
+    matched = store.query("quick fox", doc_ids=["fox", "park"])
+    assert [doc.doc_id for doc in matched] == ["fox"], "Should respect doc_ids"
+
+    store.delete("foxes")
+    assert [doc.doc_id for doc in store.query("fox")] == ["fox"]
+
+    # the index is persisted next to the document store file
+    assert (tmp_path / "default.bm25.npz").exists(), "Index file should exist"
+    store2 = SimpleFileDocumentStore(path=tmp_path)
+    assert [doc.doc_id for doc in store2.query("lazy")] == ["park", "fox"]
+
+    store2.drop()
+    assert store2.query("lazy") == []
+    assert not (tmp_path / "default.bm25.npz").exists()
+
+
 @patch(
     "elastic_transport.Transport.perform_request",
     side_effect=_elastic_search_responses,
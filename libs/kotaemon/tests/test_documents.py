@@ -1,4 +1,6 @@
-from kotaemon.base.schema import Document, RetrievedDocument
+import pytest
+
+from kotaemon.base.schema import Document, RetrievedChunk, RetrievedDocument
 
 from .conftest import skip_when_haystack_not_installed
 
@@ -50,3 +52,30 @@ def test_retrieved_document_attributes():
     assert retrieved_doc.text == sample_text
     assert retrieved_doc.score == score
     assert retrieved_doc.retrieval_metadata == metadata
+
+
+def test_retrieved_chunk():
+    doc = Document(
+        text="chunk text", metadata={"file_id": "file-1", "page_label": 3, "k": "v"}
+    )
+    chunk = RetrievedChunk(doc, score=0.5)
+    assert chunk.id == doc.doc_id
+    assert chunk.text == "chunk text"
+    assert chunk.file_id == "file-1"
+    assert chunk.page_label == 3
+    assert not hasattr(chunk, "__dict__")
+
+    # metadata is a read-only view over the source document
+    assert chunk.metadata["k"] == "v"
+    with pytest.raises(TypeError):
+        chunk.metadata["k"] = "other"  # type: ignore
+    doc.metadata["k"] = "other"
+    assert chunk.metadata["k"] == "other"
+
+    retrieved_doc = chunk.to_retrieved_document()
+    assert isinstance(retrieved_doc, RetrievedDocument)
+    assert retrieved_doc.doc_id == doc.doc_id
+    assert retrieved_doc.score == 0.5
+    assert retrieved_doc.metadata == doc.metadata
+    retrieved_doc.metadata["k"] = "copy"
+    assert doc.metadata["k"] == "other"
@@ -5,7 +5,7 @@ from unittest.mock import patch
 
 from openai.types.create_embedding_response import CreateEmbeddingResponse
 
-from kotaemon.base import Document
+from kotaemon.base import Document, RetrievedDocument
 from kotaemon.embeddings import AzureOpenAIEmbeddings
 from kotaemon.indices import VectorIndexing, VectorRetrieval
 from kotaemon.storages import ChromaVectorStore, InMemoryDocumentStore
@@ -65,3 +65,36 @@ def test_retrieving(tmp_path):
 
     assert len(output) == 1, "Expect 1 results"
     assert output == output1, "Expect identical results"
+
+
+@patch(
+    "openai.resources.embeddings.Embeddings.create",
+    side_effect=lambda *args, **kwargs: openai_embedding,
+)
+def test_retrieving_hybrid_deduplicate(tmp_path):
+    db = ChromaVectorStore(path=str(tmp_path))
+    doc_store = InMemoryDocumentStore()
+    embedding = AzureOpenAIEmbeddings(
+        azure_deployment="text-embedding-ada-002",
+        azure_endpoint="https://test.openai.azure.com/",
+        api_key="some-key",
+        api_version="version",
+    )
+
+    index_pipeline = VectorIndexing(
+        vector_store=db, embedding=embedding, doc_store=doc_store
+    )
+    retrieval_pipeline = VectorRetrieval(
+        vector_store=db, doc_store=doc_store, embedding=embedding
+    )
+
+    doc = Document(text="Hello world", metadata={"file_id": "file-1"})
+    index_pipeline(text=doc)
+    output = retrieval_pipeline(text="Hello world", scope=[doc.doc_id])
+
+    # found by both the vector and the full-text search, kept once
+    assert len(output) == 1, "Expect 1 results"
+    assert isinstance(output[0], RetrievedDocument)
+    assert output[0].doc_id == doc.doc_id
+    assert output[0].score != -1.0, "Expect the vector score"
+    assert output[0].metadata is not doc.metadata, "Expect a copy of the chunk"
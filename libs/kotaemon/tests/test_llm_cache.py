@@ -0,0 +1,142 @@
+import time
+from unittest.mock import patch
+
+import pytest
+from openai.types.chat.chat_completion import ChatCompletion
+from openai.types.chat.chat_completion_chunk import ChatCompletionChunk
+
+from kotaemon.base import HumanMessage, SystemMessage
+from kotaemon.base.usage import collect_usage
+from kotaemon.llms import CachedChatLLM, ChatOpenAI
+from kotaemon.llms.cache import LLMResponseCache, cache_key, cached_llm
+
+_completion = ChatCompletion.parse_obj(
+    {
+        "id": "chatcmpl-1",
+        "object": "chat.completion",
+        "created": 1692338378,
+        "model": "gpt-4o-mini-2024-07-18",
+        "choices": [
+            {
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": "Hello!"},
+            }
+        ],
+        "usage": {"completion_tokens": 9, "prompt_tokens": 10, "total_tokens": 19},
+    }
+)
+
+
+def _chunk(content):
+    return ChatCompletionChunk.parse_obj(
+        {
+            "id": "chatcmpl-1",
+            "object": "chat.completion.chunk",
+            "created": 1692338378,
+            "model": "gpt-4o-mini-2024-07-18",
+            "choices": [
+                {"index": 0, "delta": {"content": content}, "finish_reason": None}
+            ],
+        }
+    )
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "llm_cache.db")
+
+
+def test_response_cache_ttl_and_eviction(cache_path):
+    cache = LLMResponseCache(cache_path, max_entries=2, evict_every=1)
+    cache.set("a", {"content": "a"}, ttl=60)
+    cache.set("expired", {"content": "b"}, ttl=-1)
+    assert cache.get("a") == {"content": "a"}
+    assert cache.get("expired") is None
+
+    # the expired then the least recently used responses are evicted
+    time.sleep(0.01)
+    cache.set("c", {"content": "c"}, ttl=60)
+    cache.get("a")
+    cache.set("d", {"content": "d"}, ttl=60)
+    assert len(cache) == 2
+    assert cache.get("c") is None
+    assert cache.get("a") is not None
+
+
+def test_cache_key():
+    llm = ChatOpenAI(api_key="secret-1", model="gpt-4o-mini", temperature=0)
+    key = cache_key(llm, "hello ")
+
+    # the secrets and the transport params are not part of the key
+    other_key = ChatOpenAI(api_key="secret-2", model="gpt-4o-mini", temperature=0)
+    assert cache_key(other_key, [HumanMessage(content="hello")]) == key
+    assert (
+        cache_key(
+            llm.__class__(api_key="x", model="gpt-4o-mini", temperature=0, timeout=10),
+            "hello",
+        )
+        == key
+    )
+
+    assert cache_key(llm, "hello", temperature=1) != key
+    assert cache_key(llm, [SystemMessage(content="hello")]) != key
+    other_model = ChatOpenAI(api_key="secret-1", model="gpt-4o", temperature=0)
+    assert cache_key(other_model, "hello") != key
+
+
+@patch(
+    "openai.resources.chat.completions.Completions.create",
+    side_effect=lambda *args, **kwargs: _completion,
+)
+def test_cached_invoke(openai_completion, cache_path):
+    llm = CachedChatLLM(
+        llm=ChatOpenAI(api_key="dummy", model="gpt-4o-mini"), cache_path=cache_path
+    )
+    with collect_usage() as usage:
+        first = llm("hello")
+        second = llm("hello")
+
+    assert openai_completion.call_count == 1
+    assert second.content == first.content == "Hello!"
+    assert second.prompt_tokens == 10
+    # the cached response costs nothing
+    assert usage.totals()["calls"] == 1
+
+    llm("hello again")
+    assert openai_completion.call_count == 2
+
+
+@patch("openai.resources.chat.completions.Completions.create")
+def test_cached_stream(openai_completion, cache_path):
+    openai_completion.side_effect = lambda *args, **kwargs: iter(
+        [_chunk("Hello"), _chunk(" world")]
+    )
+    llm = CachedChatLLM(
+        llm=ChatOpenAI(api_key="dummy", model="gpt-4o-mini"), cache_path=cache_path
+    )
+
+    # an interrupted stream is not stored
+    next(llm.stream("hello"))
+    assert "".join(chunk.text for chunk in llm.stream("hello")) == "Hello world"
+    assert openai_completion.call_count == 2
+
+    chunks = list(llm.stream("hello"))
+    assert [chunk.text for chunk in chunks] == ["Hello world"]
+    assert openai_completion.call_count == 2
+
+
+def test_cached_llm_opt_in():
+    llm = ChatOpenAI(api_key="dummy", model="gpt-4o-mini")
+    assert cached_llm(llm, "SuggestConvNamePipeline") is llm
+
+    with patch(
+        "kotaemon.llms.cache.flowsettings.KH_LLM_CACHE_PIPELINES",
+        {"SuggestConvNamePipeline": 60},
+        create=True,
+    ):
+        cached = cached_llm(llm, "SuggestConvNamePipeline")
+        assert isinstance(cached, CachedChatLLM)
+        assert cached.ttl == 60
+        assert cached_llm(cached, "SuggestConvNamePipeline") is cached
+        assert cached_llm(llm, "RewriteQuestionPipeline") is llm
@@ -0,0 +1,189 @@
+import asyncio
+import threading
+import time
+from contextvars import copy_context
+from unittest.mock import patch
+
+import httpx
+import openai
+import pytest
+from openai.types.chat.chat_completion import ChatCompletion
+
+from kotaemon.base.tracing import tracer
+from kotaemon.llms import ChatOpenAI
+from kotaemon.llms.scheduler import (
+    LLMScheduler,
+    ModelQueue,
+    Priority,
+    TokenBucket,
+    get_retry_after,
+    priority,
+)
+
+_completion = ChatCompletion.parse_obj(
+    {
+        "id": "chatcmpl-1",
+        "object": "chat.completion",
+        "created": 1692338378,
+        "model": "gpt-4o-mini-2024-07-18",
+        "choices": [
+            {
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": "Hello!"},
+            }
+        ],
+        "usage": {"completion_tokens": 9, "prompt_tokens": 10, "total_tokens": 19},
+    }
+)
+
+
+def _rate_limit_error(headers=None):
+    response = httpx.Response(
+        429,
+        headers=headers or {},
+        request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"),
+    )
+    return openai.RateLimitError("Rate limit reached", response=response, body=None)
+
+
+def test_token_bucket():
+    bucket = TokenBucket(per_minute=60)
+    now = time.monotonic()
+    assert bucket.wait_time(60, now) == 0
+    bucket.take(60, now)
+    assert bucket.wait_time(1, now) == pytest.approx(1.0, abs=0.01)
+    # the requests larger than the bucket wait for a full bucket
+    assert bucket.wait_time(120, now) == pytest.approx(60.0, abs=0.1)
+
+
+def test_queue_priorities():
+    queue = ModelQueue(max_concurrency=1)
+    queue.acquire(Priority.INTERACTIVE)
+
+    order = []
+
+    def request(priority_):
+        queue.acquire(priority_)
+        order.append(priority_)
+        queue.release()
+
+    threads = []
+    for priority_ in (Priority.BATCH, Priority.AUXILIARY, Priority.INTERACTIVE):
+        thread = threading.Thread(target=request, args=(priority_,))
+        thread.start()
+        threads.append(thread)
+        # wait until the request is queued
+        while queue.stats()["waiting"] < len(threads):
+            time.sleep(0.001)
+
+    queue.release()
+    for thread in threads:
+        thread.join()
+    assert order == [Priority.INTERACTIVE, Priority.AUXILIARY, Priority.BATCH]
+
+
+def test_priority_context():
+    scheduler = LLMScheduler(limits={"model": {"max_concurrency": 1}})
+    tracer.reset()
+
+    def call():
+        return scheduler.call("model", lambda: "ok")
+
+    with priority("batch"):
+        # the threads inherit the priority of their context
+        thread = threading.Thread(target=copy_context().run, args=(call,))
+        thread.start()
+        thread.join()
+    assert call() == "ok"
+
+    summary = tracer.summary()
+    assert summary["llm.queue.batch"]["count"] == 1
+    assert summary["llm.queue.interactive"]["count"] == 1
+
+
+def test_get_retry_after():
+    assert get_retry_after(_rate_limit_error({"retry-after": "2"})) == 2.0
+    assert get_retry_after(_rate_limit_error({"retry-after-ms": "500"})) == 0.5
+    assert get_retry_after(_rate_limit_error()) is None
+    assert get_retry_after(ValueError()) is None
+
+
+def test_retries():
+    scheduler = LLMScheduler(limits={"model": {"max_concurrency": 2}}, max_retries=2)
+    errors = [_rate_limit_error({"retry-after": "0.05"})]
+
+    def fn():
+        if errors:
+            raise errors.pop()
+        return "ok"
+
+    start = time.monotonic()
+    assert scheduler.call("model", fn) == "ok"
+    # the request waited for the Retry-After delay
+    assert time.monotonic() - start >= 0.05
+    assert scheduler.stats() == {"model": {"active": 0, "waiting": 0}}
+
+    # the other errors are not retried
+    with pytest.raises(ValueError):
+        scheduler.call("model", lambda: (_ for _ in ()).throw(ValueError()))
+
+    # the retries are limited
+    errors = [_rate_limit_error({"retry-after": "0"}) for _ in range(3)]
+    with pytest.raises(openai.RateLimitError):
+        scheduler.call("model", fn)
+    assert not errors
+
+
+def test_stream_retries_before_first_chunk():
+    scheduler = LLMScheduler(max_retries=1)
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) == 1:
+            raise _rate_limit_error({"retry-after": "0"})
+        return iter(["a", "b"])
+
+    assert list(scheduler.stream("model", fn)) == ["a", "b"]
+    assert len(calls) == 2
+
+
+def test_cancelled_request_releases_slot():
+    scheduler = LLMScheduler(limits={"model": {"max_concurrency": 1}})
+    queue = scheduler.get_queue("model")
+
+    async def fn():
+        return "ok"
+
+    async def main():
+        queue.acquire()
+        task = asyncio.ensure_future(scheduler.acall("model", fn))
+        while queue.stats()["waiting"] == 0:
+            await asyncio.sleep(0.001)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        # the slot acquired after the cancellation is released
+        queue.release()
+        while queue.stats() != {"active": 0, "waiting": 0}:
+            await asyncio.sleep(0.001)
+        return await scheduler.acall("model", fn)
+
+    assert asyncio.run(asyncio.wait_for(main(), timeout=5)) == "ok"
+
+
+@patch("openai.resources.chat.completions.Completions.create")
+def test_openai_rate_limit_retry(openai_completion):
+    errors = [_rate_limit_error({"retry-after": "0"})]
+
+    def create(*args, **kwargs):
+        if errors:
+            raise errors.pop()
+        return _completion
+
+    openai_completion.side_effect = create
+    model = ChatOpenAI(api_key="dummy", model="gpt-4o-mini")
+    assert model("hello").content == "Hello!"
+    assert openai_completion.call_count == 2
@@ -11,6 +11,10 @@ from kotaemon.loaders import (
     DocxReader,
     HtmlReader,
     MhtmlReader,
+    PDFThumbnailReader,
+    ReaderCache,
+    ShardedPDFReader,
+    TxtReader,
     UnstructuredReader,
 )
 
@@ -54,6 +58,81 @@ def test_pdf_reader():
     assert len(nodes) > 0
 
 
+def test_pdf_thumbnail_reader_lazy_load():
+    reader = PDFThumbnailReader()
+    file_path = Path(__file__).parent / "resources" / "dummy.pdf"
+    documents = list(reader.lazy_load_data(file_path, extra_info={"file_id": "1"}))
+
+    # each page yields its thumbnail first, then its text
+    assert [doc.metadata.get("type") for doc in documents] == ["thumbnail", None]
+    assert documents[1].text.lower().replace(" ", "") == "dummypdffile"
+    assert all(doc.metadata["file_id"] == "1" for doc in documents)
+    assert len(reader.load_data(file_path)) == len(documents)
+
+
+def test_sharded_pdf_reader(tmp_path):
+    from pypdf import PdfReader, PdfWriter
+
+    source = PdfReader(Path(__file__).parent / "resources" / "multimodal.pdf")
+    writer = PdfWriter()
+    for _ in range(3):
+        for page in source.pages:
+            writer.add_page(page)
+    file_path = tmp_path / "large.pdf"
+    with file_path.open("wb") as f:
+        writer.write(f)
+
+    expected = list(
+        PDFThumbnailReader().lazy_load_data(file_path, extra_info={"file_id": "1"})
+    )
+    reader = ShardedPDFReader(num_workers=2, min_pages_per_shard=1)
+    documents = reader.load_data(file_path, extra_info={"file_id": "1"})
+
+    assert [doc.text for doc in documents] == [doc.text for doc in expected]
+    assert [doc.metadata for doc in documents] == [doc.metadata for doc in expected]
+
+
+def test_sharded_pdf_reader_page_labels(tmp_path):
+    from pypdf import PdfReader, PdfWriter
+
+    source = PdfReader(Path(__file__).parent / "resources" / "multimodal.pdf")
+    writer = PdfWriter()
+    for _ in range(3):
+        for page in source.pages:
+            writer.add_page(page)
+    # roman numeral front matter, skipped by the reader
+    writer.set_page_label(0, 1, style="/r")
+    writer.set_page_label(2, len(writer.pages) - 1, style="/D", start=1)
+    file_path = tmp_path / "labelled.pdf"
+    with file_path.open("wb") as f:
+        writer.write(f)
+
+    expected = list(PDFThumbnailReader().lazy_load_data(file_path))
+    reader = ShardedPDFReader(num_workers=2, min_pages_per_shard=1)
+    documents = reader.load_data(file_path)
+
+    assert [doc.metadata.get("page_label") for doc in documents] == [
+        doc.metadata.get("page_label") for doc in expected
+    ]
+
+    # the shards are not parsed further once the consumer stops
+    stream = reader.lazy_load_data(file_path)
+    next(stream)
+    stream.close()
+
+
+def test_txt_reader_lazy_load(tmp_path):
+    file_path = tmp_path / "long.txt"
+    file_path.write_text("first line\nsecond line\n\n" * 1000)
+
+    reader = TxtReader(block_size=1000)
+    documents = list(reader.lazy_load_data(file_path))
+
+    assert len(documents) > 1
+    assert all(doc.text.endswith("\n\n") for doc in documents)
+    assert "".join(doc.text for doc in documents) == file_path.read_text()
+
+
 @skip_when_unstructured_pdf_not_installed
 def test_unstructured_pdf_reader():
     reader = UnstructuredReader()
@@ -93,3 +172,76 @@ def test_azureai_document_intelligence_reader(mock_client):
 
     assert len(docs) == 1
     mock_client.assert_called_once()
+
+
+def test_figure_captioner_cache(tmp_path):
+    from kotaemon.loaders.utils.captioning import FigureCaptioner
+
+    figures = ["data:image/png;base64,AAAA", "data:image/png;base64,BBBB"] * 3
+    captioner = FigureCaptioner(max_workers=2, cache_dir=tmp_path, max_image_size=None)
+    with patch(
+        "kotaemon.loaders.utils.captioning.generate_gpt4v",
+        side_effect=lambda images, **kwargs: f"caption of {images[-4:]}",
+    ) as mock_vlm:
+        captions = captioner.caption_many("http://vlm", figures, max_figures=5)
+    assert captions == ["caption of AAAA", "caption of BBBB"] * 2 + [
+        "caption of AAAA",
+        "",
+    ]
+    assert mock_vlm.call_count == 2
+
+    # captions are persisted across captioner instances
+    captioner = FigureCaptioner(cache_dir=tmp_path, max_image_size=None)
+    with patch("kotaemon.loaders.utils.captioning.generate_gpt4v") as mock_vlm:
+        assert captioner.caption("http://vlm", figures[1]) == "caption of BBBB"
+    mock_vlm.assert_not_called()
+
+    # another VLM captions the figures again
+    with patch(
+        "kotaemon.loaders.utils.captioning.generate_gpt4v", return_value="other"
+    ) as mock_vlm:
+        assert captioner.caption("http://other-vlm", figures[1]) == "other"
+    mock_vlm.assert_called_once()
+
+
+def test_figure_captioner_memory_bound():
+    from kotaemon.loaders.utils.captioning import FigureCaptioner
+
+    captioner = FigureCaptioner(max_image_size=None, max_memory_entries=2)
+    with patch(
+        "kotaemon.loaders.utils.captioning.generate_gpt4v",
+        side_effect=lambda images, **kwargs: f"caption of {images[-1]}",
+    ) as mock_vlm:
+        for figure in ["a", "b", "a", "c", "a", "b"]:
+            captioner.caption("http://vlm", f"data:image/png;base64,{figure}")
+
+    # "b" was the least recently used when "c" was added
+    assert mock_vlm.call_count == 4
+    assert len(captioner._memory_cache) == 2
+
+
+def test_reader_cache(tmp_path):
+    file_path = tmp_path / "doc.txt"
+    file_path.write_text("first paragraph\n\nsecond paragraph\n\n")
+    cache = ReaderCache(tmp_path / "cache")
+    reader = TxtReader(block_size=10)
+
+    documents = list(cache.load(reader, file_path, extra_info={"file_id": "1"}))
+    assert len(documents) == 2
+
+    with patch.object(TxtReader, "lazy_load_data") as mock_load:
+        cached = list(cache.load(reader, file_path, extra_info={"file_id": "2"}))
+    mock_load.assert_not_called()
+    assert [doc.text for doc in cached] == [doc.text for doc in documents]
+    assert all(doc.metadata["file_id"] == "2" for doc in cached)
+    assert not {doc.doc_id for doc in cached} & {doc.doc_id for doc in documents}
+
+    # another reader setting is another entry
+    with patch.object(TxtReader, "lazy_load_data", return_value=iter([])) as mock_load:
+        list(cache.load(TxtReader(block_size=20), file_path))
+    mock_load.assert_called_once()
+
+    # entries are evicted when the cache is too large
+    cache.max_size = 0
+    cache.evict()
+    assert cache.get(cache.key(file_path, reader)) is None
@@ -6,6 +6,7 @@ from openai.types.chat.chat_completion import ChatCompletion
 from kotaemon.base import Document
 from kotaemon.indices.rankings import LLMReranking
 from kotaemon.llms import AzureChatOpenAI
+from kotaemon.rerankings.onnx_cross_encoder import length_bucketed_batches
 
 _openai_chat_completion_responses = [
     ChatCompletion.parse_obj(
@@ -61,3 +62,18 @@ def test_reranking(openai_completion, llm):
     rerank_docs = reranker(documents, query=query)
 
     assert len(rerank_docs) == 2
+
+
+def test_length_bucketed_batches():
+    lengths = [50, 10, 400, 12, 11, 300]
+    batches = length_bucketed_batches(lengths, batch_size=3, max_batch_tokens=700)
+
+    # every item is scored exactly once
+    assert sorted(idx for batch in batches for idx in batch) == list(range(6))
+    # short items are grouped together, long items do not pad short ones
+    assert batches[0] == [1, 4, 3]
+    assert batches[1] == [0, 5]
+    assert batches[2] == [2]
+    for batch in batches:
+        assert len(batch) <= 3
+        assert len(batch) * max(lengths[idx] for idx in batch) <= 700
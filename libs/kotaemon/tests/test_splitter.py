@@ -1,7 +1,13 @@
-from llama_index.core.schema import NodeRelationship
+from llama_index.core.schema import MetadataMode, NodeRelationship
 
 from kotaemon.base import Document
-from kotaemon.indices.splitters import TokenSplitter
+from kotaemon.indices.splitters import TiktokenSplitter, TokenSplitter
+from kotaemon.indices.splitters.tiktoken_splitter import (
+    TOKEN_COUNT_KEY,
+    get_encoding,
+    get_token_count,
+    get_token_func,
+)
 
 source1 = Document(
     content="The City Hall and Raffles Place MRT stations are paired cross-platform "
@@ -53,3 +59,84 @@ def test_split_token():
     )
     assert chunks[1].relationships[NodeRelationship.NEXT].node_id == chunks[2].doc_id
     assert chunks[-1].relationships[NodeRelationship.SOURCE].node_id == source2.doc_id
+
+
+def test_tiktoken_splitter():
+    """Test that the native splitter produces the same chunks as TokenSplitter"""
+    params = dict(
+        chunk_size=30, chunk_overlap=10, separator=" ", backup_separators=["\n"]
+    )
+    expected = TokenSplitter(**params)([source1, source2])
+    chunks = TiktokenSplitter(**params)([source1, source2])
+
+    assert [chunk.text for chunk in chunks] == [chunk.text for chunk in expected]
+    for chunk in chunks[:3]:
+        assert source1.text[chunk.start_char_idx : chunk.end_char_idx] == chunk.text
+
+    assert chunks[0].relationships[NodeRelationship.SOURCE].node_id == source1.doc_id
+    assert (
+        chunks[1].relationships[NodeRelationship.PREVIOUS].node_id == chunks[0].doc_id
+    )
+    assert chunks[1].relationships[NodeRelationship.NEXT].node_id == chunks[2].doc_id
+    assert chunks[-1].relationships[NodeRelationship.SOURCE].node_id == source2.doc_id
+
+
+def test_tiktoken_splitter_paragraphs():
+    """Test the separators of the file index on multi-paragraph texts"""
+    sentence = "The quick brown fox jumps over the lazy dog"
+    paragraphs = [
+        ". ".join([sentence] * 12),
+        "\n".join([sentence] * 5),
+        "lorem\u200bipsum" * 40,
+        # a paragraph without any separator is split into characters
+        " ".join([sentence] * 10),
+        sentence,
+    ]
+    documents = [
+        Document(text="\n\n".join(paragraphs)),
+        Document(text="\n\n".join(reversed(paragraphs))),
+    ]
+    params = dict(
+        chunk_size=64,
+        chunk_overlap=16,
+        separator="\n\n",
+        backup_separators=["\n", ".", "\u200B"],
+    )
+    expected = TokenSplitter(**params)(documents)
+    chunks = TiktokenSplitter(**params)(documents)
+
+    assert [chunk.text for chunk in chunks] == [chunk.text for chunk in expected]
+
+
+def test_tiktoken_splitter_token_count():
+    splitter = TiktokenSplitter(chunk_size=30, chunk_overlap=10)
+    chunks = splitter([source1])
+
+    encoding = get_encoding(splitter.model_name)
+    for chunk in chunks:
+        n_tokens = get_token_count(chunk)
+        assert n_tokens is not None
+        # the count is the sum of the tokens of the merged splits, which may
+        # tokenize slightly differently than the whole chunk
+        assert abs(n_tokens - len(encoding.encode_ordinary(chunk.text))) <= 2
+        # the count is neither embedded nor sent to the LLM
+        assert TOKEN_COUNT_KEY not in chunk.get_metadata_str(MetadataMode.EMBED)
+        assert TOKEN_COUNT_KEY not in chunk.get_metadata_str(MetadataMode.LLM)
+
+    # the source document is counted as a whole
+    assert get_token_count(source1) == len(encoding.encode_ordinary(source1.text))
+
+    chunks = TiktokenSplitter(
+        chunk_size=30, chunk_overlap=10, record_token_count=False
+    )([source1])
+    assert all(get_token_count(chunk) is None for chunk in chunks)
+
+
+def test_get_token_func():
+    get_encoding.cache_clear()
+    token_func = get_token_func("gpt-3.5-turbo", disallowed_special="all")
+    # the encoding is loaded on the first call
+    assert get_encoding.cache_info().currsize == 0
+
+    text = source1.text
+    assert token_func(text) == get_encoding("gpt-3.5-turbo").encode(text)
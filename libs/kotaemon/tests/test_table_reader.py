@@ -3,7 +3,12 @@ from pathlib import Path
 
 import pytest
 
-from kotaemon.loaders import MathpixPDFReader, OCRReader, PandasExcelReader
+from kotaemon.loaders import (
+    MathpixPDFReader,
+    OCRReader,
+    PandasExcelReader,
+    SpreadsheetReader,
+)
 
 from .conftest import skip_when_unstructured_pdf_not_installed
 
@@ -49,3 +54,48 @@ def test_excel_reader():
         input_file_excel,
     )
     assert len(documents) == 1
+
+    # the lazy path yields the same text, one document per sheet
+    lazy_documents = list(reader.lazy_load_data(input_file_excel))
+    assert lazy_documents
+    assert "\n".join(doc.text for doc in lazy_documents) == documents[0].text
+
+
+def test_spreadsheet_reader(tmp_path):
+    from openpyxl import Workbook
+
+    file_path = tmp_path / "large.xlsx"
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("data")
+    sheet.append(["id", "name"])
+    for idx in range(1, 26):
+        sheet.append([idx, f"item {idx}"])
+    workbook.save(file_path)
+
+    reader = SpreadsheetReader(rows_per_document=10, include_sheetname=False)
+    documents = reader.load_data(file_path, extra_info={"file_id": "1"})
+
+    assert len(documents) == 3
+    assert all(doc.text.startswith("id | name\n") for doc in documents)
+    assert [
+        (doc.metadata["row_start"], doc.metadata["row_end"]) for doc in documents
+    ] == [
+        (2, 11),
+        (12, 21),
+        (22, 26),
+    ]
+    assert documents[0].metadata["sheet_name"] == "data"
+    assert documents[0].metadata["file_id"] == "1"
+    assert documents[-1].text.endswith("25 | item 25")
+
+
+def test_spreadsheet_reader_csv(tmp_path):
+    file_path = tmp_path / "large.csv"
+    file_path.write_text("id,name\n\n1,first\n2,second\n")
+
+    documents = SpreadsheetReader(include_sheetname=False).load_data(file_path)
+
+    assert len(documents) == 1
+    assert documents[0].text == "id | name\n1 | first\n2 | second"
+    assert documents[0].metadata["row_start"] == 3
+    assert documents[0].metadata["sheet_name"] == "large"
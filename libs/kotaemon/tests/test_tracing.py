@@ -0,0 +1,118 @@
+import json
+import socket
+import threading
+import urllib.request
+from contextvars import copy_context
+
+import pytest
+
+from kotaemon.base.tracing import Tracer, start_metrics_server
+
+
+def test_span_nesting():
+    tracer = Tracer()
+    with tracer.span("parent") as parent:
+        assert tracer.current_span() is parent
+        with tracer.span("child", top_k=5) as child:
+            assert tracer.current_span() is child
+        other = tracer.start_span("other")
+        other.end()
+    assert tracer.current_span() is None
+
+    assert child.parent_id == parent.span_id
+    assert child.trace_id == parent.trace_id
+    assert child.attributes == {"top_k": 5}
+    assert other.parent_id == parent.span_id
+    assert parent.parent_id is None
+    assert set(tracer.summary()) == {"parent", "child", "other"}
+
+
+def test_span_error():
+    tracer = Tracer()
+    with pytest.raises(ValueError):
+        with tracer.span("failing") as span:
+            raise ValueError("boom")
+    assert span.error == "ValueError: boom"
+    assert tracer.summary()["failing"]["count"] == 1
+
+
+def test_trace_stream_across_contexts():
+    tracer = Tracer()
+    children = []
+
+    def stream():
+        for i in range(3):
+            with tracer.span(f"step_{i}") as span:
+                children.append(span)
+            yield i
+        return "done"
+
+    traced = tracer.trace_stream(stream(), "stream")
+    outputs = []
+
+    def step():
+        outputs.append(next(traced, None))
+
+    # each step runs in a new thread and context, like the gradio handlers
+    for _ in range(4):
+        thread = threading.Thread(target=copy_context().run, args=(step,))
+        thread.start()
+        thread.join()
+
+    assert outputs == [0, 1, 2, None]
+    assert len({span.trace_id for span in children}) == 1
+    assert len({span.parent_id for span in children}) == 1
+    assert tracer.summary()["stream"]["count"] == 1
+    assert tracer.current_span() is None
+
+
+def test_summary_quantiles():
+    tracer = Tracer()
+    for duration in range(1, 101):
+        span = tracer.start_span("stage")
+        span.end_ns = span.start_ns + duration * 1_000_000
+        tracer.record(span)
+
+    summary = tracer.summary()["stage"]
+    assert summary["count"] == 100
+    assert summary["p50"] == pytest.approx(0.051)
+    assert summary["p95"] == pytest.approx(0.096)
+
+    text = tracer.prometheus_text()
+    assert 'kotaemon_stage_duration_seconds{stage="stage",quantile="0.95"}' in text
+    assert 'kotaemon_stage_duration_seconds_count{stage="stage"} 100' in text
+
+
+def test_export_otlp_json(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    tracer = Tracer(export_path=str(path))
+    for _ in range(2):
+        with tracer.span("query"):
+            with tracer.span("retrieval", top_k=3):
+                pass
+
+    requests = [json.loads(line) for line in path.read_text().splitlines()]
+    assert len(requests) == 2
+    spans = requests[0]["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert [span["name"] for span in spans] == ["retrieval", "query"]
+    assert spans[0]["parentSpanId"] == spans[1]["spanId"]
+    assert spans[0]["attributes"] == [{"key": "top_k", "value": {"intValue": "3"}}]
+
+
+def test_metrics_server():
+    tracer = Tracer()
+    with tracer.span("stage"):
+        pass
+    # disabled without a port
+    assert start_metrics_server(port=0, tracer=tracer) is None
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = start_metrics_server(port=port, host="127.0.0.1", tracer=tracer)
+    assert server is not None
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+            assert 'stage="stage"' in response.read().decode()
+    finally:
+        server.shutdown()
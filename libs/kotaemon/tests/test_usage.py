@@ -0,0 +1,217 @@
+from contextvars import copy_context
+from threading import Thread
+from unittest.mock import patch
+
+import httpx
+import openai
+import pytest
+from openai.types.chat.chat_completion import ChatCompletion
+from openai.types.chat.chat_completion_chunk import ChatCompletionChunk
+
+from kotaemon.base import HumanMessage, SystemMessage
+from kotaemon.base.tracing import Tracer
+from kotaemon.base.usage import (
+    UsageCollector,
+    collect_stream,
+    collect_usage,
+    compute_cost,
+    estimate_message_tokens,
+    record_usage,
+)
+from kotaemon.llms import ChatOpenAI
+
+PRICING = {
+    "gpt-4o": {"input": 2.5, "output": 10.0},
+    "gpt-4o-mini": {"input": 0.15, "output": 0.6},
+}
+
+
+def _chunk(content=None, usage=None, choices=True):
+    return ChatCompletionChunk.parse_obj(
+        {
+            "id": "chatcmpl-1",
+            "object": "chat.completion.chunk",
+            "created": 1692338378,
+            "model": "gpt-4o-mini-2024-07-18",
+            "choices": (
+                [{"index": 0, "delta": {"content": content}, "finish_reason": None}]
+                if choices
+                else []
+            ),
+            "usage": usage,
+        }
+    )
+
+
+_completion = ChatCompletion.parse_obj(
+    {
+        "id": "chatcmpl-1",
+        "object": "chat.completion",
+        "created": 1692338378,
+        "model": "gpt-4o-mini-2024-07-18",
+        "choices": [
+            {
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": "Hello!"},
+            }
+        ],
+        "usage": {"completion_tokens": 9, "prompt_tokens": 10, "total_tokens": 19},
+    }
+)
+
+
+def test_compute_cost():
+    assert compute_cost("gpt-4o", 1_000_000, 0, PRICING) == pytest.approx(2.5)
+    # the longest matching prefix
+    assert compute_cost("gpt-4o-mini-2024-07-18", 0, 1_000_000, PRICING) == (
+        pytest.approx(0.6)
+    )
+    assert compute_cost("unknown", 1000, 1000, PRICING) == 0.0
+
+
+def test_collectors():
+    tracer = Tracer()
+    # nothing is recorded without collector
+    assert record_usage("chat", "model", 10, 5) is None
+
+    with collect_usage() as outer:
+        with collect_usage() as inner, tracer.span("answer"):
+            record_usage("chat", "model-a", 10, 5)
+        record_usage("embedding", "model-b", 7)
+
+    assert len(inner.records) == 1
+    assert outer.totals() == {
+        "calls": 2,
+        "prompt_tokens": 17,
+        "completion_tokens": 5,
+        "total_tokens": 22,
+        "cost": 0.0,
+        "estimated": False,
+    }
+    by_model = outer.group_by("model")
+    assert by_model[("model-a",)]["total_tokens"] == 15
+    assert by_model[("model-b",)]["calls"] == 1
+
+
+def test_collect_stream_across_contexts():
+    usage = UsageCollector()
+
+    def stream():
+        for i in range(3):
+            record_usage("chat", "model", 1, 1)
+            yield i
+
+    collected = collect_stream(stream(), usage)
+
+    def step():
+        next(collected, None)
+
+    # each step runs in a new thread and context, like the gradio handlers
+    for _ in range(4):
+        thread = Thread(target=copy_context().run, args=(step,))
+        thread.start()
+        thread.join()
+
+    assert usage.totals()["calls"] == 3
+
+
+def test_estimate_message_tokens():
+    messages = [
+        SystemMessage(content="You are a helpful assistant"),
+        HumanMessage(content="hello world"),
+    ]
+    assert estimate_message_tokens(messages) == 5 + 2 + 2 * 4
+    assert estimate_message_tokens({"role": "user", "content": "hello world"}) == 6
+    assert estimate_message_tokens("hello world") == 2
+
+
+@patch(
+    "openai.resources.chat.completions.Completions.create",
+    side_effect=lambda *args, **kwargs: _completion,
+)
+def test_openai_invoke_usage(openai_completion):
+    model = ChatOpenAI(api_key="dummy", model="gpt-4o-mini")
+    with collect_usage() as usage:
+        model("hello")
+
+    (record,) = usage.records
+    assert record.model == "gpt-4o-mini-2024-07-18"
+    assert (record.prompt_tokens, record.completion_tokens) == (10, 9)
+    assert not record.estimated
+
+
+@patch("openai.resources.chat.completions.Completions.create")
+def test_openai_stream_usage(openai_completion):
+    model = ChatOpenAI(api_key="dummy", model="gpt-4o-mini")
+    openai_completion.side_effect = lambda *args, **kwargs: iter(
+        [
+            _chunk("Hello"),
+            _chunk(" world"),
+            _chunk(
+                usage={"prompt_tokens": 12, "completion_tokens": 2, "total_tokens": 14},
+                choices=False,
+            ),
+        ]
+    )
+    with collect_usage() as usage:
+        output = "".join(chunk.text for chunk in model.stream("hello"))
+
+    assert output == "Hello world"
+    assert openai_completion.call_args.kwargs["stream_options"] == {
+        "include_usage": True
+    }
+    (record,) = usage.records
+    assert (record.prompt_tokens, record.completion_tokens) == (12, 2)
+    assert not record.estimated
+
+    # without usage in the stream, it is estimated
+    openai_completion.side_effect = lambda *args, **kwargs: iter(
+        [_chunk("Hello"), _chunk(" world")]
+    )
+    with collect_usage() as usage, patch(
+        "kotaemon.base.usage.flowsettings.KH_LLM_PRICING", PRICING, create=True
+    ):
+        list(model.stream("hello"))
+
+    (record,) = usage.records
+    assert record.estimated
+    assert (record.prompt_tokens, record.completion_tokens) == (5, 2)
+    assert record.cost == pytest.approx((5 * 0.15 + 2 * 0.6) / 1e6)
+
+    # the usage is not requested when it is not accounted
+    list(model.stream("hello"))
+    assert "stream_options" not in openai_completion.call_args.kwargs
+
+
+@patch("openai.resources.chat.completions.Completions.create")
+def test_openai_stream_options_rejected(openai_completion):
+    response = httpx.Response(
+        400, request=httpx.Request("POST", "http://localhost:8000/v1/chat/completions")
+    )
+    rejection = openai.BadRequestError(
+        "Unrecognized request argument supplied: stream_options",
+        response=response,
+        body=None,
+    )
+
+    def create(*args, **kwargs):
+        if "stream_options" in kwargs:
+            raise rejection
+        return iter([_chunk("Hello"), _chunk(" world")])
+
+    openai_completion.side_effect = create
+    model = ChatOpenAI(
+        api_key="dummy", model="local-model", base_url="http://localhost:8000/v1"
+    )
+    with collect_usage() as usage:
+        assert "".join(chunk.text for chunk in model.stream("hello")) == "Hello world"
+    # the stream is sent again without the option, its usage is estimated
+    assert openai_completion.call_count == 2
+    (record,) = usage.records
+    assert record.estimated
+
+    # the option is no longer sent to this server
+    with collect_usage():
+        list(model.stream("hello"))
+    assert openai_completion.call_count == 3
@@ -71,6 +71,14 @@ class TestChromaVectorStore:
         _, _, out_ids = db.query(embedding=[0.42, 0.52, 0.53], top_k=1)
         assert out_ids == ["b"]
 
+    def test_get_embeddings(self, tmp_path):
+        db = ChromaVectorStore(path=str(tmp_path))
+        db.add(embeddings=[[0.1, 0.2, 0.3], [0.4, 0.5, 0.6]], ids=["a", "b"])
+
+        embeddings = db.get_embeddings(["b", "c"])
+        assert list(embeddings) == ["b"]
+        assert embeddings["b"] == pytest.approx([0.4, 0.5, 0.6])
+
     def test_save_load_delete(self, tmp_path):
         """Test that save/load func behave correctly."""
         embeddings = [[0.1, 0.2, 0.3], [0.4, 0.5, 0.6], [0.7, 0.8, 0.9]]
@@ -130,6 +138,11 @@ class TestInMemoryVectorStore:
             0.6,
         ], "load function does not load data completely"
 
+    def test_get_embeddings(self):
+        db = InMemoryVectorStore()
+        db.add(embeddings=[[0.1, 0.2, 0.3], [0.4, 0.5, 0.6]], ids=["1", "2"])
+        assert db.get_embeddings(["2", "3"]) == {"2": [0.4, 0.5, 0.6]}
+
 
 class TestSimpleFileVectorStore:
     def test_add_delete(self, tmp_path):
@@ -7,12 +7,16 @@ import pluggy
 from ktem import extension_protocol
 from ktem.assets import PDFJS_PREBUILT_DIR, KotaemonTheme
 from ktem.components import reasonings
+from ktem.db.models import init_db
 from ktem.exceptions import HookAlreadyDeclared, HookNotDeclared
 from ktem.index import IndexManager
 from ktem.settings import BaseSettingGroup, SettingGroup, SettingReasoningGroup
+from ktem.utils.lazy_models import start_warmup
 from theflow.settings import settings
 from theflow.utils.modules import import_dotted_string
 
+from kotaemon.base.tracing import start_metrics_server
+
 BASE_PATH = os.environ.get("GR_FILE_ROOT_PATH", "")
 
 
@@ -38,6 +42,7 @@ class BaseApp:
     public_events: list[str] = []
 
     def __init__(self):
+        init_db()
         self.dev_mode = getattr(settings, "KH_MODE", "") == "dev"
         self.app_name = getattr(settings, "KH_APP_NAME", "Kotaemon")
         self.app_version = getattr(settings, "KH_APP_VERSION", "")
@@ -217,6 +222,10 @@ class BaseApp:
 
             demo.load(None, None, None, js=self._pdf_view_js)
 
+        # the models are built on first use, preload the configured ones
+        start_warmup()
+        start_metrics_server()
+
         return demo
 
     def declare_public_events(self):
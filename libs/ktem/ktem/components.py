@@ -5,6 +5,7 @@ from functools import cache
 from pathlib import Path
 from typing import Optional
 
+from ktem.utils.lazy_models import LazyModels
 from theflow.settings import settings
 from theflow.utils.modules import deserialize
 
@@ -43,13 +44,13 @@ class ModelPool:
         self._category = category
         self._conf = conf
 
-        self._models: dict[str, BaseComponent] = {}
+        self._models = LazyModels()
         self._accuracy: list[str] = []
         self._cost: list[str] = []
         self._default: list[str] = []
 
         for name, model in conf.items():
-            self._models[name] = deserialize(model["spec"], safe=False)
+            self._models.set_spec(name, model["spec"])
             if model.get("default", False):
                 self._default.append(name)
 
@@ -100,3 +100,97 @@ class BaseIssueReport(SQLModel):
     chat: Optional[dict] = Field(default=None, sa_column=Column(JSON))
     settings: Optional[dict] = Field(default=None, sa_column=Column(JSON))
     user: Optional[str] = Field(default=None)
+
+
+class BaseConversationMessage(SQLModel):
+    """Store a turn (the user message and the bot answer) of a conversation
+
+    The turns are appended as the conversation goes, so that a new turn does not
+    rewrite the conversation.
+
+    Attributes:
+        conversation_id: the conversation id
+        turn: the index of the turn in the conversation, starting from 0
+        message: the user message and the bot answer
+        date_created: the date the turn was created
+    """
+
+    __table_args__ = {"extend_existing": True}
+
+    conversation_id: str = Field(primary_key=True)
+    turn: int = Field(primary_key=True)
+    message: list = Field(default=[], sa_column=Column(JSON))
+    date_created: datetime.datetime = Field(
+        default_factory=lambda: datetime.datetime.now(get_localzone())
+    )
+
+
+class BaseConversationRetrieval(SQLModel):
+    """Store the retrieval panel (rendered evidence) of a conversation turn
+
+    Attributes:
+        conversation_id: the conversation id
+        turn: the index of the turn in the conversation, starting from 0
+        content: the rendered content of the retrieval panel
+    """
+
+    __table_args__ = {"extend_existing": True}
+
+    conversation_id: str = Field(primary_key=True)
+    turn: int = Field(primary_key=True)
+    content: str = Field(default="")
+
+
+class BaseConversationPlot(SQLModel):
+    """Store the plot of a conversation turn
+
+    Attributes:
+        conversation_id: the conversation id
+        turn: the index of the turn in the conversation, starting from 0
+        data: the plot, in plotly JSON format
+    """
+
+    __table_args__ = {"extend_existing": True}
+
+    conversation_id: str = Field(primary_key=True)
+    turn: int = Field(primary_key=True)
+    data: Optional[dict] = Field(default=None, sa_column=Column(JSON))
+
+
+class BaseLLMUsage(SQLModel):
+    """Store the token usage of the model calls of a conversation turn, summed by
+    pipeline stage and model
+
+    Attributes:
+        id: canonical id to identify the record
+        conversation_id: the conversation id
+        turn: the index of the turn in the conversation, starting from 0
+        user: the user id
+        stage: the pipeline stage of the calls (e.g. "answer.generation")
+        kind: the kind of model, "chat" or "embedding"
+        model: the name of the model
+        calls: the number of calls
+        prompt_tokens: the number of input tokens
+        completion_tokens: the number of generated tokens
+        cost: the cost in USD
+        estimated: whether some of the tokens are estimated
+        date_created: the date the record was created
+    """
+
+    __table_args__ = {"extend_existing": True}
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    conversation_id: str = Field(default="", index=True)
+    turn: int = Field(default=-1)
+    user: str = Field(default="", index=True)
+    stage: str = Field(default="")
+    kind: str = Field(default="chat")
+    model: str = Field(default="", index=True)
+    calls: int = Field(default=0)
+    prompt_tokens: int = Field(default=0)
+    completion_tokens: int = Field(default=0)
+    cost: float = Field(default=0.0)
+    estimated: bool = Field(default=False)
+    date_created: datetime.datetime = Field(
+        default_factory=lambda: datetime.datetime.now(get_localzone())
+    )
@@ -0,0 +1,147 @@
+"""Storage of the conversation turns
+
+Each turn of a conversation (the user message and the bot answer, the retrieval
+panel and the plot) is stored as a row keyed by (conversation id, turn), so that
+answering a question appends one row to each table instead of rewriting the whole
+history, and a conversation is loaded one page of turns at a time.
+"""
+from typing import Any, Optional
+
+from ktem.db.models import (
+    Conversation,
+    ConversationMessage,
+    ConversationPlot,
+    ConversationRetrieval,
+)
+from sqlalchemy import delete, func, insert
+from sqlmodel import Session, select
+from theflow.settings import settings
+
+# number of turns loaded when a conversation is selected, and for each "load
+# earlier messages" request
+KH_CHAT_HISTORY_PAGE_SIZE = getattr(settings, "KH_CHAT_HISTORY_PAGE_SIZE", 50)
+
+# keys of `Conversation.data_source` holding the history before it was moved to
+# the turn tables
+LEGACY_HISTORY_KEYS = ("messages", "retrieval_messages", "plot_history")
+
+TURN_TABLES = (ConversationMessage, ConversationRetrieval, ConversationPlot)
+
+
+def get_last_turn(session: Session, conversation_id: str) -> int:
+    """Get the last turn of a conversation, -1 if the conversation has no turn"""
+    last_turn = session.exec(
+        select(func.max(ConversationMessage.turn)).where(
+            ConversationMessage.conversation_id == conversation_id
+        )
+    ).one()
+    return -1 if last_turn is None else last_turn
+
+
+def save_turn(
+    session: Session,
+    conversation_id: str,
+    turn: int,
+    message: list,
+    retrieval: str,
+    plot: Optional[dict],
+):
+    """Insert or replace (regeneration) a turn of a conversation. The session is
+    not committed."""
+    session.merge(
+        ConversationMessage(conversation_id=conversation_id, turn=turn, message=message)
+    )
+    session.merge(
+        ConversationRetrieval(
+            conversation_id=conversation_id, turn=turn, content=retrieval or ""
+        )
+    )
+    session.merge(
+        ConversationPlot(conversation_id=conversation_id, turn=turn, data=plot)
+    )
+
+
+def load_turns(
+    session: Session,
+    conversation_id: str,
+    before: Optional[int] = None,
+    limit: int = KH_CHAT_HISTORY_PAGE_SIZE,
+) -> tuple[int, list[list]]:
+    """Load a page of turns of a conversation
+
+    Args:
+        session: the database session
+        conversation_id: the conversation id
+        before: load the turns before this turn, default to the last turns
+        limit: the maximum number of turns to load
+
+    Returns:
+        the first loaded turn and the messages of the loaded turns, in order
+    """
+    statement = select(ConversationMessage.turn, ConversationMessage.message).where(
+        ConversationMessage.conversation_id == conversation_id
+    )
+    if before is not None:
+        statement = statement.where(ConversationMessage.turn < before)
+    statement = statement.order_by(ConversationMessage.turn.desc()).limit(limit)
+
+    rows = session.exec(statement).all()[::-1]
+    if not rows:
+        return before if before is not None else 0, []
+    return rows[0][0], [message for _, message in rows]
+
+
+def load_turn_panel(
+    session: Session, conversation_id: str, turn: int
+) -> tuple[str, Optional[dict]]:
+    """Load the retrieval panel and the plot of a turn"""
+    retrieval = session.get(ConversationRetrieval, (conversation_id, turn))
+    plot = session.get(ConversationPlot, (conversation_id, turn))
+    return (
+        retrieval.content if retrieval is not None else "",
+        plot.data if plot is not None else None,
+    )
+
+
+def migrate_data_source(session: Session, conversation: Conversation) -> bool:
+    """Move the history kept in the data source of a conversation to the turn
+    tables. The session is not committed.
+
+    Returns:
+        whether the conversation was migrated
+    """
+    data_source = conversation.data_source or {}
+    if not any(key in data_source for key in LEGACY_HISTORY_KEYS):
+        return False
+
+    messages = data_source.get("messages") or []
+    retrievals = data_source.get("retrieval_messages") or []
+    plots = data_source.get("plot_history") or []
+    if messages:
+        delete_turns(session, conversation.id)
+        rows: dict[Any, list[dict]] = {table: [] for table in TURN_TABLES}
+        for turn, message in enumerate(messages):
+            key = {"conversation_id": conversation.id, "turn": turn}
+            rows[ConversationMessage].append({**key, "message": list(message)})
+            rows[ConversationRetrieval].append(
+                {**key, "content": retrievals[turn] if turn < len(retrievals) else ""}
+            )
+            rows[ConversationPlot].append(
+                {**key, "data": plots[turn] if turn < len(plots) else None}
+            )
+        for table, records in rows.items():
+            session.execute(insert(table.__table__), records)  # type: ignore
+
+    conversation.data_source = {
+        key: value
+        for key, value in data_source.items()
+        if key not in LEGACY_HISTORY_KEYS
+    }
+    session.add(conversation)
+    return True
+
+
+def delete_turns(session: Session, conversation_id: str):
+    """Delete all the turns of a conversation. The session is not committed."""
+    for table in TURN_TABLES:
+        session.execute(delete(table).where(table.conversation_id == conversation_id))
@@ -1,4 +1,223 @@
-from sqlmodel import create_engine
+import threading
+import time
+import weakref
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import QueuePool
 from theflow.settings import settings
 
-engine = create_engine(settings.KH_DATABASE)
+_engine_stats: "weakref.WeakKeyDictionary[Engine, EngineStats]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+@dataclass
+class EngineStats:
+    """Usage statistics of the connection pool of an engine
+
+    Attributes:
+        connects: number of DBAPI connections opened
+        checkouts: number of connections taken from the pool
+        checked_out: number of connections currently in use
+        max_checked_out: highest number of connections in use at the same time
+        waits: number of checkouts that found the pool exhausted and had to wait
+            for a connection to be returned
+        wait_time: total time (seconds) spent waiting for a connection
+        max_wait_time: longest wait (seconds) for a connection
+        lock_errors: number of statements that failed because the database was
+            locked (SQLite)
+    """
+
+    connects: int = 0
+    checkouts: int = 0
+    checked_out: int = 0
+    max_checked_out: int = 0
+    waits: int = 0
+    wait_time: float = 0.0
+    max_wait_time: float = 0.0
+    lock_errors: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def record_checkout(self, waited: bool, wait_time: float):
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+            if waited:
+                self.waits += 1
+                self.wait_time += wait_time
+                self.max_wait_time = max(self.max_wait_time, wait_time)
+
+    def record_checkin(self):
+        with self._lock:
+            self.checked_out -= 1
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                key: value
+                for key, value in vars(self).items()
+                if not key.startswith("_")
+            }
+
+
+class StatsQueuePool(QueuePool):
+    """Queue pool recording the time spent waiting for a connection"""
+
+    stats: Optional[EngineStats] = None
+
+    def _do_get(self):
+        exhausted = (
+            self.checkedin() == 0
+            and self.checkedout() >= self.size() + self._max_overflow
+        )
+        start = time.perf_counter()
+        connection = super()._do_get()
+        if self.stats is not None:
+            self.stats.record_checkout(exhausted, time.perf_counter() - start)
+        return connection
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.stats = self.stats  # type: ignore[attr-defined]
+        return pool
+
+
+def _sqlite_options(url, busy_timeout: float) -> dict:
+    options: dict[str, Any] = {
+        # connections are shared by the threads of the gradio handlers through
+        # the pool, never used by two threads at the same time
+        "connect_args": {"check_same_thread": False},
+    }
+    if url.database and url.database != ":memory:":
+        options["poolclass"] = StatsQueuePool
+        options["pool_size"] = getattr(settings, "KH_DATABASE_POOL_SIZE", 10)
+        options["max_overflow"] = getattr(settings, "KH_DATABASE_MAX_OVERFLOW", 20)
+        options["pool_timeout"] = busy_timeout
+    return options
+
+
+def _postgresql_options(url, busy_timeout: float) -> dict:
+    options: dict[str, Any] = {
+        "poolclass": StatsQueuePool,
+        "pool_size": getattr(settings, "KH_DATABASE_POOL_SIZE", 10),
+        "max_overflow": getattr(settings, "KH_DATABASE_MAX_OVERFLOW", 20),
+        "pool_timeout": busy_timeout,
+        # drop the connections closed by the server or a proxy (pgbouncer...)
+        "pool_pre_ping": True,
+        "pool_recycle": getattr(settings, "KH_DATABASE_POOL_RECYCLE", 1800),
+        # cache of the compiled SQL statements (per engine)
+        "query_cache_size": 1200,
+    }
+    if url.get_driver_name() == "psycopg":
+        # psycopg 3 prepares the statements executed more than this number of
+        # times on the server
+        options["connect_args"] = {"prepare_threshold": 5}
+    elif url.get_driver_name() == "asyncpg":
+        options["connect_args"] = {"prepared_statement_cache_size": 500}
+    return options
+
+
+def _setup_sqlite_pragmas(db_engine: Engine, busy_timeout: float, mmap_size: int):
+    is_memory = db_engine.url.database in (None, "", ":memory:")
+
+    @event.listens_for(db_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            if not is_memory:
+                # readers do not block the writer and the writer does not block
+                # the readers
+                cursor.execute("PRAGMA journal_mode=WAL")
+                # safe with WAL, only the last transactions may be lost on power
+                # loss, the database is never corrupted
+                cursor.execute("PRAGMA synchronous=NORMAL")
+                cursor.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+            cursor.execute(f"PRAGMA busy_timeout={int(busy_timeout * 1000)}")
+            cursor.execute("PRAGMA temp_store=MEMORY")
+        finally:
+            cursor.close()
+
+
+def _setup_stats(db_engine: Engine, stats: EngineStats):
+    if isinstance(db_engine.pool, StatsQueuePool):
+        db_engine.pool.stats = stats
+
+    @event.listens_for(db_engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        with stats._lock:
+            stats.connects += 1
+
+    @event.listens_for(db_engine, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        if isinstance(db_engine.pool, StatsQueuePool):
+            stats.record_checkin()
+
+    @event.listens_for(db_engine, "handle_error")
+    def on_error(context):
+        exception = context.sqlalchemy_exception
+        if isinstance(exception, OperationalError) and "locked" in str(exception):
+            with stats._lock:
+                stats.lock_errors += 1
+
+
+def create_db_engine(url: str, **kwargs) -> Engine:
+    """Create the engine of the application database, tuned for its backend
+
+    - SQLite: WAL journal, `synchronous=NORMAL`, busy timeout and memory-mapped
+      I/O, so that the concurrent handlers of the app (chat persistence, file
+      listing, indexing records) do not serialize on the database lock
+    - PostgreSQL: sized connection pool, pre-ping, connection recycling and
+      statement caching
+
+    The settings `KH_DATABASE_POOL_SIZE`, `KH_DATABASE_MAX_OVERFLOW`,
+    `KH_DATABASE_BUSY_TIMEOUT` (seconds) and `KH_SQLITE_MMAP_SIZE` (bytes) tune the
+    engine. The usage statistics of the engine are available with
+    `get_engine_stats`.
+
+    Args:
+        url: the database URL
+        **kwargs: options passed to `sqlalchemy.create_engine`, they take
+            precedence over the tuned options
+    """
+    sa_url = make_url(url)
+    busy_timeout = getattr(settings, "KH_DATABASE_BUSY_TIMEOUT", 30)
+    backend = sa_url.get_backend_name()
+
+    if backend == "sqlite":
+        options = _sqlite_options(sa_url, busy_timeout)
+    elif backend == "postgresql":
+        options = _postgresql_options(sa_url, busy_timeout)
+    else:
+        options = {"pool_pre_ping": True}
+    options.update(kwargs)
+
+    db_engine = create_engine(url, **options)
+    if backend == "sqlite":
+        _setup_sqlite_pragmas(
+            db_engine,
+            busy_timeout,
+            getattr(settings, "KH_SQLITE_MMAP_SIZE", 256 * 1024**2),
+        )
+
+    stats = EngineStats()
+    _setup_stats(db_engine, stats)
+    _engine_stats[db_engine] = stats
+    return db_engine
+
+
+def get_engine_stats(db_engine: Optional[Engine] = None) -> dict:
+    """Get the usage statistics of an engine created by `create_db_engine`,
+    default to the engine of the app"""
+    db_engine = db_engine or engine
+    stats = _engine_stats.get(db_engine)
+    result = stats.as_dict() if stats else {}
+    result["pool"] = db_engine.pool.status()
+    return result
+
+
+engine = create_db_engine(settings.KH_DATABASE)
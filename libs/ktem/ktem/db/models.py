@@ -28,6 +28,30 @@ _base_issue_report = (
     else base_models.BaseIssueReport
 )
 
+_base_conv_message = (
+    import_dotted_string(settings.KH_TABLE_CONV_MESSAGE, safe=False)
+    if hasattr(settings, "KH_TABLE_CONV_MESSAGE")
+    else base_models.BaseConversationMessage
+)
+
+_base_conv_retrieval = (
+    import_dotted_string(settings.KH_TABLE_CONV_RETRIEVAL, safe=False)
+    if hasattr(settings, "KH_TABLE_CONV_RETRIEVAL")
+    else base_models.BaseConversationRetrieval
+)
+
+_base_conv_plot = (
+    import_dotted_string(settings.KH_TABLE_CONV_PLOT, safe=False)
+    if hasattr(settings, "KH_TABLE_CONV_PLOT")
+    else base_models.BaseConversationPlot
+)
+
+_base_llm_usage = (
+    import_dotted_string(settings.KH_TABLE_LLM_USAGE, safe=False)
+    if hasattr(settings, "KH_TABLE_LLM_USAGE")
+    else base_models.BaseLLMUsage
+)
+
 
 class Conversation(_base_conv, table=True):  # type: ignore
     """Conversation record"""
@@ -45,5 +69,37 @@ class IssueReport(_base_issue_report, table=True):  # type: ignore
     """Record of issues"""
 
 
-if not getattr(settings, "KH_ENABLE_ALEMBIC", False):
-    SQLModel.metadata.create_all(engine)
+class ConversationMessage(_base_conv_message, table=True):  # type: ignore
+    """Turn of a conversation"""
+
+    __tablename__ = "ktem__conversation_message"  # type: ignore
+
+
+class ConversationRetrieval(_base_conv_retrieval, table=True):  # type: ignore
+    """Retrieval panel of a conversation turn"""
+
+    __tablename__ = "ktem__conversation_retrieval"  # type: ignore
+
+
+class ConversationPlot(_base_conv_plot, table=True):  # type: ignore
+    """Plot of a conversation turn"""
+
+    __tablename__ = "ktem__conversation_plot"  # type: ignore
+
+
+class LLMUsage(_base_llm_usage, table=True):  # type: ignore
+    """Token usage of the model calls of a conversation turn"""
+
+    __tablename__ = "ktem__llm_usage"  # type: ignore
+
+
+def init_db():
+    """Create the missing tables of the app
+
+    The tables are created when the app starts rather than when the models are
+    imported, so that importing them (e.g. from the migrations or a script) does
+    not connect to the database. Nothing is done when the schema is managed by
+    alembic (`KH_ENABLE_ALEMBIC`).
+    """
+    if not getattr(settings, "KH_ENABLE_ALEMBIC", False):
+        SQLModel.metadata.create_all(engine)
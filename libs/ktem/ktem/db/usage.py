@@ -0,0 +1,123 @@
+"""Storage and aggregation of the token usage of the chats
+
+The usage of the model calls made to answer a chat turn (retrieval, scoring,
+answer, citation, mindmap, suggestions...) is collected with
+`kotaemon.base.usage` and stored as one row per pipeline stage and model of the
+turn, so that it can be summed per turn, conversation, user, model or stage.
+"""
+from typing import Any, Optional
+
+from ktem.db.models import LLMUsage
+from sqlalchemy import Integer, cast, func
+from sqlmodel import Session, select
+
+from kotaemon.base.usage import UsageCollector
+
+# the attributes by which the usage of a turn is summed into rows
+USAGE_KEYS = ("stage", "kind", "model")
+
+# the columns by which the stored usage can be summarized
+SUMMARY_COLUMNS = ("model", "user", "conversation_id", "stage", "kind")
+
+
+def usage_rows(collector: UsageCollector) -> list[dict[str, Any]]:
+    """Sum the records of a collector by stage and model, as JSON-friendly rows"""
+    return [
+        {**dict(zip(USAGE_KEYS, key)), **totals}
+        for key, totals in collector.group_by(*USAGE_KEYS).items()
+    ]
+
+
+def merge_usage_rows(*rows: list[dict]) -> list[dict[str, Any]]:
+    """Merge several lists of rows (see `usage_rows`), summing the same keys"""
+    merged: dict[tuple, dict[str, Any]] = {}
+    for row in (row for rows_ in rows for row in rows_):
+        key = tuple(row[name] for name in USAGE_KEYS)
+        if key not in merged:
+            merged[key] = dict(row)
+            continue
+        for name in ("calls", "prompt_tokens", "completion_tokens", "total_tokens"):
+            merged[key][name] += row[name]
+        merged[key]["cost"] += row["cost"]
+        merged[key]["estimated"] = merged[key]["estimated"] or row["estimated"]
+    return list(merged.values())
+
+
+def save_usage(
+    session: Session,
+    conversation_id: str,
+    turn: int,
+    user: str,
+    rows: list[dict],
+):
+    """Add the usage rows of a turn, a regenerated turn adds its own rows. The
+    session is not committed."""
+    for row in rows:
+        session.add(
+            LLMUsage(
+                conversation_id=conversation_id,
+                turn=turn,
+                user=user or "",
+                stage=row["stage"],
+                kind=row["kind"],
+                model=row["model"],
+                calls=row["calls"],
+                prompt_tokens=row["prompt_tokens"],
+                completion_tokens=row["completion_tokens"],
+                cost=row["cost"],
+                estimated=row["estimated"],
+            )
+        )
+
+
+def summarize_usage(
+    session: Session,
+    group_by: str = "model",
+    user: Optional[str] = None,
+    conversation_id: Optional[str] = None,
+) -> list[dict[str, Any]]:
+    """Sum the stored usage by model, user, conversation, stage or kind
+
+    Args:
+        session: the database session
+        group_by: the column to group by, one of `SUMMARY_COLUMNS`
+        user: only sum the usage of this user
+        conversation_id: only sum the usage of this conversation
+
+    Returns:
+        the totals of each group, the most expensive (then the most tokens) first
+    """
+    if group_by not in SUMMARY_COLUMNS:
+        raise ValueError(f"Cannot summarize the usage by {group_by}")
+
+    column = getattr(LLMUsage, group_by)
+    cost = func.sum(LLMUsage.cost)
+    total_tokens = func.sum(LLMUsage.prompt_tokens + LLMUsage.completion_tokens)
+    statement = select(
+        column,
+        func.sum(LLMUsage.calls),
+        func.sum(LLMUsage.prompt_tokens),
+        func.sum(LLMUsage.completion_tokens),
+        cost,
+        func.max(cast(LLMUsage.estimated, Integer)),
+    ).group_by(column)
+    if user is not None:
+        statement = statement.where(LLMUsage.user == user)
+    if conversation_id is not None:
+        statement = statement.where(LLMUsage.conversation_id == conversation_id)
+    statement = statement.order_by(cost.desc(), total_tokens.desc())
+
+    return [
+        {
+            group_by: value,
+            "calls": calls or 0,
+            "prompt_tokens": prompt_tokens or 0,
+            "completion_tokens": completion_tokens or 0,
+            "total_tokens": (prompt_tokens or 0) + (completion_tokens or 0),
+            "cost": cost_ or 0.0,
+            "estimated": bool(estimated),
+        }
+        for value, calls, prompt_tokens, completion_tokens, cost_, estimated in (
+            session.exec(statement).all()
+        )
+    ]
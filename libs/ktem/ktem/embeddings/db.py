@@ -32,5 +32,7 @@ class EmbeddingTable(_base_llm):  # type: ignore
     __tablename__ = "embedding"
 
 
-if not getattr(flowsettings, "KH_ENABLE_ALEMBIC", False):
-    EmbeddingTable.metadata.create_all(engine)
+def init_db():
+    """Create the table of the embedding models, unless managed by alembic"""
+    if not getattr(flowsettings, "KH_ENABLE_ALEMBIC", False):
+        EmbeddingTable.metadata.create_all(engine)
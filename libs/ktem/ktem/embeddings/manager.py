@@ -1,24 +1,25 @@
 from typing import Optional, Type
 
+from ktem.utils.lazy_models import LazyModels
 from sqlalchemy import select
 from sqlalchemy.orm import Session
 from theflow.settings import settings as flowsettings
-from theflow.utils.modules import deserialize
 
 from kotaemon.embeddings.base import BaseEmbeddings
 
-from .db import EmbeddingTable, engine
+from .db import EmbeddingTable, engine, init_db
 
 
 class EmbeddingManager:
     """Represent a pool of models"""
 
     def __init__(self):
-        self._models: dict[str, BaseEmbeddings] = {}
+        self._models = LazyModels()
         self._info: dict[str, dict] = {}
         self._default: str = ""
         self._vendors: list[Type] = []
 
+        init_db()
         # populate the pool if empty
         if hasattr(flowsettings, "KH_EMBEDDINGS"):
             with Session(engine) as sess:
@@ -36,13 +37,13 @@ class EmbeddingManager:
 
     def load(self):
         """Load the model pool from database"""
-        self._models, self._info, self._default = {}, {}, ""
+        self._models, self._info, self._default = LazyModels(), {}, ""
         with Session(engine) as sess:
             stmt = select(EmbeddingTable)
             items = sess.execute(stmt)
 
             for (item,) in items:
-                self._models[item.name] = deserialize(item.spec, safe=False)
+                self._models.set_spec(item.name, item.spec)
                 self._info[item.name] = {
                     "name": item.name,
                     "spec": item.spec,
@@ -50,7 +51,7 @@ class EmbeddingManager:
                 }
                 if item.default:
                     self._default = item.name
-                    self._models["default"] = self._models[item.name]
+                    self._models.set_alias("default", item.name)
 
     def load_vendors(self):
         from kotaemon.embeddings import (
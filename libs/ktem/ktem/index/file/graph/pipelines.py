@@ -7,10 +7,10 @@ from typing import Generator
 from uuid import uuid4
 
 import pandas as pd
-import tiktoken
 import yaml
 from decouple import config
 from ktem.db.models import engine
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 from theflow.settings import settings
 
@@ -66,6 +66,9 @@ def prepare_graph_index_path(graph_id: str):
 class GraphRAGIndexingPipeline(IndexDocumentPipeline):
     """GraphRAG specific indexing pipeline"""
 
+    # the loaded documents are needed to build the graph
+    keep_docs: bool = True
+
     def route(self, file_path: str | Path) -> IndexPipeline:
         """Simply disable the splitter (chunking) for this pipeline"""
         pipeline = super().route(file_path)
@@ -77,21 +80,15 @@ class GraphRAGIndexingPipeline(IndexDocumentPipeline):
         # create new graph_id and assign them to doc_id in self.Index
         # record in the index
         graph_id = str(uuid4())
-        with Session(engine) as session:
-            nodes = []
-            for file_id in file_ids:
-                if not file_id:
-                    continue
-                nodes.append(
-                    self.Index(
-                        source_id=file_id,
-                        target_id=graph_id,
-                        relation_type="graph",
-                    )
-                )
-
-            session.add_all(nodes)
-            session.commit()
+        records = [
+            {"source_id": file_id, "target_id": graph_id, "relation_type": "graph"}
+            for file_id in file_ids
+            if file_id
+        ]
+        if records:
+            with Session(engine) as session:
+                session.execute(insert(self.Index.__table__), records)  # type: ignore
+                session.commit()
 
         return graph_id
 
@@ -276,6 +273,8 @@ class GraphRAGRetrieverPipeline(BaseFileIndexRetriever):
             deployment_name=embedding_model,
             max_retries=20,
         )
+        import tiktoken
+
         token_encoder = tiktoken.get_encoding("cl100k_base")
 
         context_builder = LocalSearchMixedContext(
@@ -5,7 +5,9 @@ from typing import Any, Optional, Type
 from ktem.components import filestorage_path, get_docstore, get_vectorstore
 from ktem.db.engine import engine
 from ktem.index.base import BaseIndex
-from sqlalchemy import JSON, Column, DateTime, Integer, String, UniqueConstraint
+from sqlalchemy import JSON, Column, DateTime
+from sqlalchemy import Index as SQLIndex
+from sqlalchemy import Integer, String, UniqueConstraint, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.ext.mutable import MutableDict
 from theflow.settings import settings as flowsettings
@@ -15,6 +17,7 @@ from tzlocal import get_localzone
 from kotaemon.storages import BaseDocumentStore, BaseVectorStore
 
 from .base import BaseFileIndexIndexing, BaseFileIndexRetriever
+from .listing import track_counts
 
 
 def generate_uuid():
@@ -67,6 +70,11 @@ class FileIndex(BaseIndex):
                     "__tablename__": f"index__{self.id}__source",
                     "__table_args__": (
                         UniqueConstraint("name", "user", name="_name_user_uc"),
+                        # default sort of the file list
+                        SQLIndex(
+                            f"ix_index__{self.id}__source_date_created",
+                            "date_created",
+                        ),
                     ),
                     "id": Column(
                         String,
@@ -93,6 +101,13 @@ class FileIndex(BaseIndex):
                 (Base,),
                 {
                     "__tablename__": f"index__{self.id}__source",
+                    "__table_args__": (
+                        # default sort of the file list
+                        SQLIndex(
+                            f"ix_index__{self.id}__source_date_created",
+                            "date_created",
+                        ),
+                    ),
                     "id": Column(
                         String,
                         primary_key=True,
@@ -117,11 +132,23 @@ class FileIndex(BaseIndex):
             (Base,),
             {
                 "__tablename__": f"index__{self.id}__index",
+                "__table_args__": (
+                    # lookup of the chunks of files (retrieval scope, deletion)
+                    SQLIndex(
+                        f"ix_index__{self.id}__index_source_id_relation_type",
+                        "source_id",
+                        "relation_type",
+                    ),
+                    # lookup of the files of chunks
+                    SQLIndex(f"ix_index__{self.id}__index_target_id", "target_id"),
+                ),
                 "id": Column(Integer, primary_key=True, autoincrement=True),
                 "source_id": Column(String),
                 "target_id": Column(String),
                 "relation_type": Column(String),
                 "user": Column(String, default=""),
+                # number of tokens of the chunk, for "document" relations
+                "n_tokens": Column(Integer, nullable=True),
             },
         )
         FileGroup = type(
@@ -150,6 +177,9 @@ class FileIndex(BaseIndex):
             },
         )
 
+        track_counts(Source)
+        track_counts(FileGroup)
+
         self._vs: BaseVectorStore = get_vectorstore(f"index_{self.id}")
         self._docstore: BaseDocumentStore = get_docstore(f"index_{self.id}")
         self._fs_path = filestorage_path / f"index_{self.id}"
@@ -326,9 +356,8 @@ class FileIndex(BaseIndex):
 
         # create the resources
         self._setup_resources()
+        # the tables of the index share their metadata
         self._resources["Source"].metadata.create_all(engine)  # type: ignore
-        self._resources["Index"].metadata.create_all(engine)  # type: ignore
-        self._resources["FileGroup"].metadata.create_all(engine)  # type: ignore
         self._fs_path.mkdir(parents=True, exist_ok=True)
 
     def on_delete(self):
@@ -343,9 +372,45 @@ class FileIndex(BaseIndex):
         self._docstore.drop()
         shutil.rmtree(self._fs_path)
 
+    def _upgrade_resources(self):
+        """Add the columns and the indexes introduced after the tables of the index
+        were created. Nothing is done when the schema is managed by the alembic
+        migrations of ktem (`KH_ENABLE_ALEMBIC`)."""
+        if getattr(flowsettings, "KH_ENABLE_ALEMBIC", False):
+            return
+
+        inspector = inspect(engine)
+        for name in ("Source", "Index", "FileGroup"):
+            table = self._resources[name].__table__  # type: ignore
+            if not inspector.has_table(table.name):
+                continue
+
+            existing_columns = {
+                column["name"] for column in inspector.get_columns(table.name)
+            }
+            with engine.begin() as conn:
+                for column in table.columns:
+                    if column.name in existing_columns:
+                        continue
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(
+                        text(
+                            f"ALTER TABLE {table.name} "
+                            f"ADD COLUMN {column.name} {column_type}"
+                        )
+                    )
+
+            existing_indexes = {
+                index["name"] for index in inspector.get_indexes(table.name)
+            }
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(engine)
+
     def on_start(self):
         """Setup the classes and hooks"""
         self._setup_resources()
+        self._upgrade_resources()
         self._setup_indexing_cls()
         self._setup_retriever_cls()
         self._setup_file_index_ui_cls()
@@ -9,6 +9,7 @@ import yaml
 
 from kotaemon.base import RetrievedDocument
 from kotaemon.indices.rankings import BaseReranking, LLMReranking, LLMTrulensScoring
+from kotaemon.llms.cache import cached_llm
 
 from ..pipelines import BaseFileIndexRetriever, IndexDocumentPipeline, IndexPipeline
 
@@ -162,8 +163,9 @@ class KnetRetrievalPipeline(BaseFileIndexRetriever):
 
         for reranker in retriever.rerankers:
             if isinstance(reranker, LLMReranking):
-                reranker.llm = llms.get(
-                    user_settings["reranking_llm"], llms.get_default()
+                reranker.llm = cached_llm(
+                    llms.get(user_settings["reranking_llm"], llms.get_default()),
+                    reranker,
                 )
 
         return retriever
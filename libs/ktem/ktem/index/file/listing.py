@@ -0,0 +1,207 @@
+"""Paginated listing of the files and the groups of a file index
+
+The listing pages of the file index UI and the file selector of the chat query one
+page of rows at a time, filtered and sorted by the database, instead of loading
+the whole tables. The total number of rows of a listing is cached for a short time,
+and invalidated when the files or the groups of the index change.
+"""
+import threading
+import time
+from typing import Any, Optional
+
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+from theflow.settings import settings as flowsettings
+
+# number of rows of a page of the file and group lists
+KH_FILE_LIST_PAGE_SIZE = getattr(flowsettings, "KH_FILE_LIST_PAGE_SIZE", 50)
+# seconds during which the total number of rows of a listing is reused
+KH_FILE_LIST_COUNT_TTL = getattr(flowsettings, "KH_FILE_LIST_COUNT_TTL", 30)
+
+SOURCE_SORT_COLUMNS = {
+    "date_created": ("date_created", True),
+    "name": ("name", False),
+    "size": ("size", True),
+}
+GROUP_SORT_COLUMNS = {
+    "date_created": ("date_created", True),
+    "name": ("name", False),
+}
+
+
+class CountCache:
+    """Short-lived cache of the number of rows of the listings"""
+
+    def __init__(self, ttl: float = KH_FILE_LIST_COUNT_TTL):
+        self.ttl = ttl
+        self._counts: dict[tuple, tuple[float, int]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> Optional[int]:
+        with self._lock:
+            entry = self._counts.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                return None
+            return entry[1]
+
+    def set(self, key: tuple, count: int):
+        with self._lock:
+            self._counts[key] = (time.monotonic(), count)
+
+    def invalidate(self, table_name: str):
+        """Forget the counts of the listings of a table"""
+        with self._lock:
+            for key in [key for key in self._counts if key[0] == table_name]:
+                del self._counts[key]
+
+
+count_cache = CountCache()
+
+
+# names of the tables whose listings are counted
+_tracked_tables: set[str] = set()
+
+
+def _collect_changes(session: Session, flush_context):
+    """Remember the tracked tables changed by a flush, until the commit"""
+    changed = session.info.setdefault("changed_listings", set())
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        table_name = getattr(type(obj), "__tablename__", None)
+        if table_name in _tracked_tables:
+            changed.add(table_name)
+
+
+def _invalidate_changes(session: Session):
+    for table_name in session.info.pop("changed_listings", ()):
+        count_cache.invalidate(table_name)
+
+
+def _discard_changes(session: Session, *args):
+    session.info.pop("changed_listings", None)
+
+
+def track_counts(table):
+    """Invalidate the cached counts of the listings of a table when a session
+    adding, renaming or deleting its rows through the ORM is committed
+
+    The rows changed with Core statements (e.g. `delete(table)`) are not seen, the
+    caller invalidates the counts with `count_cache.invalidate` after the commit.
+    """
+    _tracked_tables.add(table.__tablename__)
+    if not event.contains(Session, "after_flush", _collect_changes):
+        event.listen(Session, "after_flush", _collect_changes)
+        event.listen(Session, "after_commit", _invalidate_changes)
+        event.listen(Session, "after_rollback", _discard_changes)
+
+
+def _filter(statement, table, user_id: Optional[str], name_pattern: str):
+    if user_id is not None:
+        statement = statement.where(table.user == user_id)
+    if name_pattern:
+        statement = statement.where(table.name.ilike(f"%{name_pattern}%"))
+    return statement
+
+
+def count_rows(
+    session: Session, table, user_id: Optional[str] = None, name_pattern: str = ""
+) -> int:
+    """Count the rows of a listing, the count is cached (see `CountCache`)
+
+    Args:
+        session: the database session
+        table: the Source or FileGroup table of the index
+        user_id: only count the rows of this user (private index)
+        name_pattern: only count the rows whose name contains this pattern
+    """
+    key = (table.__tablename__, user_id, name_pattern)
+    count = count_cache.get(key)
+    if count is None:
+        statement = _filter(
+            select(func.count()).select_from(table), table, user_id, name_pattern
+        )
+        count = session.execute(statement).scalar_one()
+        count_cache.set(key, count)
+    return count
+
+
+def list_rows(
+    session: Session,
+    table,
+    columns: list[str],
+    user_id: Optional[str] = None,
+    name_pattern: str = "",
+    sort_by: str = "date_created",
+    page: int = 1,
+    page_size: int = KH_FILE_LIST_PAGE_SIZE,
+) -> list[Any]:
+    """Get a page of rows of a listing
+
+    Args:
+        session: the database session
+        table: the Source or FileGroup table of the index
+        columns: the columns to load
+        user_id: only list the rows of this user (private index)
+        name_pattern: only list the rows whose name contains this pattern
+        sort_by: the column to sort by, the dates and sizes are sorted in
+            descending order and the names in ascending order
+        page: the page number, starting from 1
+        page_size: the number of rows of a page
+
+    Returns:
+        the rows, with the requested columns as attributes
+    """
+    sort_columns = SOURCE_SORT_COLUMNS if hasattr(table, "size") else GROUP_SORT_COLUMNS
+    column_name, descending = sort_columns.get(sort_by, sort_columns["date_created"])
+    sort_column = getattr(table, column_name)
+
+    statement = _filter(
+        select(*[getattr(table, column) for column in columns]),
+        table,
+        user_id,
+        name_pattern,
+    )
+    statement = (
+        statement.order_by(
+            sort_column.desc() if descending else sort_column.asc(), table.id
+        )
+        .offset((max(page, 1) - 1) * page_size)
+        .limit(page_size)
+    )
+    return list(session.execute(statement).all())
+
+
+def get_names(
+    session: Session, table, ids: list[str], user_id: Optional[str] = None
+) -> dict[str, str]:
+    """Map the ids of some rows (of a user, for a private index) to their names"""
+    if not ids:
+        return {}
+    statement = _filter(
+        select(table.id, table.name).where(table.id.in_(ids)), table, user_id, ""
+    )
+    return {row.id: row.name for row in session.execute(statement).all()}
+
+
+def search_names(
+    session: Session,
+    table,
+    query: str,
+    user_id: Optional[str] = None,
+    limit: int = KH_FILE_LIST_PAGE_SIZE,
+) -> list[tuple[str, str]]:
+    """Get the (name, id) of the rows whose name contains the query, for the
+    incremental search of the selectors. The names starting with the query come
+    first."""
+    statement = _filter(select(table.id, table.name), table, user_id, query)
+    if query:
+        statement = statement.order_by(
+            table.name.ilike(f"{query}%").desc(), table.name.asc()
+        )
+    else:
+        statement = statement.order_by(table.date_created.desc())
+    statement = statement.limit(limit)
+    return [(row.name, row.id) for row in session.execute(statement).all()]
+
+
+def num_pages(count: int, page_size: int = KH_FILE_LIST_PAGE_SIZE) -> int:
+    return max((count + page_size - 1) // page_size, 1)
@@ -4,16 +4,14 @@ import json
 import logging
 import shutil
 import threading
-import time
 import warnings
 from collections import defaultdict
 from copy import deepcopy
 from functools import lru_cache
 from hashlib import sha256
 from pathlib import Path
-from typing import Generator, Optional, Sequence
+from typing import Generator, Iterable, Optional, Sequence
 
-import tiktoken
 from decouple import config
 from ktem.db.models import engine
 from ktem.embeddings.manager import embedding_models_manager
@@ -28,12 +26,13 @@ from llama_index.core.vector_stores import (
     MetadataFilters,
 )
 from llama_index.core.vector_stores.types import VectorStoreQueryMode
-from sqlalchemy import delete, select
+from sqlalchemy import delete, func, insert, select
 from sqlalchemy.orm import Session
 from theflow.settings import settings
 from theflow.utils.modules import import_dotted_string
 
 from kotaemon.base import BaseComponent, Document, Node, Param, RetrievedDocument
+from kotaemon.base.tracing import span, start_span
 from kotaemon.embeddings import BaseEmbeddings
 from kotaemon.indices import VectorIndexing, VectorRetrieval
 from kotaemon.indices.ingests.files import (
@@ -41,13 +40,23 @@ from kotaemon.indices.ingests.files import (
     adobe_reader,
     azure_reader,
     docling_reader,
+    reader_cache,
     unstructured,
     web_reader,
 )
 from kotaemon.indices.rankings import BaseReranking, LLMReranking, LLMTrulensScoring
-from kotaemon.indices.splitters import BaseSplitter, TokenSplitter
+from kotaemon.indices.splitters import BaseSplitter, TiktokenSplitter
+from kotaemon.indices.splitters.tiktoken_splitter import (
+    get_token_count,
+    get_token_func,
+    set_token_count,
+)
+from kotaemon.llms.cache import cached_llm
+from kotaemon.llms.scheduler import Priority, priority
+from kotaemon.loaders import ReaderCache
 
 from .base import BaseFileIndexIndexing, BaseFileIndexRetriever
+from .listing import count_cache
 
 logger = logging.getLogger(__name__)
 
@@ -74,7 +83,7 @@ def dev_settings():
     return file_extractors, chunk_size, chunk_overlap
 
 
-_default_token_func = tiktoken.encoding_for_model("gpt-3.5-turbo").encode
+_default_token_func = get_token_func("gpt-3.5-turbo")
 
 
 class DocumentRetrievalPipeline(BaseFileIndexRetriever):
@@ -136,19 +145,18 @@ class DocumentRetrievalPipeline(BaseFileIndexRetriever):
                     flatten_doc_ids.append(doc_id)
             doc_ids = flatten_doc_ids
 
-        print("searching in doc_ids", doc_ids)
+        logger.debug(f"Searching in doc_ids {doc_ids}")
         if not doc_ids:
             logger.info(f"Skip retrieval because of no selected files: {self}")
             return []
 
         retrieval_kwargs: dict = {}
         with Session(engine) as session:
-            stmt = select(self.Index).where(
-                self.Index.relation_type == "document",
+            stmt = select(self.Index.target_id).where(
                 self.Index.source_id.in_(doc_ids),
+                self.Index.relation_type == "document",
             )
-            results = session.execute(stmt)
-            chunk_ids = [r[0].target_id for r in results.all()]
+            chunk_ids = list(session.execute(stmt).scalars())
 
         # do first round top_k extension
         retrieval_kwargs["do_extend"] = True
@@ -170,10 +178,11 @@ class DocumentRetrievalPipeline(BaseFileIndexRetriever):
             retrieval_kwargs["mmr_threshold"] = 0.5
 
         # rerank
-        s_time = time.time()
-        print(f"retrieval_kwargs: {retrieval_kwargs.keys()}")
-        docs = self.vector_retrieval(text=text, top_k=self.top_k, **retrieval_kwargs)
-        print("retrieval step took", time.time() - s_time)
+        with span("retrieval", top_k=self.top_k) as retrieval:
+            docs = self.vector_retrieval(
+                text=text, top_k=self.top_k, **retrieval_kwargs
+            )
+        logger.debug(f"Retrieval step took {retrieval.duration:.2f}s")
 
         if not self.get_extra_table:
             return docs
@@ -206,19 +215,19 @@ class DocumentRetrievalPipeline(BaseFileIndexRetriever):
                     if doc.doc_id not in retrieved_id:
                         docs.append(doc)
             except Exception:
-                print("Error retrieving additional tables")
+                logger.exception("Error retrieving additional tables")
 
         return docs
 
     def generate_relevant_scores(
         self, query: str, documents: list[RetrievedDocument]
     ) -> list[RetrievedDocument]:
-        docs = (
-            documents
-            if not self.llm_scorer
-            else self.llm_scorer(documents=documents, query=query)
-        )
-        return docs
+        if not self.llm_scorer:
+            return documents
+        with span(
+            "retrieval.llm_scoring", reranker=self.llm_scorer.__class__.__name__
+        ), priority(Priority.AUXILIARY):
+            return self.llm_scorer(documents=documents, query=query)
 
     @classmethod
     def get_user_settings(cls) -> dict:
@@ -316,8 +325,9 @@ class DocumentRetrievalPipeline(BaseFileIndexRetriever):
                 )
 
         if retriever.llm_scorer:
-            retriever.llm_scorer.llm = llms.get(
-                user_settings["reranking_llm"], llms.get_default()
+            retriever.llm_scorer.llm = cached_llm(
+                llms.get(user_settings["reranking_llm"], llms.get_default()),
+                retriever.llm_scorer,
             )
 
         kwargs = {".doc_ids": selected}
@@ -331,6 +341,21 @@ class IndexPipeline(BaseComponent):
     loader: BaseReader
     splitter: BaseSplitter | None
     chunk_batch_size: int = 200
+    load_batch_size: int = Param(
+        32,
+        help="Number of loaded documents (e.g. pages) to split and index at once. "
+        "Bounds the memory used when indexing large files.",
+    )
+    keep_docs: bool = Param(
+        True,
+        help="Whether to return the loaded documents at the end of `stream`. "
+        "Disable it to avoid holding the whole file in memory.",
+    )
+    reader_cache: Optional[ReaderCache] = Param(
+        None,
+        help="Cache of the loaded documents, keyed by the file content and the "
+        "loader settings. If None, the loader is always called.",
+    )
 
     Source = Param(help="The SQLAlchemy Source table")
     Index = Param(help="The SQLAlchemy Index table")
@@ -349,8 +374,31 @@ class IndexPipeline(BaseComponent):
             vector_store=self.VS, doc_store=self.DS, embedding=self.embedding
         )
 
-    def handle_docs(self, docs, file_id, file_name) -> Generator[Document, None, int]:
-        s_time = time.time()
+    def handle_docs(
+        self,
+        docs,
+        file_id,
+        file_name,
+        page_label_to_thumbnail: Optional[dict] = None,
+        n_processed: int = 0,
+        file_stats: Optional[dict] = None,
+    ) -> Generator[Document, None, int]:
+        """Split, store and embed a batch of loaded documents
+
+        Args:
+            docs: the batch of loaded documents
+            file_id: the id of the file in the Source table
+            file_name: the name of the file, for progress messages
+            page_label_to_thumbnail: mapping from page label to thumbnail doc id,
+                shared across the batches of the same file and updated in place
+            n_processed: number of chunks of the file processed by previous batches
+            file_stats: statistics of the file (number of tokens), shared across
+                the batches of the same file and updated in place
+
+        Returns:
+            the number of chunks indexed from this batch
+        """
+        indexing = start_span("indexing", file_name=file_name)
         text_docs = []
         non_text_docs = []
         thumbnail_docs = []
@@ -364,10 +412,12 @@ class IndexPipeline(BaseComponent):
             else:
                 non_text_docs.append(doc)
 
-        print(f"Got {len(thumbnail_docs)} page thumbnails")
-        page_label_to_thumbnail = {
-            doc.metadata["page_label"]: doc.doc_id for doc in thumbnail_docs
-        }
+        logger.debug(f"Got {len(thumbnail_docs)} page thumbnails")
+        if page_label_to_thumbnail is None:
+            page_label_to_thumbnail = {}
+        page_label_to_thumbnail.update(
+            {doc.metadata["page_label"]: doc.doc_id for doc in thumbnail_docs}
+        )
 
         if self.splitter:
             all_chunks = self.splitter(text_docs)
@@ -382,6 +432,26 @@ class IndexPipeline(BaseComponent):
 
         to_index_chunks = all_chunks + non_text_docs + thumbnail_docs
 
+        # the splitter may already have counted the tokens of the chunks, only
+        # the other documents are tokenized
+        token_func = self.get_token_func()
+        if token_func:
+            for doc in to_index_chunks:
+                if get_token_count(doc) is None:
+                    set_token_count(doc, len(token_func(doc.text)))
+            if file_stats is not None:
+                # the file is counted on its loaded documents rather than on its
+                # chunks, whose overlaps would be counted twice. The splitter
+                # records the count of the text documents (see `TiktokenSplitter`),
+                # only the documents it did not count are tokenized
+                n_tokens = 0
+                for doc in text_docs + non_text_docs + thumbnail_docs:
+                    doc_tokens = get_token_count(doc)
+                    if doc_tokens is None:
+                        doc_tokens = len(token_func(doc.text))
+                    n_tokens += doc_tokens
+                file_stats["tokens"] = file_stats.get("tokens", 0) + n_tokens
+
         # add to doc store
         chunks = []
         n_chunks = 0
@@ -391,7 +461,7 @@ class IndexPipeline(BaseComponent):
             self.handle_chunks_docstore(chunks, file_id)
             n_chunks += len(chunks)
             yield Document(
-                f" => [{file_name}] Processed {n_chunks} chunks",
+                f" => [{file_name}] Processed {n_processed + n_chunks} chunks",
                 channel="debug",
             )
 
@@ -405,20 +475,22 @@ class IndexPipeline(BaseComponent):
                 n_chunks += len(chunks)
                 if self.VS:
                     yield Document(
-                        f" => [{file_name}] Created embedding for {n_chunks} chunks",
+                        f" => [{file_name}] Created embedding for "
+                        f"{n_processed + n_chunks} chunks",
                         channel="debug",
                     )
 
         # run vector indexing in thread if specified
         if self.run_embedding_in_thread:
-            print("Running embedding in thread")
+            logger.debug("Running embedding in thread")
             threading.Thread(
                 target=lambda: list(insert_chunks_to_vectorstore())
             ).start()
         else:
             yield from insert_chunks_to_vectorstore()
 
-        print("indexing step took", time.time() - s_time)
+        indexing.end()
+        logger.debug(f"Indexing step took {indexing.duration:.2f}s")
         return n_chunks
 
     def handle_chunks_docstore(self, chunks, file_id):
@@ -427,18 +499,17 @@ class IndexPipeline(BaseComponent):
         self.vector_indexing.add_to_docstore(chunks)
 
         # record in the index
-        with Session(engine) as session:
-            nodes = []
-            for chunk in chunks:
-                nodes.append(
-                    self.Index(
-                        source_id=file_id,
-                        target_id=chunk.doc_id,
-                        relation_type="document",
-                    )
-                )
-            session.add_all(nodes)
-            session.commit()
+        self.add_index_records(
+            [
+                {
+                    "source_id": file_id,
+                    "target_id": chunk.doc_id,
+                    "relation_type": "document",
+                    "n_tokens": get_token_count(chunk),
+                }
+                for chunk in chunks
+            ]
+        )
 
     def handle_chunks_vectorstore(self, chunks, file_id):
         """Run chunks"""
@@ -448,18 +519,30 @@ class IndexPipeline(BaseComponent):
 
         if self.VS:
             # record in the index
-            with Session(engine) as session:
-                nodes = []
-                for chunk in chunks:
-                    nodes.append(
-                        self.Index(
-                            source_id=file_id,
-                            target_id=chunk.doc_id,
-                            relation_type="vector",
-                        )
-                    )
-                session.add_all(nodes)
-                session.commit()
+            self.add_index_records(
+                [
+                    {
+                        "source_id": file_id,
+                        "target_id": chunk.doc_id,
+                        "relation_type": "vector",
+                    }
+                    for chunk in chunks
+                ]
+            )
+
+    def add_index_records(self, records: list[dict]):
+        """Insert records in the Index table with a single executemany
+
+        Args:
+            records: the column values of each record, all the records must set
+                the same columns
+        """
+        if not records:
+            return
+
+        with Session(engine) as session:
+            session.execute(insert(self.Index.__table__), records)  # type: ignore
+            session.commit()
 
     def get_id_if_exists(self, file_path: str | Path) -> Optional[str]:
         """Check if the file is already indexed
@@ -536,8 +619,19 @@ class IndexPipeline(BaseComponent):
 
         return file_id
 
-    def finish(self, file_id: str, file_path: str | Path) -> str:
-        """Finish the indexing"""
+    def finish(
+        self, file_id: str, file_path: str | Path, n_tokens: Optional[int] = None
+    ) -> str:
+        """Finish the indexing
+
+        Args:
+            file_id: the file id
+            file_path: the path to the file
+            n_tokens: the number of tokens of the file, as counted while indexing.
+                If None, it is summed from the token counts of the chunks in the
+                Index table, an approximation which counts the overlaps of the
+                chunks twice.
+        """
         with Session(engine) as session:
             stmt = select(self.Source).where(self.Source.id == file_id)
             result = session.execute(stmt).first()
@@ -547,15 +641,14 @@ class IndexPipeline(BaseComponent):
             item = result[0]
 
             # populate the number of tokens
-            doc_ids_stmt = select(self.Index.target_id).where(
-                self.Index.source_id == file_id,
-                self.Index.relation_type == "document",
-            )
-            doc_ids = [_[0] for _ in session.execute(doc_ids_stmt)]
-            token_func = self.get_token_func()
-            if doc_ids and token_func:
-                docs = self.DS.get(doc_ids)
-                item.note["tokens"] = sum([len(token_func(doc.text)) for doc in docs])
+            if n_tokens is None:
+                n_tokens_stmt = select(func.sum(self.Index.n_tokens)).where(
+                    self.Index.source_id == file_id,
+                    self.Index.relation_type == "document",
+                )
+                n_tokens = session.execute(n_tokens_stmt).scalar()
+            if n_tokens is not None:
+                item.note["tokens"] = n_tokens
 
             # populate the note
             item.note["loader"] = self.get_from_path("loader").__class__.__name__
@@ -579,15 +672,19 @@ class IndexPipeline(BaseComponent):
             session.execute(delete(self.Source).where(self.Source.id == file_id))
             vs_ids, ds_ids = [], []
             index = session.execute(
-                select(self.Index).where(self.Index.source_id == file_id)
+                select(self.Index.relation_type, self.Index.target_id).where(
+                    self.Index.source_id == file_id
+                )
             ).all()
-            for each in index:
-                if each[0].relation_type == "vector":
-                    vs_ids.append(each[0].target_id)
-                elif each[0].relation_type == "document":
-                    ds_ids.append(each[0].target_id)
-                session.delete(each[0])
+            for relation_type, target_id in index:
+                if relation_type == "vector":
+                    vs_ids.append(target_id)
+                elif relation_type == "document":
+                    ds_ids.append(target_id)
+            session.execute(delete(self.Index).where(self.Index.source_id == file_id))
             session.commit()
+        # the Core delete is not seen by the ORM events of `track_counts`
+        count_cache.invalidate(self.Source.__tablename__)
 
         if vs_ids and self.VS:
             self.VS.delete(vs_ids)
@@ -644,15 +741,49 @@ class IndexPipeline(BaseComponent):
         extra_info["collection_name"] = self.collection_name
 
         yield Document(f" => Converting {file_name} to text", channel="debug")
-        docs = self.loader.load_data(file_path, extra_info=extra_info)
-        yield Document(f" => Converted {file_name} to text", channel="debug")
-        yield from self.handle_docs(docs, file_id, file_name)
 
-        self.finish(file_id, file_path)
+        # consume the loader output batch by batch, so that the memory usage is
+        # bounded by `load_batch_size` instead of the file size
+        docs: list[Document] = []
+        batch: list[Document] = []
+        page_label_to_thumbnail: dict = {}
+        file_stats: dict = {}
+        n_chunks = 0
+        for doc in self.load_docs(file_path, extra_info):
+            batch.append(doc)
+            if self.keep_docs:
+                docs.append(doc)
+            if len(batch) >= self.load_batch_size:
+                n_chunks += yield from self.handle_docs(
+                    batch,
+                    file_id,
+                    file_name,
+                    page_label_to_thumbnail,
+                    n_chunks,
+                    file_stats,
+                )
+                batch = []
+        if batch:
+            n_chunks += yield from self.handle_docs(
+                batch, file_id, file_name, page_label_to_thumbnail, n_chunks, file_stats
+            )
+
+        self.finish(file_id, file_path, n_tokens=file_stats.get("tokens"))
 
         yield Document(f" => Finished indexing {file_name}", channel="debug")
         return file_id, docs
 
+    def load_docs(self, file_path: str | Path, extra_info: dict) -> Iterable[Document]:
+        """Load the documents of a file, lazily if the loader supports it"""
+        if self.reader_cache is not None and isinstance(file_path, Path):
+            return self.reader_cache.load(self.loader, file_path, extra_info)
+
+        try:
+            return self.loader.lazy_load_data(file_path, extra_info=extra_info)
+        except NotImplementedError:
+            # llama-index readers raise when they do not support lazy loading
+            return self.loader.load_data(file_path, extra_info=extra_info)
+
 
 class IndexDocumentPipeline(BaseFileIndexIndexing):
     """Index the file. Decide which pipeline based on the file type.
@@ -669,11 +800,17 @@ class IndexDocumentPipeline(BaseFileIndexIndexing):
     reader_mode: str = Param("default", help="The reader mode")
     embedding: BaseEmbeddings
     run_embedding_in_thread: bool = False
+    keep_docs: bool = Param(
+        False, help="Whether to return the loaded documents of the indexed files"
+    )
+    reader_cache: Optional[ReaderCache] = Param(
+        reader_cache, help="Cache of the loaded documents, None to disable"
+    )
 
     @Param.auto(depends_on="reader_mode")
     def readers(self):
         readers = deepcopy(KH_DEFAULT_FILE_EXTRACTORS)
-        print("reader_mode", self.reader_mode)
+        logger.debug(f"reader_mode {self.reader_mode}")
         if self.reader_mode == "adobe":
             readers[".pdf"] = adobe_reader
         elif self.reader_mode == "azure-di":
@@ -708,7 +845,7 @@ class IndexDocumentPipeline(BaseFileIndexIndexing):
     @classmethod
     def get_pipeline(cls, user_settings, index_settings) -> BaseFileIndexIndexing:
         use_quick_index_mode = user_settings.get("quick_index_mode", False)
-        print("use_quick_index_mode", use_quick_index_mode)
+        logger.debug(f"use_quick_index_mode {use_quick_index_mode}")
         obj = cls(
             embedding=embedding_models_manager[
                 index_settings.get(
@@ -749,18 +886,20 @@ class IndexDocumentPipeline(BaseFileIndexIndexing):
                     "the suitable pipeline for this file type in the settings."
                 )
 
-        print(f"Chunk size: {chunk_size}, chunk overlap: {chunk_overlap}")
+        logger.debug(f"Chunk size: {chunk_size}, chunk overlap: {chunk_overlap}")
 
-        print("Using reader", reader)
+        logger.debug(f"Using reader {reader}")
         pipeline: IndexPipeline = IndexPipeline(
             loader=reader,
-            splitter=TokenSplitter(
+            splitter=TiktokenSplitter(
                 chunk_size=chunk_size or 1024,
                 chunk_overlap=chunk_overlap or 256,
                 separator="\n\n",
                 backup_separators=["\n", ".", "\u200B"],
             ),
             run_embedding_in_thread=self.run_embedding_in_thread,
+            keep_docs=self.keep_docs,
+            reader_cache=self.reader_cache,
             Source=self.Source,
             Index=self.Index,
             VS=self.VS,
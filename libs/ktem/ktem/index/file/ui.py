@@ -19,8 +19,18 @@ from sqlalchemy import select
 from sqlalchemy.orm import Session
 from theflow.settings import settings as flowsettings
 
+from kotaemon.llms.scheduler import Priority, stream_with_priority
+
 from ...utils.commands import WEB_SEARCH_COMMAND
 from ...utils.rate_limit import check_rate_limit
+from .listing import (
+    KH_FILE_LIST_PAGE_SIZE,
+    count_rows,
+    get_names,
+    list_rows,
+    num_pages,
+    search_names,
+)
 from .utils import download_arxiv_pdf, is_arxiv_url
 
 KH_DEMO_MODE = getattr(flowsettings, "KH_DEMO_MODE", False)
@@ -172,7 +182,17 @@ class FileIndexPage(BasePage):
                 "(2) Search with empty string to show all files."
             ),
         )
+        self.file_sort = gr.Dropdown(
+            value="date_created",
+            choices=[
+                ("Newest first", "date_created"),
+                ("Name", "name"),
+                ("Largest first", "size"),
+            ],
+            label="Sort by:",
+        )
         self.file_list_state = gr.State(value=None)
+        self.file_page = gr.State(value=1)
         self.file_list = gr.DataFrame(
             headers=[
                 "id",
@@ -187,6 +207,10 @@ class FileIndexPage(BasePage):
             wrap=False,
             elem_id="file_list_view",
         )
+        with gr.Row():
+            self.file_prev_button = gr.Button("Previous", size="sm")
+            self.file_list_info = gr.Markdown()
+            self.file_next_button = gr.Button("Next", size="sm")
 
         with gr.Row():
 
@@ -234,6 +258,7 @@ class FileIndexPage(BasePage):
 
     def render_group_list(self):
         self.group_list_state = gr.State(value=None)
+        self.group_page = gr.State(value=1)
         self.group_list = gr.DataFrame(
             headers=[
                 "id",
@@ -245,6 +270,10 @@ class FileIndexPage(BasePage):
             interactive=False,
             wrap=False,
         )
+        with gr.Row():
+            self.group_prev_button = gr.Button("Previous", size="sm")
+            self.group_list_info = gr.Markdown()
+            self.group_next_button = gr.Button("Next", size="sm")
 
         with gr.Row():
             self.group_add_button = gr.Button(
@@ -276,6 +305,7 @@ class FileIndexPage(BasePage):
             )
             self.group_files = gr.Dropdown(
                 label="Attached files",
+                info="Type to search the files",
                 multiselect=True,
             )
             self.group_save_button = gr.Button(
@@ -348,7 +378,7 @@ class FileIndexPage(BasePage):
             name=f"onFileIndex{self._index.id}Changed",
             definition={
                 "fn": self.list_file_names,
-                "inputs": [self.file_list_state],
+                "inputs": [self._app.user_id, self.group_files],
                 "outputs": [self.group_files],
                 "show_progress": "hidden",
             },
@@ -360,7 +390,12 @@ class FileIndexPage(BasePage):
                 definition={
                     "fn": self.list_file,
                     "inputs": [self._app.user_id],
-                    "outputs": [self.file_list_state, self.file_list],
+                    "outputs": [
+                        self.file_list_state,
+                        self.file_list,
+                        self.file_page,
+                        self.file_list_info,
+                    ],
                     "show_progress": "hidden",
                 },
             )
@@ -368,8 +403,13 @@ class FileIndexPage(BasePage):
                 name="onSignIn",
                 definition={
                     "fn": self.list_group,
-                    "inputs": [self._app.user_id, self.file_list_state],
-                    "outputs": [self.group_list_state, self.group_list],
+                    "inputs": [self._app.user_id, self.group_page],
+                    "outputs": [
+                        self.group_list_state,
+                        self.group_list,
+                        self.group_page,
+                        self.group_list_info,
+                    ],
                     "show_progress": "hidden",
                 },
             )
@@ -377,7 +417,7 @@ class FileIndexPage(BasePage):
                 name="onSignIn",
                 definition={
                     "fn": self.list_file_names,
-                    "inputs": [self.file_list_state],
+                    "inputs": [self._app.user_id, self.group_files],
                     "outputs": [self.group_files],
                     "show_progress": "hidden",
                 },
@@ -387,7 +427,12 @@ class FileIndexPage(BasePage):
                 definition={
                     "fn": self.list_file,
                     "inputs": [self._app.user_id],
-                    "outputs": [self.file_list_state, self.file_list],
+                    "outputs": [
+                        self.file_list_state,
+                        self.file_list,
+                        self.file_page,
+                        self.file_list_info,
+                    ],
                     "show_progress": "hidden",
                 },
             )
@@ -566,8 +611,18 @@ class FileIndexPage(BasePage):
                 zipMe.write(file, arcname=arcname.name)
         return gr.DownloadButton(label=DOWNLOAD_MESSAGE, value=f"{zip_file_path}.zip")
 
-    def delete_all_files(self, file_list):
-        for file_id in file_list.id.values:
+    def delete_all_files(self, user_id, name_pattern=""):
+        """Delete all the files matching the filter, not only the listed page"""
+        Source = self._index._resources["Source"]
+        with Session(engine) as session:
+            statement = select(Source.id)
+            if self._index.config.get("private", False):
+                statement = statement.where(Source.user == user_id)
+            if name_pattern:
+                statement = statement.where(Source.name.ilike(f"%{name_pattern}%"))
+            file_ids = list(session.execute(statement).scalars())
+
+        for file_id in file_ids:
             self.delete_event(file_id)
 
     def set_file_id_selector(self, selected_file_id):
@@ -651,8 +706,18 @@ class FileIndexPage(BasePage):
                         )
                         .then(
                             fn=self.list_file,
-                            inputs=[self._app.user_id, self.filter],
-                            outputs=[self.file_list_state, self.file_list],
+                            inputs=[
+                                self._app.user_id,
+                                self.filter,
+                                self.file_page,
+                                self.file_sort,
+                            ],
+                            outputs=[
+                                self.file_list_state,
+                                self.file_list,
+                                self.file_page,
+                                self.file_list_info,
+                            ],
                             concurrency_limit=20,
                         )
                         .then(
@@ -708,8 +773,18 @@ class FileIndexPage(BasePage):
                 if not KH_DEMO_MODE:
                     quickURLUploadedEvent = quickURLUploadedEvent.then(
                         fn=self.list_file,
-                        inputs=[self._app.user_id, self.filter],
-                        outputs=[self.file_list_state, self.file_list],
+                        inputs=[
+                            self._app.user_id,
+                            self.filter,
+                            self.file_page,
+                            self.file_sort,
+                        ],
+                        outputs=[
+                            self.file_list_state,
+                            self.file_list,
+                            self.file_page,
+                            self.file_list_info,
+                        ],
                         concurrency_limit=20,
                     )
 
@@ -744,8 +819,13 @@ class FileIndexPage(BasePage):
             )
             .then(
                 fn=self.list_file,
-                inputs=[self._app.user_id, self.filter],
-                outputs=[self.file_list_state, self.file_list],
+                inputs=[self._app.user_id, self.filter, self.file_page, self.file_sort],
+                outputs=[
+                    self.file_list_state,
+                    self.file_list,
+                    self.file_page,
+                    self.file_list_info,
+                ],
             )
             .then(
                 fn=self.file_selected,
@@ -824,13 +904,18 @@ class FileIndexPage(BasePage):
 
         self.delete_all_button_confirm.click(
             fn=self.delete_all_files,
-            inputs=[self.file_list],
+            inputs=[self._app.user_id, self.filter],
             outputs=[],
             show_progress="hidden",
         ).then(
             fn=self.list_file,
-            inputs=[self._app.user_id, self.filter],
-            outputs=[self.file_list_state, self.file_list],
+            inputs=[self._app.user_id, self.filter, self.file_page, self.file_sort],
+            outputs=[
+                self.file_list_state,
+                self.file_list,
+                self.file_page,
+                self.file_list_info,
+            ],
         ).then(
             lambda: [
                 gr.update(visible=True),
@@ -885,8 +970,13 @@ class FileIndexPage(BasePage):
 
         uploadedEvent = onUploaded.then(
             fn=self.list_file,
-            inputs=[self._app.user_id, self.filter],
-            outputs=[self.file_list_state, self.file_list],
+            inputs=[self._app.user_id, self.filter, self.file_page, self.file_sort],
+            outputs=[
+                self.file_list_state,
+                self.file_list,
+                self.file_page,
+                self.file_list_info,
+            ],
             concurrency_limit=20,
         )
         for event in self._app.get_event(f"onFileIndex{self._index.id}Changed"):
@@ -922,7 +1012,7 @@ class FileIndexPage(BasePage):
 
         self.group_list.select(
             fn=self.interact_group_list,
-            inputs=[self.group_list_state],
+            inputs=[self._app.user_id, self.group_list_state],
             outputs=[
                 self.group_label,
                 self.selected_group_id,
@@ -947,10 +1037,54 @@ class FileIndexPage(BasePage):
             ],
         )
 
-        self.filter.submit(
-            fn=self.list_file,
-            inputs=[self._app.user_id, self.filter],
-            outputs=[self.file_list_state, self.file_list],
+        file_list_outputs = [
+            self.file_list_state,
+            self.file_list,
+            self.file_page,
+            self.file_list_info,
+        ]
+        gr.on(
+            triggers=[self.filter.submit, self.file_sort.change],
+            fn=lambda user_id, name_pattern, sort_by: self.list_file(
+                user_id, name_pattern, 1, sort_by
+            ),
+            inputs=[self._app.user_id, self.filter, self.file_sort],
+            outputs=file_list_outputs,
+            show_progress="hidden",
+        )
+        for button, step in ((self.file_prev_button, -1), (self.file_next_button, 1)):
+            button.click(
+                fn=lambda user_id, name_pattern, page, sort_by, step=step: (
+                    self.list_file(user_id, name_pattern, page + step, sort_by)
+                ),
+                inputs=[self._app.user_id, self.filter, self.file_page, self.file_sort],
+                outputs=file_list_outputs,
+                show_progress="hidden",
+            )
+
+        group_list_outputs = [
+            self.group_list_state,
+            self.group_list,
+            self.group_page,
+            self.group_list_info,
+        ]
+        for button, step in (
+            (self.group_prev_button, -1),
+            (self.group_next_button, 1),
+        ):
+            button.click(
+                fn=lambda user_id, page, step=step: self.list_group(
+                    user_id, page + step
+                ),
+                inputs=[self._app.user_id, self.group_page],
+                outputs=group_list_outputs,
+                show_progress="hidden",
+            )
+
+        self.group_files.key_up(
+            fn=self.search_file_names,
+            inputs=[self._app.user_id, self.group_files],
+            outputs=[self.group_files],
             show_progress="hidden",
         )
 
@@ -1014,8 +1148,13 @@ class FileIndexPage(BasePage):
             )
             .then(
                 self.list_group,
-                inputs=[self._app.user_id, self.file_list_state],
-                outputs=[self.group_list_state, self.group_list],
+                inputs=[self._app.user_id, self.group_page],
+                outputs=[
+                    self.group_list_state,
+                    self.group_list,
+                    self.group_page,
+                    self.group_list_info,
+                ],
             )
             .then(**onGroupClosedEvent)
         )
@@ -1026,8 +1165,13 @@ class FileIndexPage(BasePage):
             )
             .then(
                 self.list_group,
-                inputs=[self._app.user_id, self.file_list_state],
-                outputs=[self.group_list_state, self.group_list],
+                inputs=[self._app.user_id, self.group_page],
+                outputs=[
+                    self.group_list_state,
+                    self.group_list,
+                    self.group_page,
+                    self.group_list_info,
+                ],
             )
             .then(**onGroupClosedEvent)
         )
@@ -1043,15 +1187,25 @@ class FileIndexPage(BasePage):
 
         self._app.app.load(
             self.list_file,
-            inputs=[self._app.user_id, self.filter],
-            outputs=[self.file_list_state, self.file_list],
+            inputs=[self._app.user_id, self.filter, self.file_page, self.file_sort],
+            outputs=[
+                self.file_list_state,
+                self.file_list,
+                self.file_page,
+                self.file_list_info,
+            ],
         ).then(
             self.list_group,
-            inputs=[self._app.user_id, self.file_list_state],
-            outputs=[self.group_list_state, self.group_list],
+            inputs=[self._app.user_id, self.group_page],
+            outputs=[
+                self.group_list_state,
+                self.group_list,
+                self.group_page,
+                self.group_list_info,
+            ],
         ).then(
             self.list_file_names,
-            inputs=[self.file_list_state],
+            inputs=[self._app.user_id, self.group_files],
             outputs=[self.group_files],
         )
 
@@ -1127,7 +1281,9 @@ class FileIndexPage(BasePage):
 
         outputs, debugs = [], []
         # stream the output
-        output_stream = indexing_pipeline.stream(files, reindex=reindex)
+        output_stream = stream_with_priority(
+            indexing_pipeline.stream(files, reindex=reindex), Priority.BATCH
+        )
         try:
             while True:
                 response = next(output_stream)
@@ -1349,41 +1505,65 @@ class FileIndexPage(BasePage):
             num /= 1024.0
         return f"{num:.0f}Yi{suffix}"
 
-    def list_file(self, user_id, name_pattern=""):
+    def _listing_user(self, user_id):
+        """The rows of a private index are only listed for their owner"""
+        return user_id if self._index.config.get("private", False) else None
+
+    def _page_info(self, page: int, count: int, label: str) -> str:
+        return f"Page {page} / {num_pages(count)} ({count} {label})"
+
+    def list_file(self, user_id, name_pattern="", page=1, sort_by="date_created"):
+        """List a page of the files, filtered by name and sorted in the database
+
+        Returns:
+            the files of the page, the table to display, the page number and the
+            page information
+        """
         if user_id is None:
             # not signed in
-            return [], pd.DataFrame.from_records(
-                [
-                    {
-                        "id": "-",
-                        "name": "-",
-                        "size": "-",
-                        "tokens": "-",
-                        "loader": "-",
-                        "date_created": "-",
-                    }
-                ]
+            return (
+                [],
+                pd.DataFrame.from_records(
+                    [
+                        {
+                            "id": "-",
+                            "name": "-",
+                            "size": "-",
+                            "tokens": "-",
+                            "loader": "-",
+                            "date_created": "-",
+                        }
+                    ]
+                ),
+                1,
+                "",
             )
 
         Source = self._index._resources["Source"]
+        listing_user = self._listing_user(user_id)
         with Session(engine) as session:
-            statement = select(Source)
-            if self._index.config.get("private", False):
-                statement = statement.where(Source.user == user_id)
-            if name_pattern:
-                statement = statement.where(Source.name.ilike(f"%{name_pattern}%"))
+            count = count_rows(session, Source, listing_user, name_pattern)
+            page = min(max(int(page or 1), 1), num_pages(count))
             results = [
                 {
-                    "id": each[0].id,
-                    "name": each[0].name,
-                    "size": self.format_size_human_readable(each[0].size),
+                    "id": each.id,
+                    "name": each.name,
+                    "size": self.format_size_human_readable(each.size),
                     "tokens": self.format_size_human_readable(
-                        each[0].note.get("tokens", "-"), suffix=""
+                        (each.note or {}).get("tokens", "-"), suffix=""
                     ),
-                    "loader": each[0].note.get("loader", "-"),
-                    "date_created": each[0].date_created.strftime("%Y-%m-%d %H:%M:%S"),
+                    "loader": (each.note or {}).get("loader", "-"),
+                    "date_created": each.date_created.strftime("%Y-%m-%d %H:%M:%S"),
                 }
-                for each in session.execute(statement).all()
+                for each in list_rows(
+                    session,
+                    Source,
+                    ["id", "name", "size", "note", "date_created"],
+                    user_id=listing_user,
+                    name_pattern=name_pattern,
+                    sort_by=sort_by,
+                    page=page,
+                )
             ]
 
         if results:
@@ -1402,51 +1582,89 @@ class FileIndexPage(BasePage):
                 ]
             )
 
-        return results, file_list
+        return results, file_list, page, self._page_info(page, count, "files")
 
-    def list_file_names(self, file_list_state):
-        if file_list_state:
-            file_names = [(item["name"], item["id"]) for item in file_list_state]
-        else:
-            file_names = []
+    def _file_choices(self, user_id, selected_files=None, query="") -> list:
+        """The selected files, then the files whose name contains the query"""
+        Source = self._index._resources["Source"]
+        selected_files = selected_files or []
+        with Session(engine) as session:
+            names = get_names(session, Source, selected_files)
+            choices = [
+                (names[file_id], file_id)
+                for file_id in selected_files
+                if file_id in names
+            ]
+            choices += [
+                choice
+                for choice in search_names(
+                    session, Source, query, user_id=self._listing_user(user_id)
+                )
+                if choice[1] not in names
+            ]
+        return choices
 
-        return gr.update(choices=file_names)
+    def list_file_names(self, user_id, selected_files=None, query=""):
+        """Choices of the attached files of a group. Only a page of files is sent,
+        the other files are found by typing their name."""
+        if user_id is None:
+            return gr.update(choices=[])
+        return gr.update(choices=self._file_choices(user_id, selected_files, query))
 
-    def list_group(self, user_id, file_list):
-        # supply file_list to display the file names in the group
-        if file_list:
-            file_id_to_name = {item["id"]: item["name"] for item in file_list}
-        else:
-            file_id_to_name = {}
+    def search_file_names(self, user_id, selected_files, key_up_data: gr.KeyUpData):
+        return self.list_file_names(user_id, selected_files, key_up_data.input_value)
 
+    def list_group(self, user_id, page=1):
+        """List a page of the groups, with the names of their files
+
+        Returns:
+            the groups of the page, the table to display, the page number and the
+            page information
+        """
         if user_id is None:
             # not signed in
-            return [], pd.DataFrame.from_records(
-                [
-                    {
-                        "id": "-",
-                        "name": "-",
-                        "files": "-",
-                        "date_created": "-",
-                    }
-                ]
+            return (
+                [],
+                pd.DataFrame.from_records(
+                    [
+                        {
+                            "id": "-",
+                            "name": "-",
+                            "files": "-",
+                            "date_created": "-",
+                        }
+                    ]
+                ),
+                1,
+                "",
             )
 
         FileGroup = self._index._resources["FileGroup"]
+        listing_user = self._listing_user(user_id)
         with Session(engine) as session:
-            statement = select(FileGroup)
-            if self._index.config.get("private", False):
-                statement = statement.where(FileGroup.user == user_id)
-
+            count = count_rows(session, FileGroup, listing_user)
+            page = min(max(int(page or 1), 1), num_pages(count))
             results = [
                 {
-                    "id": each[0].id,
-                    "name": each[0].name,
-                    "files": each[0].data.get("files", []),
-                    "date_created": each[0].date_created.strftime("%Y-%m-%d %H:%M:%S"),
+                    "id": each.id,
+                    "name": each.name,
+                    "files": (each.data or {}).get("files", []),
+                    "date_created": each.date_created.strftime("%Y-%m-%d %H:%M:%S"),
                 }
-                for each in session.execute(statement).all()
+                for each in list_rows(
+                    session,
+                    FileGroup,
+                    ["id", "name", "data", "date_created"],
+                    user_id=listing_user,
+                    page=page,
+                )
             ]
+            # only the names of the files of the listed groups are needed
+            file_id_to_name = get_names(
+                session,
+                self._index._resources["Source"],
+                list({file_id for item in results for file_id in item["files"]}),
+            )
 
         if results:
             formated_results = deepcopy(results)
@@ -1477,7 +1695,7 @@ class FileIndexPage(BasePage):
                 ]
             )
 
-        return results, group_list
+        return results, group_list, page, self._page_info(page, count, "groups")
 
     def set_group_id_selector(self, selected_group_id):
         FileGroup = self._index._resources["FileGroup"]
@@ -1560,7 +1778,7 @@ class FileIndexPage(BasePage):
             name=list_files["name"][ev.index[0]]
         )
 
-    def interact_group_list(self, list_groups, ev: gr.SelectData):
+    def interact_group_list(self, user_id, list_groups, ev: gr.SelectData):
         selected_id = ev.index[0]
         if (not ev.value or ev.value == "-") and selected_id == 0:
             raise gr.Error("No group is selected")
@@ -1571,7 +1789,10 @@ class FileIndexPage(BasePage):
             "### Group Information",
             selected_group_id,
             selected_item["name"],
-            selected_item["files"],
+            gr.update(
+                value=selected_item["files"],
+                choices=self._file_choices(user_id, selected_item["files"]),
+            ),
         )
 
     def validate_files(self, files: list[str]):
@@ -1657,6 +1878,12 @@ class FileSelector(BasePage):
             inputs=[self.mode, self._app.user_id],
             outputs=[self.selector, self.selector_user_id],
         )
+        self.selector.key_up(
+            fn=self.search_files,
+            inputs=[self.selector, self._app.user_id],
+            outputs=[self.selector],
+            show_progress="hidden",
+        )
         # attach special event for the first index
         if self._index.id == 1:
             self.selector_choices.change(
@@ -1692,50 +1919,60 @@ class FileSelector(BasePage):
 
         return file_ids
 
-    def load_files(self, selected_files, user_id):
+    def load_files(self, selected_files, user_id, query=""):
+        """Load the choices of the selector: the selected files, then the files
+        and the groups whose name contains the query (the latest files when there
+        is no query). The other files are found by typing their name."""
         options: list = []
-        available_ids = []
         if user_id is None:
             # not signed in
             return gr.update(value=selected_files, choices=options), options
 
+        Source = self._index._resources["Source"]
+        FileGroup = self._index._resources["FileGroup"]
+        listing_user = user_id if self._index.config.get("private", False) else None
+        # limit query by MAX_FILE_COUNT in demo mode
+        limit = MAX_FILE_COUNT if KH_DEMO_MODE else KH_FILE_LIST_PAGE_SIZE
+
         with Session(engine) as session:
-            # get file list from Source table
-            statement = select(self._index._resources["Source"])
-            if self._index.config.get("private", False):
-                statement = statement.where(
-                    self._index._resources["Source"].user == user_id
+            selected_names = get_names(
+                session, Source, selected_files or [], user_id=listing_user
+            )
+            selected_files = [
+                each for each in selected_files or [] if each in selected_names
+            ]
+            options.extend((selected_names[each], each) for each in selected_files)
+            options.extend(
+                option
+                for option in search_names(
+                    session, Source, query, user_id=listing_user, limit=limit
                 )
-
-            if KH_DEMO_MODE:
-                # limit query by MAX_FILE_COUNT
-                statement = statement.limit(MAX_FILE_COUNT)
-
-            results = session.execute(statement).all()
-            for result in results:
-                available_ids.append(result[0].id)
-                options.append((result[0].name, result[0].id))
+                if option[1] not in selected_names
+            )
 
             # get group list from FileGroup table
-            FileGroup = self._index._resources["FileGroup"]
-            statement = select(FileGroup)
-            if self._index.config.get("private", False):
-                statement = statement.where(FileGroup.user == user_id)
-            results = session.execute(statement).all()
-            for result in results:
-                item = result[0]
+            for item in list_rows(
+                session,
+                FileGroup,
+                ["name", "data"],
+                user_id=listing_user,
+                name_pattern=query,
+                sort_by="name",
+                page_size=limit,
+            ):
                 options.append(
-                    (f"group: '{item.name}'", json.dumps(item.data.get("files", [])))
+                    (
+                        f"group: '{item.name}'",
+                        json.dumps((item.data or {}).get("files", [])),
+                    )
                 )
 
-        if selected_files:
-            available_ids_set = set(available_ids)
-            selected_files = [
-                each for each in selected_files if each in available_ids_set
-            ]
-
         return gr.update(value=selected_files, choices=options), options
 
+    def search_files(self, selected_files, user_id, key_up_data: gr.KeyUpData):
+        options = self.load_files(selected_files, user_id, key_up_data.input_value)[1]
+        return gr.update(choices=options)
+
     def _on_app_created(self):
         self._app.app.load(
             self.load_files,
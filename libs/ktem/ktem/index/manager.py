@@ -25,6 +25,10 @@ class IndexManager:
         self._indices = []
         self._index_types: dict[str, Type[BaseIndex]] = {}
 
+        # the index records are needed by the app, even when the schema is
+        # managed by alembic
+        Index.metadata.create_all(engine, tables=[Index.__table__])
+
     @property
     def index_types(self) -> dict:
         """List the index_type of the index"""
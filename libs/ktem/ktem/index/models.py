@@ -1,6 +1,5 @@
 from typing import Optional
 
-from ktem.db.engine import engine
 from sqlalchemy import JSON, Column
 from sqlmodel import Field, SQLModel
 
@@ -14,6 +13,3 @@ class Index(SQLModel, table=True):
     name: str = Field(unique=True)
     index_type: str = Field()
     config: dict = Field(default={}, sa_column=Column(JSON))
-
-
-Index.metadata.create_all(engine)
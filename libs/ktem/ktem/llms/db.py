@@ -32,5 +32,7 @@ class LLMTable(_base_llm):  # type: ignore
     __tablename__ = "llm_table"
 
 
-if not getattr(flowsettings, "KH_ENABLE_ALEMBIC", False):
-    LLMTable.metadata.create_all(engine)
+def init_db():
+    """Create the table of the LLMs, unless managed by alembic"""
+    if not getattr(flowsettings, "KH_ENABLE_ALEMBIC", False):
+        LLMTable.metadata.create_all(engine)
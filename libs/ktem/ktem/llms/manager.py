@@ -1,24 +1,26 @@
 from typing import Optional, Type, overload
 
+from ktem.utils.lazy_models import LazyModels
 from sqlalchemy import select
 from sqlalchemy.orm import Session
 from theflow.settings import settings as flowsettings
-from theflow.utils.modules import deserialize, import_dotted_string
+from theflow.utils.modules import import_dotted_string
 
 from kotaemon.llms import ChatLLM
 
-from .db import LLMTable, engine
+from .db import LLMTable, engine, init_db
 
 
 class LLMManager:
     """Represent a pool of models"""
 
     def __init__(self):
-        self._models: dict[str, ChatLLM] = {}
+        self._models = LazyModels()
         self._info: dict[str, dict] = {}
         self._default: str = ""
         self._vendors: list[Type] = []
 
+        init_db()
         if hasattr(flowsettings, "KH_LLMS"):
             for name, model in flowsettings.KH_LLMS.items():
                 with Session(engine) as session:
@@ -38,13 +40,13 @@ class LLMManager:
 
     def load(self):
         """Load the model pool from database"""
-        self._models, self._info, self._default = {}, {}, ""
+        self._models, self._info, self._default = LazyModels(), {}, ""
         with Session(engine) as session:
             stmt = select(LLMTable)
             items = session.execute(stmt)
 
             for (item,) in items:
-                self._models[item.name] = deserialize(item.spec, safe=False)
+                self._models.set_spec(item.name, item.spec)
                 self._info[item.name] = {
                     "name": item.name,
                     "spec": item.spec,
@@ -1,5 +1,6 @@
 import asyncio
 import json
+import logging
 import re
 from copy import deepcopy
 from typing import Optional
@@ -8,7 +9,15 @@ import gradio as gr
 from decouple import config
 from ktem.app import BasePage
 from ktem.components import reasonings
+from ktem.db.conversation import (
+    get_last_turn,
+    load_turn_panel,
+    load_turns,
+    migrate_data_source,
+    save_turn,
+)
 from ktem.db.models import Conversation, engine
+from ktem.db.usage import merge_usage_rows, save_usage, usage_rows
 from ktem.index.file.ui import File
 from ktem.reasoning.prompt_optimization.mindmap import MINDMAP_HTML_EXPORT_TEMPLATE
 from ktem.reasoning.prompt_optimization.suggest_conversation_name import (
@@ -22,14 +31,19 @@ from sqlmodel import Session, select
 from theflow.settings import settings as flowsettings
 from theflow.utils.modules import import_dotted_string
 
-from kotaemon.base import Document
+from kotaemon.base.tracing import span, trace_stream
+from kotaemon.base.usage import UsageCollector, collect_stream, collect_usage
 from kotaemon.indices.ingests.files import KH_DEFAULT_FILE_EXTRACTORS
 from kotaemon.indices.qa.utils import strip_think_tag
+from kotaemon.llms.scheduler import Priority, priority
 
 from ...utils import SUPPORTED_LANGUAGE_MAP, get_file_names_regex, get_urls
 from ...utils.commands import WEB_SEARCH_COMMAND
+from ...utils.generator import coalesce_chat_stream
 from ...utils.hf_papers import get_recommended_papers
 from ...utils.rate_limit import check_rate_limit
+from ...utils.render import Render
+from ...utils.session_store import get_session_store
 from .chat_panel import ChatPanel
 from .chat_suggestion import ChatSuggestion
 from .common import STATE
@@ -38,9 +52,15 @@ from .demo_hint import HintPage
 from .paper_list import PaperListPage
 from .report import ReportIssue
 
+logger = logging.getLogger(__name__)
+
 KH_DEMO_MODE = getattr(flowsettings, "KH_DEMO_MODE", False)
 KH_SSO_ENABLED = getattr(flowsettings, "KH_SSO_ENABLED", False)
 KH_WEB_SEARCH_BACKEND = getattr(flowsettings, "KH_WEB_SEARCH_BACKEND", None)
+# the chat is re-rendered at most every KH_CHAT_STREAM_INTERVAL_MS milliseconds or
+# every KH_CHAT_STREAM_MAX_TOKENS streamed chunks
+KH_CHAT_STREAM_INTERVAL = getattr(flowsettings, "KH_CHAT_STREAM_INTERVAL_MS", 80) / 1000
+KH_CHAT_STREAM_MAX_TOKENS = getattr(flowsettings, "KH_CHAT_STREAM_MAX_TOKENS", 64)
 WebSearch = None
 if KH_WEB_SEARCH_BACKEND:
     try:
@@ -201,6 +221,7 @@ class ChatPage(BasePage):
     def __init__(self, app):
         self._app = app
         self._indices_input = []
+        self._panel_store = get_session_store()
 
         self.on_building_ui()
 
@@ -217,9 +238,12 @@ class ChatPage(BasePage):
     def on_building_ui(self):
         with gr.Row():
             self.state_chat = gr.State(STATE)
-            self.state_retrieval_history = gr.State([])
-            self.state_plot_history = gr.State([])
+            # keys of the retrieval panel and plot of each message in the session
+            # store, `None` for the messages whose panels were not loaded
+            self.state_panel_history = gr.State([])
             self.state_plot_panel = gr.State(None)
+            # first turn of the conversation shown in the chatbot
+            self.state_first_turn = gr.State(0)
             self.first_selector_choices = gr.State(None)
 
             with gr.Column(scale=1, elem_id="conv-settings-panel") as self.conv_column:
@@ -484,10 +508,11 @@ class ChatPage(BasePage):
             )
             .success(
                 fn=self.check_and_suggest_name_conv,
-                inputs=self.chat_panel.chatbot,
+                inputs=[self.chat_panel.chatbot, self.state_chat],
                 outputs=[
                     self.chat_control.conversation_rn,
                     self._conversation_renamed,
+                    self.state_chat,
                 ],
             )
             .success(
@@ -514,10 +539,12 @@ class ChatPage(BasePage):
                 self.language,
                 self.chat_panel.chatbot,
                 self._use_suggestion,
+                self.state_chat,
             ],
             "outputs": [
                 self.followup_questions_ui,
                 self.followup_questions,
+                self.state_chat,
             ],
             "show_progress": "hidden",
         }
@@ -533,15 +560,13 @@ class ChatPage(BasePage):
                     self._app.user_id,
                     self.info_panel,
                     self.state_plot_panel,
-                    self.state_retrieval_history,
-                    self.state_plot_history,
+                    self.state_panel_history,
                     self.chat_panel.chatbot,
                     self.state_chat,
                 ]
                 + self._indices_input,
                 outputs=[
-                    self.state_retrieval_history,
-                    self.state_plot_history,
+                    self.state_panel_history,
                 ],
                 concurrency_limit=20,
             )
@@ -573,10 +598,11 @@ class ChatPage(BasePage):
                     self.followup_questions,
                     self.info_panel,
                     self.state_plot_panel,
-                    self.state_retrieval_history,
-                    self.state_plot_history,
+                    self.state_panel_history,
                     self.chat_control.cb_is_public,
                     self.state_chat,
+                    self.state_first_turn,
+                    self.chat_panel.btn_load_earlier,
                 ]
                 + self._indices_input,
             ).then(
@@ -608,10 +634,11 @@ class ChatPage(BasePage):
                     self.followup_questions,
                     self.info_panel,
                     self.state_plot_panel,
-                    self.state_retrieval_history,
-                    self.state_plot_history,
+                    self.state_panel_history,
                     self.chat_control.cb_is_public,
                     self.state_chat,
+                    self.state_first_turn,
+                    self.chat_panel.btn_load_earlier,
                 ]
                 + self._indices_input,
                 show_progress="hidden",
@@ -652,10 +679,11 @@ class ChatPage(BasePage):
                     self.followup_questions,
                     self.info_panel,
                     self.state_plot_panel,
-                    self.state_retrieval_history,
-                    self.state_plot_history,
+                    self.state_panel_history,
                     self.chat_control.cb_is_public,
                     self.state_chat,
+                    self.state_first_turn,
+                    self.chat_panel.btn_load_earlier,
                 ]
                 + self._indices_input,
                 show_progress="hidden",
@@ -711,10 +739,11 @@ class ChatPage(BasePage):
                     self.followup_questions,
                     self.info_panel,
                     self.state_plot_panel,
-                    self.state_retrieval_history,
-                    self.state_plot_history,
+                    self.state_panel_history,
                     self.chat_control.cb_is_public,
                     self.state_chat,
+                    self.state_first_turn,
+                    self.chat_panel.btn_load_earlier,
                 ]
                 + self._indices_input,
                 show_progress="hidden",
@@ -758,8 +787,9 @@ class ChatPage(BasePage):
             self.chat_panel.chatbot.select(
                 self.message_selected,
                 inputs=[
-                    self.state_retrieval_history,
-                    self.state_plot_history,
+                    self.chat_control.conversation_id,
+                    self.state_first_turn,
+                    self.state_panel_history,
                 ],
                 outputs=[
                     self.info_panel,
@@ -776,6 +806,24 @@ class ChatPage(BasePage):
                 js=pdfview_js,
             )
 
+        if not KH_DEMO_MODE:
+            self.chat_panel.btn_load_earlier.click(
+                self.load_earlier_messages,
+                inputs=[
+                    self.chat_control.conversation_id,
+                    self.state_first_turn,
+                    self.chat_panel.chatbot,
+                    self.state_panel_history,
+                ],
+                outputs=[
+                    self.chat_panel.chatbot,
+                    self.state_panel_history,
+                    self.state_first_turn,
+                    self.chat_panel.btn_load_earlier,
+                ],
+                show_progress="hidden",
+            )
+
         self.chat_control.cb_is_public.change(
             self.on_set_public_conversation,
             inputs=[self.chat_control.cb_is_public, self.chat_control.conversation],
@@ -787,7 +835,7 @@ class ChatPage(BasePage):
             # user feedback events
             self.chat_panel.chatbot.like(
                 fn=self.is_liked,
-                inputs=[self.chat_control.conversation_id],
+                inputs=[self.chat_control.conversation_id, self.state_first_turn],
                 outputs=None,
             )
             self.report_issue.report_btn.click(
@@ -884,7 +932,7 @@ class ChatPage(BasePage):
         """Submit a message to the chatbot"""
         if KH_DEMO_MODE:
             sso_user_id = check_rate_limit("chat", request)
-            print("User ID:", sso_user_id)
+            logger.debug(f"User ID: {sso_user_id}")
 
         if not chat_input:
             raise ValueError("Input is empty")
@@ -908,7 +956,7 @@ class ChatPage(BasePage):
         urls, chat_input_text = get_urls(chat_input_text)
 
         if urls and self.first_indexing_url_fn:
-            print("Detected URLs", urls)
+            logger.debug(f"Detected URLs {urls}")
             file_ids = self.first_indexing_url_fn(
                 "\n".join(urls),
                 True,
@@ -1040,10 +1088,11 @@ class ChatPage(BasePage):
                         self.followup_questions,
                         self.info_panel,
                         self.state_plot_panel,
-                        self.state_retrieval_history,
-                        self.state_plot_history,
+                        self.state_panel_history,
                         self.chat_control.cb_is_public,
                         self.state_chat,
+                        self.state_first_turn,
+                        self.chat_panel.btn_load_earlier,
                     ]
                     + self._indices_input,
                     "show_progress": "hidden",
@@ -1078,29 +1127,37 @@ class ChatPage(BasePage):
         user_id,
         retrieval_msg,
         plot_data,
-        retrival_history,
-        plot_history,
+        panel_history,
         messages,
         state,
         *selecteds,
     ):
-        """Update the data source"""
+        """Append the new turn (or replace the last turn on regeneration) to the
+        conversation"""
         if not convo_id:
             gr.Warning("No conversation selected")
             return
+        if not messages:
+            return panel_history
+
+        regen = state["app"].get("regen", False)
+        panel_key = self._panel_store.put(
+            {"retrieval": retrieval_msg, "plot": plot_data}
+        )
 
         # if not regen, then append the new message
-        if not state["app"].get("regen", False):
-            retrival_history = retrival_history + [retrieval_msg]
-            plot_history = plot_history + [plot_data]
+        if not regen:
+            panel_history = panel_history + [panel_key]
         else:
-            if retrival_history:
-                print("Updating retrieval history (regen=True)")
-                retrival_history[-1] = retrieval_msg
-                plot_history[-1] = plot_data
+            if panel_history:
+                logger.debug("Updating retrieval history (regen=True)")
+                if panel_history[-1]:
+                    self._panel_store.delete(panel_history[-1])
+                panel_history[-1] = panel_key
 
         # reset regen state
         state["app"]["regen"] = False
+        usage = state["app"].pop("usage", [])
 
         selecteds_ = {}
         for index in self._app.index_manager.indices:
@@ -1111,9 +1168,22 @@ class ChatPage(BasePage):
             else:
                 selecteds_[str(index.id)] = [selecteds[i] for i in index.selector]
 
-        with Session(engine) as session:
+        with span("chat.persistence"), Session(engine) as session:
             statement = select(Conversation).where(Conversation.id == convo_id)
             result = session.exec(statement).one()
+            migrate_data_source(session, result)
+
+            last_turn = get_last_turn(session, convo_id)
+            turn = last_turn if regen and last_turn >= 0 else last_turn + 1
+            save_turn(
+                session,
+                convo_id,
+                turn,
+                list(messages[-1]),
+                retrieval_msg,
+                plot_data,
+            )
+            save_usage(session, convo_id, turn, user_id, usage)
 
             data_source = result.data_source
             old_selecteds = data_source.get("selected", {})
@@ -1121,17 +1191,14 @@ class ChatPage(BasePage):
 
             # Write down to db
             result.data_source = {
+                **data_source,
                 "selected": selecteds_ if is_owner else old_selecteds,
-                "messages": messages,
-                "retrieval_messages": retrival_history,
-                "plot_history": plot_history,
                 "state": state,
-                "likes": deepcopy(data_source.get("likes", [])),
             }
             session.add(result)
             session.commit()
 
-        return retrival_history, plot_history
+        return panel_history
 
     def reasoning_changed(self, reasoning_type):
         if reasoning_type != DEFAULT_SETTING:
@@ -1139,31 +1206,69 @@ class ChatPage(BasePage):
             gr.Info("Reasoning type changed to `{}`".format(reasoning_type))
         return reasoning_type
 
-    def is_liked(self, convo_id, liked: gr.LikeData):
+    def is_liked(self, convo_id, first_turn, liked: gr.LikeData):
         with Session(engine) as session:
             statement = select(Conversation).where(Conversation.id == convo_id)
             result = session.exec(statement).one()
 
             data_source = deepcopy(result.data_source)
             likes = data_source.get("likes", [])
-            likes.append([liked.index, liked.value, liked.liked])
+            # the chatbot only holds the turns from `first_turn`
+            index = liked.index
+            if isinstance(index, (list, tuple)):
+                index = [first_turn + index[0], *index[1:]]
+            else:
+                index = first_turn + index
+            likes.append([index, liked.value, liked.liked])
             data_source["likes"] = likes
 
             result.data_source = data_source
             session.add(result)
             session.commit()
 
-    def message_selected(self, retrieval_history, plot_history, msg: gr.SelectData):
+    def message_selected(
+        self,
+        convo_id,
+        first_turn,
+        panel_history,
+        msg: gr.SelectData,
+    ):
         index = msg.index[0]
-        try:
-            retrieval_content, plot_content = (
-                retrieval_history[index],
-                plot_history[index],
-            )
-        except IndexError:
-            retrieval_content, plot_content = gr.update(), None
+        if index >= len(panel_history):
+            return gr.update(), None
+
+        panel = None
+        if panel_history[index]:
+            panel = self._panel_store.get(panel_history[index])
+
+        if panel is None:
+            if not convo_id:
+                return gr.update(), None
+            # the panels not loaded yet or evicted from the session store are
+            # read from the conversation
+            with Session(engine) as session:
+                retrieval_content, plot_content = load_turn_panel(
+                    session, convo_id, first_turn + index
+                )
+            panel = {"retrieval": retrieval_content, "plot": plot_content}
+            panel_history[index] = self._panel_store.put(panel)
+
+        return panel["retrieval"], panel["plot"]
+
+    def load_earlier_messages(self, convo_id, first_turn, chat_history, panel_history):
+        """Prepend the previous page of turns to the chat"""
+        if not convo_id or first_turn <= 0:
+            return chat_history, panel_history, first_turn, gr.update(visible=False)
+
+        with Session(engine) as session:
+            new_first_turn, messages = load_turns(session, convo_id, before=first_turn)
 
-        return retrieval_content, plot_content
+        return (
+            messages + chat_history,
+            [None] * len(messages) + panel_history,
+            new_first_turn,
+            gr.update(visible=new_first_turn > 0),
+        )
 
     def create_pipeline(
         self,
@@ -1190,24 +1295,18 @@ class ChatPage(BasePage):
             - the pipeline objects
         """
         # override reasoning_mode by temporary chat page state
-        print(
-            "Session reasoning type",
-            session_reasoning_type,
-            "use mindmap",
-            session_use_mindmap,
-            "use citation",
-            session_use_citation,
-            "language",
-            session_language,
+        logger.debug(
+            f"Session reasoning type {session_reasoning_type}, "
+            f"use mindmap {session_use_mindmap}, use citation {session_use_citation}, "
+            f"language {session_language}, LLM {session_llm}"
         )
-        print("Session LLM", session_llm)
         reasoning_mode = (
             settings["reasoning.use"]
             if session_reasoning_type in (DEFAULT_SETTING, None)
             else session_reasoning_type
         )
         reasoning_cls = reasonings[reasoning_mode]
-        print("Reasoning class", reasoning_cls)
+        logger.debug(f"Reasoning class {reasoning_cls}")
         reasoning_id = reasoning_cls.get_info()["id"]
 
         settings = deepcopy(settings)
@@ -1301,14 +1400,13 @@ class ChatPage(BasePage):
             user_id,
             *selecteds,
         )
-        print("Reasoning state", reasoning_state)
+        logger.debug(f"Reasoning state {reasoning_state}")
         pipeline.set_output_queue(queue)
 
         text, refs, plot, plot_gr = "", "", None, gr.update(visible=False)
         msg_placeholder = getattr(
             flowsettings, "KH_CHAT_MSG_PLACEHOLDER", "Thinking ..."
         )
-        print(msg_placeholder)
         yield (
             chat_history + [(chat_input, text or msg_placeholder)],
             refs,
@@ -1317,48 +1415,52 @@ class ChatPage(BasePage):
             chat_state,
         )
 
+        usage = UsageCollector()
+        chat_stream = collect_stream(
+            trace_stream(
+                pipeline.stream(chat_input, conversation_id, chat_history),
+                "chat",
+                reasoning=pipeline.get_info()["id"],
+            ),
+            usage,
+        )
         try:
-            for response in pipeline.stream(chat_input, conversation_id, chat_history):
-
-                if not isinstance(response, Document):
-                    continue
-
-                if response.channel is None:
-                    continue
-
-                if response.channel == "chat":
-                    if response.content is None:
-                        text = ""
-                    else:
-                        text += response.content
-
-                if response.channel == "info":
-                    if response.content is None:
-                        refs = ""
-                    else:
-                        refs += response.content
-
-                if response.channel == "plot":
-                    plot = response.content
+            for update in coalesce_chat_stream(
+                chat_stream,
+                interval=KH_CHAT_STREAM_INTERVAL,
+                max_tokens=KH_CHAT_STREAM_MAX_TOKENS,
+            ):
+                text, refs = update.text, update.refs
+                if update.plot_changed:
+                    plot = update.plot
                     plot_gr = self._json_to_plot(plot)
 
                 chat_state[pipeline.get_info()["id"]] = reasoning_state["pipeline"]
 
+                # the info panel and the plot are only sent when they change
                 yield (
                     chat_history + [(chat_input, text or msg_placeholder)],
-                    refs,
-                    plot_gr,
+                    refs if update.refs_changed else gr.update(),
+                    plot_gr if update.plot_changed else gr.update(),
                     plot,
                     chat_state,
                 )
         except ValueError as e:
-            print(e)
+            logger.warning(e)
+        finally:
+            # release the model calls of an interrupted answer right away
+            chat_stream.close()
+
+        rows = usage_rows(usage)
+        chat_state = self.add_usage(chat_state, usage)
+        if rows:
+            refs += Render.usage(rows)
 
         if not text:
             empty_msg = getattr(
                 flowsettings, "KH_CHAT_EMPTY_MSG_PLACEHOLDER", "(Sorry, I don't know)"
             )
-            print(f"Generate nothing: {empty_msg}")
+            logger.debug(f"Generate nothing: {empty_msg}")
             yield (
                 chat_history + [(chat_input, text or empty_msg)],
                 refs,
@@ -1366,21 +1468,41 @@ class ChatPage(BasePage):
                 plot,
                 chat_state,
             )
+        elif rows:
+            yield (
+                chat_history + [(chat_input, text)],
+                refs,
+                gr.update(),
+                plot,
+                chat_state,
+            )
 
-    def check_and_suggest_name_conv(self, chat_history):
+    def add_usage(self, chat_state, usage: UsageCollector):
+        """Add the usage of some model calls (answer, suggestions...) to the usage
+        of the turn, stored with the turn by `persist_data_source`"""
+        chat_state["app"]["usage"] = merge_usage_rows(
+            chat_state["app"].get("usage", []), usage_rows(usage)
+        )
+        return chat_state
+
+    def check_and_suggest_name_conv(self, chat_history, chat_state):
         suggest_pipeline = SuggestConvNamePipeline()
         new_name = gr.update()
         renamed = False
 
         # check if this is a newly created conversation
         if len(chat_history) == 1:
-            suggested_name = suggest_pipeline(chat_history).text
+            with span("chat.conversation_name"), collect_usage() as usage, priority(
+                Priority.AUXILIARY
+            ):
+                suggested_name = suggest_pipeline(chat_history).text
+            chat_state = self.add_usage(chat_state, usage)
             suggested_name = strip_think_tag(suggested_name)
             suggested_name = suggested_name.replace('"', "").replace("'", "")[:40]
             new_name = gr.update(value=suggested_name)
             renamed = True
 
-        return new_name, renamed
+        return new_name, renamed, chat_state
 
     def suggest_chat_conv(
         self,
@@ -1388,6 +1510,7 @@ class ChatPage(BasePage):
         session_language,
         chat_history,
         use_suggestion,
+        chat_state,
     ):
         target_language = (
             session_language
@@ -1402,7 +1525,11 @@ class ChatPage(BasePage):
             suggested_questions = [[each] for each in ChatSuggestion.CHAT_SAMPLES]
 
             if len(chat_history) >= 1:
-                suggested_resp = suggest_pipeline(chat_history).text
+                with span(
+                    "chat.followup_suggestion"
+                ), collect_usage() as usage, priority(Priority.AUXILIARY):
+                    suggested_resp = suggest_pipeline(chat_history).text
+                chat_state = self.add_usage(chat_state, usage)
                 if ques_res := re.search(
                     r"\[(.*?)\]", re.sub("\n", "", suggested_resp)
                 ):
@@ -1413,6 +1540,6 @@ class ChatPage(BasePage):
                     except Exception:
                         pass
 
-            return gr.update(visible=True), suggested_questions
+            return gr.update(visible=True), suggested_questions, chat_state
 
-        return gr.update(visible=False), gr.update()
+        return gr.update(visible=False), gr.update(), chat_state
@@ -24,6 +24,12 @@ class ChatPanel(BasePage):
         self.on_building_ui()
 
     def on_building_ui(self):
+        self.btn_load_earlier = gr.Button(
+            "Load earlier messages",
+            size="sm",
+            visible=False,
+            elem_id="btn-load-earlier",
+        )
         self.chatbot = gr.Chatbot(
             label=self._app.app_name,
             placeholder=PLACEHOLDER_TEXT,
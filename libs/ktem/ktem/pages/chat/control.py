@@ -4,12 +4,18 @@ from copy import deepcopy
 
 import gradio as gr
 from ktem.app import BasePage
+from ktem.db.conversation import (
+    delete_turns,
+    load_turn_panel,
+    load_turns,
+    migrate_data_source,
+)
 from ktem.db.models import Conversation, User, engine
 from sqlmodel import Session, or_, select
 
 import flowsettings
 
-from ...utils.conversation import sync_retrieval_n_message
+from ...utils.session_store import get_session_store
 from .chat_suggestion import ChatSuggestion
 from .common import STATE
 
@@ -287,6 +293,7 @@ class ConversationControl(BasePage):
             result = session.exec(statement).one()
 
             session.delete(result)
+            delete_turns(session, conversation_id)
             session.commit()
 
         history = self.load_chat_history(user_id)
@@ -315,26 +322,28 @@ class ConversationControl(BasePage):
                 else:
                     selected = {}
 
-                chats = result.data_source.get("messages", [])
+                if migrate_data_source(session, result):
+                    session.commit()
+                    session.refresh(result)
+
                 chat_suggestions = result.data_source.get(
                     "chat_suggestions", default_chat_suggestions
                 )
 
-                retrieval_history: list[str] = result.data_source.get(
-                    "retrieval_messages", []
-                )
-                plot_history: list[dict] = result.data_source.get("plot_history", [])
-
-                # On initialization
-                # Ensure len of retrieval and messages are equal
-                retrieval_history = sync_retrieval_n_message(chats, retrieval_history)
-
-                info_panel = (
-                    retrieval_history[-1]
-                    if retrieval_history
-                    else "<h5><b>No evidence found.</b></h5>"
-                )
-                plot_data = plot_history[-1] if plot_history else None
+                # only the last page of turns is loaded, the retrieval panels and
+                # plots of the turns other than the last one are loaded when the
+                # message is selected
+                first_turn, chats = load_turns(session, id_)
+                panel_history: list = [None] * len(chats)
+                info_panel = "<h5><b>No evidence found.</b></h5>"
+                plot_data = None
+                if chats:
+                    info_panel, plot_data = load_turn_panel(
+                        session, id_, first_turn + len(chats) - 1
+                    )
+                    panel_history[-1] = get_session_store().put(
+                        {"retrieval": info_panel, "plot": plot_data}
+                    )
                 state = result.data_source.get("state", STATE)
 
             except Exception as e:
@@ -344,12 +353,12 @@ class ConversationControl(BasePage):
                 selected = {}
                 chats = []
                 chat_suggestions = default_chat_suggestions
-                retrieval_history = []
-                plot_history = []
+                panel_history = []
                 info_panel = ""
                 plot_data = None
                 state = STATE
                 is_conv_public = False
+                first_turn = 0
 
         indices = []
         for index in self._app.index_manager.indices:
@@ -369,10 +378,11 @@ class ConversationControl(BasePage):
             chat_suggestions,
             info_panel,
             plot_data,
-            retrieval_history,
-            plot_history,
+            panel_history,
             is_conv_public,
             state,
+            first_turn,
+            gr.update(visible=first_turn > 0),
             *indices,
         )
 
@@ -7,6 +7,7 @@ from ktem.llms.ui import LLMManagement
 from ktem.rerankings.ui import RerankingManagement
 from sqlmodel import Session, select
 
+from .usage import UsageManagement
 from .user import UserManagement
 
 
@@ -28,6 +29,9 @@ class ResourcesTab(BasePage):
         with gr.Tab("Rerankings") as self.rerank_management_tab:
             self.rerank_management = RerankingManagement(self._app)
 
+        with gr.Tab("Usage") as self.usage_management_tab:
+            self.usage_management = UsageManagement(self._app)
+
         if self._app.f_user_management:
             with gr.Tab("Users", visible=False) as self.user_management_tab:
                 self.user_management = UserManagement(self._app)
@@ -0,0 +1,88 @@
+import gradio as gr
+import pandas as pd
+from ktem.app import BasePage
+from ktem.db.models import Conversation, User, engine
+from ktem.db.usage import summarize_usage
+from sqlmodel import Session, select
+
+GROUP_BY_CHOICES = [
+    ("Model", "model"),
+    ("Pipeline stage", "stage"),
+    ("Conversation", "conversation_id"),
+    ("User", "user"),
+]
+USAGE_COLUMNS = [
+    "calls",
+    "prompt_tokens",
+    "completion_tokens",
+    "total_tokens",
+    "cost",
+    "estimated",
+]
+
+
+class UsageManagement(BasePage):
+    """Token usage and cost of the chats, summed by model, stage, conversation or
+    user. The admins see the usage of all the users, the other users their own."""
+
+    def __init__(self, app):
+        self._app = app
+        self.on_building_ui()
+
+    def on_building_ui(self):
+        with gr.Row():
+            self.group_by = gr.Dropdown(
+                label="Group by",
+                choices=GROUP_BY_CHOICES,
+                value="model",
+                interactive=True,
+            )
+            self.btn_refresh = gr.Button("Refresh", size="sm")
+        self.usage_list = gr.DataFrame(interactive=False)
+        gr.Markdown(
+            "The cost is computed from the `KH_LLM_PRICING` setting. The usage is "
+            "estimated with a local tokenizer when the model does not report it."
+        )
+
+    def on_register_events(self):
+        gr.on(
+            triggers=[self.btn_refresh.click, self.group_by.change],
+            fn=self.list_usage,
+            inputs=[self.group_by, self._app.user_id],
+            outputs=[self.usage_list],
+        )
+
+    def list_usage(self, group_by, user_id):
+        if user_id is None:
+            return pd.DataFrame(columns=[group_by] + USAGE_COLUMNS)
+
+        with Session(engine) as session:
+            user = session.exec(select(User).where(User.id == user_id)).first()
+            is_admin = bool(user and user.admin) or not self._app.f_user_management
+            if group_by == "user" and not is_admin:
+                gr.Warning("Only the admins can see the usage of the users")
+                return pd.DataFrame(columns=[group_by] + USAGE_COLUMNS)
+
+            rows = summarize_usage(
+                session, group_by=group_by, user=None if is_admin else user_id
+            )
+
+            # show the names instead of the ids
+            if group_by == "user":
+                names = dict(session.exec(select(User.id, User.username)).all())
+            elif group_by == "conversation_id":
+                ids = [row[group_by] for row in rows]
+                names = dict(
+                    session.exec(
+                        select(Conversation.id, Conversation.name).where(
+                            Conversation.id.in_(ids)  # type: ignore
+                        )
+                    ).all()
+                )
+            else:
+                names = {}
+
+        for row in rows:
+            row[group_by] = names.get(row[group_by], row[group_by]) or "-"
+            row["cost"] = round(row["cost"], 4)
+        return pd.DataFrame.from_records(rows, columns=[group_by] + USAGE_COLUMNS)
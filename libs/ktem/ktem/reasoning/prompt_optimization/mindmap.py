@@ -5,6 +5,7 @@ from ktem.llms.manager import llms
 
 from kotaemon.base import BaseComponent, Document, HumanMessage, Node, SystemMessage
 from kotaemon.llms import ChatLLM, PromptTemplate
+from kotaemon.llms.cache import cached_llm
 
 logger = logging.getLogger(__name__)
 
@@ -37,7 +38,11 @@ MINDMAP_HTML_EXPORT_TEMPLATE = dedent(
 class CreateMindmapPipeline(BaseComponent):
     """Create a mindmap from the question and context"""
 
-    llm: ChatLLM = Node(default_callback=lambda _: llms.get_default())
+    llm: ChatLLM = Node(
+        default_callback=lambda _: cached_llm(
+            llms.get_default(), "CreateMindmapPipeline"
+        )
+    )
 
     SYSTEM_PROMPT = """
 From now on you will behave as "MapGPT" and, for every text the user will submit, you are going to create a PlantUML mind map file for the inputted text to best describe main ideas. Format it as a code and remember that the mind map should be in the same language as the inputted context. You don't have to provide a general example for the mind map format before the user inputs the text.
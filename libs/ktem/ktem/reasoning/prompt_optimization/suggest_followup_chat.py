@@ -4,6 +4,7 @@ from ktem.llms.manager import llms
 
 from kotaemon.base import AIMessage, BaseComponent, Document, HumanMessage, Node
 from kotaemon.llms import ChatLLM, PromptTemplate
+from kotaemon.llms.cache import cached_llm
 
 logger = logging.getLogger(__name__)
 
@@ -11,7 +12,11 @@ logger = logging.getLogger(__name__)
 class SuggestFollowupQuesPipeline(BaseComponent):
     """Suggest a list of follow-up questions based on the chat history."""
 
-    llm: ChatLLM = Node(default_callback=lambda _: llms.get_default())
+    llm: ChatLLM = Node(
+        default_callback=lambda _: cached_llm(
+            llms.get_default(), "SuggestFollowupQuesPipeline"
+        )
+    )
     SUGGEST_QUESTIONS_PROMPT_TEMPLATE = (
         "Based on the chat history above. "
         "your task is to generate 3 to 5 relevant follow-up questions. "
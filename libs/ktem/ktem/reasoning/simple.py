@@ -1,5 +1,6 @@
 import logging
 import threading
+from contextvars import copy_context
 from textwrap import dedent
 from typing import Generator
 
@@ -11,7 +12,7 @@ from ktem.reasoning.prompt_optimization import (
     RewriteQuestionPipeline,
 )
 from ktem.utils.render import Render
-from ktem.utils.visualize_cited import CreateCitationVizPipeline
+from ktem.utils.visualize_cited import CreateCitationVizPipeline, embedding_key
 from plotly.io import to_json
 
 from kotaemon.base import (
@@ -32,6 +33,7 @@ from kotaemon.indices.qa.citation_qa_inline import AnswerWithInlineCitation
 from kotaemon.indices.qa.format_context import PrepareEvidencePipeline
 from kotaemon.indices.qa.utils import replace_think_tag_with_details
 from kotaemon.llms import ChatLLM
+from kotaemon.llms.cache import cached_llm
 
 from ..utils import SUPPORTED_LANGUAGE_MAP
 from .base import BaseReasoning
@@ -203,6 +205,41 @@ class FullQAPipeline(BaseReasoning):
 
         return mindmap_content
 
+    def get_stored_vectors(self, docs) -> list:
+        """Get the vectors of the retrieved documents from the vector stores of the
+        indices using the embedding model of the citation visualization (None for
+        the documents without stored vector)"""
+        model_key = embedding_key(self.create_citation_viz_pipeline.embedding)
+        doc_ids = [doc.doc_id for doc in docs]
+        vectors: dict = {}
+        for retriever in self.retrievers:
+            vector_store = getattr(retriever, "VS", None)
+            embedding = getattr(retriever, "embedding", None)
+            if vector_store is None or embedding is None:
+                continue
+            if embedding_key(embedding) != model_key:
+                continue
+            missing = [doc_id for doc_id in doc_ids if doc_id not in vectors]
+            if not missing:
+                break
+            try:
+                vectors.update(vector_store.get_embeddings(missing))
+            except Exception as e:
+                logger.warning(f"Failed to get the stored vectors: {e}")
+        return [vectors.get(doc_id) for doc_id in doc_ids]
+
+    def get_citation_viz_key(self) -> tuple:
+        """The key of the projector of the citation visualization, shared by the
+        questions on the same indices with the same embedding model"""
+        indices = sorted(
+            getattr(getattr(retriever, "Index", None), "__tablename__", "")
+            for retriever in self.retrievers
+        )
+        return (
+            *indices,
+            embedding_key(self.create_citation_viz_pipeline.embedding),
+        )
+
     def prepare_citation_viz(self, answer, question, docs) -> Document | None:
         doc_texts = [doc.text for doc in docs]
         citation_plot = None
@@ -210,9 +247,14 @@ class FullQAPipeline(BaseReasoning):
 
         if answer.metadata["citation_viz"] and len(docs) > 1:
             try:
-                citation_plot = self.create_citation_viz_pipeline(doc_texts, question)
+                citation_plot = self.create_citation_viz_pipeline(
+                    doc_texts,
+                    question,
+                    vectors=self.get_stored_vectors(docs),
+                    cache_key=self.get_citation_viz_key(),
+                )
             except Exception as e:
-                print("Failed to create citation plot:", e)
+                logger.warning(f"Failed to create citation plot: {e}")
 
             if citation_plot:
                 plot = to_json(citation_plot)
@@ -282,14 +324,14 @@ class FullQAPipeline(BaseReasoning):
         self, message: str, conv_id: str, history: list, **kwargs  # type: ignore
     ) -> Generator[Document, None, Document]:
         if self.use_rewrite and self.rewrite_pipeline:
-            print("Chosen rewrite pipeline", self.rewrite_pipeline)
+            logger.debug(f"Chosen rewrite pipeline {self.rewrite_pipeline}")
             message = self.rewrite_pipeline(question=message).text
-            print("Rewrite result", message)
+            logger.debug(f"Rewrite result {message}")
 
-        print(f"Retrievers {self.retrievers}")
+        logger.debug(f"Retrievers {self.retrievers}")
         # should populate the context
         docs, infos = self.retrieve(message, history)
-        print(f"Got {len(docs)} retrieved documents")
+        logger.debug(f"Got {len(docs)} retrieved documents")
         yield from infos
 
         evidence_mode, evidence, images = self.evidence_pipeline(docs).content
@@ -300,7 +342,10 @@ class FullQAPipeline(BaseReasoning):
 
         # generate relevant score using
         if evidence and self.retrievers:
-            scoring_thread = threading.Thread(target=generate_relevant_scores)
+            # traced in the span of the answer
+            scoring_thread = threading.Thread(
+                target=copy_context().run, args=(generate_relevant_scores,)
+            )
             scoring_thread.start()
         else:
             scoring_thread = None
@@ -312,6 +357,7 @@ class FullQAPipeline(BaseReasoning):
             evidence_mode=evidence_mode,
             images=images,
             conv_id=conv_id,
+            docs=docs,
             **kwargs,
         )
 
@@ -366,7 +412,9 @@ class FullQAPipeline(BaseReasoning):
             answer_pipeline = pipeline.answering_pipeline = AnswerWithContextPipeline()
 
         answer_pipeline.llm = llm
-        answer_pipeline.citation_pipeline.llm = llm
+        answer_pipeline.citation_pipeline.llm = cached_llm(
+            llm, answer_pipeline.citation_pipeline
+        )
         answer_pipeline.n_last_interactions = settings[f"{prefix}.n_last_interactions"]
         answer_pipeline.enable_citation = (
             settings[f"{prefix}.highlight_citation"] != "off"
@@ -388,7 +436,7 @@ class FullQAPipeline(BaseReasoning):
         pipeline.trigger_context = settings[f"{prefix}.trigger_context"]
         pipeline.use_rewrite = states.get("app", {}).get("regen", False)
         if pipeline.rewrite_pipeline:
-            pipeline.rewrite_pipeline.llm = llm
+            pipeline.rewrite_pipeline.llm = cached_llm(llm, pipeline.rewrite_pipeline)
             pipeline.rewrite_pipeline.lang = SUPPORTED_LANGUAGE_MAP.get(
                 settings["reasoning.lang"], "English"
             )
@@ -497,7 +545,7 @@ class FullDecomposeQAPipeline(FullQAPipeline):
             )
             # should populate the context
             docs, infos = self.retrieve(message, history)
-            print(f"Got {len(docs)} retrieved documents")
+            logger.debug(f"Got {len(docs)} retrieved documents")
 
             yield from infos
 
@@ -523,9 +571,9 @@ class FullDecomposeQAPipeline(FullQAPipeline):
     ) -> Generator[Document, None, Document]:
         sub_question_answer_output = ""
         if self.rewrite_pipeline:
-            print("Chosen rewrite pipeline", self.rewrite_pipeline)
+            logger.debug(f"Chosen rewrite pipeline {self.rewrite_pipeline}")
             result = self.rewrite_pipeline(question=message)
-            print("Rewrite result", result)
+            logger.debug(f"Rewrite result {result}")
             if isinstance(result, Document):
                 message = result.text
             elif (
@@ -548,7 +596,7 @@ class FullDecomposeQAPipeline(FullQAPipeline):
 
         # should populate the context
         docs, infos = self.retrieve(message, history)
-        print(f"Got {len(docs)} retrieved documents")
+        logger.debug(f"Got {len(docs)} retrieved documents")
         yield from infos
 
         evidence_mode, evidence, images = self.evidence_pipeline(docs).content
@@ -559,6 +607,7 @@ class FullDecomposeQAPipeline(FullQAPipeline):
             evidence_mode=evidence_mode,
             images=images,
             conv_id=conv_id,
+            docs=docs,
             **kwargs,
         )
 
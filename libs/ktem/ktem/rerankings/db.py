@@ -32,5 +32,7 @@ class RerankingTable(__base_reranking):  # type: ignore
     __tablename__ = "reranking"
 
 
-if not getattr(flowsettings, "KH_ENABLE_ALEMBIC", False):
-    RerankingTable.metadata.create_all(engine)
+def init_db():
+    """Create the table of the reranking models, unless managed by alembic"""
+    if not getattr(flowsettings, "KH_ENABLE_ALEMBIC", False):
+        RerankingTable.metadata.create_all(engine)
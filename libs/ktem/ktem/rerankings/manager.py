@@ -1,24 +1,25 @@
 from typing import Optional, Type
 
+from ktem.utils.lazy_models import LazyModels
 from sqlalchemy import select
 from sqlalchemy.orm import Session
 from theflow.settings import settings as flowsettings
-from theflow.utils.modules import deserialize
 
 from kotaemon.rerankings.base import BaseReranking
 
-from .db import RerankingTable, engine
+from .db import RerankingTable, engine, init_db
 
 
 class RerankingManager:
     """Represent a pool of rerankings models"""
 
     def __init__(self):
-        self._models: dict[str, BaseReranking] = {}
+        self._models = LazyModels()
         self._info: dict[str, dict] = {}
         self._default: str = ""
         self._vendors: list[Type] = []
 
+        init_db()
         # populate the pool if empty
         if hasattr(flowsettings, "KH_RERANKINGS"):
             with Session(engine) as sess:
@@ -36,13 +37,13 @@ class RerankingManager:
 
     def load(self):
         """Load the model pool from database"""
-        self._models, self._info, self._default = {}, {}, ""
+        self._models, self._info, self._default = LazyModels(), {}, ""
         with Session(engine) as sess:
             stmt = select(RerankingTable)
             items = sess.execute(stmt)
 
             for (item,) in items:
-                self._models[item.name] = deserialize(item.spec, safe=False)
+                self._models.set_spec(item.name, item.spec)
                 self._info[item.name] = {
                     "name": item.name,
                     "spec": item.spec,
@@ -54,11 +55,17 @@ class RerankingManager:
     def load_vendors(self):
         from kotaemon.rerankings import (
             CohereReranking,
+            ONNXCrossEncoderReranking,
             TeiFastReranking,
             VoyageAIReranking,
         )
 
-        self._vendors = [TeiFastReranking, CohereReranking, VoyageAIReranking]
+        self._vendors = [
+            TeiFastReranking,
+            CohereReranking,
+            VoyageAIReranking,
+            ONNXCrossEncoderReranking,
+        ]
 
     def __getitem__(self, key: str) -> BaseReranking:
         """Get model by name"""
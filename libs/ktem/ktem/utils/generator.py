@@ -1,3 +1,9 @@
+import time
+from typing import Any, Callable, Iterable, Iterator, NamedTuple, Optional
+
+from kotaemon.base import Document
+
+
 class Generator:
     """A generator that stores return value from another generator"""
 
@@ -7,3 +13,90 @@ class Generator:
     def __iter__(self):
         self.value = yield from self.gen
         return self.value
+
+
+class ChatStreamUpdate(NamedTuple):
+    """Snapshot of a chat stream sent to the UI
+
+    Attributes:
+        text: the answer so far
+        refs: the content of the information panel so far
+        refs_changed: whether `refs` changed since the previous snapshot
+        plot: the plot, if any
+        plot_changed: whether `plot` changed since the previous snapshot
+    """
+
+    text: str
+    refs: str
+    refs_changed: bool
+    plot: Optional[Any]
+    plot_changed: bool
+
+
+def coalesce_chat_stream(
+    responses: Iterable[Any],
+    interval: float = 0.08,
+    max_tokens: int = 64,
+    clock: Callable[[], float] = time.monotonic,
+) -> Iterator[ChatStreamUpdate]:
+    """Merge the responses of a reasoning pipeline into snapshots for the UI
+
+    Re-rendering the chat on every token costs a diff and a message to the browser
+    per token. The snapshots are instead emitted at most every `interval` seconds,
+    or when `max_tokens` responses are pending, and always at the end of the
+    stream. The information panel and the plot are flagged as changed only when
+    they differ from the previous snapshot, so that they are not sent again.
+
+    Args:
+        responses: the `Document` responses of the pipeline, on the "chat", "info"
+            and "plot" channels
+        interval: the minimum time (seconds) between two snapshots, 0 to emit a
+            snapshot for every response
+        max_tokens: emit a snapshot once this number of responses is pending,
+            even before `interval`, 0 to disable
+        clock: the time function, for testing
+    """
+    text, refs, plot = "", "", None
+    sent_refs, sent_plot = "", None
+    pending = 0
+    last_flush = clock()
+
+    def snapshot() -> ChatStreamUpdate:
+        nonlocal sent_refs, sent_plot, pending, last_flush
+        update = ChatStreamUpdate(
+            text=text,
+            refs=refs,
+            refs_changed=refs != sent_refs,
+            plot=plot,
+            plot_changed=plot is not sent_plot,
+        )
+        sent_refs, sent_plot = refs, plot
+        pending = 0
+        last_flush = clock()
+        return update
+
+    try:
+        for response in responses:
+            if not isinstance(response, Document) or response.channel is None:
+                continue
+
+            if response.channel == "chat":
+                text = "" if response.content is None else text + response.content
+            elif response.channel == "info":
+                refs = "" if response.content is None else refs + response.content
+            elif response.channel == "plot":
+                plot = response.content
+            pending += 1
+
+            if clock() - last_flush >= interval or (
+                max_tokens and pending >= max_tokens
+            ):
+                yield snapshot()
+    except Exception:
+        # show what was streamed before the error
+        if pending:
+            yield snapshot()
+        raise
+
+    if pending:
+        yield snapshot()
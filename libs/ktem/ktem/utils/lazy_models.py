@@ -0,0 +1,167 @@
+"""Models of the pools built on first use, and their warmup
+
+The model pools (LLMs, embeddings, rerankings...) keep the spec of each model and
+only deserialize it the first time it is accessed, so that the SDKs, clients and
+local weights of the models that are never used are not loaded at startup.
+
+The models listed in the `KH_MODEL_WARMUP` setting are loaded in the background
+once the app is built, so that the first query does not wait for them. Each item
+is "<pool>:<model name>", the pool being "llms", "embeddings" or "rerankings" and
+the name "default" meaning the default model of the pool, e.g.
+"embeddings:default,rerankings:default". The embedding and reranking models also
+process a tiny input, which loads their local weights or opens their
+connections; the LLMs are only built, to not spend tokens.
+"""
+import logging
+import threading
+from collections.abc import MutableMapping
+from typing import Any, Iterator, Optional
+
+from theflow.settings import settings as flowsettings
+from theflow.utils.modules import deserialize
+
+logger = logging.getLogger(__name__)
+
+
+class LazyModels(MutableMapping):
+    """Models by name, each deserialized from its spec on first access
+
+    Concurrent first accesses to a model build it once. An alias (e.g. "default")
+    gives the same model instance as its target.
+    """
+
+    def __init__(self):
+        self._keys: dict[str, None] = {}
+        self._specs: dict[str, dict] = {}
+        self._aliases: dict[str, str] = {}
+        self._models: dict[str, Any] = {}
+        self._locks: dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def set_spec(self, name: str, spec: dict):
+        """Add (or replace) a model by its spec, it is built on first access"""
+        with self._lock:
+            self._keys[name] = None
+            self._specs[name] = spec
+            self._models.pop(name, None)
+
+    def set_alias(self, alias: str, name: str):
+        """Make `alias` give the model `name`"""
+        with self._lock:
+            self._keys[alias] = None
+            self._aliases[alias] = name
+
+    def is_loaded(self, key: str) -> bool:
+        """Whether the model has already been built"""
+        return self._aliases.get(key, key) in self._models
+
+    def __getitem__(self, key: str) -> Any:
+        name = self._aliases.get(key, key)
+        model = self._models.get(name)
+        if model is not None:
+            return model
+
+        with self._lock:
+            if name not in self._specs:
+                raise KeyError(key)
+            spec = self._specs[name]
+            lock = self._locks.setdefault(name, threading.Lock())
+
+        # build the models in parallel, but each model only once
+        with lock:
+            model = self._models.get(name)
+            if model is None:
+                logger.info(f"Loading model {name}")
+                model = deserialize(spec, safe=False)
+                with self._lock:
+                    # the spec may have been replaced meanwhile
+                    if self._specs.get(name) is spec:
+                        self._models[name] = model
+        return model
+
+    def __setitem__(self, key: str, model: Any):
+        with self._lock:
+            self._keys[key] = None
+            self._aliases.pop(key, None)
+            self._specs.pop(key, None)
+            self._models[key] = model
+
+    def __delitem__(self, key: str):
+        with self._lock:
+            del self._keys[key]
+            self._aliases.pop(key, None)
+            self._specs.pop(key, None)
+            self._models.pop(key, None)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._keys
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._keys))
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+
+def parse_warmup(value: Any) -> list[tuple[str, str]]:
+    """Parse the warmup list: "pool:name" items, comma separated or as a list"""
+    if isinstance(value, str):
+        value = value.split(",")
+    items = []
+    for item in value or []:
+        pool, _, name = item.strip().partition(":")
+        if pool and name:
+            items.append((pool.strip(), name.strip()))
+        elif item.strip():
+            logger.warning(f"Invalid model warmup item {item}, expected pool:name")
+    return items
+
+
+def get_pool(pool: str):
+    """Get a model pool by its name in the warmup list"""
+    if pool == "llms":
+        from ktem.llms.manager import llms
+
+        return llms
+    if pool == "embeddings":
+        from ktem.embeddings.manager import embedding_models_manager
+
+        return embedding_models_manager
+    if pool == "rerankings":
+        from ktem.rerankings.manager import reranking_models_manager
+
+        return reranking_models_manager
+    raise ValueError(f"Unknown model pool {pool}")
+
+
+def warmup_model(pool: str, name: str):
+    """Build a model of a pool, and run it on a tiny input if it is cheap"""
+    from kotaemon.base import Document
+
+    manager = get_pool(pool)
+    model = manager[manager.get_default_name() if name == "default" else name]
+    if pool == "embeddings":
+        model("warmup")
+    elif pool == "rerankings":
+        model(documents=[Document(text="warmup")], query="warmup")
+
+
+def start_warmup(value: Optional[Any] = None) -> Optional[threading.Thread]:
+    """Warm the models of the `KH_MODEL_WARMUP` setting up in a background thread"""
+    items = parse_warmup(
+        value if value is not None else getattr(flowsettings, "KH_MODEL_WARMUP", "")
+    )
+    if not items:
+        return None
+
+    def warmup():
+        for pool, name in items:
+            try:
+                warmup_model(pool, name)
+                logger.info(f"Warmed up {pool}:{name}")
+            except Exception as e:
+                logger.warning(f"Failed to warm up {pool}:{name}: {e}")
+
+    thread = threading.Thread(target=warmup, name="model-warmup", daemon=True)
+    thread.start()
+    return thread
@@ -138,6 +138,35 @@ class Render:
             return f"<figure>{img}{caption}</figure><br>"
         return img
 
+    @staticmethod
+    def usage(rows: list[dict]) -> str:
+        """Render the token usage of a chat turn (see `ktem.db.usage.usage_rows`)
+        as a collapsible table, by pipeline stage and model"""
+        prompt_tokens = sum(row["prompt_tokens"] for row in rows)
+        completion_tokens = sum(row["completion_tokens"] for row in rows)
+        cost = sum(row["cost"] for row in rows)
+        estimated = any(row["estimated"] for row in rows)
+
+        lines = [
+            "| Stage | Model | Calls | Input tokens | Output tokens | Cost (USD) |",
+            "|---|---|---|---|---|---|",
+        ]
+        for row in sorted(
+            rows, key=lambda row: (row["cost"], row["total_tokens"]), reverse=True
+        ):
+            lines.append(
+                f"| {row['stage'] or '-'} | {row['model']} | {row['calls']} "
+                f"| {row['prompt_tokens']} | {row['completion_tokens']} "
+                f"| {row['cost']:.4f} |"
+            )
+
+        header = (
+            f"<i>Usage: {prompt_tokens + completion_tokens} tokens "
+            f"({prompt_tokens} in, {completion_tokens} out), ${cost:.4f}"
+            f"{' (estimated)' if estimated else ''}</i>"
+        )
+        return Render.collapsible(header=header, content=Render.table("\n".join(lines)))
+
     @staticmethod
     def collapsible_with_header(
         doc: RetrievedDocument,
@@ -0,0 +1,169 @@
+"""Server-side store of the heavy per-session values of the UI
+
+The values (retrieval panels, plots...) are kept on the server and the gradio
+states only hold their keys, so that the states stay small whatever the length of
+the conversation. The store is bounded: the least recently used values are
+evicted, the UI must then be able to rebuild them (e.g. from the database).
+
+The store is selected with the `KH_SESSION_STORE` setting:
+    - "memory" (default): in-process LRU, `KH_SESSION_STORE_MAX_ITEMS` values
+    - "sqlite": SQLite file at `KH_SESSION_STORE_PATH`, shared by the worker
+      processes of the app, `KH_SESSION_STORE_MAX_ITEMS` values
+"""
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Optional
+
+from theflow.settings import settings
+
+
+class BaseSessionStore:
+    """Key-value store of the session values"""
+
+    def get(self, key: str, default: Any = None) -> Any:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any):
+        raise NotImplementedError
+
+    def delete(self, *keys: str):
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def put(self, value: Any) -> str:
+        """Store a value under a new key and return the key"""
+        key = uuid.uuid4().hex
+        self.set(key, value)
+        return key
+
+
+class InMemorySessionStore(BaseSessionStore):
+    """Least recently used values of the current process"""
+
+    def __init__(self, max_items: int = 1000):
+        self.max_items = max_items
+        self._data: OrderedDict[str, Any] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key: str, value: Any):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_items:
+                self._data.popitem(last=False)
+
+    def delete(self, *keys: str):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteSessionStore(BaseSessionStore):
+    """Least recently used values in a SQLite file, as JSON
+
+    The store is shared by the processes using the same file. The eviction runs
+    every `evict_every` writes, so the store may briefly hold a few more values
+    than `max_items`.
+    """
+
+    def __init__(self, path: str, max_items: int = 10000, evict_every: int = 100):
+        self.path = path
+        self.max_items = max_items
+        self.evict_every = evict_every
+        self._local = threading.local()
+        self._writes = 0
+        self._lock = threading.Lock()
+
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS session_store "
+            "(key TEXT PRIMARY KEY, value TEXT, accessed REAL)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_session_store_accessed "
+            "ON session_store (accessed)"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str, default: Any = None) -> Any:
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT value FROM session_store WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return default
+        conn.execute(
+            "UPDATE session_store SET accessed = ? WHERE key = ?", (time.time(), key)
+        )
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any):
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO session_store (key, value, accessed) "
+            "VALUES (?, ?, ?)",
+            (key, json.dumps(value), time.time()),
+        )
+        with self._lock:
+            self._writes += 1
+            evict = self._writes % self.evict_every == 0
+        if evict:
+            self.evict()
+
+    def delete(self, *keys: str):
+        if keys:
+            self._conn().executemany(
+                "DELETE FROM session_store WHERE key = ?", [(key,) for key in keys]
+            )
+
+    def evict(self):
+        """Delete the least recently used values above `max_items`"""
+        self._conn().execute(
+            "DELETE FROM session_store WHERE key IN (SELECT key FROM session_store "
+            "ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+            (self.max_items,),
+        )
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM session_store").fetchone()[0]
+
+
+@lru_cache
+def get_session_store(backend: Optional[str] = None) -> BaseSessionStore:
+    """Get the session store of the app, as configured by the settings"""
+    backend = backend or getattr(settings, "KH_SESSION_STORE", "memory")
+    if backend == "memory":
+        return InMemorySessionStore(
+            max_items=getattr(settings, "KH_SESSION_STORE_MAX_ITEMS", 1000)
+        )
+    if backend == "sqlite":
+        return SQLiteSessionStore(
+            path=getattr(settings, "KH_SESSION_STORE_PATH", "session_store.db"),
+            max_items=getattr(settings, "KH_SESSION_STORE_MAX_ITEMS", 1000),
+        )
+    raise ValueError(f"Unknown session store: {backend}")
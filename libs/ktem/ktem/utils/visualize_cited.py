@@ -6,15 +6,18 @@ Refs:
 1. [RAGxplorer](https://github.com/gabrielchua/RAGxplorer)
 2. [RAGVizExpander](https://github.com/KKenny0/RAGVizExpander)
 """
-from typing import List, Tuple
+import json
+import threading
+from typing import Any, List, Optional, Tuple
 
 import numpy as np
 import pandas as pd
 import plotly.graph_objs as go
-import umap
+from theflow.settings import settings as flowsettings
 
-from kotaemon.base import BaseComponent
+from kotaemon.base import BaseComponent, Param
 from kotaemon.embeddings import BaseEmbeddings
+from kotaemon.llms.cache import model_spec
 
 VISUALIZATION_SETTINGS = {
     "Original Query": {"color": "red", "opacity": 1, "symbol": "cross", "size": 15},
@@ -23,25 +26,144 @@ VISUALIZATION_SETTINGS = {
     "Sub-Questions": {"color": "purple", "opacity": 1, "symbol": "star", "size": 15},
 }
 
+PROJECTION_METHODS = ("umap", "pca", "random")
+
+
+class PCAProjector:
+    """Project on the 2 principal components of the fitted embeddings"""
+
+    def fit(self, embeddings: np.ndarray) -> "PCAProjector":
+        self.mean = embeddings.mean(axis=0)
+        _, _, vt = np.linalg.svd(embeddings - self.mean, full_matrices=False)
+        components = np.zeros((2, embeddings.shape[1]))
+        components[: len(vt[:2])] = vt[:2]
+        self.components = components
+        return self
+
+    def transform(self, embeddings: np.ndarray) -> np.ndarray:
+        return (embeddings - self.mean) @ self.components.T
+
+
+class RandomProjector:
+    """Project on 2 random directions, the same for a given embedding size"""
+
+    def __init__(self, seed: int = 0):
+        self.seed = seed
+
+    def fit(self, embeddings: np.ndarray) -> "RandomProjector":
+        rng = np.random.default_rng(self.seed)
+        self.components = rng.standard_normal((2, embeddings.shape[1]))
+        self.components /= np.linalg.norm(self.components, axis=1, keepdims=True)
+        return self
+
+    def transform(self, embeddings: np.ndarray) -> np.ndarray:
+        return embeddings @ self.components.T
+
+
+def make_projector(method: str):
+    """Create an unfitted projector: `fit(embeddings)` then `transform(embeddings)`"""
+    if method == "umap":
+        import umap
+
+        return umap.UMAP()
+    if method == "pca":
+        return PCAProjector()
+    if method == "random":
+        return RandomProjector()
+    raise ValueError(
+        f"Unknown projection method {method}, expected one of {PROJECTION_METHODS}"
+    )
+
+
+def embedding_key(embedding: BaseEmbeddings) -> str:
+    """The identity of an embedding model in the projector keys: its class and
+    params without the secrets, else its class"""
+    try:
+        return json.dumps(model_spec(embedding), sort_keys=True, default=str)
+    except Exception:
+        return f"{type(embedding).__module__}.{type(embedding).__qualname__}"
+
+
+class ProjectorCache:
+    """Projectors fitted per index, reused by the next plots of the index
+
+    The embeddings of the plotted chunks are added to a sample of the index (at
+    most `max_samples` embeddings), and the projector is only fitted again once
+    the sample has grown by `refit_growth` since the last fit. The next plots of
+    the index are then only projected with the fitted projector.
+    """
+
+    def __init__(self, max_samples: int = 2000, refit_growth: float = 2.0):
+        self.max_samples = max_samples
+        self.refit_growth = refit_growth
+        self._entries: dict[tuple, dict] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple, method: str, texts: List[str], embeddings: np.ndarray):
+        """Get the projector of an index, after adding the plotted embeddings to its
+        sample
+
+        Args:
+            key: the key of the index and of the embedding model (see
+                `embedding_key`), the projections of different models differ
+            method: the projection method
+            texts: the plotted chunks, to not sample them twice
+            embeddings: the embeddings of the plotted chunks
+        """
+        key = (*key, method, embeddings.shape[1])
+        with self._lock:
+            entry = self._entries.setdefault(
+                key, {"samples": {}, "projector": None, "fitted_on": 0}
+            )
+            samples = entry["samples"]
+            for text, embedding in zip(texts, embeddings):
+                if len(samples) >= self.max_samples:
+                    break
+                samples.setdefault(text, embedding)
+
+            if (
+                entry["projector"] is None
+                or len(samples) >= entry["fitted_on"] * self.refit_growth
+            ):
+                entry["projector"] = make_projector(method).fit(
+                    np.array(list(samples.values()))
+                )
+                entry["fitted_on"] = len(samples)
+            return entry["projector"]
+
+
+projector_cache = ProjectorCache()
+
 
 class CreateCitationVizPipeline(BaseComponent):
-    """Creating PlotData for visualizing query results"""
+    """Creating PlotData for visualizing query results
 
-    embedding: BaseEmbeddings
-    projector: umap.UMAP = None
+    The chunks are projected in 2D with `method`: "umap" (fitted on the retrieved
+    chunks, the slowest), "pca" or "random" (a random projection, the fastest).
+    """
 
-    def _set_up_umap(self, embeddings: np.ndarray):
-        umap_transform = umap.UMAP().fit(embeddings)
-        return umap_transform
+    embedding: BaseEmbeddings
+    method: str = Param(
+        getattr(flowsettings, "KH_CITATION_VIZ_METHOD", "umap"),
+        help="The projection method: umap, pca or random",
+    )
+    projector: Any = None
 
-    def _project_embeddings(self, embeddings, umap_transform) -> np.ndarray:
-        umap_embeddings = np.empty((len(embeddings), 2))
-        for i, embedding in enumerate(embeddings):
-            umap_embeddings[i] = umap_transform.transform([embedding])
-        return umap_embeddings
+    def _get_embeddings(
+        self, context: List[str], vectors: Optional[list] = None
+    ) -> np.ndarray:
+        """Get the embeddings of the chunks, only the chunks without a stored
+        vector are embedded, in one batch"""
+        vectors = list(vectors) if vectors else [None] * len(context)
+        missing = [idx for idx, vector in enumerate(vectors) if vector is None]
+        if missing:
+            embedded = self.embedding([context[idx] for idx in missing])
+            for idx, doc in zip(missing, embedded):
+                vectors[idx] = doc.embedding
+        return np.array(vectors, dtype=float)
 
-    def _get_projections(self, embeddings, umap_transform):
-        projections = self._project_embeddings(embeddings, umap_transform)
+    def _get_projections(self, embeddings, projector):
+        projections = projector.transform(np.asarray(embeddings))
         x = projections[:, 0]
         y = projections[:, 1]
         return x, y
@@ -110,31 +232,52 @@ class CreateCitationVizPipeline(BaseComponent):
         )
         return fig
 
-    def run(self, context: List[str], question: str):
-        embed_contexts = self.embedding(context)
-        context_embeddings = np.array([d.embedding for d in embed_contexts])
+    def run(
+        self,
+        context: List[str],
+        question: str,
+        vectors: Optional[list] = None,
+        cache_key: Optional[tuple] = None,
+    ):
+        """Plot the retrieved chunks and the question
 
-        self.projector = self._set_up_umap(embeddings=context_embeddings)
+        Args:
+            context: the texts of the retrieved chunks
+            question: the question
+            vectors: the stored embeddings of the chunks (None for the chunks to
+                embed), they must come from the same embedding model
+            cache_key: reuse the projector fitted for this key (e.g. the indices of
+                the chunks), instead of fitting one on the chunks
+        """
+        context_embeddings = self._get_embeddings(context, vectors)
+        query_embedding = np.array([self.embedding(question)[0].embedding])
+        if query_embedding.shape[1] != context_embeddings.shape[1]:
+            # the stored vectors come from another embedding model
+            context_embeddings = self._get_embeddings(context)
+
+        if cache_key is None:
+            self.projector = make_projector(self.method).fit(context_embeddings)
+        else:
+            self.projector = projector_cache.get(
+                cache_key, self.method, context, context_embeddings
+            )
 
-        embed_query = self.embedding(question)
-        query_projection = self._get_projections(
-            embeddings=[embed_query[0].embedding], umap_transform=self.projector
+        # project the chunks and the question in one batch
+        x, y = self._get_projections(
+            np.vstack([context_embeddings, query_embedding]), self.projector
         )
         viz_query_df = pd.DataFrame(
             {
-                "x": [query_projection[0][0]],
-                "y": [query_projection[1][0]],
+                "x": [x[-1]],
+                "y": [y[-1]],
                 "document_cleaned": question,
                 "category": "Original Query",
                 "size": 5,
             }
         )
 
-        context_projections = self._get_projections(
-            embeddings=context_embeddings, umap_transform=self.projector
-        )
         viz_base_df = self._prepare_projection_df(
-            document_projections=context_projections, document_text=context
+            document_projections=(x[:-1], y[:-1]), document_text=context
         )
 
         visualization_df = pd.concat([viz_base_df, viz_query_df], axis=0)
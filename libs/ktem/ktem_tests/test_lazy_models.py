@@ -0,0 +1,130 @@
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+from ktem.utils.lazy_models import LazyModels, parse_warmup, start_warmup
+
+
+class _Model:
+    def __init__(self, spec):
+        self.spec = spec
+
+
+@pytest.fixture
+def builds():
+    """The specs deserialized by the models, slowly to expose the races"""
+    built = []
+
+    def deserialize(spec, safe=False):
+        built.append(spec)
+        time.sleep(0.02)
+        return _Model(spec)
+
+    with patch("ktem.utils.lazy_models.deserialize", side_effect=deserialize):
+        yield built
+
+
+def test_concurrent_first_access(builds):
+    models = LazyModels()
+    models.set_spec("a", {"name": "a"})
+
+    results = []
+    barrier = threading.Barrier(8)
+
+    def access():
+        barrier.wait()
+        results.append(models["a"])
+
+    threads = [threading.Thread(target=access) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(builds) == 1
+    assert all(model is results[0] for model in results)
+
+
+def test_alias(builds):
+    models = LazyModels()
+    models.set_spec("a", {"name": "a"})
+    models.set_alias("default", "a")
+
+    assert models["default"] is models["a"]
+    assert models.is_loaded("default")
+    assert len(builds) == 1
+
+
+def test_set_spec_rebuilds(builds):
+    models = LazyModels()
+    models.set_spec("a", {"name": "a", "version": 1})
+    first = models["a"]
+
+    models.set_spec("a", {"name": "a", "version": 2})
+    assert not models.is_loaded("a")
+    second = models["a"]
+    assert second is not first
+    assert second.spec["version"] == 2
+    assert models["a"] is second
+
+
+def test_listing_builds_nothing(builds):
+    models = LazyModels()
+    models.set_spec("a", {"name": "a"})
+    models.set_spec("b", {"name": "b"})
+    models.set_alias("default", "b")
+
+    assert list(models.keys()) == ["a", "b", "default"]
+    assert len(models) == 3
+    assert "a" in models and "c" not in models
+    assert not builds
+
+    with pytest.raises(KeyError):
+        models["c"]
+
+
+def test_options_builds_nothing(builds):
+    pytest.importorskip("sqlmodel")
+    from ktem.llms.manager import LLMManager
+
+    manager = LLMManager.__new__(LLMManager)
+    manager._models = LazyModels()
+    manager._models.set_spec("a", {"name": "a"})
+
+    assert list(manager.options().keys()) == ["a"]
+    assert not builds
+
+
+def test_parse_warmup():
+    assert parse_warmup("embeddings:default, rerankings:cohere") == [
+        ("embeddings", "default"),
+        ("rerankings", "cohere"),
+    ]
+    assert parse_warmup(["llms:gpt-4o"]) == [("llms", "gpt-4o")]
+    assert parse_warmup("") == []
+    assert parse_warmup(None) == []
+
+    # the malformed items are skipped
+    assert parse_warmup("embeddings, :default, llms:, ,rerankings:default") == [
+        ("rerankings", "default")
+    ]
+
+
+def test_start_warmup():
+    assert start_warmup("") is None
+
+    warmed = []
+
+    def warmup_model(pool, name):
+        if pool == "llms":
+            raise ValueError("no model")
+        warmed.append((pool, name))
+
+    with patch("ktem.utils.lazy_models.warmup_model", side_effect=warmup_model):
+        thread = start_warmup("llms:default,embeddings:default")
+        assert thread is not None
+        thread.join(timeout=5)
+
+    # a failed model does not stop the warmup of the next ones
+    assert warmed == [("embeddings", "default")]
@@ -0,0 +1,64 @@
+"""Add indexes and the token count to the file index tables
+
+Revision ID: 3f2b1c7d9a10
+Revises:
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+import re
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "3f2b1c7d9a10"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# the tables are created per file index, as `index__{index id}__index`
+INDEX_TABLE_PATTERN = re.compile(r"^index__(\d+)__index$")
+
+
+def _index_tables() -> list[tuple[str, str]]:
+    inspector = sa.inspect(op.get_bind())
+    tables = []
+    for table_name in inspector.get_table_names():
+        match = INDEX_TABLE_PATTERN.match(table_name)
+        if match:
+            tables.append((match.group(1), table_name))
+    return tables
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    for index_id, table_name in _index_tables():
+        columns = {column["name"] for column in inspector.get_columns(table_name)}
+        if "n_tokens" not in columns:
+            op.add_column(table_name, sa.Column("n_tokens", sa.Integer, nullable=True))
+
+        indexes = {index["name"] for index in inspector.get_indexes(table_name)}
+        name = f"ix_index__{index_id}__index_source_id_relation_type"
+        if name not in indexes:
+            op.create_index(name, table_name, ["source_id", "relation_type"])
+        name = f"ix_index__{index_id}__index_target_id"
+        if name not in indexes:
+            op.create_index(name, table_name, ["target_id"])
+
+
+def downgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    for index_id, table_name in _index_tables():
+        indexes = {index["name"] for index in inspector.get_indexes(table_name)}
+        for name in (
+            f"ix_index__{index_id}__index_source_id_relation_type",
+            f"ix_index__{index_id}__index_target_id",
+        ):
+            if name in indexes:
+                op.drop_index(name, table_name=table_name)
+
+        columns = {column["name"] for column in inspector.get_columns(table_name)}
+        if "n_tokens" in columns:
+            with op.batch_alter_table(table_name) as batch_op:
+                batch_op.drop_column("n_tokens")
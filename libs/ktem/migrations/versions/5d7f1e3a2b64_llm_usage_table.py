@@ -0,0 +1,50 @@
+"""Add the token usage table
+
+The token usage of the model calls of each conversation turn, summed by pipeline
+stage and model (`ktem.db.usage.save_usage`).
+
+Revision ID: 5d7f1e3a2b64
+Revises: 8c4e2a9b5d31
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "5d7f1e3a2b64"
+down_revision: Union[str, None] = "8c4e2a9b5d31"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLE_NAME = "ktem__llm_usage"
+
+
+def upgrade() -> None:
+    if TABLE_NAME in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table(
+        TABLE_NAME,
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("conversation_id", sa.String, nullable=False),
+        sa.Column("turn", sa.Integer, nullable=False),
+        sa.Column("user", sa.String, nullable=False),
+        sa.Column("stage", sa.String, nullable=False),
+        sa.Column("kind", sa.String, nullable=False),
+        sa.Column("model", sa.String, nullable=False),
+        sa.Column("calls", sa.Integer, nullable=False),
+        sa.Column("prompt_tokens", sa.Integer, nullable=False),
+        sa.Column("completion_tokens", sa.Integer, nullable=False),
+        sa.Column("cost", sa.Float, nullable=False),
+        sa.Column("estimated", sa.Boolean, nullable=False),
+        sa.Column("date_created", sa.DateTime, nullable=False),
+    )
+    for column in ("conversation_id", "user", "model"):
+        op.create_index(f"ix_{TABLE_NAME}_{column}", TABLE_NAME, [column])
+
+
+def downgrade() -> None:
+    if TABLE_NAME in sa.inspect(op.get_bind()).get_table_names():
+        op.drop_table(TABLE_NAME)
@@ -0,0 +1,62 @@
+"""Add the conversation turn tables
+
+The history of the conversations is moved from `ktem__conversation.data_source` to
+these tables when a conversation is selected or answered
+(`ktem.db.conversation.migrate_data_source`).
+
+Revision ID: 8c4e2a9b5d31
+Revises: 3f2b1c7d9a10
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "8c4e2a9b5d31"
+down_revision: Union[str, None] = "3f2b1c7d9a10"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _turn_columns() -> list[sa.Column]:
+    return [
+        sa.Column("conversation_id", sa.String, primary_key=True),
+        sa.Column("turn", sa.Integer, primary_key=True),
+    ]
+
+
+def upgrade() -> None:
+    tables = set(sa.inspect(op.get_bind()).get_table_names())
+    if "ktem__conversation_message" not in tables:
+        op.create_table(
+            "ktem__conversation_message",
+            *_turn_columns(),
+            sa.Column("message", sa.JSON),
+            sa.Column("date_created", sa.DateTime, nullable=False),
+        )
+    if "ktem__conversation_retrieval" not in tables:
+        op.create_table(
+            "ktem__conversation_retrieval",
+            *_turn_columns(),
+            sa.Column("content", sa.String, nullable=False),
+        )
+    if "ktem__conversation_plot" not in tables:
+        op.create_table(
+            "ktem__conversation_plot",
+            *_turn_columns(),
+            sa.Column("data", sa.JSON),
+        )
+
+
+def downgrade() -> None:
+    tables = set(sa.inspect(op.get_bind()).get_table_names())
+    for table_name in (
+        "ktem__conversation_message",
+        "ktem__conversation_retrieval",
+        "ktem__conversation_plot",
+    ):
+        if table_name in tables:
+            op.drop_table(table_name)
@@ -0,0 +1,52 @@
+"""Add the index of the file list sort to the file index tables
+
+The file lists are paginated and sorted by the database, by default on the date
+of creation of the files (`ktem.index.file.listing`).
+
+Revision ID: 9a6c3e1f7b42
+Revises: 5d7f1e3a2b64
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+import re
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "9a6c3e1f7b42"
+down_revision: Union[str, None] = "5d7f1e3a2b64"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# the tables are created per file index, as `index__{index id}__source`
+SOURCE_TABLE_PATTERN = re.compile(r"^index__(\d+)__source$")
+
+
+def _source_tables() -> list[tuple[str, str]]:
+    inspector = sa.inspect(op.get_bind())
+    tables = []
+    for table_name in inspector.get_table_names():
+        match = SOURCE_TABLE_PATTERN.match(table_name)
+        if match:
+            tables.append((match.group(1), table_name))
+    return tables
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    for index_id, table_name in _source_tables():
+        indexes = {index["name"] for index in inspector.get_indexes(table_name)}
+        name = f"ix_index__{index_id}__source_date_created"
+        if name not in indexes:
+            op.create_index(name, table_name, ["date_created"])
+
+
+def downgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    for index_id, table_name in _source_tables():
+        indexes = {index["name"] for index in inspector.get_indexes(table_name)}
+        name = f"ix_index__{index_id}__source_date_created"
+        if name in indexes:
+            op.drop_index(name, table_name=table_name)
@@ -0,0 +1,105 @@
+"""Measure the cost of streaming a chat answer to the UI.
+
+A stub LLM streams `--tokens` tokens (every `--token-delay` seconds) after an
+information panel of `--refs-kb` kilobytes, like a reasoning pipeline answering
+with its evidence. Each update of the chat page is serialized to JSON, as gradio
+does before diffing and sending it to the browser, either for every token (as
+before) or through `ktem.utils.generator.coalesce_chat_stream`. The script
+reports the number of UI updates, the serialized bytes, the server CPU time and the
+token throughput. Run it with the ktem package importable:
+
+    python scripts/benchmarks/chat_streaming.py --tokens 1000 --token-delay 0.002 \
+        --interval-ms 80 --max-tokens 64
+"""
+
+import argparse
+import json
+import random
+import time
+
+from ktem.utils.generator import coalesce_chat_stream
+
+from kotaemon.base import Document
+
+WORDS = (
+    "retrieval augmented generation document chunk embedding vector index query "
+    "answer citation model token context latency throughput reranker score page"
+).split()
+
+
+def stub_llm(num_tokens: int, token_delay: float, refs_kb: int):
+    rng = random.Random(0)
+    evidence = "<details><summary>Evidence</summary>" + "x" * 1024 + "</details>"
+    yield Document(channel="info", content=evidence * refs_kb)
+    for _ in range(num_tokens):
+        if token_delay:
+            time.sleep(token_delay)
+        yield Document(channel="chat", content=" " + rng.choice(WORDS))
+
+
+def per_token(responses):
+    """The updates of the chat page before coalescing: one per response, with the
+    whole answer and information panel"""
+    text, refs = "", ""
+    for response in responses:
+        if response.channel == "chat":
+            text += response.content
+        elif response.channel == "info":
+            refs += response.content
+        yield text, refs
+
+
+def coalesced(responses, interval: float, max_tokens: int):
+    for update in coalesce_chat_stream(
+        responses, interval=interval, max_tokens=max_tokens
+    ):
+        yield update.text, update.refs if update.refs_changed else None
+
+
+def run(name: str, updates, history: list, num_tokens: int):
+    n_updates, n_bytes = 0, 0
+    start, start_cpu = time.perf_counter(), time.process_time()
+    for text, refs in updates:
+        payload = json.dumps([history + [["question", text]], refs])
+        n_updates += 1
+        n_bytes += len(payload)
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - start_cpu
+    print(
+        f"{name:<10} {n_updates:6d} updates  {n_bytes / 1024**2:9.2f} MB  "
+        f"cpu {cpu * 1000:8.1f} ms  {num_tokens / elapsed:8.0f} tokens/s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tokens", type=int, default=1000)
+    parser.add_argument("--token-delay", type=float, default=0.002)
+    parser.add_argument("--refs-kb", type=int, default=50)
+    parser.add_argument("--history", type=int, default=10, help="previous messages")
+    parser.add_argument("--interval-ms", type=float, default=80)
+    parser.add_argument("--max-tokens", type=int, default=64)
+    args = parser.parse_args()
+
+    history = [["question " * 20, "answer " * 200] for _ in range(args.history)]
+
+    run(
+        "per token",
+        per_token(stub_llm(args.tokens, args.token_delay, args.refs_kb)),
+        history,
+        args.tokens,
+    )
+    run(
+        "coalesced",
+        coalesced(
+            stub_llm(args.tokens, args.token_delay, args.refs_kb),
+            args.interval_ms / 1000,
+            args.max_tokens,
+        ),
+        history,
+        args.tokens,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""Measure the matching of the cited evidences with the retrieved chunks.
+
+An answer cites `--evidences` quotes, each taken (and lightly edited) from one of
+`--chunks` retrieved chunks of about `--chunk-chars` characters. The evidences are
+matched against every chunk as `CitationPipeline.match_evidence_with_context`
+does, either with `difflib.SequenceMatcher` (as before) or with the n-gram index
+of `kotaemon.indices.qa.utils.SpanMatcher`, built once per chunk and answer. The
+script checks that both find the same spans and reports the matching time:
+
+    python scripts/benchmarks/citation_matching.py --chunks 20 50 100 \
+        --evidences 10 --chunk-chars 2000
+"""
+
+import argparse
+import random
+import time
+from difflib import SequenceMatcher
+
+from kotaemon.indices.qa.utils import SpanMatcher, find_start_end_phrase, find_text
+
+WORDS = (
+    "retrieval augmented generation document chunk embedding vector index query "
+    "answer citation model token context latency throughput reranker score page "
+    "the of and a to in is for on with as by at from"
+).split()
+
+
+def difflib_find_text(search_span, context, min_length=5):
+    """`find_text` before the n-gram index"""
+    search_span, context = search_span.lower(), context.lower()
+    context = context.replace("\n", " ")
+    matches_span = []
+    if len(search_span) > min_length:
+        for sentence in search_span.split("\n"):
+            blocks = [
+                (start, start + length)
+                for _, start, length in SequenceMatcher(
+                    None, sentence, context, autojunk=False
+                ).get_matching_blocks()
+                if length > max(len(sentence) * 0.25, min_length)
+            ]
+            if blocks:
+                start_index = min(start for start, _ in blocks)
+                end_index = max(end for _, end in blocks)
+                if end_index - start_index > max(len(sentence) * 0.35, min_length):
+                    matches_span.append((start_index, end_index))
+    if matches_span:
+        matches_span = [
+            (min(start for start, _ in matches_span), max(e for _, e in matches_span))
+        ]
+    return matches_span
+
+
+def difflib_find_start_end_phrase(start_phrase, end_phrase, context, min_length=5):
+    """`find_start_end_phrase` before the n-gram index (without the excerpt cap)"""
+    context = context.lower().replace("\n", " ")
+    matches, matched_length = [], 0
+    for sentence in [start_phrase.lower(), end_phrase.lower()]:
+        match = SequenceMatcher(None, sentence, context, autojunk=False)
+        match = match.find_longest_match(0, len(sentence), 0, len(context))
+        if match.size > max(len(sentence) * 0.35, min_length):
+            matches.append((match.b, match.b + match.size))
+            matched_length += match.size
+    return matches, matched_length
+
+
+def make_answer(rng, num_chunks: int, num_evidences: int, chunk_chars: int):
+    chunks = []
+    for _ in range(num_chunks):
+        words = []
+        while sum(len(word) + 1 for word in words) < chunk_chars:
+            words.append(rng.choice(WORDS))
+        chunks.append(" ".join(words))
+
+    evidences = []
+    for _ in range(num_evidences):
+        chunk = rng.choice(chunks)
+        start = rng.randrange(len(chunk) - 200)
+        quote = chunk[start : start + rng.randint(60, 200)]
+        # the LLM rarely quotes verbatim
+        quote = quote.replace(" the ", " a ", 1)
+        evidences.append(quote)
+    return chunks, evidences
+
+
+def match_find_text(chunks, evidences, indexed: bool):
+    if indexed:
+        matchers = [SpanMatcher.from_context(chunk) for chunk in chunks]
+        return [
+            find_text(quote, chunk, matcher=matcher)
+            for quote in evidences
+            for chunk, matcher in zip(chunks, matchers)
+        ]
+    return [difflib_find_text(quote, chunk) for quote in evidences for chunk in chunks]
+
+
+def match_phrases(chunks, evidences, indexed: bool):
+    phrases = [(quote[:40], quote[-40:]) for quote in evidences]
+    if indexed:
+        matchers = [SpanMatcher.from_context(chunk) for chunk in chunks]
+        return [
+            find_start_end_phrase(start, end, chunk, matcher=matcher)[1]
+            for start, end in phrases
+            for chunk, matcher in zip(chunks, matchers)
+        ]
+    return [
+        difflib_find_start_end_phrase(start, end, chunk)[1]
+        for start, end in phrases
+        for chunk in chunks
+    ]
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chunks", type=int, nargs="+", default=[20, 50, 100])
+    parser.add_argument("--evidences", type=int, default=10)
+    parser.add_argument("--chunk-chars", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(
+        f"{'chunks':>6} {'matching':<12} {'difflib ms':>11} {'n-gram ms':>10} "
+        f"{'speedup':>8} {'same':>5}"
+    )
+    for num_chunks in args.chunks:
+        rng = random.Random(args.seed)
+        chunks, evidences = make_answer(
+            rng, num_chunks, args.evidences, args.chunk_chars
+        )
+        for name, func in (
+            ("find_text", match_find_text),
+            ("start/end", match_phrases),
+        ):
+            expected, before = timed(func, chunks, evidences, False)
+            result, after = timed(func, chunks, evidences, True)
+            print(
+                f"{num_chunks:6d} {name:<12} {before * 1000:11.1f} "
+                f"{after * 1000:10.1f} {before / after:7.1f}x "
+                f"{str(result == expected):>5}"
+            )
+
+
+if __name__ == "__main__":
+    main()
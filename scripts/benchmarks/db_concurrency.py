@@ -0,0 +1,161 @@
+"""Measure the app database under concurrent chat persistence and file listing.
+
+Writer threads keep updating the message history of conversations (as the chat
+page does after every answer) while reader threads list the files of an index
+(as the file pages do). The bare SQLAlchemy engine is compared with the engine of
+`ktem.db.engine.create_db_engine` (WAL, `synchronous=NORMAL`, busy timeout, pool
+statistics) on a fresh SQLite database. Run it from the repository root so that
+the app settings are found:
+
+    python scripts/benchmarks/db_concurrency.py --writers 8 --readers 8 \
+        --duration 10
+"""
+
+import argparse
+import random
+import statistics
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from ktem.db.engine import create_db_engine, get_engine_stats
+from sqlalchemy import JSON, Column, Integer, String, create_engine, select, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session, declarative_base
+
+Base = declarative_base()
+
+
+class Conversation(Base):  # type: ignore
+    __tablename__ = "ktem__conversation"
+    id = Column(String, primary_key=True)
+    user = Column(String)
+    data_source = Column(JSON)
+
+
+class Source(Base):  # type: ignore
+    __tablename__ = "index__1__source"
+    id = Column(String, primary_key=True)
+    name = Column(String)
+    user = Column(String)
+    size = Column(Integer)
+    note = Column(JSON)
+
+
+def populate(engine, num_conversations: int, num_files: int) -> list[str]:
+    conv_ids = [uuid.uuid4().hex for _ in range(num_conversations)]
+    with Session(engine) as session:
+        session.add_all(
+            [Conversation(id=conv_id, user="u", data_source={}) for conv_id in conv_ids]
+        )
+        session.add_all(
+            [
+                Source(
+                    id=str(uuid.uuid4()),
+                    name=f"file_{idx}.pdf",
+                    user="u",
+                    size=idx,
+                    note={"tokens": idx, "loader": "PDFThumbnailReader"},
+                )
+                for idx in range(num_files)
+            ]
+        )
+        session.commit()
+    return conv_ids
+
+
+def writer(engine, conv_ids, stop, latencies, errors, seed):
+    rng = random.Random(seed)
+    messages: list = []
+    while not stop.is_set():
+        messages.append(["question " * 20, "answer " * 200])
+        start = time.perf_counter()
+        try:
+            with Session(engine) as session:
+                session.execute(
+                    update(Conversation)
+                    .where(Conversation.id == rng.choice(conv_ids))
+                    .values(data_source={"messages": messages[-20:]})
+                )
+                session.commit()
+        except OperationalError:
+            errors.append(1)
+            continue
+        latencies.append(time.perf_counter() - start)
+
+
+def reader(engine, stop, latencies, errors):
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            with Session(engine) as session:
+                session.execute(
+                    select(Source).where(Source.user == "u").order_by(Source.name)
+                ).all()
+        except OperationalError:
+            errors.append(1)
+            continue
+        latencies.append(time.perf_counter() - start)
+
+
+def bench(name: str, engine, args):
+    Base.metadata.create_all(engine)
+    conv_ids = populate(engine, args.conversations, args.files)
+
+    stop = threading.Event()
+    write_latencies: list[float] = []
+    read_latencies: list[float] = []
+    errors: list[int] = []
+    threads = [
+        threading.Thread(
+            target=writer,
+            args=(engine, conv_ids, stop, write_latencies, errors, idx),
+        )
+        for idx in range(args.writers)
+    ] + [
+        threading.Thread(target=reader, args=(engine, stop, read_latencies, errors))
+        for _ in range(args.readers)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    print(f"{name}: {len(errors)} errors")
+    for kind, latencies in (("writes", write_latencies), ("lists", read_latencies)):
+        if not latencies:
+            print(f"  {kind:<7} none")
+            continue
+        p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else 0
+        print(
+            f"  {kind:<7} {len(latencies) / args.duration:8.1f} ops/s  "
+            f"p50 {statistics.median(latencies) * 1000:7.2f} ms  "
+            f"p95 {p95 * 1000:7.2f} ms"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--conversations", type=int, default=100)
+    parser.add_argument("--files", type=int, default=1000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        url = f"sqlite:///{Path(tmp_dir) / 'default.db'}"
+        bench("create_engine", create_engine(url), args)
+
+        url = f"sqlite:///{Path(tmp_dir) / 'tuned.db'}"
+        engine = create_db_engine(url)
+        bench("create_db_engine", engine, args)
+        print(f"  stats   {get_engine_stats(engine)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""Measure the file index SQL layer: chunk record inserts and scope lookups.
+
+A SQLite table with the schema of the `index__{id}__index` table of the file index
+is filled with `--num-files` files of `--chunks-per-file` chunks. The script then
+reports:
+
+- the insert throughput of ORM `add_all` and Core `insert` executemany
+- the latency of the retrieval scope lookup (chunk ids of the selected files)
+  and of the file deletion lookup, without and with the secondary indexes
+
+    python scripts/benchmarks/index_table.py --num-files 2000 \
+        --chunks-per-file 500 --selected-files 5
+"""
+
+import argparse
+import random
+import statistics
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+from sqlalchemy import Column
+from sqlalchemy import Index as SQLIndex
+from sqlalchemy import Integer, String, create_engine, insert, select
+from sqlalchemy.orm import Session, declarative_base
+
+Base = declarative_base()
+
+
+class IndexTable(Base):  # type: ignore
+    __tablename__ = "index__1__index"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    source_id = Column(String)
+    target_id = Column(String)
+    relation_type = Column(String)
+    user = Column(String, default="")
+    n_tokens = Column(Integer, nullable=True)
+
+
+def create_indexes(engine):
+    """Create the secondary indexes of the file index, after the table so that
+    the table can first be measured without them"""
+    SQLIndex(
+        "ix_index__1__index_source_id_relation_type",
+        IndexTable.source_id,
+        IndexTable.relation_type,
+    ).create(engine)
+    SQLIndex("ix_index__1__index_target_id", IndexTable.target_id).create(engine)
+
+
+def records(file_id: str, n_chunks: int) -> list[dict]:
+    rows = []
+    for _ in range(n_chunks):
+        chunk_id = str(uuid.uuid4())
+        rows.append(
+            {
+                "source_id": file_id,
+                "target_id": chunk_id,
+                "relation_type": "document",
+                "n_tokens": 200,
+            }
+        )
+        rows.append(
+            {
+                "source_id": file_id,
+                "target_id": chunk_id,
+                "relation_type": "vector",
+                "n_tokens": None,
+            }
+        )
+    return rows
+
+
+def bench_inserts(engine, n_chunks: int):
+    rows = records(str(uuid.uuid4()), n_chunks)
+
+    start = time.perf_counter()
+    with Session(engine) as session:
+        session.add_all([IndexTable(**row) for row in rows])
+        session.commit()
+    elapsed = time.perf_counter() - start
+    print(f"ORM add_all         {len(rows) / elapsed:12.0f} rows/s")
+
+    rows = records(str(uuid.uuid4()), n_chunks)
+    start = time.perf_counter()
+    with Session(engine) as session:
+        session.execute(insert(IndexTable.__table__), rows)
+        session.commit()
+    elapsed = time.perf_counter() - start
+    print(f"Core executemany    {len(rows) / elapsed:12.0f} rows/s")
+
+
+def bench_lookups(engine, file_ids: list[str], selected: int, repeat: int):
+    rng = random.Random(0)
+    scope_times, delete_times = [], []
+    with Session(engine) as session:
+        for _ in range(repeat):
+            doc_ids = rng.sample(file_ids, selected)
+            start = time.perf_counter()
+            stmt = select(IndexTable.target_id).where(
+                IndexTable.source_id.in_(doc_ids),
+                IndexTable.relation_type == "document",
+            )
+            list(session.execute(stmt).scalars())
+            scope_times.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            stmt = select(IndexTable.relation_type, IndexTable.target_id).where(
+                IndexTable.source_id == doc_ids[0]
+            )
+            session.execute(stmt).all()
+            delete_times.append(time.perf_counter() - start)
+
+    for name, times in (("scope lookup", scope_times), ("file lookup", delete_times)):
+        print(
+            f"  {name:<14} p50 {statistics.median(times) * 1000:8.3f} ms  "
+            f"max {max(times) * 1000:8.3f} ms"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--num-files", type=int, default=2000)
+    parser.add_argument("--chunks-per-file", type=int, default=500)
+    parser.add_argument("--selected-files", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine = create_engine(f"sqlite:///{Path(tmp_dir) / 'bench.db'}")
+        Base.metadata.create_all(engine)
+
+        bench_inserts(engine, args.chunks_per_file)
+
+        file_ids = [str(uuid.uuid4()) for _ in range(args.num_files)]
+        with engine.begin() as conn:
+            for file_id in file_ids:
+                conn.execute(
+                    insert(IndexTable.__table__),
+                    records(file_id, args.chunks_per_file),
+                )
+        print(f"{args.num_files * args.chunks_per_file * 2} rows")
+
+        print("without indexes")
+        bench_lookups(engine, file_ids, args.selected_files, args.repeat)
+
+        create_indexes(engine)
+        print("with indexes")
+        bench_lookups(engine, file_ids, args.selected_files, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Measure reranking throughput (documents per second).
+
+Compare the local ONNX cross-encoder against a running TEI reranking endpoint:
+
+    python scripts/benchmarks/reranking.py --num-docs 200 --num-threads 4 \
+        --tei-url http://localhost:8080/rerank
+"""
+
+import argparse
+import random
+import time
+
+from kotaemon.base import Document
+from kotaemon.rerankings import ONNXCrossEncoderReranking, TeiFastReranking
+
+WORDS = (
+    "retrieval augmented generation document chunk embedding vector index query "
+    "answer citation model token context latency throughput reranker score page"
+).split()
+
+
+def make_documents(num_docs: int, min_words: int, max_words: int) -> list[Document]:
+    rng = random.Random(0)
+    return [
+        Document(
+            text=" ".join(
+                rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words))
+            )
+        )
+        for _ in range(num_docs)
+    ]
+
+
+def bench(name: str, reranker, query: str, docs: list[Document], repeat: int):
+    # warmup, also loads the model / opens the connection
+    reranker(docs[:4], query=query)
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        reranker([doc.copy() for doc in docs], query=query)
+    elapsed = time.perf_counter() - start
+
+    print(
+        f"{name:<12} {len(docs) * repeat / elapsed:10.1f} docs/s "
+        f"({elapsed / repeat * 1000:.1f} ms per {len(docs)} docs)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--num-docs", type=int, default=100)
+    parser.add_argument("--min-words", type=int, default=20)
+    parser.add_argument("--max-words", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--model-name", default="Xenova/ms-marco-MiniLM-L-6-v2")
+    parser.add_argument("--num-threads", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--max-length", type=int, default=512)
+    parser.add_argument("--tei-url", default=None, help="TEI /rerank endpoint")
+    args = parser.parse_args()
+
+    query = "how does the reranker affect retrieval latency"
+    docs = make_documents(args.num_docs, args.min_words, args.max_words)
+
+    bench(
+        "onnx",
+        ONNXCrossEncoderReranking(
+            model_name=args.model_name,
+            num_threads=args.num_threads,
+            batch_size=args.batch_size,
+            max_length=args.max_length,
+        ),
+        query,
+        docs,
+        args.repeat,
+    )
+    if args.tei_url:
+        bench(
+            "tei",
+            TeiFastReranking(endpoint_url=args.tei_url),
+            query,
+            docs,
+            args.repeat,
+        )
+
+
+if __name__ == "__main__":
+    main()
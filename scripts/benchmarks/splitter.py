@@ -0,0 +1,92 @@
+"""Measure text splitting throughput (tokens per second).
+
+Compare the llama-index based TokenSplitter with the native TiktokenSplitter on
+generated pages, using the separators of the file index. `run` is called directly
+so that the pipeline bookkeeping of theflow, common to both, is not measured:
+
+    python scripts/benchmarks/splitter.py --num-docs 500 --chunk-size 1024 \
+        --chunk-overlap 256
+"""
+
+import argparse
+import random
+import time
+
+from kotaemon.base import Document
+from kotaemon.indices.splitters import TiktokenSplitter, TokenSplitter
+from kotaemon.indices.splitters.tiktoken_splitter import get_encoding
+
+WORDS = (
+    "retrieval augmented generation document chunk embedding vector index query "
+    "answer citation model token context latency throughput reranker score page "
+    "the of and to in is that for on with as by"
+).split()
+
+
+def make_documents(num_docs: int, words_per_doc: int) -> list[Document]:
+    rng = random.Random(0)
+    docs = []
+    for idx in range(num_docs):
+        paragraphs, n_words = [], 0
+        while n_words < words_per_doc:
+            sentences = [
+                " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 25))) + "."
+                for _ in range(rng.randint(1, 8))
+            ]
+            paragraph = " ".join(sentences)
+            paragraphs.append(paragraph)
+            n_words += paragraph.count(" ") + 1
+        docs.append(
+            Document(
+                text="\n\n".join(paragraphs),
+                metadata={"file_name": "benchmark.pdf", "page_label": idx + 1},
+            )
+        )
+    return docs
+
+
+def bench(name: str, splitter, docs: list[Document], n_tokens: int, repeat: int):
+    # warmup, also loads the tokenizer
+    splitter.run(docs[:2])
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        chunks = splitter.run(docs)
+    elapsed = (time.perf_counter() - start) / repeat
+
+    print(
+        f"{name:<16} {n_tokens / elapsed:12.0f} tokens/s "
+        f"({elapsed * 1000:.1f} ms, {len(chunks)} chunks)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--num-docs", type=int, default=200)
+    parser.add_argument("--words-per-doc", type=int, default=600)
+    parser.add_argument("--chunk-size", type=int, default=1024)
+    parser.add_argument("--chunk-overlap", type=int, default=256)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    docs = make_documents(args.num_docs, args.words_per_doc)
+    n_tokens = sum(
+        len(tokens)
+        for tokens in get_encoding("gpt-3.5-turbo").encode_ordinary_batch(
+            [doc.text for doc in docs]
+        )
+    )
+    print(f"{len(docs)} documents, {n_tokens} tokens")
+
+    params = dict(
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap,
+        separator="\n\n",
+        backup_separators=["\n", ".", "​"],
+    )
+    bench("TokenSplitter", TokenSplitter(**params), docs, n_tokens, args.repeat)
+    bench("TiktokenSplitter", TiktokenSplitter(**params), docs, n_tokens, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Measure the cold start of the app.
+
+For each module of `--module`, the import is timed in fresh interpreters
+(`--repeat` times) and `python -X importtime` reports the imports taking the most
+time, cumulated (with their own imports) and self. With `--command`, the command
+starting the app is run and the time until `--url` first answers with a success
+status is reported, i.e. the time until the app serves its first request. Run it
+from the root of the repository:
+
+    python scripts/benchmarks/startup.py --module ktem.main kotaemon.indices \
+        --top 15 --command "python app.py" --url http://127.0.0.1:7860/
+"""
+
+import argparse
+import os
+import shlex
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+IMPORT_TIMER = (
+    "import time; start = time.perf_counter(); import {module}; "
+    "print(time.perf_counter() - start)"
+)
+
+
+def import_seconds(module: str) -> float:
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_TIMER.format(module=module)],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def import_profile(module: str) -> list[tuple[int, int, str]]:
+    """The (self, cumulative, package) times in microseconds of the imports"""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, package = line[len("import time:") :].split("|")
+        rows.append((int(self_us), int(cumulative_us), package.strip()))
+    return rows
+
+
+def report_imports(module: str, repeat: int, top: int):
+    timings = [import_seconds(module) for _ in range(repeat)]
+    print(
+        f"import {module}: median {statistics.median(timings):.2f} s, "
+        f"min {min(timings):.2f} s over {repeat} runs"
+    )
+
+    rows = import_profile(module)
+    for title, key in (("cumulative", 1), ("self", 0)):
+        print(f"  top {top} imports by {title} time")
+        for row in sorted(rows, key=lambda row: row[key], reverse=True)[:top]:
+            print(f"    {row[key] / 1000:9.1f} ms  {row[2]}")
+
+
+def time_to_first_request(command: str, url: str, timeout: float) -> float:
+    process = subprocess.Popen(
+        shlex.split(command),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        env={**os.environ, "BROWSER": "true"},
+    )
+    start = time.perf_counter()
+    try:
+        while time.perf_counter() - start < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"The app exited with code {process.returncode}")
+            try:
+                with urllib.request.urlopen(url, timeout=5) as response:
+                    if response.status < 400:
+                        return time.perf_counter() - start
+            except (urllib.error.URLError, ConnectionError, TimeoutError):
+                pass
+            time.sleep(0.1)
+        raise TimeoutError(f"{url} did not answer within {timeout} s")
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--module", nargs="*", default=["ktem.main"])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--command", help="command starting the app")
+    parser.add_argument("--url", default="http://127.0.0.1:7860/")
+    parser.add_argument("--timeout", type=float, default=600)
+    args = parser.parse_args()
+
+    for module in args.module:
+        report_imports(module, args.repeat, args.top)
+
+    if args.command:
+        seconds = time_to_first_request(args.command, args.url, args.timeout)
+        print(f"first request served after {seconds:.2f} s")
+
+
+if __name__ == "__main__":
+    main()